@@ -2,13 +2,9 @@
 电量数据查看器 - 完整层次结构版本
 ExcelDataViewerWindow → device_tabs → device_tab → data_type_tabs → sheet_tabs → 数据类型tabs
 """
-import re
-import math
 from datetime import datetime
 from pathlib import Path
-from dataclasses import dataclass, field
 
-import pandas as pd
 from PyQt6.QtCore import pyqtSignal, Qt, QDate
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QTabWidget,
@@ -28,49 +24,17 @@ from Service.connect_server_service.index.Client_server import Client_server
 from theme.ThemeQt6 import ThemedWindow
 from public.entity.MyQThread import MyQThread
 from public.config_class.global_setting import global_setting
+from public.dao.SQLite.AsyncSQLiteManager import AsyncSQLiteManager, QueryExecutor, QueryFuture
+from public.entity.QtAsyncTask import qt_async_slot
 from public.function.Cache.cache_manager import cache_manager
+from public.function.Cache.content_store import content_store
 from public.function.Cache.data_download_manager import download_manager
-
-
-# ==================== 数据结构 ====================
-@dataclass
-class xlsx_datas_device_item:
-    name: str = ""
-    data: list = field(default_factory=list)
-
-
-@dataclass
-class xlsx_datas_phase_item:
-    name: str = ""
-    data: list = field(default_factory=list)
-
-
-@dataclass
-class xlsx_datas_item_x:
-    name: list = field(default_factory=list)
-    data: list = field(default_factory=list)
-
-
-@dataclass
-class xlsx_datas_item:
-    x: xlsx_datas_item_x = field(default_factory=xlsx_datas_item_x)
-    y: list = field(default_factory=list)
-
-
-@dataclass
-class xlsx_datas_type_item:
-    name: str = ""
-    data: xlsx_datas_item = field(default_factory=xlsx_datas_item)
-
-
-@dataclass
-class xlsx_data:
-    rated_voltage: float = 0
-    rated_voltage_unit: str = ''
-    rated_frequency: float = 0
-    rated_frequency_unit: str = ''
-    name: str = ""
-    data: list = field(default_factory=list)
+from public.function.Cache import excel_parser
+from public.function.Cache.excel_parser import (
+    xlsx_data, xlsx_datas_device_item, xlsx_datas_item, xlsx_datas_item_x, xlsx_datas_phase_item,
+    xlsx_datas_type_item
+)
+from public.util.number_util import number_util
 
 
 # ==================== 线程 ====================
@@ -107,6 +71,9 @@ class ExcelViewerQueueThread(MyQThread):
 
 # ==================== 主窗口 ====================
 class ExcelDataViewerWindow(ThemedWindow):
+    # 趋势图最多读取的文件数，超过画布像素宽度的部分由 LTTB 降采样
+    TREND_MAX_RECORDS = 5000
+
     update_data_signal = pyqtSignal(dict)
     cache_update_signal = pyqtSignal(str, str)  # file_path, device_id - 从队列线程发送到主线程
     
@@ -118,6 +85,10 @@ class ExcelDataViewerWindow(ThemedWindow):
         self.device_data = {}  # {device_id: {sheet_name: xlsx_data}}
         self.device_tab_dict = {}  # {device_id: device_tab_widget}
         self.history_data = []
+        # 正在进行的趋势图加载（QtAsyncTask）
+        self._trend_task = None
+        # 补算测量值统计要解析 Excel 文件，使用单独的单线程执行器，不占用图表与表格共用的查询线程池
+        self._backfill_executor = QueryExecutor(max_workers=1, max_pending=8, name="excel_trend_backfill")
         
         # 窗口状态
         self.is_visible = False  # 窗口是否可见
@@ -281,6 +252,8 @@ class ExcelDataViewerWindow(ThemedWindow):
             sheet_data_dict = self.parse_excel_all_sheets(file_path)
             if not sheet_data_dict:
                 raise Exception("Excel解析失败")
+            # 记录查看时间，磁盘配额清理时优先保留最近查看的文件
+            content_store.touch(file_path, latest_record.get('content_hash'))
             
             self.log_message(f"解析成功，共 {len(sheet_data_dict)} 个Sheet")
             
@@ -307,136 +280,14 @@ class ExcelDataViewerWindow(ThemedWindow):
     
     def parse_excel_all_sheets(self, file_path: str) -> dict:
         """
-        解析Excel所有Sheet
+        解析Excel所有Sheet（优先读取按文件内容缓存的解析结果）
         返回: {sheet_name: xlsx_data}
         """
-        logger.info(f"解析Excel: {file_path}")
-        
-        try:
-            excel_file = pd.ExcelFile(file_path)
-            result = {}
-            
-            for sheet_name in excel_file.sheet_names:
-                logger.info(f"解析Sheet: {sheet_name}")
-                df = excel_file.parse(sheet_name, header=None)
-                sheet_data = self.parse_single_sheet(df, sheet_name)
-                
-                if sheet_data:
-                    result[sheet_name] = sheet_data
-                    logger.info(f"✅ {sheet_name} 解析成功")
-            
-            logger.info(f"✅ 共解析{len(result)}个Sheet")
-            return result
-            
-        except Exception as e:
-            import traceback
-            logger.error(f"解析失败: {e}\n{traceback.format_exc()}")
-            return {}
+        return excel_parser.parse_excel_all_sheets(file_path)
     
     def parse_single_sheet(self, data, sheet_name: str) -> xlsx_data:
-        """解析单个Sheet（使用test/get_test.py的逻辑）"""
-        try:
-            data_each_counts = 36
-            return_data = xlsx_data()
-            return_data.name = sheet_name
-            
-            data_clean = data.dropna()
-            if data_clean.empty:
-                return None
-            
-            df_colum_0_unique = data_clean.drop_duplicates(subset=[data_clean.columns[0]])
-            df_colum_1_unique = data_clean.drop_duplicates(subset=[data_clean.columns[1]])
-            
-            # 额定频率和电压
-            return_data.rated_frequency = float("".join(re.findall(r'[0-9]', str(df_colum_1_unique.iloc[0, 1]))))
-            return_data.rated_frequency_unit = "".join(re.findall(r'[A-Za-z]', str(df_colum_1_unique.iloc[0, 1])))
-            return_data.rated_voltage = float("".join(re.findall(r'[0-9]', str(df_colum_0_unique.iloc[0, 0]).split(",")[0])))
-            return_data.rated_voltage_unit = "".join(re.findall(r'[A-Za-z]', str(df_colum_0_unique.iloc[0, 0]).split(",")[0]))
-            
-            # X轴数据
-            xlsx_datas_type_item_obj_x_data = []
-            for row in range(data_clean.shape[0]):
-                temp = row / data_each_counts
-                index = math.floor(temp)
-                
-                if temp == 0:
-                    xlsx_datas_type_item_obj = xlsx_datas_type_item()
-                    xlsx_datas_type_item_obj.name = "功率W"
-                    xlsx_datas_type_item_obj.data.x.name.append(str(data.iloc[3, 2]))
-                    xlsx_datas_type_item_obj.data.x.name.append("电流/A")
-                    return_data.data.append(xlsx_datas_type_item_obj)
-                elif temp == 1:
-                    xlsx_datas_type_item_obj = xlsx_datas_type_item()
-                    xlsx_datas_type_item_obj.name = "电压"
-                    xlsx_datas_type_item_obj.data.x.name.append(str(data.iloc[3, 2]))
-                    xlsx_datas_type_item_obj.data.x.name.append("电流/A")
-                    return_data.data.append(xlsx_datas_type_item_obj)
-                    return_data.data[index - 1].data.x.data = xlsx_datas_type_item_obj_x_data
-                    xlsx_datas_type_item_obj_x_data = []
-                elif temp == 2:
-                    xlsx_datas_type_item_obj = xlsx_datas_type_item()
-                    xlsx_datas_type_item_obj.name = "电流"
-                    xlsx_datas_type_item_obj.data.x.name.append(str(data.iloc[3, 2]))
-                    xlsx_datas_type_item_obj.data.x.name.append("电流/A")
-                    return_data.data.append(xlsx_datas_type_item_obj)
-                    return_data.data[index - 1].data.x.data = xlsx_datas_type_item_obj_x_data
-                    xlsx_datas_type_item_obj_x_data = []
-                elif temp == 3:
-                    xlsx_datas_type_item_obj = xlsx_datas_type_item()
-                    xlsx_datas_type_item_obj.name = "相角"
-                    xlsx_datas_type_item_obj.data.x.name.append(str(data.iloc[3, 2]))
-                    xlsx_datas_type_item_obj.data.x.name.append("电流/A")
-                    return_data.data.append(xlsx_datas_type_item_obj)
-                    return_data.data[index - 1].data.x.data = xlsx_datas_type_item_obj_x_data
-                    xlsx_datas_type_item_obj_x_data = []
-                
-                # 额定电流
-                rated_current_unit = "".join(re.findall(r'[A-Za-z]', str(data_clean.iloc[row, 0]).strip().split(",")[1]))
-                if rated_current_unit == "mA":
-                    rated_current = float("".join(re.findall(r'[0-9]', str(data_clean.iloc[row, 0]).strip().split(",")[1]))) / 1000
-                else:
-                    rated_current = float("".join(re.findall(r'[0-9]', str(data_clean.iloc[row, 0]).strip().split(",")[1])))
-                
-                xlsx_datas_type_item_obj_x_data.append([data_clean.iloc[row, 2], rated_current])
-            
-            return_data.data[-1].data.x.data = xlsx_datas_type_item_obj_x_data
-            
-            # Y轴数据
-            df_rows_2_4_unique = data.iloc[3, 4:].dropna()
-            df_rows_3_4 = data.iloc[4, 4:]
-            
-            for row in range(data_clean.shape[0]):
-                temp = row / data_each_counts
-                index = math.floor(temp)
-                if temp == 0 or temp == 1 or temp == 2 or temp == 3:
-                    for j in range(df_rows_2_4_unique.shape[0]):
-                        xlsx_datas_phase_item_obj = xlsx_datas_phase_item()
-                        xlsx_datas_phase_item_obj.name = df_rows_2_4_unique.iloc[j]
-                        
-                        device_series = df_rows_3_4.drop_duplicates()[:-2]
-                        for device_row in range(device_series.shape[0]):
-                            xlsx_datas_device_item_obj = xlsx_datas_device_item()
-                            xlsx_datas_device_item_obj.name = device_series.iloc[device_row]
-                            xlsx_datas_phase_item_obj.data.append(xlsx_datas_device_item_obj)
-                        
-                        return_data.data[index].data.y.append(xlsx_datas_phase_item_obj)
-            
-            # 具体值
-            for row in range(data_clean.shape[0]):
-                temp = row / data_each_counts
-                index = math.floor(temp)
-                
-                for j in range(df_rows_2_4_unique.shape[0]):
-                    device_series = df_rows_3_4.drop_duplicates()[:-2]
-                    for device_row in range(device_series.shape[0]):
-                        return_data.data[index].data.y[j].data[device_row].data.append(
-                            data_clean.iloc[row, int(df_rows_2_4_unique.index[j]) + device_row])
-            
-            return return_data
-            
-        except Exception as e:
-            logger.error(f"解析Sheet失败: {e}")
-            return None
+        """解析单个Sheet"""
+        return excel_parser.parse_single_sheet(data, sheet_name)
     
     def create_or_update_device_tab(self, device_id: str, sheet_data_dict: dict, file_name: str = None):
         """创建或更新设备选项卡"""
@@ -759,6 +610,7 @@ class ExcelDataViewerWindow(ThemedWindow):
                     self.log_message(f"正在加载设备 {device_id} 的数据...")
                     sheet_data_dict = self.parse_excel_all_sheets(file_path)
                     if sheet_data_dict:
+                        content_store.touch(file_path, latest_record.get('content_hash'))
                         self.device_data[device_id] = sheet_data_dict
                         file_name = Path(file_path).name
                         self.create_or_update_device_tab(device_id, sheet_data_dict, file_name)
@@ -931,6 +783,7 @@ class ExcelDataViewerWindow(ThemedWindow):
                 # 解析并显示
                 sheet_data_dict = self.parse_excel_all_sheets(file_path)
                 if sheet_data_dict:
+                    content_store.touch(file_path, record.get('content_hash'))
                     self.device_data[device_id] = sheet_data_dict
                     self.create_or_update_device_tab(device_id, sheet_data_dict)
                     # 切换到实时数据选项卡
@@ -957,74 +810,63 @@ class ExcelDataViewerWindow(ThemedWindow):
         self.update_trend_chart(current_device)
     
     def update_trend_chart(self, device_id: str = None):
-        """更新趋势图 - 从每个Excel提取实际测量数据"""
+        """更新趋势图，上一次尚未完成的加载先取消"""
+        if not device_id:
+            device_id = self.trend_device_combo.currentText()
+        if not device_id:
+            return
+        if self._trend_task is not None and self._trend_task.is_running():
+            self._trend_task.cancel()
+        self._trend_task = self.load_trend_chart(device_id, self.trend_data_type_combo.currentText(),
+                                                 self.trend_phase_combo.currentText())
+
+    def _backfill_measurements(self, device_id: str):
+        """在补算执行器中执行：补算入库前已有记录的测量值统计，每条记录单独处理，失败的记录不影响其余记录"""
+        for record in cache_manager.get_excel_records_without_measurements(device_id, limit=self.TREND_MAX_RECORDS):
+            file_path = record['file_path']
+            if not file_path or not Path(file_path).exists():
+                continue
+            try:
+                # 解析结果有缓存；没有测量值的文件也保存（空的）统计，标记为已统计，之后不再重复解析
+                measurements = excel_parser.summarize_measurements(excel_parser.parse_excel_all_sheets(file_path))
+            except Exception as e:
+                logger.error(f"补算测量值统计失败 {file_path}: {e}")
+                measurements = []
+            cache_manager.save_excel_measurements(record['id'], measurements)
+
+    @qt_async_slot
+    async def load_trend_chart(self, device_id: str, data_type: str, phase: str):
+        """
+        加载并绘制趋势图，不阻塞界面：先在补算执行器中补算缺少的测量值统计，
+        再在共用的查询线程池中从统计表一次查出趋势（取第一个Sheet、第一个设备的平均值作为代表值）
+        """
         try:
-            if not device_id:
-                device_id = self.trend_device_combo.currentText()
-            
-            if not device_id:
-                return
-            
-            # 从缓存读取历史数据
-            records = cache_manager.get_excel_records(device_id=device_id, limit=50)
+            self.log_message(f"正在提取 {data_type} - {phase} 的数据...")
+            await QueryFuture(self._backfill_executor.submit(self._backfill_measurements, device_id))
+            rows = await AsyncSQLiteManager(cache_manager.excel_db).run(
+                cache_manager.get_measurement_trend, device_id, data_type, phase, limit=self.TREND_MAX_RECORDS)
             
-            if not records:
+            if not rows:
                 self.log_message(f"设备 {device_id} 没有历史数据")
-                return
             
-            # 解析数据
             timestamps = []
             values = []
-            
-            data_type = self.trend_data_type_combo.currentText()
-            phase = self.trend_phase_combo.currentText()
-            
-            self.log_message(f"正在提取 {data_type} - {phase} 的数据...")
-            
-            for record in reversed(records):  # 从旧到新
+            for timestamp, avg_value in rows:
+                if avg_value is None:
+                    continue
                 try:
-                    file_path = record['file_path']
-                    if not Path(file_path).exists():
-                        continue
-                    
-                    # 解析Excel获取实际测量数据
-                    sheet_data_dict = self.parse_excel_all_sheets(file_path)
-                    if not sheet_data_dict:
-                        continue
-                    
-                    # 取第一个Sheet的数据
-                    first_sheet = list(sheet_data_dict.values())[0]
-                    
-                    # 找到对应的数据类型
-                    data_type_item = None
-                    for item in first_sheet.data:
-                        if item.name == data_type:
-                            data_type_item = item
-                            break
-                    
-                    if not data_type_item:
-                        continue
-                    
-                    # 找到对应的相位
-                    phase_item = None
-                    for p_item in data_type_item.data.y:
-                        if phase in p_item.name:
-                            phase_item = p_item
-                            break
-                    
-                    if not phase_item or not phase_item.data:
-                        continue
-                    
-                    # 取第一个设备的平均值作为代表值
-                    if phase_item.data[0].data:
-                        avg_value = sum(phase_item.data[0].data) / len(phase_item.data[0].data)
-                        timestamps.append(datetime.strptime(record['timestamp'], '%Y-%m-%d %H:%M:%S'))
-                        values.append(avg_value)
-                    
-                except Exception as e:
+                    timestamps.append(datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S'))
+                    values.append(avg_value)
+                except ValueError as e:
                     logger.error(f"解析记录失败: {e}")
-                    continue
             
+            # 点数超过画布像素宽度时按 LTTB 降采样，多余的点画出来也看不到
+            max_points = max(self.trend_canvas.width(), 3)
+            if len(values) > max_points:
+                indexes = number_util.lttb_indexes([t.timestamp() for t in timestamps], values, max_points)
+                timestamps = [timestamps[i] for i in indexes]
+                values = [values[i] for i in indexes]
+
             # 绘制折线图
             self.trend_figure.clear()
             ax = self.trend_figure.add_subplot(111)
@@ -1062,6 +904,9 @@ class ExcelDataViewerWindow(ThemedWindow):
         """关闭事件"""
         if hasattr(self, 'queue_thread'):
             self.queue_thread.stop()
+        if self._trend_task is not None and self._trend_task.is_running():
+            self._trend_task.cancel()
+        self._backfill_executor.shutdown(wait=False)
         
         # 断开下载管理器信号
         try:
@@ -10,13 +10,13 @@ from datetime import datetime
 from pathlib import Path
 
 from PyQt6 import QtGui
-from PyQt6.QtCore import pyqtSignal, Qt
+from PyQt6.QtCore import QObject, pyqtSignal, Qt
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTabWidget,
                               QLabel, QPushButton, QGroupBox, QGridLayout,
                               QScrollArea, QListWidget, QListWidgetItem,
                               QSplitter, QFrame, QComboBox, QTableWidget, QTableWidgetItem,
                               QPlainTextEdit, QHeaderView)
-from PyQt6.QtGui import QPixmap
+from PyQt6.QtGui import QImage, QPixmap
 from loguru import logger
 
 from Module.image_data_viewer.service.image_recognition import image_recognition_service
@@ -25,7 +25,53 @@ from theme.ThemeQt6 import ThemedWindow
 from public.entity.MyQThread import MyQThread
 from public.config_class.global_setting import global_setting
 from public.function.Cache.cache_manager import cache_manager
+from public.function.Cache.content_store import content_store
 from public.function.Cache.data_download_manager import download_manager
+from public.function.Cache.thumbnail_cache import thumbnail_cache
+
+
+def _thumbnail_pixmap(image_path, size: int, content_hash: str = None) -> QPixmap:
+    """读取长边不超过 size 的缩略图（优先使用缩略图缓存，不解码全分辨率原图）"""
+    return QPixmap.fromImage(thumbnail_cache.load_image(image_path, size, content_hash))
+
+
+class _ThumbnailLoader(QObject):
+    """
+    异步填充缩略图：已知内容哈希且缩略图已缓存时直接显示，
+    否则在缩略图线程池中计算哈希并生成缩略图，完成后回到主线程设置到 QLabel
+    """
+    _loaded = pyqtSignal(object, object, str)  # QLabel, QImage, 图片路径
+
+    def __init__(self):
+        super().__init__()
+        self._loaded.connect(self._apply)
+
+    def load(self, label: QLabel, image_path, size: int, content_hash: str = None):
+        # 标签可能在结果返回前被用来显示其它图片，只接受最后一次请求的结果
+        label.setProperty("thumbnail_source", str(image_path))
+        cached = thumbnail_cache.find(content_hash, size) if content_hash else None
+        if cached is not None:
+            pixmap = QPixmap(str(cached))
+            if not pixmap.isNull():
+                label.setPixmap(pixmap)
+                return
+        future = thumbnail_cache.submit_load(image_path, size, content_hash)
+        future.add_done_callback(lambda f: self._loaded.emit(label, f.result(), str(image_path)))
+
+    def _apply(self, label: QLabel, image: QImage, image_path: str):
+        try:
+            if label.property("thumbnail_source") != image_path:
+                return
+            if image.isNull():
+                label.setText("无法加载图片")
+            else:
+                label.setPixmap(QPixmap.fromImage(image))
+        except RuntimeError:
+            # 标签已随页面销毁
+            pass
+
+
+_thumbnail_loader = _ThumbnailLoader()
 
 
 class ImageViewerQueueThread(MyQThread):
@@ -67,6 +113,7 @@ class ImageDisplayWidget(QFrame):
         super().__init__(parent)
         self.index = index
         self.original_image_path = None
+        self.original_content_hash = None  # 原图的内容哈希（记录中有时）
         self.recognized_image_path = None
         self.has_fault = None  # 识别结果
         
@@ -130,27 +177,24 @@ class ImageDisplayWidget(QFrame):
         self.status_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         layout.addWidget(self.status_label)
     
-    def load_original_image(self, image_path: Path):
-        """加载原图并自动识别"""
+    def load_original_image(self, image_path: Path, content_hash: str = None):
+        """加载原图并自动识别（content_hash 为记录中的内容哈希，可选）"""
         try:
             self.original_image_path = image_path
+            self.original_content_hash = content_hash
             
             # 显示文件名
             self.filename_label.setText(image_path.name)
             
-            # 加载原图
-            pixmap = QPixmap(str(image_path))
+            # 加载原图（标签固定为 150x150，直接使用同尺寸的缩略图）
+            pixmap = _thumbnail_pixmap(image_path, thumbnail_cache.SIZE_GRID, content_hash)
             
             if pixmap.isNull():
                 raise Exception("无法加载图片")
+            # 记录查看时间，磁盘配额清理时优先保留最近查看的文件
+            content_store.touch(image_path, content_hash)
             
-            # 缩放图片以适应标签
-            scaled_pixmap = pixmap.scaled(
-                self.original_label.size(),
-                Qt.AspectRatioMode.KeepAspectRatio,
-                Qt.TransformationMode.SmoothTransformation
-            )
-            self.original_label.setPixmap(scaled_pixmap)
+            self.original_label.setPixmap(pixmap)
             
             self.status_label.setText(f"已加载")
             self.status_label.setStyleSheet("color: green; font-size: 10px;")
@@ -165,24 +209,13 @@ class ImageDisplayWidget(QFrame):
             self.status_label.setText(f"加载失败")
             self.status_label.setStyleSheet("color: red; font-size: 10px;")
     
-    def load_recognized_image(self, image_path: Path, has_fault: bool = False):
-        """加载识别图并显示识别结果"""
+    def load_recognized_image(self, image_path: Path, has_fault: bool = False, content_hash: str = None):
+        """加载识别图并显示识别结果（content_hash 为识别图的内容哈希，未知时在后台计算并生成缩略图）"""
         try:
             self.recognized_image_path = image_path
             self.has_fault = has_fault  # 保存识别结果
             
-            pixmap = QPixmap(str(image_path))
-            
-            if pixmap.isNull():
-                raise Exception("无法加载图片")
-            
-            # 缩放图片以适应标签
-            scaled_pixmap = pixmap.scaled(
-                self.recognized_label.size(),
-                Qt.AspectRatioMode.KeepAspectRatio,
-                Qt.TransformationMode.SmoothTransformation
-            )
-            self.recognized_label.setPixmap(scaled_pixmap)
+            _thumbnail_loader.load(self.recognized_label, image_path, thumbnail_cache.SIZE_GRID, content_hash)
             
             # 显示识别结果
             if has_fault:
@@ -219,7 +252,10 @@ class ImageDisplayWidget(QFrame):
             recognized_path = self.original_image_path  # 使用原图作为识别图
         
         if recognized_path:
-            self.load_recognized_image(recognized_path, has_fault)
+            # 没有单独的识别图时识别图就是原图，沿用原图的内容哈希
+            same_file = Path(recognized_path) == Path(self.original_image_path)
+            self.load_recognized_image(recognized_path, has_fault,
+                                       self.original_content_hash if same_file else None)
         else:
             self.status_label.setText("识别失败")
             self.status_label.setStyleSheet("color: red; font-size: 10px;")
@@ -228,7 +264,9 @@ class ImageDisplayWidget(QFrame):
         """清空显示"""
         self.original_label.clear()
         self.recognized_label.clear()
+        self.recognized_label.setProperty("thumbnail_source", None)
         self.original_image_path = None
+        self.original_content_hash = None
         self.recognized_image_path = None
         
         self.filename_label.setText("--")
@@ -776,36 +814,8 @@ class ImageDataViewerWindow(ThemedWindow):
     
     def _update_recognition_result_in_cache(self, file_path: str, has_fault: bool):
         """更新缓存中的识别结果"""
-        try:
-            import sqlite3
-            import json
-            
-            conn = sqlite3.connect(str(cache_manager.image_db_path))
-            cursor = conn.cursor()
-            
-            # 读取现有的extra_data
-            cursor.execute("SELECT extra_data FROM image_records WHERE file_path = ?", (file_path,))
-            row = cursor.fetchone()
-            
-            if row:
-                extra_data = json.loads(row[0]) if row[0] else {}
-                extra_data['has_fault'] = has_fault
-                extra_data_str = json.dumps(extra_data, ensure_ascii=False)
-                
-                # 更新
-                cursor.execute("""
-                    UPDATE image_records 
-                    SET extra_data = ?
-                    WHERE file_path = ?
-                """, (extra_data_str, file_path))
-                
-                conn.commit()
-                logger.info(f"更新识别结果到缓存: {Path(file_path).name}, 故障={has_fault}")
-            
-            conn.close()
-            
-        except Exception as e:
-            logger.error(f"更新识别结果失败: {e}")
+        if cache_manager.update_image_extra_data(file_path, {'has_fault': has_fault}):
+            logger.info(f"更新识别结果到缓存: {Path(file_path).name}, 故障={has_fault}")
     
     def _update_history_from_cache(self):
         """从缓存更新历史记录列表（增量更新）"""
@@ -832,6 +842,7 @@ class ImageDataViewerWindow(ThemedWindow):
                         'original_path': record['original_path'],
                         'recognized_path': record.get('recognized_path', record['original_path']),
                         'timestamp': record['timestamp'],
+                        'content_hash': record.get('content_hash'),
                         'has_fault': has_fault  # 包含识别结果
                     }
                     self.history_records.insert(0, history_item)  # 插入到开头
@@ -938,16 +949,13 @@ class ImageDataViewerWindow(ThemedWindow):
         original_path = record.get('original_path')
         recognized_path = record.get('recognized_path')
         
+        content_hash = record.get('content_hash')
         if original_path and Path(original_path).exists():
             # 加载原图
-            pixmap = QPixmap(str(original_path))
+            pixmap = _thumbnail_pixmap(original_path, thumbnail_cache.SIZE_DETAIL, content_hash)
             if not pixmap.isNull():
-                scaled_pixmap = pixmap.scaled(
-                    300, 300,
-                    Qt.AspectRatioMode.KeepAspectRatio,
-                    Qt.TransformationMode.SmoothTransformation
-                )
-                self.history_original_label.setPixmap(scaled_pixmap)
+                content_store.touch(original_path, content_hash)
+                self.history_original_label.setPixmap(pixmap)
             else:
                 self.history_original_label.setText("无法加载图片")
                 logger.error(f"无法加载图片: {original_path}")
@@ -957,27 +965,18 @@ class ImageDataViewerWindow(ThemedWindow):
         
         # 加载识别图
         if recognized_path and Path(recognized_path).exists():
-            recognized_pixmap = QPixmap(str(recognized_path))
+            recognized_pixmap = _thumbnail_pixmap(recognized_path, thumbnail_cache.SIZE_DETAIL,
+                                                  content_hash if recognized_path == original_path else None)
             if not recognized_pixmap.isNull():
-                scaled_recognized_pixmap = recognized_pixmap.scaled(
-                    300, 300,
-                    Qt.AspectRatioMode.KeepAspectRatio,
-                    Qt.TransformationMode.SmoothTransformation
-                )
-                self.history_recognized_label.setPixmap(scaled_recognized_pixmap)
+                self.history_recognized_label.setPixmap(recognized_pixmap)
             else:
                 self.history_recognized_label.setText("无法加载识别图")
         else:
             # 识别图使用原图（当前识别功能返回原图）
             if original_path and Path(original_path).exists():
-                pixmap = QPixmap(str(original_path))
+                pixmap = _thumbnail_pixmap(original_path, thumbnail_cache.SIZE_DETAIL, content_hash)
                 if not pixmap.isNull():
-                    scaled_pixmap = pixmap.scaled(
-                        300, 300,
-                        Qt.AspectRatioMode.KeepAspectRatio,
-                        Qt.TransformationMode.SmoothTransformation
-                    )
-                    self.history_recognized_label.setPixmap(scaled_pixmap)
+                    self.history_recognized_label.setPixmap(pixmap)
             else:
                 self.history_recognized_label.setText("暂无识别图")
         
@@ -1029,7 +1028,8 @@ class ImageDataViewerWindow(ThemedWindow):
                         'file_name': record['file_name'],
                         'original_path': record['original_path'],
                         'recognized_path': record.get('recognized_path', record['original_path']),
-                        'timestamp': record['timestamp']
+                        'timestamp': record['timestamp'],
+                        'content_hash': record.get('content_hash')
                     }
                     self.history_records.append(history_item)
                     
@@ -1092,7 +1092,7 @@ class ImageDataViewerWindow(ThemedWindow):
                     try:
                         target_widget = self.get_next_widget_for_device(device_tab)
                         if target_widget:
-                            target_widget.load_original_image(Path(original_path))
+                            target_widget.load_original_image(Path(original_path), record.get('content_hash'))
                             loaded_count += 1
                             logger.info(f"✅ 从缓存加载图片: {Path(original_path).name}")
                     except Exception as e:
@@ -1223,12 +1223,10 @@ class ImageDataViewerWindow(ThemedWindow):
                 # 缩略图
                 if record.get('original_path') and Path(record['original_path']).exists():
                     thumbnail_label = QLabel()
-                    pixmap = QPixmap(record['original_path'])
-                    if not pixmap.isNull():
-                        thumbnail_label.setPixmap(pixmap.scaled(60, 60, 
-                            Qt.AspectRatioMode.KeepAspectRatio,
-                            Qt.TransformationMode.SmoothTransformation))
-                        thumbnail_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+                    thumbnail_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+                    # 缩略图未缓存时在后台生成，表格先显示出来
+                    _thumbnail_loader.load(thumbnail_label, record['original_path'], thumbnail_cache.SIZE_TABLE,
+                                           record.get('content_hash'))
                     self.cache_image_table.setCellWidget(row, 4, thumbnail_label)
                 
                 # 查看按钮
@@ -1247,22 +1245,19 @@ class ImageDataViewerWindow(ThemedWindow):
         """查看图片缓存记录"""
         try:
             original_path = record['original_path']
+            content_hash = record.get('content_hash')
             
             if Path(original_path).exists():
+                content_store.touch(original_path, content_hash)
                 # 在历史详情中显示
-                self.history_original_label.setPixmap(QPixmap(original_path).scaled(
-                    300, 300,
-                    Qt.AspectRatioMode.KeepAspectRatio,
-                    Qt.TransformationMode.SmoothTransformation
-                ))
+                self.history_original_label.setPixmap(
+                    _thumbnail_pixmap(original_path, thumbnail_cache.SIZE_DETAIL, content_hash))
                 
                 recognized_path = record.get('recognized_path', original_path)
                 if Path(recognized_path).exists():
-                    self.history_recognized_label.setPixmap(QPixmap(recognized_path).scaled(
-                        300, 300,
-                        Qt.AspectRatioMode.KeepAspectRatio,
-                        Qt.TransformationMode.SmoothTransformation
-                    ))
+                    self.history_recognized_label.setPixmap(_thumbnail_pixmap(
+                        recognized_path, thumbnail_cache.SIZE_DETAIL,
+                        content_hash if recognized_path == original_path else None))
                 
                 # 显示信息
                 extra_data = record.get('extra_data', {})
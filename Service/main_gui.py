@@ -18,6 +18,9 @@ from public.entity.MyQThread import MyThread, MyQThread
 from public.entity.enum.Public_Enum import AppState
 from public.entity.queue.ObjectQueueItem import ObjectQueueItem
 from public.function.Crash_handle.CrashHandle import CrashHandler
+from public.function.Monitor_data_storage.ArchiveJob import start_archive_job_from_config, stop_archive_job
+from public.function.Monitor_data_storage.StorageWriterService import start_storage_writer_from_config, \
+    stop_storage_writer
 
 from public.util.time_util import time_util
 from theme.ThemeManager import ThemeManager
@@ -76,6 +79,10 @@ def quit_qt_application():
 
                             time=time_util.get_format_from_time(time.time())))
 
+    # 写完存储队列中剩余的数据
+    stop_storage_writer()
+    # 停止冷数据归档任务
+    stop_archive_job()
     #
     # 等待5秒系统退出
     time.sleep(5)
@@ -162,6 +169,10 @@ def main(q, send_message_q):
     logger.info(f"{'-' * 40}main_gui_start{'-' * 40}")
     logger.info(f"{__name__} | {os.path.basename(__file__)}|{os.getpid()}|{os.getppid()}")
     global_load.load_global_setting()
+    # 存储队列 store_Q 及其写入服务
+    start_storage_writer_from_config()
+    # 冷数据归档任务
+    start_archive_job_from_config()
     global_setting.set_setting("queue", q)
     global_setting.set_setting("send_message_queue", send_message_q)
     global read_queue_data_thread
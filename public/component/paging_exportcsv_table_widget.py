@@ -9,20 +9,28 @@ from PyQt6.QtCore import pyqtSignal
 from PyQt6.QtWidgets import QTableWidgetItem, QVBoxLayout, QScrollArea, QSizePolicy, QWidget, QHeaderView
 from loguru import logger
 
+from public.dao.SQLite.AsyncSQLiteManager import QueryExecutor, QueryFuture
 from public.dao.SQLite.Monitor_Datas_Handle import Monitor_Datas_Handle
 from public.entity.MyQThread import MyQThread
+from public.entity.QtAsyncTask import qt_async_slot
+from public.function.DataCaculation.Data_Caculation import DataCaculation
 from theme.ThemeManager import ThemeManager
 from theme.ThemeQt6 import ThemedWindow, ThemedWidget
 #logger = logger.bind(category="gui_logger")
 
 class DataFetcher(MyQThread):
     data_fetched = pyqtSignal(list)  # 信号传递时间和值
+    page_fetched = pyqtSignal(dict)  # 游标分页模式下传递 query_Epoch_datas_keyset 的结果
 
-    def __init__(self, name, table_name,rows_per_page,start_row):
+    def __init__(self, name, table_name,rows_per_page,start_row,use_keyset=False):
         super().__init__(name=name)
         self.table_name = table_name
         self.rows_per_page = rows_per_page
         self.start_row = start_row
+        # 游标分页：page_token 为 None 表示第一页，page_last 为 True 表示最后一页
+        self.use_keyset = use_keyset
+        self.page_token = None
+        self.page_last = False
 
         # 数据库操作类
         self.handle: Monitor_Datas_Handle = None
@@ -54,6 +62,16 @@ class DataFetcher(MyQThread):
         """
 
 
+        if self.use_keyset:
+            page = self.handle.sqlite_manager.query_Epoch_datas_keyset(table=self.table_name,
+                                                                      page_size=self.rows_per_page,
+                                                                      token=self.page_token,
+                                                                      last=self.page_last,
+                                                                      total_mode="approx")
+            self.page_fetched.emit(page)
+            time.sleep(0.3)
+            return
+
         datas = self.handle.query_data_paging(table_name=self.table_name,rows_per_page=self.rows_per_page,start_row=self.start_row)
         if datas is None:
             datas = []
@@ -63,7 +81,18 @@ class DataFetcher(MyQThread):
         time.sleep(0.3)  # 每秒获取一次数据
 
 class TableWidgetPaging(ThemedWidget):
-    def __init__(self,parent: QVBoxLayout = None, object_name: str = "",rows_per_page=10,type=None, data_type="", mouse_cage_number=0):
+    # 整表导出耗时与表的行数成正比，在单独的导出线程中执行，不占用分页与图表共用的查询线程池
+    _export_executor: QueryExecutor = None
+
+    @staticmethod
+    def _get_export_executor() -> QueryExecutor:
+        """所有表格共用一个导出线程（在界面线程中调用）"""
+        if TableWidgetPaging._export_executor is None:
+            TableWidgetPaging._export_executor = QueryExecutor(max_workers=1, max_pending=8, name="csv_export")
+        return TableWidgetPaging._export_executor
+
+    def __init__(self,parent: QVBoxLayout = None, object_name: str = "",rows_per_page=10,type=None, data_type="", mouse_cage_number=0,
+                 use_keyset=False):
         """
 
         :param parent:父组件
@@ -71,6 +100,7 @@ class TableWidgetPaging(ThemedWidget):
         :param rows_per_page 每一页几行
         :param type:模块类型 UFC,UGC等 枚举类 Modbus_Slave_Ids.UFC
         :param data_type: 数据类型 比如monitor_data senior_state等
+        :param use_keyset: 是否使用基于 time 的游标分页（大表翻页不再随页码变慢，总数为估算值）
         """
         super().__init__()
         self.setSizePolicy(QSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding))
@@ -79,6 +109,9 @@ class TableWidgetPaging(ThemedWidget):
         self.mouse_cage_number = mouse_cage_number
         self.type = type
         self.data_type = data_type
+        self.use_keyset = use_keyset
+        # 游标分页模式下最近一次的查询结果
+        self.keyset_page: dict = {}
         # 数据库操作类
         self.handle: Monitor_Datas_Handle = None
         if self.mouse_cage_number == 0:
@@ -117,6 +150,7 @@ class TableWidgetPaging(ThemedWidget):
         self.next_button = QtWidgets.QPushButton("下一页")
         self.last_button = QtWidgets.QPushButton("尾页")
         self.export_button = QtWidgets.QPushButton("导出当页CSV")
+        self.export_all_button = QtWidgets.QPushButton("导出全部CSV")
 
         # 分页指示器
         self.page_info_label = QtWidgets.QLabel()
@@ -127,6 +161,7 @@ class TableWidgetPaging(ThemedWidget):
         self.next_button.clicked.connect(self.next_page)
         self.last_button.clicked.connect(self.go_to_last_page)
         self.export_button.clicked.connect(self.export_to_csv)
+        self.export_all_button.clicked.connect(self.export_all_to_csv)
 
         # 布局设置
 
@@ -139,6 +174,7 @@ class TableWidgetPaging(ThemedWidget):
         self.pagination_layout.addWidget(self.next_button)
         self.pagination_layout.addWidget(self.last_button)
         self.pagination_layout.addWidget(self.export_button)
+        self.pagination_layout.addWidget(self.export_all_button)
 
 
         layout.addLayout(self.pagination_layout)
@@ -152,8 +188,10 @@ class TableWidgetPaging(ThemedWidget):
             self.data_fetcher_thread.stop()
         # 启动新线程来获取新的数据类型
         start_row = self.current_page * self.rows_per_page
-        self.data_fetcher_thread = DataFetcher(name="tab_2_tab_0_table_data_fetch_thread", table_name=self.table_name,start_row=start_row,rows_per_page=self.rows_per_page )
+        self.data_fetcher_thread = DataFetcher(name="tab_2_tab_0_table_data_fetch_thread", table_name=self.table_name,start_row=start_row,rows_per_page=self.rows_per_page,
+                                               use_keyset=self.use_keyset)
         self.data_fetcher_thread.data_fetched.connect(self.update_table)
+        self.data_fetcher_thread.page_fetched.connect(self.update_table_keyset)
         self.data_fetcher_thread.start()
     def set_table_setting(self):
         self.handle = Monitor_Datas_Handle()  # # 创建数据库
@@ -220,8 +258,18 @@ class TableWidgetPaging(ThemedWidget):
         self.table_widget.setCornerButtonEnabled(True)
 
 
+    def update_table_keyset(self, page: dict):
+        """游标分页模式下更新表格"""
+        self.keyset_page = page
+        columns = page.get("columns", [])
+        datas = [tuple(row[column] for column in columns) for row in page.get("rows", [])]
+        self.update_table(datas)
+
     def update_page_info(self):
         """更新分页信息显示"""
+        if self.use_keyset:
+            self.update_page_info_keyset()
+            return
 
         self.total_rows = self.handle.query_data_counts(table_name=self.table_name)
 
@@ -235,8 +283,36 @@ class TableWidgetPaging(ThemedWidget):
         # 更新分页信息标签
         self.page_info_label.setText(f"页 {self.current_page + 1} / {total_pages}, 总数据数量: {self.total_rows}")
 
+    def update_page_info_keyset(self):
+        """游标分页模式下的分页信息，按钮状态取决于是否存在前后页令牌"""
+        page = self.keyset_page
+        self.total_rows = page.get("total_items") or 0
+        total_pages = max(1, (self.total_rows + self.rows_per_page - 1) // self.rows_per_page)
+        has_prev = bool(page.get("has_prev"))
+        has_next = bool(page.get("has_next"))
+        if not has_next:
+            # 已到最后一页，用估算总页数校正页码
+            self.current_page = max(self.current_page, total_pages - 1)
+        if not has_prev:
+            self.current_page = 0
+        self.first_button.setEnabled(has_prev)
+        self.prev_button.setEnabled(has_prev)
+        self.next_button.setEnabled(has_next)
+        self.last_button.setEnabled(has_next)
+
+        self.page_info_label.setText(f"页 {self.current_page + 1} / 约{total_pages}, 总数据数量: 约{self.total_rows}")
+
+    def _set_keyset_page(self, token, last=False):
+        if self.data_fetcher_thread is not None:
+            self.data_fetcher_thread.page_token = token
+            self.data_fetcher_thread.page_last = last
+
     def go_to_first_page(self):
         """切换到第一页"""
+        if self.use_keyset:
+            self.current_page = 0
+            self._set_keyset_page(None)
+            return
         self.current_page = 0
         start_row = self.current_page * self.rows_per_page
         if self.data_fetcher_thread is not None:
@@ -244,6 +320,12 @@ class TableWidgetPaging(ThemedWidget):
 
     def prev_page(self):
         """切换到上一页"""
+        if self.use_keyset:
+            token = self.keyset_page.get("prev_token")
+            if token:
+                self.current_page = max(0, self.current_page - 1)
+                self._set_keyset_page(token)
+            return
         if self.current_page > 0:
             self.current_page -= 1
             start_row = self.current_page * self.rows_per_page
@@ -252,6 +334,12 @@ class TableWidgetPaging(ThemedWidget):
 
     def next_page(self):
         """切换到下一页"""
+        if self.use_keyset:
+            token = self.keyset_page.get("next_token")
+            if token:
+                self.current_page += 1
+                self._set_keyset_page(token)
+            return
         if (self.current_page + 1) * self.rows_per_page < self.total_rows:
             self.current_page += 1
             start_row = self.current_page * self.rows_per_page
@@ -260,6 +348,10 @@ class TableWidgetPaging(ThemedWidget):
 
     def go_to_last_page(self):
         """切换到最后一页"""
+        if self.use_keyset:
+            self.current_page = max(0, (self.total_rows + self.rows_per_page - 1) // self.rows_per_page - 1)
+            self._set_keyset_page(None, last=True)
+            return
         self.current_page = (self.total_rows + self.rows_per_page - 1) // self.rows_per_page - 1
         start_row = self.current_page * self.rows_per_page
         if self.data_fetcher_thread is not None:
@@ -285,7 +377,38 @@ class TableWidgetPaging(ThemedWidget):
                         row_data.append(item.text() if item is not None else "")
                     writer.writerow(row_data[:-1])
 
+    @qt_async_slot
+    async def export_all_to_csv(self):
+        """
+        流式导出整张表到 CSV 文件：在导出线程中分批读取并写入，不阻塞界面，不把全表载入内存；
+        导出的同时统计各数据列的 count/min/max/mean
+        """
+        file_path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Save CSV", "", "CSV Files (*.csv);;All Files (*)")
+        if not file_path:
+            return
 
-
-
-
+        # 表头有描述的列使用中文描述
+        desc_mapping = {column['name']: column['desc'] for column in (self.table_columns_data or [])
+                        if 'name' in column and 'desc' in column}
+        handle = Monitor_Datas_Handle()
+        self.export_all_button.setEnabled(False)
+        try:
+            rows, stats = await QueryFuture(self._get_export_executor().submit(
+                self._export_table_to_csv, handle.sqlite_manager, file_path, desc_mapping))
+            logger.info(f"表 {self.table_name} 已导出 {rows} 行到 {file_path}，列统计: {stats}")
+        except Exception as e:
+            logger.error(f"导出表 {self.table_name} 到 CSV 失败: {e}")
+        finally:
+            handle.stop()
+            self.export_all_button.setEnabled(True)
+
+    def _export_table_to_csv(self, sqlite_manager, file_path: str, desc_mapping: dict):
+        """在导出线程中执行：返回 (导出的行数, 各数据列的统计)"""
+        with sqlite_manager.iter_table(self.table_name, arraysize=5000) as stream, \
+                open(file_path, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow([desc_mapping.get(column, column) for column in stream.columns])
+            data_columns = [column for column in stream.columns if column not in ('id', 'time', 'time_ms')]
+            stats = DataCaculation(sqlite_manager).caculate_data_stream(data_columns, stream,
+                                                                         on_batch=writer.writerows)
+            return stream.rows_fetched, stats
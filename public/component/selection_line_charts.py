@@ -17,17 +17,24 @@ from loguru import logger
 
 from public.config_class.global_setting import global_setting
 from public.dao.SQLite.Monitor_Datas_Handle import Monitor_Datas_Handle
+from public.dao.SQLite.AsyncSQLiteManager import AsyncSQLiteManager
 from public.dao.SQLite.SQliteManager import SQLiteManager
 from public.entity.MyQThread import MyQThread
+from public.entity.QtAsyncTask import qt_async_slot
 from theme.ThemeManager import Charts_Style_Name
 
 #logger = logger.bind(category="gui_logger")
 class DataFetcher(MyQThread):
     data_fetched = pyqtSignal(list)  # 信号传递时间和值
 
-    def __init__(self, name, table_name, data_type, data_types):
+    def __init__(self, name, table_name, data_type, data_types, sqlite_manager: SQLiteManager = None):
         super().__init__(name=name)
         self.table_name = table_name
+        # 查询的时间列在创建时确定一次，不在每次刷新时查询表结构；
+        # 有 time_ms 列时一并读取，绘图时不再逐点解析时间字符串
+        self.columns_flag_time = [SQLiteManager.TIME_COLUMN_NAME]
+        if sqlite_manager is not None and sqlite_manager.has_time_ms(table_name):
+            self.columns_flag_time.append(SQLiteManager.TIME_MS_COLUMN_NAME)
         # 选中的数据类型
         self.data_type = data_type
         # 所有的数据类型
@@ -72,8 +79,7 @@ class DataFetcher(MyQThread):
         for data_type_temp in self.data_types:
             if self.data_type['name'] == data_type_temp['name']:
                 data = self.handle.query_data_one_column_current(table_name=self.table_name,
-                                                                 columns_flag=[data_type_temp['name'],
-                                                                               SQLiteManager.TIME_COLUMN_NAME])
+                                                                 columns_flag=[data_type_temp['name']] + self.columns_flag_time)
                 break
         else:
             pass
@@ -84,6 +90,9 @@ class DataFetcher(MyQThread):
 
 
 class LineChartWidget(QWidget):
+    # 时间范围下拉框：{显示文本: 回看秒数}，0 表示实时刷新
+    HISTORY_RANGES = {"实时": 0, "最近1小时": 3600, "最近24小时": 24 * 3600, "最近7天": 7 * 24 * 3600}
+
     def __init__(self, parent: QVBoxLayout = None, object_name: str = "", data_read_counts=10, data_origin_nums=1,
                  is_span=False, type=None, data_type="", mouse_cage_number=0):
         """
@@ -143,6 +152,8 @@ class LineChartWidget(QWidget):
         # 数据的最大值 和最小值
         self.min_and_max_x = [0, 0]
         self.min_and_max_y = [0, 0]
+        # 正在执行的历史数据加载任务（QtAsyncTask），切换范围或数据类型时取消
+        self._history_task = None
 
         self.get_combobox_data()
         self._init_ui()
@@ -172,6 +183,12 @@ class LineChartWidget(QWidget):
         sub_layout = QHBoxLayout()
         sub_layout.addWidget(QLabel("选择数据："))
         sub_layout.addWidget(self.combo_box)
+        # 时间范围：实时刷新，或加载一段历史数据（数据库端降采样）
+        self.range_combo_box = QComboBox()
+        self.range_combo_box.addItems(list(self.HISTORY_RANGES.keys()))
+        self.range_combo_box.currentTextChanged.connect(self.change_history_range)
+        sub_layout.addWidget(QLabel("时间范围："))
+        sub_layout.addWidget(self.range_combo_box)
         sub_layout.addItem(QSpacerItem(20,40, QSizePolicy.Policy.Expanding,  QSizePolicy.Policy.Expanding))
         layout.addLayout(sub_layout)
 
@@ -256,10 +273,15 @@ class LineChartWidget(QWidget):
         for i in range(self.data_origin_nums):
             self.data_points.append([])
             # self.data_points.append([QPointF(random.randint(120000,130000),random.randint(1,10))  for i in range(random.randint(5,10))])  # 用于存储最新数据点
+        if self.HISTORY_RANGES.get(self.range_combo_box.currentText(), 0):
+            # 历史模式下切换数据类型，重新加载该列的历史数据
+            self.reload_history()
+            return
         # 启动新线程来获取新的数据类型
         self.data_fetcher_thread = DataFetcher(name="tab_2_tab_0_data_fetch_thread", table_name=self.table_name,
                                                data_type=self.columns_desc_combobox_selected,
-                                               data_types=self.columns_desc_combobox_data)
+                                               data_types=self.columns_desc_combobox_data,
+                                               sqlite_manager=self.handle.sqlite_manager if self.handle else None)
         self.data_fetcher_thread.data_fetched.connect(self.update_chart)
         self.data_fetcher_thread.start()
 
@@ -286,8 +308,12 @@ class LineChartWidget(QWidget):
                     #                                     data[i][self.columns_desc_combobox_selected['name']]['value']
                     #                                     )
 
-                    date_data = int(datetime.strptime(data[i][SQLiteManager.TIME_COLUMN_NAME]['value'],
-                                              "%Y-%m-%d %H:%M:%S.%f").timestamp()* 1000)
+                    time_ms_item = data[i].get(SQLiteManager.TIME_MS_COLUMN_NAME)
+                    if time_ms_item is not None and time_ms_item['value'] is not None:
+                        date_data = int(time_ms_item['value'])
+                    else:
+                        date_data = int(datetime.strptime(data[i][SQLiteManager.TIME_COLUMN_NAME]['value'],
+                                                  "%Y-%m-%d %H:%M:%S.%f").timestamp()* 1000)
                     point =QPointF(
                             date_data,
                             data[i][self.columns_desc_combobox_selected['name']]['value']
@@ -335,6 +361,63 @@ class LineChartWidget(QWidget):
         # 更新样式
         # self.set_series_lenged_style()
 
+    @pyqtSlot(str)
+    def change_history_range(self, range_text):
+        """切换时间范围：实时模式重新启动刷新线程，否则加载对应时间段的历史数据"""
+        if self.HISTORY_RANGES.get(range_text, 0):
+            self.reload_history()
+            return
+        self._cancel_history_task()
+        self.change_data_type(self.combo_box.currentText())
+
+    def reload_history(self):
+        """按当前时间范围加载历史数据，上一次尚未完成的加载先取消"""
+        self._cancel_history_task()
+        end_time = time.time()
+        start_time = end_time - self.HISTORY_RANGES.get(self.range_combo_box.currentText(), 0)
+        # 长时间段的原始点数远超像素宽度：SQL 中 minmax 预聚合后由 LTTB 选点，保留曲线形状
+        self._history_task = self.load_history(start_time, end_time, method='lttb')
+
+    def _cancel_history_task(self):
+        if self._history_task is not None and self._history_task.is_running():
+            self._history_task.cancel()
+        self._history_task = None
+
+    @qt_async_slot
+    async def load_history(self, start_time: float, end_time: float, method: str = 'minmax'):
+        """
+        加载历史时间段数据，数据库端按像素宽度降采样，点数与时间跨度无关
+        查询在共用的查询线程池中执行，不阻塞界面，也不需要为每个图表单独开线程
+        :param start_time: 开始时间（秒级时间戳）
+        :param end_time: 结束时间（秒级时间戳）
+        :param method: 降采样方法 avg/min/max/minmax/lttb
+        :return:
+        """
+        if not self.columns_desc_combobox_selected:
+            return
+        if self.data_fetcher_thread is not None and self.data_fetcher_thread.isRunning():
+            self.data_fetcher_thread.stop()
+        if self.handle is None:
+            self.handle = Monitor_Datas_Handle()
+        column = self.columns_desc_combobox_selected['name']
+        max_points = max(self.chart_view.width(), 2)
+        async_db = AsyncSQLiteManager(self.handle.sqlite_manager)
+        try:
+            result = await async_db.query_downsampled(self.table_name, [column], start_time, end_time,
+                                                      max_points=max_points, method=method)
+        except Exception as e:
+            logger.error(f"图表{self.object_name}加载历史数据失败，失败原因：{e}")
+            return
+        points = [QPointF(x, y) for x, y in zip(result['time_ms'], result[column]) if y is not None]
+        self.data_points = [list(points) for _ in range(self.data_origin_nums)]
+        for i in range(self.data_origin_nums):
+            # replace 一次性替换，避免逐点 append 触发重绘
+            self.series[i].replace(points)
+        self.min_and_max_y = [0, 0]
+        self.get_max_and_min_data()
+        self._set_x_axis()
+        self._set_y_axis()
+
     #   设置图表类型 line 折线图
     def _set_series(self):
 
@@ -0,0 +1,178 @@
+# SQLiteManager 的异步外观：查询在有上限的专用线程池中执行，返回可 await 的结果
+import asyncio
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from public.dao.SQLite.SQliteManager import SQLiteManager
+
+
+class QueryQueueFullError(RuntimeError):
+    """查询执行器中排队的查询已达上限"""
+
+
+class QueryExecutor:
+    """
+    有上限的查询执行器：max_workers 个线程并发执行，最多 max_pending 个查询排队，超出时 submit 抛出 QueryQueueFullError
+
+    所有 AsyncSQLiteManager 默认共用一个执行器，界面上打开再多图表/表格，数据库线程数也是固定的
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 64, name: str = "sqlite_query"):
+        if max_workers <= 0:
+            raise ValueError("max_workers must be > 0")
+        if max_pending < 0:
+            raise ValueError("max_pending must be >= 0")
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise QueryQueueFullError(f"查询队列已满（{self.max_workers} 执行中 + {self.max_pending} 排队）")
+        try:
+            future = self._executor.submit(func, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def shutdown(self, wait: bool = True, cancel_pending: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_pending)
+
+
+_default_executor: Optional[QueryExecutor] = None
+_default_executor_lock = threading.Lock()
+
+
+def get_default_executor() -> QueryExecutor:
+    """进程内共用的查询执行器"""
+    global _default_executor
+    with _default_executor_lock:
+        if _default_executor is None:
+            _default_executor = QueryExecutor()
+        return _default_executor
+
+
+class QueryFuture:
+    """
+    查询结果的可等待对象：
+        - 在 asyncio 协程中 await 时包装为 asyncio Future，不阻塞事件循环
+        - 在 QtAsyncTask 驱动的协程中 await 时，查询完成后在 Qt 主线程恢复执行
+    也可以直接调用 result()/add_done_callback()
+    """
+
+    def __init__(self, future: Future):
+        self.future = future
+
+    def __await__(self):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # 没有运行中的 asyncio 事件循环：交给 QtAsyncTask 等待
+            yield self.future
+            return self.future.result()
+        return (yield from asyncio.wrap_future(self.future).__await__())
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        return self.future.result(timeout)
+
+    def add_done_callback(self, fn: Callable[[Future], Any]):
+        self.future.add_done_callback(fn)
+
+    def cancel(self) -> bool:
+        return self.future.cancel()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+
+class AsyncSQLiteManager:
+    """
+    SQLiteManager 的异步外观，方法签名与同名同步方法一致，返回 QueryFuture
+
+    用法:
+        async_db = AsyncSQLiteManager(SQLiteManager(db, pool_mode=SQLiteManager.POOL_MODE_BOUNDED))
+        page = await async_db.query_Epoch_datas(table, page=2)
+
+    底层 SQLiteManager 建议使用 bounded 连接池，连接数不小于执行器线程数
+    """
+
+    def __init__(self, manager: SQLiteManager, executor: Optional[QueryExecutor] = None):
+        self.manager = manager
+        self.executor = executor or get_default_executor()
+
+    def run(self, func: Callable, *args, **kwargs) -> QueryFuture:
+        """在查询执行器中执行任意函数（通常为 manager 的方法）"""
+        return QueryFuture(self.executor.submit(functools.partial(func, *args, **kwargs)))
+
+    def _call(self, method_name: str, *args, **kwargs) -> QueryFuture:
+        return self.run(getattr(self.manager, method_name), *args, **kwargs)
+
+    def query_Epoch_datas(self, table: str, page: int = 1, page_size: int = 100,
+                          order_asc: bool = True) -> QueryFuture:
+        return self._call("query_Epoch_datas", table, page=page, page_size=page_size, order_asc=order_asc)
+
+    def query_Epoch_datas_keyset(self, table: str, page_size: int = 100, token: Optional[str] = None,
+                                 last: bool = False, descending: bool = True,
+                                 total_mode: Optional[str] = None) -> QueryFuture:
+        return self._call("query_Epoch_datas_keyset", table, page_size=page_size, token=token, last=last,
+                          descending=descending, total_mode=total_mode)
+
+    def query_joined_by_time(self, tables: List[str], page: int = 1, page_size: int = 100, order_asc: bool = True,
+                             columnar: bool = False, start_time: Optional[float] = None,
+                             end_time: Optional[float] = None) -> QueryFuture:
+        return self._call("query_joined_by_time", tables, page=page, page_size=page_size, order_asc=order_asc,
+                          columnar=columnar, start_time=start_time, end_time=end_time)
+
+    def query_joined_by_time_keyset(self, tables: List[str], page_size: int = 100, token: Optional[str] = None,
+                                    last: bool = False, descending: bool = True,
+                                    total_mode: Optional[str] = None) -> QueryFuture:
+        return self._call("query_joined_by_time_keyset", tables, page_size=page_size, token=token, last=last,
+                          descending=descending, total_mode=total_mode)
+
+    def get_multi_table_data(self, table_names: List[str], start_time: float, end_time: float,
+                             join_type: str = "union", fill: str = "null", tolerance: Optional[float] = None,
+                             columnar: bool = False) -> QueryFuture:
+        # 流式结果会在执行器线程之外被消费，这里不提供 stream 参数
+        return self._call("get_multi_table_data", table_names, start_time, end_time, join_type=join_type,
+                          fill=fill, tolerance=tolerance, columnar=columnar)
+
+    def query_downsampled(self, table: str, columns: List[str], start_time: float, end_time: float,
+                          max_points: int = 1000, method: str = 'minmax') -> QueryFuture:
+        return self._call("query_downsampled", table, columns, start_time, end_time, max_points=max_points,
+                          method=method)
+
+    def get_table_data_count(self, table_name: str, start_time=None, end_time=None) -> QueryFuture:
+        return self._call("get_table_data_count", table_name, start_time, end_time)
+
+    def query_counts_conditions(self, table_name: str, conditions: str = "") -> QueryFuture:
+        return self._call("query_counts_conditions", table_name, conditions)
+
+    def count_tables(self, table_names: List[str]) -> QueryFuture:
+        """一次提交统计多张表的行数，返回 {表名: 行数}"""
+        def count_all() -> Dict[str, int]:
+            return {name: self.manager.get_table_data_count(name) for name in table_names}
+        return self.run(count_all)
+
+    def query_conditions(self, table_name: str, conditions: str = "") -> QueryFuture:
+        return self._call("query_conditions", table_name, conditions)
+
+    def query_current_Data_columns(self, table_name: str, columns: List[str], **kwargs) -> QueryFuture:
+        return self._call("query_current_Data_columns", table_name, columns, **kwargs)
+
+    def query_columnar(self, sql: str, params=None, arraysize: int = 5000) -> QueryFuture:
+        return self._call("query_columnar", sql, params, arraysize=arraysize)
+
+    def close(self, close_manager: bool = False):
+        """关闭外观；默认执行器为进程共用，不在这里关闭"""
+        if self.executor is not _default_executor:
+            self.executor.shutdown(wait=False)
+        if close_manager:
+            self.manager.close()
+        logger.debug(f"AsyncSQLiteManager({self.manager.db_name}) 已关闭")
@@ -1,52 +1,399 @@
+import base64
 import datetime
+import functools
+import heapq
+import itertools
+import json
 import math
+import operator
+import os
+import pathlib
+import queue
+import random
 import sqlite3
+import threading
 import time
-from typing import List, Dict, Any, Optional, Generator
+from typing import List, Dict, Any, Optional, Generator, Iterable, Sequence
 from contextlib import contextmanager
 
 from loguru import logger
 
+from public.dao.SQLite.query_profiler import QueryProfiler, ProfiledConnection
+from public.util.number_util import number_util
+
+
+def _catalog_scoped(method):
+    """只读查询入口：整个调用内表结构目录只解析一次，见 SQLiteManager._catalog_scope"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._catalog_scope():
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class SQLiteManager:
     TIME_COLUMN_NAME = 'time'
+    # 由 time 派生的毫秒时间戳列（可选），用于数值范围查询
+    TIME_MS_COLUMN_NAME = 'time_ms'
+    # 连接池模式：None 为每次调用新建连接（兼容旧行为）
+    POOL_MODE_THREAD = 'thread'  # 每个线程一个长连接
+    POOL_MODE_BOUNDED = 'bounded'  # 有上限的共享连接池
+    # 触发器维护的行数统计表：总行数 / 按天分桶的行数
+    ROW_COUNT_TABLE_NAME = '_row_counts'
+    ROW_COUNT_BUCKET_TABLE_NAME = '_row_count_buckets'
+    # 按时间分区的逻辑表登记表 / 物理分区登记表
+    PARTITIONED_TABLE_NAME = '_partitioned_tables'
+    PARTITION_TABLE_NAME = '_partitions'
+    PARTITION_DAY = 'day'
+    PARTITION_WEEK = 'week'
+    # 单个复合 SELECT 的项数上限（SQLITE_MAX_COMPOUND_SELECT 默认 500），超过时分组嵌套
+    MAX_COMPOUND_SELECT = 400
+    # 冷数据归档文件登记表，归档目录默认为 {数据库文件名}_archive
+    ARCHIVE_TABLE_NAME = '_archive_files'
+    ARCHIVE_DIR_SUFFIX = '_archive'
+    # 归档期间某天的数据被改动时，重新读取归档的次数
+    ARCHIVE_RETRY_ATTEMPTS = 3
+    # 游标分页中归档行的 rowid：基数 + (日期序号 << 32) + 文件内行号，不与数据库中的 rowid 重叠
+    ARCHIVE_ROWID_BASE = 1 << 62
+    # 连接配置：None 为默认读写连接；reader 只读连接；writer 写入连接
+    PROFILE_READER = 'reader'
+    PROFILE_WRITER = 'writer'
+    CONNECTION_PROFILE: Optional[str] = None
+    # 只读连接：禁止写入，加大内存映射和页缓存，图表等读线程不必和写线程争用
+    READER_PRAGMAS = {
+        "query_only": "ON",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,  # 负数表示 KiB，即 64MB
+    }
+    # 写入连接：WAL 下 NORMAL 已可保证一致性；增大自动检查点间隔，减少检查点与读者的竞争
+    WRITER_PRAGMAS = {
+        "synchronous": "NORMAL",
+        "wal_autocheckpoint": 4000,  # 页数，默认 1000
+        "cache_size": -16 * 1024,
+    }
+    # BEGIN IMMEDIATE 在 busy timeout 用尽后的退避重试（秒）
+    BUSY_RETRY_ATTEMPTS = 5
+    BUSY_BACKOFF_INITIAL = 0.05
+    BUSY_BACKOFF_MAX = 1.0
+    # 所有未单独指定剖析器的实例共用的查询剖析器，None 表示不剖析
+    default_profiler: Optional[QueryProfiler] = None
+
+    def __init__(self, db_name: str, timeout: float = 30.0, pool_mode: Optional[str] = None,
+                 pool_size: int = 5, health_check_interval: float = 30.0,
+                 profiler: Optional[QueryProfiler] = None, connection_profile: Optional[str] = None):
+        """
+        初始化数据库管理器（不立即连接）
 
-    def __init__(self, db_name: str, timeout: float = 30.0):
-        """初始化数据库管理器（不立即连接）"""
+        Args:
+            db_name: 数据库文件路径
+            timeout: 连接超时时间（秒）
+            pool_mode: 连接池模式 None / 'thread' / 'bounded'
+            pool_size: bounded 模式下的最大连接数
+            health_check_interval: 连接空闲超过该秒数后，取出时先做一次健康检查
+            profiler: 查询剖析器，None 时使用 SQLiteManager.default_profiler
+            connection_profile: 连接配置 None / 'reader' / 'writer'，None 时使用类属性 CONNECTION_PROFILE
+        """
+        if pool_mode not in (None, self.POOL_MODE_THREAD, self.POOL_MODE_BOUNDED):
+            raise ValueError(f"不支持的连接池模式: {pool_mode}")
+        if pool_size <= 0:
+            raise ValueError("pool_size must be > 0")
+        connection_profile = connection_profile or self.CONNECTION_PROFILE
+        if connection_profile not in (None, self.PROFILE_READER, self.PROFILE_WRITER):
+            raise ValueError(f"不支持的连接配置: {connection_profile}")
         self.db_name = db_name
         self.timeout = timeout
-
-    @contextmanager
-    def get_connection(self,
-                       row_factory: Optional[callable] = None,
-                       isolation_level: Optional[str] = None) -> Generator[sqlite3.Connection, None, None]:
-        """获取数据库连接的上下文管理器"""
-        conn = None
+        self.pool_mode = pool_mode
+        self.pool_size = pool_size
+        self.health_check_interval = health_check_interval
+        self.profiler = profiler
+        self.connection_profile = connection_profile
+
+        self._pool_lock = threading.Lock()
+        self._init_pool_state()
+
+        # 表结构目录缓存，PRAGMA schema_version 变化时重新加载
+        self._schema_lock = threading.Lock()
+        self._schema_catalog: Optional[Dict[str, Dict[str, Any]]] = None
+        self._schema_version: Optional[int] = None
+        # 线程局部的目录快照，见 _catalog_scope
+        self._schema_local = threading.local()
+        # 冷数据归档文件目录（见 archive_older_than）
+        self.archive_dir = os.path.splitext(os.path.abspath(db_name))[0] + self.ARCHIVE_DIR_SUFFIX
+
+    def _init_pool_state(self):
+        """初始化（或在 fork 后重置）连接池状态"""
+        self._pool_pid = os.getpid()
+        # 所有由连接池创建的连接 {id(conn): conn}，close() 时统一关闭
+        self._pool_connections: Dict[int, sqlite3.Connection] = {}
+        # 连接最后一次归还的时间 {id(conn): time.monotonic()}
+        self._pool_last_used: Dict[int, float] = {}
+        self._pool_idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        # thread 模式下连接所属线程 {id(conn): thread}，线程结束后连接会被回收
+        self._pool_owner: Dict[int, threading.Thread] = {}
+        self._pool_local = threading.local()
+        self._pool_closed = False
+
+    def _create_connection(self, isolation_level: Optional[str] = None) -> sqlite3.Connection:
+        """新建连接并执行一次性的 PRAGMA 设置"""
+        if self.connection_profile == self.PROFILE_READER:
+            conn = self._create_reader_connection(isolation_level)
+            if conn is not None:
+                return conn
+        conn = sqlite3.connect(
+            self.db_name,
+            timeout=self.timeout,
+            check_same_thread=False,
+            isolation_level=isolation_level
+        )
+        # WAL模式提供更好的并发性
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA foreign_keys = ON')
+        if self.connection_profile == self.PROFILE_READER:
+            self._apply_pragmas(conn, self.READER_PRAGMAS)
+        elif self.connection_profile == self.PROFILE_WRITER:
+            self._apply_pragmas(conn, self.WRITER_PRAGMAS)
+        return conn
+
+    def _create_reader_connection(self, isolation_level: Optional[str] = None) -> Optional[sqlite3.Connection]:
+        """
+        以 mode=ro URI 打开只读连接；数据库尚不存在或无法只读打开时返回 None，
+        由调用方退回普通连接（仍会设置 query_only）
+        """
+        if self.db_name == ':memory:' or not os.path.exists(self.db_name):
+            return None
+        uri = pathlib.Path(self.db_name).resolve().as_uri() + "?mode=ro"
         try:
             conn = sqlite3.connect(
-                self.db_name,
+                uri,
+                uri=True,
                 timeout=self.timeout,
                 check_same_thread=False,
                 isolation_level=isolation_level
             )
+            # 只读连接无法切换日志模式，数据库由写入方设置为 WAL
+            self._apply_pragmas(conn, self.READER_PRAGMAS)
+            return conn
+        except sqlite3.Error as e:
+            logger.warning(f"以只读方式打开数据库 {self.db_name} 失败，改用普通连接: {e}")
+            return None
+
+    def _apply_pragmas(self, conn: sqlite3.Connection, pragmas: Dict[str, Any]):
+        for name, value in pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+
+    def _begin_immediate(self, cursor: sqlite3.Cursor):
+        """
+        开始写事务并立即获取写锁，避免事务中途由读升级为写时直接报 database is locked；
+        busy timeout 用尽后再按指数退避（带随机抖动）重试 BUSY_RETRY_ATTEMPTS 次
+        """
+        delay = self.BUSY_BACKOFF_INITIAL
+        for attempt in range(self.BUSY_RETRY_ATTEMPTS + 1):
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                message = str(e).lower()
+                if attempt == self.BUSY_RETRY_ATTEMPTS or ("locked" not in message and "busy" not in message):
+                    raise
+                logger.warning(f"数据库 {self.db_name} 写锁被占用，{delay:.2f}s 后第 {attempt + 1} 次重试")
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                delay = min(delay * 2, self.BUSY_BACKOFF_MAX)
+
+    def _is_connection_healthy(self, conn: sqlite3.Connection) -> bool:
+        """空闲过久的连接取出前先执行 SELECT 1 检查是否可用"""
+        last_used = self._pool_last_used.get(id(conn), 0.0)
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error as e:
+            logger.warning(f"数据库连接健康检查失败，重新建立连接: {e}")
+            return False
+
+    def _discard_connection(self, conn: sqlite3.Connection):
+        """从连接池中移除并关闭连接"""
+        with self._pool_lock:
+            self._pool_connections.pop(id(conn), None)
+            self._pool_last_used.pop(id(conn), None)
+            self._pool_owner.pop(id(conn), None)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _register_connection(self) -> sqlite3.Connection:
+        conn = self._create_connection()
+        with self._pool_lock:
+            self._pool_connections[id(conn)] = conn
+            self._pool_last_used[id(conn)] = time.monotonic()
+        return conn
+
+    def _reap_dead_thread_connections(self):
+        """关闭已结束线程遗留的连接（thread 模式）"""
+        with self._pool_lock:
+            dead = [self._pool_connections[conn_id] for conn_id, owner in self._pool_owner.items()
+                    if not owner.is_alive() and conn_id in self._pool_connections]
+        for conn in dead:
+            self._discard_connection(conn)
+
+    def _acquire_connection(self) -> sqlite3.Connection:
+        """从连接池取出连接"""
+        if self._pool_closed:
+            raise sqlite3.ProgrammingError("连接池已关闭")
+        # fork 出的子进程不能复用父进程的连接
+        if self._pool_pid != os.getpid():
+            self._init_pool_state()
+
+        if self.pool_mode == self.POOL_MODE_THREAD:
+            conn = getattr(self._pool_local, 'conn', None)
+            if conn is not None and not self._is_connection_healthy(conn):
+                self._discard_connection(conn)
+                conn = None
+            if conn is None:
+                self._reap_dead_thread_connections()
+                conn = self._register_connection()
+                with self._pool_lock:
+                    self._pool_owner[id(conn)] = threading.current_thread()
+                self._pool_local.conn = conn
+            return conn
+
+        # bounded 模式
+        while True:
+            try:
+                conn = self._pool_idle.get_nowait()
+            except queue.Empty:
+                with self._pool_lock:
+                    can_create = len(self._pool_connections) < self.pool_size
+                if can_create:
+                    return self._register_connection()
+                try:
+                    conn = self._pool_idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError(f"等待数据库连接超时({self.timeout}秒)，连接池大小: {self.pool_size}")
+            if self._is_connection_healthy(conn):
+                return conn
+            self._discard_connection(conn)
+
+    def _release_connection(self, conn: sqlite3.Connection):
+        """归还连接到连接池"""
+        with self._pool_lock:
+            if id(conn) not in self._pool_connections:
+                return
+            self._pool_last_used[id(conn)] = time.monotonic()
+        if self._pool_closed:
+            self._discard_connection(conn)
+        elif self.pool_mode == self.POOL_MODE_BOUNDED:
+            self._pool_idle.put(conn)
+
+    @classmethod
+    def set_default_profiler(cls, profiler: Optional[QueryProfiler]):
+        """为所有未单独指定剖析器的实例开启（传 None 关闭）查询剖析"""
+        cls.default_profiler = profiler
+
+    @property
+    def active_profiler(self) -> Optional[QueryProfiler]:
+        return self.profiler if self.profiler is not None else self.default_profiler
+
+    @contextmanager
+    def get_connection(self,
+                       row_factory: Optional[callable] = None,
+                       isolation_level: Optional[str] = None) -> Generator[sqlite3.Connection, None, None]:
+        """获取数据库连接的上下文管理器，开启查询剖析时返回记录每条语句的包装连接"""
+        profiler = self.active_profiler
+        if profiler is None:
+            with self._get_connection(row_factory, isolation_level) as conn:
+                yield conn
+            return
+        with self._get_connection(row_factory, isolation_level) as conn:
+            profiled = ProfiledConnection(conn, profiler)
+            try:
+                yield profiled
+            finally:
+                profiled.finish()
 
+    @contextmanager
+    def _get_connection(self,
+                        row_factory: Optional[callable] = None,
+                        isolation_level: Optional[str] = None) -> Generator[sqlite3.Connection, None, None]:
+        """获取原始连接：非连接池模式新建连接，否则从连接池借出"""
+        if self.pool_mode is None:
+            conn = None
+            try:
+                conn = self._create_connection(isolation_level=isolation_level)
+
+                if row_factory:
+                    conn.row_factory = row_factory
+
+                yield conn
+
+            except Exception as e:
+                if conn:
+                    conn.rollback()
+                logger.error(f"Database error: {e}")
+                raise
+            finally:
+                if conn:
+                    conn.close()
+            return
+
+        lease = getattr(self._pool_local, 'lease', None)
+        if lease is not None and lease['depth'] > 0:
+            # 同一线程嵌套借用：复用外层的连接，不改动隔离级别（改为 None 会隐式提交外层事务），
+            # 回滚、恢复设置与归还只在最后一个借用方退出时进行
+            conn = lease['conn']
+            with self._pool_lock:
+                lease['depth'] += 1
+            old_row_factory = conn.row_factory
+            try:
+                if row_factory:
+                    conn.row_factory = row_factory
+                yield conn
+            finally:
+                conn.row_factory = old_row_factory
+                self._end_lease(lease)
+            return
+
+        conn = self._acquire_connection()
+        # 借用记录放在线程局部变量中；流式查询可能在其他线程关闭，深度计数在 _pool_lock 下增减
+        lease = {'conn': conn, 'depth': 1, 'row_factory': conn.row_factory,
+                 'isolation_level': conn.isolation_level}
+        self._pool_local.lease = lease
+        try:
             if row_factory:
                 conn.row_factory = row_factory
-
-            # WAL模式提供更好的并发性
-            conn.execute('PRAGMA journal_mode=WAL')
-            conn.execute('PRAGMA foreign_keys = ON')
+            if conn.isolation_level != isolation_level:
+                conn.isolation_level = isolation_level
 
             yield conn
 
         except Exception as e:
-            if conn:
-                conn.rollback()
+            conn.rollback()
             logger.error(f"Database error: {e}")
             raise
         finally:
-            if conn:
-                conn.close()
+            self._end_lease(lease)
+
+    def _end_lease(self, lease: Dict[str, Any]):
+        """借用方退出：深度减为 0 时回滚未提交的事务、恢复连接设置并归还连接"""
+        with self._pool_lock:
+            lease['depth'] -= 1
+            if lease['depth'] > 0:
+                return
+        conn = lease['conn']
+        try:
+            # 未提交的事务在归还前回滚，与非连接池模式下关闭连接的行为一致
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = lease['row_factory']
+            if conn.isolation_level != lease['isolation_level']:
+                conn.isolation_level = lease['isolation_level']
+            self._release_connection(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"归还数据库连接失败，丢弃该连接: {e}")
+            if self.pool_mode == self.POOL_MODE_THREAD:
+                self._pool_local.conn = None
+            self._discard_connection(conn)
 
     @contextmanager
     def execute_transaction(self, auto_commit: bool = True) -> Generator[sqlite3.Cursor, None, None]:
@@ -66,6 +413,119 @@ class SQLiteManager:
     def quote_ident(self, name: str) -> str:
         """用双引号安全引用 SQLite 标识符（表名或列名）。"""
         return '"' + name.replace('"', '""') + '"'
+
+    # ==================== 表结构目录缓存 ====================
+
+    def _load_schema_catalog(self, cursor: sqlite3.Cursor) -> Dict[str, Dict[str, Any]]:
+        """
+        读取所有表/视图的结构
+
+        Returns:
+            {表名: {"type": 'table'/'view', "columns": [列名], "has_time": bool,
+                    "meta": {item_name: description} 或 None,
+                    "partitioned": 分区逻辑表的 {granularity, columns, with_time_ms, with_row_counts,
+                                   partitions: [(分区表名, start_ms, end_ms)]} 或 None,
+                    "partition_of": 物理分区所属的逻辑表名或 None}}
+        """
+        cursor.execute("SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view')")
+        catalog: Dict[str, Dict[str, Any]] = {}
+        for name, typ in cursor.fetchall():
+            cursor.execute(f"PRAGMA table_info({self.quote_ident(name)})")
+            columns = [r[1] for r in cursor.fetchall()]
+            catalog[name] = {
+                "type": typ,
+                "columns": columns,
+                "has_time": self.TIME_COLUMN_NAME in columns,
+                "meta": None,
+                "partitioned": None,
+                "partition_of": None
+            }
+
+        # xxx_meta 表保存了 xxx 表的字段描述
+        for name, info in catalog.items():
+            if not name.endswith("_meta") or name[:-len("_meta")] not in catalog:
+                continue
+            if "item_name" not in info["columns"] or "description" not in info["columns"]:
+                continue
+            cursor.execute(f"SELECT item_name, description FROM {self.quote_ident(name)}")
+            catalog[name[:-len("_meta")]]["meta"] = dict(cursor.fetchall())
+
+        # 分区逻辑表（视图）及其物理分区
+        if self.PARTITIONED_TABLE_NAME in catalog and self.PARTITION_TABLE_NAME in catalog:
+            cursor.execute(f"SELECT logical_name, granularity, columns, with_time_ms, with_row_counts "
+                           f"FROM {self.quote_ident(self.PARTITIONED_TABLE_NAME)}")
+            for logical_name, granularity, columns_json, with_time_ms, with_row_counts in cursor.fetchall():
+                if logical_name not in catalog:
+                    continue
+                catalog[logical_name]["partitioned"] = {
+                    "granularity": granularity,
+                    "columns": json.loads(columns_json),
+                    "with_time_ms": bool(with_time_ms),
+                    "with_row_counts": bool(with_row_counts),
+                    "partitions": []
+                }
+            cursor.execute(f"SELECT logical_name, partition_name, start_ms, end_ms "
+                           f"FROM {self.quote_ident(self.PARTITION_TABLE_NAME)} ORDER BY start_ms")
+            for logical_name, partition_name, start_ms, end_ms in cursor.fetchall():
+                spec = catalog.get(logical_name, {}).get("partitioned")
+                if spec is None or partition_name not in catalog:
+                    continue
+                spec["partitions"].append((partition_name, start_ms, end_ms))
+                catalog[partition_name]["partition_of"] = logical_name
+        return catalog
+
+    def get_schema_catalog(self) -> Dict[str, Dict[str, Any]]:
+        """
+        获取表结构目录，仅在 PRAGMA schema_version 变化时重新加载（结构见 _load_schema_catalog）
+
+        在 _catalog_scope 内直接返回进入时解析的目录，不再为每次查找读取 schema_version
+        """
+        pinned = getattr(self._schema_local, 'catalog', None)
+        if pinned is not None:
+            return pinned
+        with self.execute_transaction(auto_commit=True) as cursor:
+            cursor.execute("PRAGMA schema_version")
+            version = cursor.fetchone()[0]
+            with self._schema_lock:
+                if self._schema_catalog is None or self._schema_version != version:
+                    self._schema_catalog = self._load_schema_catalog(cursor)
+                    self._schema_version = version
+                return self._schema_catalog
+
+    @contextmanager
+    def _catalog_scope(self):
+        """
+        只读查询的入口在此范围内执行：表结构目录只解析一次（一次 schema_version 检查），
+        内部的 has_time_ms / _time_range_condition / _table_source 等查找都复用它；嵌套时沿用外层
+        """
+        if getattr(self._schema_local, 'catalog', None) is not None:
+            yield
+            return
+        self._schema_local.catalog = self.get_schema_catalog()
+        try:
+            yield
+        finally:
+            self._schema_local.catalog = None
+
+    def invalidate_schema_catalog(self):
+        """使表结构目录缓存失效（_meta 表内容变化不会改变 schema_version，需要手动失效）"""
+        with self._schema_lock:
+            self._schema_catalog = None
+            self._schema_version = None
+
+    def _invalidate_meta_cache(self, table_name: str):
+        if table_name.endswith("_meta"):
+            self.invalidate_schema_catalog()
+
+    def get_table_columns(self, table_name: str) -> Optional[List[str]]:
+        """从表结构目录中获取表的列名，表不存在时返回 None"""
+        info = self.get_schema_catalog().get(table_name)
+        return list(info["columns"]) if info else None
+
+    def get_table_meta(self, table_name: str) -> Optional[Dict[str, str]]:
+        """从表结构目录中获取 xxx_meta 表的 {item_name: description}，没有描述表时返回 None"""
+        info = self.get_schema_catalog().get(table_name)
+        return dict(info["meta"]) if info and info["meta"] is not None else None
     def get_tables_with_time_sql_results(self,select_column_name:list=None, exclude_substr: list = None, columns: list = None):
         """
                 返回数据库中不包含 exclude_substr（不区分大小写）的数据库返回结果，并且该表具有 columns列。
@@ -126,44 +586,54 @@ class SQLiteManager:
             exclude_substr = ["meta", "Epoch_data"]
         if columns is None:
             columns = ['time']
-        rows = self.get_tables_with_time_sql_results(select_column_name=select_column_name,exclude_substr=exclude_substr,columns=columns)
-        with self.execute_transaction(auto_commit=True) as cursor:
-            tables = [r[0] for r in rows]
-
-            good = []
-            for table_name in tables:
-                try:
-                    q = self.quote_ident(table_name)
-                    cursor.execute(f"PRAGMA table_info({q})")
-                    table_info = cursor.fetchall()
-                    cols = [r[1] for r in table_info]
-
-                    # 检查是否包含所有required columns（不区分大小写）
-                    cols_lower = [col.lower() for col in cols]
-                    if all([column.lower() in cols_lower for column in columns]):
-                        good.append(table_name)
-
-                except Exception as e:
-                    # 记录错误但继续处理其他表
-                    print(f"检查表 {table_name} 时出错: {e}")
-                    continue
-
-            return good
-
-    def build_all_times_sql(self, tables: List[str]) -> str:
-        """构造用于 all_times 的子查询 SQL（UNION 去重）。"""
-        selects = [f"SELECT time FROM {self.quote_ident(t)}" for t in tables]
+        # 从表结构目录中筛选，不再逐表执行 PRAGMA table_info
+        catalog = self.get_schema_catalog()
+        exclude_lower = [substr.lower() for substr in exclude_substr]
+        good = []
+        for table_name, info in catalog.items():
+            name_lower = table_name.lower()
+            if any(substr in name_lower for substr in exclude_lower):
+                continue
+            # 物理分区通过其逻辑表访问
+            if info["partition_of"] is not None:
+                continue
+            # 检查是否包含所有required columns（不区分大小写）
+            cols_lower = [col.lower() for col in info["columns"]]
+            if all([column.lower() in cols_lower for column in columns]):
+                good.append(table_name)
+
+        return good
+
+    def build_all_times_sql(self, tables: List[str], sources: Optional[Dict[str, str]] = None) -> str:
+        """构造用于 all_times 的子查询 SQL（UNION 去重）；sources 为 {表名: FROM 子句}"""
+        selects = [f"SELECT time FROM {sources[t] if sources else self.quote_ident(t)}" for t in tables]
         return " UNION ".join(selects)
 
-    def count_all_times(self, all_times_sql: str) -> int:
+    def _build_ranged_all_times_sql(self, tables: List[str], start_time: float, end_time: float,
+                                    sources: Optional[Dict[str, str]] = None):
+        """构造时间范围内 all_times 子查询（UNION 去重），返回 (sql, 参数列表)；sources 为 {表名: FROM 子句}"""
+        selects = []
+        params: list = []
+        for t in tables:
+            condition, condition_params, _ = self._time_range_condition(t, start_time, end_time)
+            source = sources[t] if sources else self._table_source(t, start_time, end_time)
+            selects.append(f"SELECT time FROM {source} WHERE {condition}")
+            params.extend(condition_params)
+        return " UNION ".join(selects), params
+
+    def count_all_times(self, all_times_sql: str, params: Optional[Sequence[Any]] = None) -> int:
         """统计 all_times 的行数（即所有表 time 的并集大小）。"""
         count_sql = f"SELECT COUNT(*) FROM ({all_times_sql}) AS _all_times_count"
         with self.execute_transaction(auto_commit=True) as cursor:
-            cursor.execute(count_sql)
+            cursor.execute(count_sql, params or ())
             return cursor.fetchone()[0] or 0
 
     def query_counts_conditions(self, table_name: str, conditions: str = "") -> int:
-        """查询数据条数"""
+        """查询数据条数，无条件且已启用行数统计时直接读取统计值"""
+        if not conditions.strip():
+            maintained = self.get_maintained_row_count(table_name)
+            if maintained is not None:
+                return maintained
         sql = f"""SELECT COUNT(*) FROM "{table_name}" """
         sql += conditions
         with self.execute_transaction(auto_commit=True) as cursor:
@@ -219,9 +689,16 @@ class SQLiteManager:
             "rows": result_rows
         }
 
-    def query_joined_by_time(self, tables: List[str], page: int = 1, page_size: int = 100, order_asc: bool = True) -> \
-    Dict[str, Any]:
-        """把传入的表按 time 字段联立并分页返回结果"""
+    @_catalog_scoped
+    def query_joined_by_time(self, tables: List[str], page: int = 1, page_size: int = 100, order_asc: bool = True,
+                             columnar: bool = False, start_time: Optional[float] = None,
+                             end_time: Optional[float] = None) -> Dict[str, Any]:
+        """
+        把传入的表按 time 字段联立并分页返回结果，columnar=True 时 rows 为 {列名: NumPy 数组}
+
+        start_time/end_time: 可选的时间范围（秒级时间戳），同时给出时只联立范围内的数据，分区表只扫描重叠的分区
+        范围内（不给范围时为全部）已归档的数据（见 archive_older_than）一并联立
+        """
         if page_size <= 0:
             raise ValueError("page_size must be > 0")
         if not tables:
@@ -234,38 +711,31 @@ class SQLiteManager:
                 "rows": []
             }
 
-        all_times_sql = self.build_all_times_sql(tables)
-        total_items = self.count_all_times(all_times_sql)
-        total_pages = max(1, math.ceil(total_items / page_size)) if total_items > 0 else 0
-
-        if total_pages == 0:
-            page = 1
+        ranged = start_time is not None and end_time is not None
+        if ranged:
+            overlay = self._prepare_archive_overlay(tables, start_time, end_time)
+            sources = self._with_archive_sources(
+                {t: self._table_source(t, start_time, end_time) for t in tables}, overlay)
+            all_times_sql, time_params = self._build_ranged_all_times_sql(tables, start_time, end_time, sources)
         else:
-            page = max(1, min(page, total_pages))
-
-        offset = (page - 1) * page_size
-
-        with self.execute_transaction(auto_commit=True) as cursor:
-            # 构造 SELECT 列与 JOIN 子句
-            select_cols = [f"all_times.time AS {self.quote_ident('time')}"]
-            join_clauses = []
-
-            for t in tables:
-                q_t = self.quote_ident(t)
-                cursor.execute(f"PRAGMA table_info({q_t})")
-                col_rows = cursor.fetchall()
-                col_names = [r[1] for r in col_rows]
-
-                for col in col_names:
-                    if col == "time":
-                        continue
-                    alias = f"{t}__{col}"
-                    select_cols.append(f"{q_t}.{self.quote_ident(col)} AS {self.quote_ident(alias)}")
-
-                join_clauses.append(f"LEFT JOIN {q_t} ON {q_t}.time = all_times.time")
+            overlay = self._prepare_archive_overlay(tables)
+            sources = self._with_archive_sources({t: self.quote_ident(t) for t in tables}, overlay)
+            all_times_sql, time_params = self.build_all_times_sql(tables, sources), []
+
+        # 构造 SELECT 列与 JOIN 子句
+        select_clause, join_clause = self._build_joined_select(tables, sources)
+        # 归档数据只存在于本连接的临时表中，计数与分页查询在同一个连接上执行
+        with self.execute_transaction(auto_commit=True) as cursor, self._archive_overlay(cursor, overlay):
+            cursor.execute(f"SELECT COUNT(*) FROM ({all_times_sql}) AS _all_times_count", time_params)
+            total_items = cursor.fetchone()[0] or 0
+            total_pages = max(1, math.ceil(total_items / page_size)) if total_items > 0 else 0
+
+            if total_pages == 0:
+                page = 1
+            else:
+                page = max(1, min(page, total_pages))
 
-            select_clause = ",\n  ".join(select_cols)
-            join_clause = "\n  ".join(join_clauses)
+            offset = (page - 1) * page_size
             order = "DESC" if order_asc else "ASC"
 
             final_sql = f"""
@@ -278,11 +748,15 @@ class SQLiteManager:
             LIMIT ? OFFSET ?
             """
 
-            cursor.execute(final_sql, (page_size, offset))
-            rows = cursor.fetchall()
+            cursor.execute(final_sql, time_params + [page_size, offset])
             colnames = [desc[0] for desc in cursor.description]
+            if columnar:
+                result_rows = self._columnar_from_cursor(cursor)
+            else:
+                rows = cursor.fetchall()
 
-        result_rows = [dict(zip(colnames, r)) for r in rows]
+        if not columnar:
+            result_rows = [dict(zip(colnames, r)) for r in rows]
 
         return {
             "total_items": total_items,
@@ -293,6 +767,270 @@ class SQLiteManager:
             "rows": result_rows
         }
 
+    def _build_joined_select(self, tables: List[str], sources: Optional[Dict[str, str]] = None):
+        """构造按 all_times.time 联立多表的 SELECT 列与 LEFT JOIN 子句，sources 为 {表名: FROM 子句}（分区裁剪）"""
+        select_cols = [f"all_times.time AS {self.quote_ident('time')}"]
+        join_clauses = []
+        catalog = self.get_schema_catalog()
+
+        for t in tables:
+            q_t = self.quote_ident(t)
+            col_names = catalog[t]["columns"] if t in catalog else []
+
+            for col in col_names:
+                if col in ("time", self.TIME_MS_COLUMN_NAME):
+                    continue
+                alias = f"{t}__{col}"
+                select_cols.append(f"{q_t}.{self.quote_ident(col)} AS {self.quote_ident(alias)}")
+
+            if sources and sources.get(t, q_t) != q_t:
+                join_clauses.append(f"LEFT JOIN {sources[t]} AS {q_t} ON {q_t}.time = all_times.time")
+            else:
+                join_clauses.append(f"LEFT JOIN {q_t} ON {q_t}.time = all_times.time")
+
+        return ",\n  ".join(select_cols), "\n  ".join(join_clauses)
+
+    # ==================== 游标（keyset）分页 ====================
+    # 游标令牌为 base64(json) 的不透明字符串：
+    #   d: 翻页方向 'next'/'prev'
+    #   k: 分页边界的排序键 [time] 或 [time, rowid]
+    #   o: 排序方向 'desc'/'asc'，与调用时不一致的令牌视为无效
+
+    def _encode_page_token(self, direction: str, key: list, descending: bool) -> str:
+        payload = {"d": direction, "k": key, "o": "desc" if descending else "asc"}
+        raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii")
+
+    def _decode_page_token(self, token: str, descending: bool) -> Dict[str, Any]:
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8"))
+            direction = payload["d"]
+            key = payload["k"]
+            order = payload["o"]
+        except Exception as e:
+            raise ValueError(f"无效的分页令牌: {e}")
+        if direction not in ("next", "prev") or not isinstance(key, list) or not key:
+            raise ValueError("无效的分页令牌")
+        if order != ("desc" if descending else "asc"):
+            raise ValueError("分页令牌的排序方向与本次查询不一致")
+        return payload
+
+    def _resolve_keyset_page(self, token: Optional[str], last: bool, descending: bool):
+        """
+        根据令牌计算本次查询的扫描方向与边界
+
+        Returns:
+            (scan_desc, bound_key, direction) scan_desc 为 SQL 实际扫描方向，
+            direction 为 'first' / 'last' / 'next' / 'prev'
+        """
+        if last:
+            return not descending, None, "last"
+        if token is None:
+            return descending, None, "first"
+        payload = self._decode_page_token(token, descending)
+        if payload["d"] == "next":
+            return descending, payload["k"], "next"
+        return not descending, payload["k"], "prev"
+
+    def _build_keyset_page_result(self, rows: list, key_func, page_size: int, descending: bool,
+                                  direction: str, colnames: List[str], total_items: Optional[int]) -> Dict[str, Any]:
+        """多取一行判断是否还有下一页，并按展示顺序生成前后页令牌"""
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        # prev / last 方向是反向扫描得到的，需要翻转回展示顺序
+        if direction in ("prev", "last"):
+            rows.reverse()
+
+        if direction in ("first", "next"):
+            has_prev = direction == "next"
+            has_next = has_more
+        else:
+            has_prev = has_more
+            has_next = direction == "prev"
+
+        next_token = None
+        prev_token = None
+        if rows:
+            if has_next:
+                next_token = self._encode_page_token("next", key_func(rows[-1]), descending)
+            if has_prev:
+                prev_token = self._encode_page_token("prev", key_func(rows[0]), descending)
+
+        return {
+            "total_items": total_items,
+            "page_size": page_size,
+            "columns": colnames,
+            "rows": rows,
+            "has_next": has_next,
+            "has_prev": has_prev,
+            "next_token": next_token,
+            "prev_token": prev_token
+        }
+
+    def approximate_table_count(self, table_name: str) -> int:
+        """
+        估算表行数：已启用行数统计时返回准确值，
+        否则用 MAX(rowid)-MIN(rowid)+1 估算（走主键 B 树两端，O(log n)），删除过数据时偏大；
+        分区逻辑表为各分区估算值之和，其他视图没有 rowid，使用 COUNT(*)
+        """
+        info = self.get_schema_catalog().get(table_name)
+        if info is not None and info["partitioned"] is not None:
+            return sum(self.approximate_table_count(name) for name, _, _ in info["partitioned"]["partitions"])
+        maintained = self.get_maintained_row_count(table_name)
+        if maintained is not None:
+            return maintained
+        if info is not None and info["type"] == 'view':
+            return self.query_counts_conditions(table_name)
+        q_t = self.quote_ident(table_name)
+        with self.execute_transaction(auto_commit=True) as cursor:
+            cursor.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {q_t}")
+            min_id, max_id = cursor.fetchone()
+        if min_id is None:
+            return 0
+        return max_id - min_id + 1
+
+    @_catalog_scoped
+    def query_Epoch_datas_keyset(self, table: str, page_size: int = 100, token: Optional[str] = None,
+                                 last: bool = False, descending: bool = True,
+                                 total_mode: Optional[str] = None) -> Dict[str, Any]:
+        """
+        基于 time 字段的游标分页，按 (time, rowid) 定位，不使用 OFFSET；
+        分区逻辑表（视图）没有 rowid，按 (time, 物理分区中的 rowid) 定位（同一 time 必然落在同一分区）；
+        已归档的数据一并分页，只载入本页需要的归档行
+
+        Args:
+            table: 表名
+            page_size: 每页条数
+            token: 上一次结果中的 next_token / prev_token，None 表示第一页
+            last: 是否跳到最后一页（忽略 token）
+            descending: 是否按时间倒序（最新数据在前）
+            total_mode: None 不统计总数；'approx' 估算；'exact' 使用 COUNT(*)
+
+        Returns:
+            dict: total_items, page_size, columns, rows, has_next, has_prev, next_token, prev_token
+        """
+        if page_size <= 0:
+            raise ValueError("page_size must be > 0")
+        if not table:
+            return self._build_keyset_page_result([], None, page_size, descending, "first", [], 0)
+
+        scan_desc, bound_key, direction = self._resolve_keyset_page(token, last, descending)
+        q_t = self.quote_ident(table)
+        order = "DESC" if scan_desc else "ASC"
+        info = self.get_schema_catalog().get(table)
+        # 归档行的 rowid 见 _prepare_keyset_archive_overlay，与数据库中的 rowid 不重叠
+        overlay = self._prepare_keyset_archive_overlay([table], bound_key, scan_desc, page_size + 1, row_ids=True)
+        archive_source = f"temp.{self.quote_ident(self._archive_temp_name(table))}"
+        if info is not None and info["partitioned"] is not None:
+            # 视图的 rowid 为 NULL，改为从各物理分区取 rowid 作为同一 time 内的次序
+            partitions = [name for name, _, _ in info["partitioned"]["partitions"]]
+            columns_sql = ', '.join(self.quote_ident(c) for c in info["columns"])
+            selects = [f"SELECT rowid AS _keyset_rowid, {columns_sql} FROM {self.quote_ident(p)}" for p in partitions]
+            if overlay:
+                selects.append(f"SELECT rowid AS _keyset_rowid, {columns_sql} FROM {archive_source}")
+            if selects:
+                source = "(" + self._union_all_sql(selects) + ")"
+            else:
+                source = f"(SELECT NULL AS _keyset_rowid, * FROM {q_t} WHERE 0)"
+            select_sql, tie_column = f"SELECT * FROM {source}", "_keyset_rowid"
+        elif overlay:
+            select_sql = (f"SELECT * FROM (SELECT rowid AS _keyset_rowid, * FROM {q_t} "
+                          f"UNION ALL SELECT rowid AS _keyset_rowid, * FROM {archive_source})")
+            tie_column = "_keyset_rowid"
+        else:
+            select_sql, tie_column = f"SELECT rowid AS _keyset_rowid, * FROM {q_t}", "rowid"
+        where_clause = ""
+        params: list = []
+        if bound_key is not None:
+            if len(bound_key) != 2:
+                raise ValueError("无效的分页令牌")
+            where_clause = f"WHERE (time, {tie_column}) {'<' if scan_desc else '>'} (?, ?)"
+            params.extend(bound_key)
+        params.append(page_size + 1)
+
+        final_sql = f"""
+           {select_sql}
+           {where_clause}
+           ORDER BY time {order}, {tie_column} {order}
+           LIMIT ?
+        """
+
+        with self.execute_transaction(auto_commit=True) as cursor, self._archive_overlay(cursor, overlay):
+            cursor.execute(final_sql, params)
+            rows = cursor.fetchall()
+            colnames = [desc[0] for desc in cursor.description][1:]
+
+        total_items = None
+        if total_mode == "exact":
+            total_items = self.query_counts_conditions(table) + self._count_archived(table)
+        elif total_mode == "approx":
+            total_items = self.approximate_table_count(table) + self._count_archived(table)
+
+        result = self._build_keyset_page_result(rows, lambda r: [r[colnames.index("time") + 1], r[0]],
+                                                page_size, descending, direction, colnames, total_items)
+        result["rows"] = [dict(zip(colnames, r[1:])) for r in result["rows"]]
+        return result
+
+    @_catalog_scoped
+    def query_joined_by_time_keyset(self, tables: List[str], page_size: int = 100, token: Optional[str] = None,
+                                    last: bool = False, descending: bool = True,
+                                    total_mode: Optional[str] = None) -> Dict[str, Any]:
+        """
+        把传入的表按 time 字段联立，并基于 time 游标分页（time 的并集天然唯一），已归档的数据一并联立
+
+        参数与返回值同 query_Epoch_datas_keyset；total_mode='approx' 时取各表估算行数的最大值
+        """
+        if page_size <= 0:
+            raise ValueError("page_size must be > 0")
+        if not tables:
+            return self._build_keyset_page_result([], None, page_size, descending, "first", [], 0)
+
+        scan_desc, bound_key, direction = self._resolve_keyset_page(token, last, descending)
+        order = "DESC" if scan_desc else "ASC"
+        overlay = self._prepare_keyset_archive_overlay(tables, bound_key, scan_desc, page_size + 1)
+        sources = self._with_archive_sources({t: self.quote_ident(t) for t in tables}, overlay)
+        time_selects = []
+        params: list = []
+        for t in tables:
+            if bound_key is not None:
+                time_selects.append(f"SELECT time FROM {sources[t]} WHERE time {'<' if scan_desc else '>'} ?")
+                params.append(bound_key[0])
+            else:
+                time_selects.append(f"SELECT time FROM {sources[t]}")
+        params.append(page_size + 1)
+        page_times_sql = " UNION ".join(time_selects) + f" ORDER BY time {order} LIMIT ?"
+
+        select_clause, join_clause = self._build_joined_select(tables, sources)
+        with self.execute_transaction(auto_commit=True) as cursor, self._archive_overlay(cursor, overlay):
+            final_sql = f"""
+            SELECT
+              {select_clause}
+            FROM
+              ({page_times_sql}) AS all_times
+              {join_clause}
+            ORDER BY all_times.time {order}
+            """
+            cursor.execute(final_sql, params)
+            rows = cursor.fetchall()
+            colnames = [desc[0] for desc in cursor.description]
+
+        total_items = None
+        if total_mode == "exact":
+            total_overlay = self._prepare_archive_overlay(tables)
+            all_times_sql = self.build_all_times_sql(
+                tables, self._with_archive_sources({t: self.quote_ident(t) for t in tables}, total_overlay))
+            with self.execute_transaction(auto_commit=True) as cursor, \
+                    self._archive_overlay(cursor, total_overlay):
+                cursor.execute(f"SELECT COUNT(*) FROM ({all_times_sql}) AS _all_times_count")
+                total_items = cursor.fetchone()[0] or 0
+        elif total_mode == "approx":
+            total_items = max(self.approximate_table_count(t) + self._count_archived(t) for t in tables)
+
+        result = self._build_keyset_page_result(rows, lambda r: [r[0]], page_size, descending, direction,
+                                                colnames, total_items)
+        result["rows"] = [dict(zip(colnames, r)) for r in result["rows"]]
+        return result
+
     def convert_to_foreign_key_sql(self, foreign_key_dict: dict) -> str:
         """将 foreign_key_dict 转换成 SQL 外键约束语句"""
         foreign_keys = []
@@ -309,73 +1047,97 @@ class SQLiteManager:
 
         return ",\n".join(foreign_keys)
 
+    @_catalog_scoped
     def get_multi_table_data(self, table_names: List[str], start_time: float, end_time: float,
-                             join_type: str = "union"):
-        """从多个SQLite表中获取指定时间范围的数据"""
-        try:
-            valid_tables = []
-            table_columns = {}
-
-            with self.execute_transaction(auto_commit=True) as cursor:
-                for table in table_names:
-                    try:
-                        # 检查表是否存在
-                        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
-                        if not cursor.fetchone():
-                            continue
-
-                        # 获取表的列信息
-                        cursor.execute(f"PRAGMA table_info({table})")
-                        columns_info = cursor.fetchall()
-                        columns = [col[1] for col in columns_info]
-
-                        if self.TIME_COLUMN_NAME not in columns:
-                            continue
-
-                        other_columns = [col for col in columns if col not in ['id', 'time']]
+                             join_type: str = "union", stream: bool = False, fill: str = "null",
+                             tolerance: Optional[float] = None, columnar: bool = False):
+        """
+        从多个SQLite表中获取指定时间范围的数据
 
-                        if other_columns:
-                            valid_tables.append(table)
-                            table_columns[table] = other_columns
+        columnar: join_type 为 'union' / 'join' 时，结果以 {列名: NumPy 数组} 代替行元组列表返回
+        时间范围内已归档的数据（见 archive_older_than）与数据库中的数据一并返回
 
-                    except sqlite3.OperationalError as e:
-                        logger.error(f"检查表 {table} 时出错: {e}")
-                        continue
+        join_type 为 'join' 时：
+            stream: True 时返回 (行生成器, 列名)，内存占用与时间范围无关
+            fill: 某个时间点上缺失的表取 None（'null'）或沿用该表上一次的值（'ffill'）
+            tolerance: ffill 的最大回溯秒数（as-of 容差），None 表示不限制
+        """
+        try:
+            valid_tables, table_columns = self._resolve_time_tables(table_names)
 
             if not valid_tables:
-                return [], []
+                return ({}, []) if columnar else ([], [])
+
+            # separate 查询的范围多 10 秒，这里按最大范围载入归档数据
+            overlay = self._prepare_archive_overlay(valid_tables, start_time, end_time + 10)
+
+            if columnar and join_type.lower() == "union":
+                if overlay:
+                    rows, column_names = self._union_query(valid_tables, table_columns, start_time, end_time,
+                                                           overlay=overlay)
+                    return self._columnar_from_batches(column_names, [rows]), column_names
+                sql, params = self._build_union_sql(valid_tables, table_columns, start_time, end_time)
+                with self.iter_query(sql, params) as stream:
+                    return self._columnar_from_batches(stream.columns, stream), stream.columns
+            if columnar and join_type.lower() not in ("union", "separate"):
+                rows, column_names = self._join_query(valid_tables, table_columns, start_time, end_time,
+                                                      stream=True, fill=fill, tolerance=tolerance, overlay=overlay)
+                return self._columnar_from_batches(column_names, self._iter_row_chunks(rows, 1000)), column_names
 
             if join_type.lower() == "union":
-                return self._union_query(valid_tables, table_columns, start_time, end_time)
+                return self._union_query(valid_tables, table_columns, start_time, end_time, overlay=overlay)
             elif join_type.lower() == "separate":
-                return self._separate_queries(valid_tables, table_columns, start_time, end_time)
+                return self._separate_queries(valid_tables, table_columns, start_time, end_time, overlay=overlay)
             else:
-                return self._join_query(valid_tables, table_columns, start_time, end_time)
+                return self._join_query(valid_tables, table_columns, start_time, end_time,
+                                        stream=stream, fill=fill, tolerance=tolerance, overlay=overlay)
 
         except Exception as e:
             logger.error(f"查询过程中出现错误: {e}")
-            return [], []
+            return ({}, []) if columnar else ([], [])
+
+    def _resolve_time_tables(self, table_names: List[str]):
+        """筛选存在且含 time 列的表，返回 (表名列表, {表名: 除 id/time/time_ms 外的数据列})"""
+        valid_tables = []
+        table_columns = {}
+        catalog = self.get_schema_catalog()
+
+        for table in table_names:
+            # 检查表是否存在
+            info = catalog.get(table)
+            if info is None or not info["has_time"] or (info["type"] != 'table' and info["partitioned"] is None):
+                continue
+
+            other_columns = [col for col in info["columns"] if col not in ['id', 'time', self.TIME_MS_COLUMN_NAME]]
+
+            if other_columns:
+                valid_tables.append(table)
+                table_columns[table] = other_columns
+        return valid_tables, table_columns
 
     def _separate_queries(self, tables: List[str], table_columns: Dict[str, List[str]], start_time: float,
-                          end_time: float):
-        """分别查询每个表，返回字典格式的结果"""
+                          end_time: float, overlay: Optional[Dict[str, Any]] = None):
+        """分别查询每个表，返回字典格式的结果；overlay 为 _prepare_archive_overlay 载入的归档数据"""
         results_dict = {}
         all_columns = ['time']
-        start_time_f = datetime.datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-        end_time_f = datetime.datetime.fromtimestamp(end_time +10).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        overlay = overlay or {}
+        range_conditions = {table: self._time_range_condition(table, start_time, end_time + 10) for table in tables}
+        sources = self._with_archive_sources(
+            {table: self._table_source(table, start_time, end_time + 10) for table in tables}, overlay)
 
-        with self.execute_transaction(auto_commit=True) as cursor:
+        with self.execute_transaction(auto_commit=True) as cursor, self._archive_overlay(cursor, overlay):
             for table in tables:
                 table_cols = table_columns[table]
                 column_selects = ['time'] + [f"{col} AS {table}__{col}" for col in table_cols]
+                condition, params, order_column = range_conditions[table]
                 query = f"""
                 SELECT {', '.join(column_selects)}
-                FROM {table}
-                WHERE time BETWEEN ? AND ?
-                ORDER BY time
+                FROM {sources[table]}
+                WHERE {condition}
+                ORDER BY {order_column}
                 """
 
-                cursor.execute(query, (start_time_f, end_time_f))
+                cursor.execute(query, params)
                 table_results = cursor.fetchall()
                 table_column_names = [desc[0] for desc in cursor.description]
 
@@ -393,66 +1155,376 @@ class SQLiteManager:
         all_columns.pop(0)
         return merged_results, all_columns
 
-    def _union_query(self, tables: List[str], table_columns: Dict[str, List[str]], start_time: float, end_time: float):
+    def _union_query(self, tables: List[str], table_columns: Dict[str, List[str]], start_time: float, end_time: float,
+                     overlay: Optional[Dict[str, Any]] = None):
         """使用UNION ALL合并多个表的数据"""
+        overlay = overlay or {}
+        sources = self._with_archive_sources(
+            {table: self._table_source(table, start_time, end_time) for table in tables}, overlay)
+        final_query, params = self._build_union_sql(tables, table_columns, start_time, end_time, sources)
+
+        with self.execute_transaction(auto_commit=True) as cursor, self._archive_overlay(cursor, overlay):
+            cursor.execute(final_query, params)
+            results = cursor.fetchall()
+            column_names = [desc[0] for desc in cursor.description]
+
+        return results, column_names
+
+    def _build_union_sql(self, tables: List[str], table_columns: Dict[str, List[str]], start_time: float,
+                         end_time: float, sources: Optional[Dict[str, str]] = None):
+        """构造 UNION ALL 合并多个表的 SQL，返回 (sql, 参数列表)；sources 为 {表名: FROM 子句}"""
         select_parts = []
-        start_time_f = datetime.datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-        end_time_f = datetime.datetime.fromtimestamp(end_time).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        params = []
 
         for table in tables:
             columns = table_columns[table]
             column_selects = [f"{col} AS {table}__{col}" for col in columns]
+            condition, condition_params, _ = self._time_range_condition(table, start_time, end_time)
+            params.extend(condition_params)
 
             select_part = f"""
             SELECT 
                 '{table}' AS source_table,
                 time,
                 {', '.join(column_selects)}
-            FROM {table}
-            WHERE time BETWEEN ? AND ?
+            FROM {sources[table] if sources else self._table_source(table, start_time, end_time)}
+            WHERE {condition}
             """
             select_parts.append(select_part)
 
         final_query = " UNION ALL ".join(select_parts) + " ORDER BY time"
-        params = []
-        for _ in tables:
-            params.extend([start_time_f, end_time_f])
+        return final_query, params
+
+    # ==================== 流式查询 ====================
+
+    def iter_query(self, sql: str, params: Optional[Sequence[Any]] = None, arraysize: int = 1000,
+                   cancel_event: Optional[threading.Event] = None) -> "QueryStream":
+        """
+        流式执行查询，按 fetchmany(arraysize) 分批返回元组列表
 
+        返回的 QueryStream 在创建时即执行 SQL 并持有连接，遍历结束、close() 或 cancel() 后释放。
+        用法:
+            with manager.iter_query(sql) as stream:
+                for batch in stream:
+                    ...  # stream.columns 为列名
+        """
+        return QueryStream(self, sql, params or (), arraysize, cancel_event)
+
+    def iter_table(self, table_name: str, arraysize: int = 1000,
+                   cancel_event: Optional[threading.Event] = None) -> "QueryStream":
+        """流式读取整张表：先读已归档的行（按时间顺序），再读数据库中的行（按 rowid 顺序）"""
+        overlay = self._prepare_archive_overlay([table_name])
+        source = self._with_archive_sources({table_name: self.quote_ident(table_name)}, overlay)[table_name]
+        return QueryStream(self, f"SELECT * FROM {source}", (), arraysize, cancel_event, overlay=overlay)
+
+    @_catalog_scoped
+    def stream_multi_table_data(self, table_names: List[str], start_time: float, end_time: float,
+                                arraysize: int = 1000,
+                                cancel_event: Optional[threading.Event] = None) -> Optional["QueryStream"]:
+        """
+        get_multi_table_data(join_type='union') 的流式版本，没有可查询的表时返回 None；
+        范围内已归档的数据在流的连接上载入临时表，与数据库中的数据一并按时间返回
+        """
+        valid_tables, table_columns = self._resolve_time_tables(table_names)
+        if not valid_tables:
+            return None
+        overlay = self._prepare_archive_overlay(valid_tables, start_time, end_time)
+        sources = self._with_archive_sources(
+            {table: self._table_source(table, start_time, end_time) for table in valid_tables}, overlay)
+        sql, params = self._build_union_sql(valid_tables, table_columns, start_time, end_time, sources)
+        return QueryStream(self, sql, params, arraysize, cancel_event, overlay=overlay)
+
+    # ==================== 降采样查询 ====================
+
+    DOWNSAMPLE_METHODS = ('avg', 'min', 'max', 'minmax', 'lttb')
+
+    def _bucket_aggregate(self, table: str, columns: List[str], start_time: float, end_time: float,
+                          buckets: int, method: str) -> List[tuple]:
+        """
+        在 SQL 中按等宽时间桶聚合
+
+        Returns:
+            [(time_ms, 列1, 列2, ...)]，minmax 每桶返回最小值点和最大值点两行
+        """
+        condition, params, _ = self._time_range_condition(table, start_time, end_time)
+        key_expr = self.TIME_MS_COLUMN_NAME if self.has_time_ms(table) else self._time_ms_expr('time')
+        start_ms = math.floor(start_time * 1000)
+        width_ms = max(1, math.ceil((math.floor(end_time * 1000) - start_ms + 1) / buckets))
+        q_columns = [self.quote_ident(column) for column in columns]
+
+        if method == 'avg':
+            selects = ["AVG(_k)"] + [f"AVG({c})" for c in q_columns]
+        elif method in ('min', 'max'):
+            selects = ["MIN(_k)"] + [f"{method.upper()}({c})" for c in q_columns]
+        else:
+            selects = (["MIN(_k)"] + [f"MIN({c})" for c in q_columns]
+                       + ["MAX(_k)"] + [f"MAX({c})" for c in q_columns])
+
+        sql = f"""
+        SELECT (_k - ?) / ? AS _bucket, {', '.join(selects)}
+        FROM (
+            SELECT {key_expr} AS _k, {', '.join(q_columns)}
+            FROM {self._table_source(table, start_time, end_time)}
+            WHERE {condition}
+        )
+        WHERE _k IS NOT NULL
+        GROUP BY _bucket
+        ORDER BY _bucket
+        """
         with self.execute_transaction(auto_commit=True) as cursor:
-            cursor.execute(final_query, params)
-            results = cursor.fetchall()
-            column_names = [desc[0] for desc in cursor.description]
+            cursor.execute(sql, [start_ms, width_ms] + params)
+            rows = cursor.fetchall()
 
-        return results, column_names
+        width = len(columns) + 1
+        points = []
+        for row in rows:
+            if method == 'minmax':
+                low, high = row[1:1 + width], row[1 + width:1 + 2 * width]
+                points.append(low)
+                if high[0] != low[0]:
+                    points.append(high)
+            else:
+                points.append(row[1:])
+        return points
+
+    @_catalog_scoped
+    def query_downsampled(self, table: str, columns: List[str], start_time: float, end_time: float,
+                          max_points: int = 1000, method: str = 'minmax') -> Dict[str, list]:
+        """
+        降采样查询，用于图表只需要约等于像素宽度数量的点
+
+        Args:
+            table: 表名
+            columns: 数值列名列表
+            start_time/end_time: 时间范围（秒级时间戳）
+            max_points: 最多返回的点数（通常为图表像素宽度）
+            method: 'avg' / 'min' / 'max' 每桶一个点；'minmax' 每桶最小、最大两个点（保留峰值）；
+                    'lttb' 先在 SQL 中做 minmax 预聚合，再用 LTTB 选点，按第一列选点，其余列取同一行
+
+        Returns:
+            {'time_ms': [毫秒时间戳], 列名: [值], ...}；minmax 的时间为桶内最小/最大时间，同一点各列为桶内极值
+        """
+        if method not in self.DOWNSAMPLE_METHODS:
+            raise ValueError(f"不支持的降采样方法: {method}")
+        if max_points <= 0:
+            raise ValueError("max_points must be > 0")
+        if not columns or end_time < start_time:
+            return {'time_ms': [], **{column: [] for column in columns}}
+
+        if method == 'minmax':
+            points = self._bucket_aggregate(table, columns, start_time, end_time, max(1, max_points // 2), 'minmax')
+        elif method == 'lttb':
+            # MinMax 预选 4 倍候选点，再由 LTTB 精选，内存与原始数据量无关
+            points = self._bucket_aggregate(table, columns, start_time, end_time, max_points * 2, 'minmax')
+            if len(points) > max_points:
+                indexes = number_util.lttb_indexes([p[0] for p in points], [p[1] for p in points], max_points)
+                points = [points[i] for i in indexes]
+        else:
+            points = self._bucket_aggregate(table, columns, start_time, end_time, max_points, method)
+
+        result = {'time_ms': [int(p[0]) for p in points]}
+        for i, column in enumerate(columns):
+            result[column] = [p[i + 1] for p in points]
+        return result
 
-    def _join_query(self, tables: List[str], table_columns: Dict[str, List[str]], start_time: float, end_time: float):
+    # ==================== 列式（NumPy）结果 ====================
+
+    @staticmethod
+    def _to_column_array(np, values):
+        """
+        把一列值转换为 NumPy 数组：纯数值保持整型/浮点型；含 None 的数值列转为 float64（None 为 NaN）；
+        文本/二进制等其他列为 object 数组
+        """
+        arr = np.array(values)
+        if arr.dtype.kind in "iufb":
+            return arr
+        if arr.dtype.kind in "US":
+            return np.array(values, dtype=object)
+        try:
+            return np.array(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            return np.array(values, dtype=object)
+
+    def _columnar_from_batches(self, columns: List[str], batches) -> Dict[str, Any]:
+        """由行批次直接构造 {列名: NumPy 数组}，每批转置后即转换为数组，不保留行对象"""
+        import numpy as np
+
+        chunks: Dict[str, list] = {column: [] for column in columns}
+        for batch in batches:
+            if not batch:
+                continue
+            for column, values in zip(columns, zip(*batch)):
+                chunks[column].append(self._to_column_array(np, values))
+
+        result = {}
+        for column, arrays in chunks.items():
+            if not arrays:
+                result[column] = np.array([], dtype=np.float64)
+            elif len(arrays) == 1:
+                result[column] = arrays[0]
+            else:
+                kinds = {arr.dtype.kind for arr in arrays}
+                if "O" in kinds:
+                    arrays = [arr.astype(object) for arr in arrays]
+                result[column] = np.concatenate(arrays)
+        return result
+
+    def _columnar_from_cursor(self, cursor: sqlite3.Cursor, arraysize: int = 5000) -> Dict[str, Any]:
+        """按 fetchmany 分批读取已执行的游标并构造列式结果"""
+        columns = [desc[0] for desc in cursor.description]
+
+        def batches():
+            while True:
+                rows = cursor.fetchmany(arraysize)
+                if not rows:
+                    return
+                yield rows
+
+        return self._columnar_from_batches(columns, batches())
+
+    def query_columnar(self, sql: str, params: Optional[Sequence[Any]] = None,
+                       arraysize: int = 5000) -> Dict[str, Any]:
+        """执行查询并返回 {列名: NumPy 数组}"""
+        with self.iter_query(sql, params, arraysize=arraysize) as stream:
+            return self._columnar_from_batches(stream.columns, stream)
+
+    def _join_query(self, tables: List[str], table_columns: Dict[str, List[str]], start_time: float, end_time: float,
+                    stream: bool = False, fill: str = "null", tolerance: Optional[float] = None,
+                    overlay: Optional[Dict[str, Any]] = None):
         """使用JOIN合并多个表的数据（基于time字段）"""
-        start_time_f = datetime.datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-        end_time_f = datetime.datetime.fromtimestamp(end_time).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        overlay = overlay or {}
+        if stream or len(tables) > 1:
+            column_names = ['time'] + [f"{table}__{col}" for table in tables for col in table_columns[table]]
+            rows = self.iter_join_by_time(tables, table_columns, start_time, end_time, fill=fill, tolerance=tolerance,
+                                          overlay=overlay)
+            if stream:
+                return rows, column_names
+            return list(rows), column_names
 
         if len(tables) == 1:
             table = tables[0]
             columns = table_columns[table]
             column_selects = [f"{table}.{col} AS {table}__{col}" for col in columns]
+            condition, params, order_column = self._time_range_condition(table, start_time, end_time,
+                                                                         column_prefix=f"{table}.")
+            source = self._with_archive_sources({table: self._table_source(table, start_time, end_time)},
+                                                overlay)[table]
 
             query = f"""
             SELECT 
                 {table}.time,
                 {', '.join(column_selects)}
-            FROM {table}
-            WHERE {table}.time BETWEEN ? AND ?
-            ORDER BY {table}.time
+            FROM {source} AS {table}
+            WHERE {condition}
+            ORDER BY {order_column}
             """
 
-            with self.execute_transaction(auto_commit=True) as cursor:
-                cursor.execute(query, (start_time_f, end_time_f))
+            with self.execute_transaction(auto_commit=True) as cursor, self._archive_overlay(cursor, overlay):
+                cursor.execute(query, params)
                 results = cursor.fetchall()
                 column_names = [desc[0] for desc in cursor.description]
             return results, column_names
 
-        # 多个表时使用JOIN - 实现省略，与原代码逻辑相同
-        # ... 这里需要完整实现JOIN逻辑
-        pass
+    def iter_join_by_time(self, tables: List[str], table_columns: Dict[str, List[str]], start_time: float,
+                          end_time: float, fill: str = "null", tolerance: Optional[float] = None,
+                          batch_size: int = 1000,
+                          overlay: Optional[Dict[str, Any]] = None) -> Generator[tuple, None, None]:
+        """
+        多表按 time 流式联立：每个表一次带索引的范围扫描，再在 Python 中用堆做 k 路归并
+
+        Args:
+            tables: 表名列表
+            table_columns: {表名: 数据列名列表}
+            start_time/end_time: 时间范围（秒级时间戳）
+            fill: 'null' 缺失值为 None；'ffill' 沿用该表上一次的值
+            tolerance: ffill 的最大回溯秒数，None 表示不限制
+            batch_size: 每个表每次 fetchmany 的行数
+            overlay: _prepare_archive_overlay 载入的归档数据，None 表示只查询数据库
+
+        Yields:
+            (time, 表1列1, 表1列2, ..., 表2列1, ...)，同一时间点多行时取最后一行
+        """
+        if fill not in ("null", "ffill"):
+            raise ValueError(f"不支持的缺失值填充方式: {fill}")
+        tolerance_ms = None if tolerance is None else tolerance * 1000
+
+        # 先准备好每个表的 SQL，避免持有连接时再去取连接（bounded 连接池可能死锁）
+        overlay = overlay or {}
+        table_sqls = []
+        with self._catalog_scope():
+            sources = self._with_archive_sources(
+                {table: self._table_source(table, start_time, end_time) for table in tables}, overlay)
+            for table in tables:
+                condition, params, order_column = self._time_range_condition(table, start_time, end_time)
+                # 统一用毫秒时间戳作为归并键
+                key_expr = self.TIME_MS_COLUMN_NAME if self.has_time_ms(table) else self._time_ms_expr('time')
+                columns_sql = ', '.join(self.quote_ident(col) for col in table_columns[table])
+                sql = f"""
+                SELECT {key_expr} AS _merge_key, time, {columns_sql}
+                FROM {sources[table]}
+                WHERE {condition}
+                ORDER BY {order_column}
+                """
+                table_sqls.append((sql, params))
+
+        widths = [len(table_columns[table]) for table in tables]
+        offsets = list(itertools.accumulate([0] + widths[:-1]))
+        total_width = sum(widths)
+
+        def scan(conn: sqlite3.Connection, index: int, sql: str, params: list):
+            cursor = conn.execute(sql, params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        return
+                    for row in rows:
+                        if row[0] is not None:
+                            yield row[0], index, row
+            finally:
+                cursor.close()
+
+        with self.get_connection() as conn, self._archive_overlay(conn, overlay):
+            scans = [scan(conn, i, sql, params) for i, (sql, params) in enumerate(table_sqls)]
+            try:
+                merged = heapq.merge(*scans, key=operator.itemgetter(0))
+                last_keys: List[Optional[int]] = [None] * len(tables)
+                last_values: List[Optional[tuple]] = [None] * len(tables)
+                current_key = None
+                current_time = None
+                values: list = []
+                present: List[bool] = []
+
+                def finish_row():
+                    if fill == "ffill":
+                        for i, is_present in enumerate(present):
+                            if is_present or last_keys[i] is None:
+                                continue
+                            if tolerance_ms is not None and current_key - last_keys[i] > tolerance_ms:
+                                continue
+                            values[offsets[i]:offsets[i] + widths[i]] = last_values[i]
+                    return (current_time, *values)
+
+                for key, index, row in merged:
+                    if key != current_key:
+                        if current_key is not None:
+                            yield finish_row()
+                        current_key = key
+                        current_time = row[1]
+                        values = [None] * total_width
+                        present = [False] * len(tables)
+                    data = row[2:]
+                    values[offsets[index]:offsets[index] + widths[index]] = data
+                    present[index] = True
+                    last_keys[index] = key
+                    last_values[index] = data
+
+                if current_key is not None:
+                    yield finish_row()
+            finally:
+                # 提前结束迭代时先关闭各表的游标，归档临时表才能删除
+                for table_scan in scans:
+                    table_scan.close()
 
     def process_data_to_dict(self, data_dict: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
         """将数据转换为 {'column': data} 的字典格式"""
@@ -473,14 +1545,21 @@ class SQLiteManager:
 
     def is_exist_table(self, table_name: str) -> bool:
         """查询数据表是否存在"""
-        sql = "SELECT name FROM sqlite_master WHERE type='table' AND name=?"
-        with self.execute_transaction(auto_commit=True) as cursor:
-            cursor.execute(sql, (table_name,))
-            result = cursor.fetchone()
-            return result is not None
+        info = self.get_schema_catalog().get(table_name)
+        return info is not None and (info["type"] == 'table' or info["partitioned"] is not None)
 
-    def create_table(self, table_name: str, columns: Dict[str, str], foreign_key_dict: Optional[dict] = None):
-        """创建表"""
+    def create_table(self, table_name: str, columns: Dict[str, str], foreign_key_dict: Optional[dict] = None,
+                     with_time_ms: bool = False, with_row_counts: bool = False):
+        """
+        创建表
+
+        with_time_ms=True 且表含 time 列时，额外添加 time_ms INTEGER 列及其索引，
+        并由触发器在写入时根据 time 自动填充（不指定列名的 insert_not_columns 可以不传入 time_ms）
+        with_row_counts=True 时安装行数统计触发器，见 enable_row_counts
+        """
+        with_time_ms = with_time_ms and self.TIME_COLUMN_NAME in columns
+        if with_time_ms and self.TIME_MS_COLUMN_NAME not in columns:
+            columns = {**columns, self.TIME_MS_COLUMN_NAME: 'INTEGER'}
         columns_with_types = ', '.join(f"{name} {datatype}" for name, datatype in columns.items())
         if foreign_key_dict:
             foreign_key_sqls = ",\n" + self.convert_to_foreign_key_sql(foreign_key_dict)
@@ -493,6 +1572,941 @@ class SQLiteManager:
 
         with self.execute_transaction() as cursor:
             cursor.execute(sql)
+            if with_time_ms:
+                self._ensure_time_ms_objects(cursor, table_name)
+        if with_row_counts:
+            self.enable_row_counts(table_name)
+
+    # ==================== time_ms 数值时间列 ====================
+
+    def _time_ms_expr(self, value_expr: str) -> str:
+        """把 time 值转换为毫秒时间戳的 SQL 表达式：文本按本地时间解析，数值按秒级时间戳处理"""
+        return (f"CASE typeof({value_expr}) "
+                f"WHEN 'text' THEN CAST(ROUND((julianday({value_expr}, 'utc') - 2440587.5) * 86400000.0) AS INTEGER) "
+                f"WHEN 'null' THEN NULL "
+                f"ELSE CAST(ROUND({value_expr} * 1000.0) AS INTEGER) END")
+
+    def _ensure_time_ms_objects(self, cursor: sqlite3.Cursor, table_name: str):
+        """创建 time_ms 索引以及插入/更新 time 时自动维护 time_ms 的触发器"""
+        q_t = self.quote_ident(table_name)
+        time_ms = self.quote_ident(self.TIME_MS_COLUMN_NAME)
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {self.quote_ident(f'idx_{table_name}_time_ms')} "
+                       f"ON {q_t}({time_ms})")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {self.quote_ident(f'trg_{table_name}_time_ms_insert')}
+            AFTER INSERT ON {q_t}
+            WHEN NEW.{time_ms} IS NULL AND NEW.time IS NOT NULL
+            BEGIN
+                UPDATE {q_t} SET {time_ms} = {self._time_ms_expr('NEW.time')} WHERE rowid = NEW.rowid;
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {self.quote_ident(f'trg_{table_name}_time_ms_update')}
+            AFTER UPDATE OF time ON {q_t}
+            BEGIN
+                UPDATE {q_t} SET {time_ms} = {self._time_ms_expr('NEW.time')} WHERE rowid = NEW.rowid;
+            END
+        """)
+
+    def has_time_ms(self, table_name: str) -> bool:
+        """表是否带有 time_ms 列"""
+        return self.TIME_MS_COLUMN_NAME in (self.get_table_columns(table_name) or [])
+
+    def _time_range_condition(self, table_name: str, start_time: float, end_time: float, column_prefix: str = ""):
+        """
+        生成时间范围条件：有 time_ms 列时按整数毫秒比较（走 time_ms 索引），否则退回 time 文本比较
+
+        Returns:
+            (where 条件, 参数列表, 排序列)
+        """
+        if self.has_time_ms(table_name):
+            column = f"{column_prefix}{self.TIME_MS_COLUMN_NAME}"
+            return (f"{column} BETWEEN ? AND ?",
+                    [math.floor(start_time * 1000), math.floor(end_time * 1000)],
+                    column)
+        start_time_f = datetime.datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        end_time_f = datetime.datetime.fromtimestamp(end_time).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        column = f"{column_prefix}time"
+        return f"{column} BETWEEN ? AND ?", [start_time_f, end_time_f], column
+
+    def migrate_time_ms(self, tables: Optional[List[str]] = None, batch_size: int = 50000) -> Dict[str, int]:
+        """
+        为已有数据库补充 time_ms 列：添加列、按 rowid 分批回填、创建索引和触发器
+
+        Args:
+            tables: 要迁移的表，默认所有含 time 列的数据表（排除 _meta 表）
+            batch_size: 每批回填的 rowid 跨度，每批一个事务
+
+        Returns:
+            {表名: 回填的行数}
+        """
+        if batch_size <= 0:
+            raise ValueError("batch_size must be > 0")
+        catalog = self.get_schema_catalog()
+        if tables is None:
+            tables = [name for name, info in catalog.items()
+                      if info["type"] == 'table' and info["has_time"] and not name.endswith("_meta")]
+
+        result = {}
+        time_ms = self.quote_ident(self.TIME_MS_COLUMN_NAME)
+        for table in tables:
+            info = catalog.get(table)
+            if info is None or not info["has_time"]:
+                logger.warning(f"表 {table} 不存在或没有 time 列，跳过 time_ms 迁移")
+                continue
+            q_t = self.quote_ident(table)
+            backfilled = 0
+            with self.get_connection() as conn:
+                if self.TIME_MS_COLUMN_NAME not in info["columns"]:
+                    conn.execute(f"ALTER TABLE {q_t} ADD COLUMN {time_ms} INTEGER")
+                min_id, max_id = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {q_t}").fetchone()
+                if min_id is not None:
+                    for start in range(min_id, max_id + 1, batch_size):
+                        conn.execute("BEGIN")
+                        cursor = conn.execute(
+                            f"UPDATE {q_t} SET {time_ms} = {self._time_ms_expr('time')} "
+                            f"WHERE rowid BETWEEN ? AND ? AND {time_ms} IS NULL AND time IS NOT NULL",
+                            (start, start + batch_size - 1))
+                        backfilled += cursor.rowcount
+                        conn.commit()
+                cursor = conn.cursor()
+                try:
+                    self._ensure_time_ms_objects(cursor, table)
+                finally:
+                    cursor.close()
+            result[table] = backfilled
+            logger.info(f"表 {table} time_ms 迁移完成，回填 {backfilled} 行")
+        return result
+
+    # ==================== 触发器维护的行数统计 ====================
+
+    def _quote_literal(self, value: str) -> str:
+        """用单引号引用 SQL 字符串字面量（触发器体内不能使用参数）"""
+        return "'" + value.replace("'", "''") + "'"
+
+    def _day_bucket_expr(self, value_expr: str) -> str:
+        """把 time 值转换为 'YYYY-MM-DD' 日期桶的 SQL 表达式：文本取前 10 位，数值按秒级时间戳取本地日期"""
+        return (f"CASE typeof({value_expr}) "
+                f"WHEN 'text' THEN substr({value_expr}, 1, 10) "
+                f"WHEN 'null' THEN NULL "
+                f"ELSE date({value_expr}, 'unixepoch', 'localtime') END")
+
+    def _ensure_row_count_tables(self, cursor: sqlite3.Cursor):
+        """创建行数统计表"""
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.quote_ident(self.ROW_COUNT_TABLE_NAME)} (
+                table_name TEXT PRIMARY KEY,
+                row_count INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        """)
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.quote_ident(self.ROW_COUNT_BUCKET_TABLE_NAME)} (
+                table_name TEXT NOT NULL,
+                day TEXT NOT NULL,
+                row_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (table_name, day)
+            ) WITHOUT ROWID
+        """)
+
+    def _create_row_count_triggers(self, cursor: sqlite3.Cursor, table_name: str, with_buckets: bool):
+        """创建 INSERT/DELETE（以及 UPDATE OF time）时维护行数统计的触发器"""
+        q_t = self.quote_ident(table_name)
+        name = self._quote_literal(table_name)
+        counts = self.quote_ident(self.ROW_COUNT_TABLE_NAME)
+        buckets = self.quote_ident(self.ROW_COUNT_BUCKET_TABLE_NAME)
+
+        def bucket_add(row: str, delta: int) -> str:
+            return (f"INSERT INTO {buckets} (table_name, day, row_count) "
+                    f"SELECT {name}, _day, {delta} FROM (SELECT {self._day_bucket_expr(f'{row}.time')} AS _day) "
+                    f"WHERE _day IS NOT NULL "
+                    f"ON CONFLICT (table_name, day) DO UPDATE SET row_count = row_count + {delta};")
+
+        def bucket_sub(row: str) -> str:
+            return (f"UPDATE {buckets} SET row_count = row_count - 1 "
+                    f"WHERE table_name = {name} AND day = {self._day_bucket_expr(f'{row}.time')};")
+
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {self.quote_ident(f'trg_{table_name}_row_count_insert')}
+            AFTER INSERT ON {q_t}
+            BEGIN
+                INSERT INTO {counts} (table_name, row_count) VALUES ({name}, 1)
+                ON CONFLICT (table_name) DO UPDATE SET row_count = row_count + 1;
+                {bucket_add('NEW', 1) if with_buckets else ''}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {self.quote_ident(f'trg_{table_name}_row_count_delete')}
+            AFTER DELETE ON {q_t}
+            BEGIN
+                UPDATE {counts} SET row_count = row_count - 1 WHERE table_name = {name};
+                {bucket_sub('OLD') if with_buckets else ''}
+            END
+        """)
+        if with_buckets:
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {self.quote_ident(f'trg_{table_name}_row_count_update')}
+                AFTER UPDATE OF time ON {q_t}
+                BEGIN
+                    {bucket_sub('OLD')}
+                    {bucket_add('NEW', 1)}
+                END
+            """)
+
+    def enable_row_counts(self, table_name: str) -> bool:
+        """
+        为表安装行数统计触发器，并用一次 COUNT(*) 初始化总行数和按天分桶的行数（表含 time 列时）
+
+        之后 get_table_data_count / query_counts_conditions / query_Epoch_datas 直接读取统计值，不再扫描全表。
+        注意：INSERT OR REPLACE 替换已有行时不会触发 DELETE 触发器（除非开启 recursive_triggers），会导致计数偏大
+
+        Returns:
+            是否安装成功（已安装时直接返回 True）
+        """
+        info = self.get_schema_catalog().get(table_name)
+        if info is None or info["type"] != 'table':
+            logger.warning(f"表 {table_name} 不存在，无法启用行数统计")
+            return False
+        with_buckets = info["has_time"]
+        q_t = self.quote_ident(table_name)
+        insert_trigger = f'trg_{table_name}_row_count_insert'
+        with self.get_connection() as conn:
+            # IMMEDIATE 事务：建触发器与初始化计数之间不会有其它写入
+            self._begin_immediate(conn.cursor())
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                                  (insert_trigger,)).fetchone()
+            if exists:
+                conn.rollback()
+                return True
+            cursor = conn.cursor()
+            try:
+                self._ensure_row_count_tables(cursor)
+                self._create_row_count_triggers(cursor, table_name, with_buckets)
+                cursor.execute(f"DELETE FROM {self.quote_ident(self.ROW_COUNT_TABLE_NAME)} WHERE table_name = ?",
+                               (table_name,))
+                cursor.execute(f"DELETE FROM {self.quote_ident(self.ROW_COUNT_BUCKET_TABLE_NAME)} WHERE table_name = ?",
+                               (table_name,))
+                cursor.execute(f"INSERT INTO {self.quote_ident(self.ROW_COUNT_TABLE_NAME)} (table_name, row_count) "
+                               f"SELECT ?, COUNT(*) FROM {q_t}", (table_name,))
+                if with_buckets:
+                    cursor.execute(f"""
+                        INSERT INTO {self.quote_ident(self.ROW_COUNT_BUCKET_TABLE_NAME)} (table_name, day, row_count)
+                        SELECT ?, _day, COUNT(*) FROM (SELECT {self._day_bucket_expr('time')} AS _day FROM {q_t})
+                        WHERE _day IS NOT NULL
+                        GROUP BY _day
+                    """, (table_name,))
+                conn.commit()
+            finally:
+                cursor.close()
+        logger.info(f"表 {table_name} 已启用行数统计")
+        return True
+
+    def get_maintained_row_count(self, table_name: str) -> Optional[int]:
+        """读取触发器维护的总行数，未启用行数统计时返回 None"""
+        if self.ROW_COUNT_TABLE_NAME not in self.get_schema_catalog():
+            return None
+        with self.execute_transaction(auto_commit=True) as cursor:
+            cursor.execute(f"SELECT row_count FROM {self.quote_ident(self.ROW_COUNT_TABLE_NAME)} WHERE table_name = ?",
+                           (table_name,))
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def _count_by_day_buckets(self, table_name: str, start_time: Optional[str],
+                              end_time: Optional[str]) -> Optional[int]:
+        """
+        用按天分桶的行数统计时间范围内的行数：整天直接累加桶，只扫描首尾两个不完整的天
+
+        Returns:
+            行数；未启用分桶或时间格式无法识别时返回 None
+        """
+        catalog = self.get_schema_catalog()
+        info = catalog.get(table_name)
+        if self.ROW_COUNT_BUCKET_TABLE_NAME not in catalog or info is None or not info["has_time"]:
+            return None
+        # 有总行数记录说明触发器已安装，分桶同步维护
+        if self.get_maintained_row_count(table_name) is None:
+            return None
+        try:
+            start_day = datetime.date.fromisoformat(str(start_time)[:10]) if start_time else None
+            end_day = datetime.date.fromisoformat(str(end_time)[:10]) if end_time else None
+        except ValueError:
+            return None
+
+        q_t = self.quote_ident(table_name)
+        buckets = self.quote_ident(self.ROW_COUNT_BUCKET_TABLE_NAME)
+        with self.execute_transaction(auto_commit=True) as cursor:
+            if start_day is not None and start_day == end_day:
+                cursor.execute(f"SELECT COUNT(*) FROM {q_t} WHERE time >= ? AND time <= ?", (start_time, end_time))
+                return cursor.fetchone()[0]
+
+            conditions = ["table_name = ?"]
+            params: list = [table_name]
+            if start_day is not None:
+                conditions.append("day > ?")
+                params.append(start_day.isoformat())
+            if end_day is not None:
+                conditions.append("day < ?")
+                params.append(end_day.isoformat())
+            cursor.execute(f"SELECT COALESCE(SUM(row_count), 0) FROM {buckets} WHERE {' AND '.join(conditions)}",
+                           params)
+            total = cursor.fetchone()[0]
+
+            if start_day is not None:
+                next_day = (start_day + datetime.timedelta(days=1)).isoformat()
+                cursor.execute(f"SELECT COUNT(*) FROM {q_t} WHERE time >= ? AND time < ?", (start_time, next_day))
+                total += cursor.fetchone()[0]
+            if end_day is not None:
+                cursor.execute(f"SELECT COUNT(*) FROM {q_t} WHERE time >= ? AND time <= ?",
+                               (end_day.isoformat(), end_time))
+                total += cursor.fetchone()[0]
+            return total
+
+    # ==================== 按时间分区的表 ====================
+    # 逻辑表是一个 UNION ALL 所有物理分区的视图，写入按 time 路由到 {逻辑表}__p{日期} 分区，
+    # 范围查询只扫描与时间范围重叠的分区；删除旧数据时直接 DROP 分区
+
+    def create_partitioned_table(self, table_name: str, columns: Dict[str, str], granularity: str = 'day',
+                                 with_time_ms: bool = True, with_row_counts: bool = True):
+        """
+        创建按天（'day'）或按周（'week'，周一开始）分区的逻辑表，分区在第一次写入对应时间段时创建
+
+        Args:
+            table_name: 逻辑表名，读写时与普通表一样使用
+            columns: 列定义，必须包含 time 列
+            granularity: 分区粒度 'day' / 'week'
+            with_time_ms: 分区是否带 time_ms 列（见 create_table）
+            with_row_counts: 分区是否启用行数统计（见 enable_row_counts）
+        """
+        if granularity not in (self.PARTITION_DAY, self.PARTITION_WEEK):
+            raise ValueError(f"不支持的分区粒度: {granularity}")
+        if self.TIME_COLUMN_NAME not in columns:
+            raise ValueError("分区表必须包含 time 列")
+        spec_columns = dict(columns)
+        if with_time_ms and self.TIME_MS_COLUMN_NAME not in spec_columns:
+            spec_columns[self.TIME_MS_COLUMN_NAME] = 'INTEGER'
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                self._begin_immediate(cursor)
+                cursor.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {self.quote_ident(self.PARTITIONED_TABLE_NAME)} (
+                        logical_name TEXT PRIMARY KEY,
+                        granularity TEXT NOT NULL,
+                        columns TEXT NOT NULL,
+                        with_time_ms INTEGER NOT NULL,
+                        with_row_counts INTEGER NOT NULL
+                    ) WITHOUT ROWID
+                """)
+                cursor.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {self.quote_ident(self.PARTITION_TABLE_NAME)} (
+                        partition_name TEXT PRIMARY KEY,
+                        logical_name TEXT NOT NULL,
+                        start_ms INTEGER NOT NULL,
+                        end_ms INTEGER NOT NULL
+                    ) WITHOUT ROWID
+                """)
+                cursor.execute(f"INSERT OR IGNORE INTO {self.quote_ident(self.PARTITIONED_TABLE_NAME)} "
+                               f"(logical_name, granularity, columns, with_time_ms, with_row_counts) "
+                               f"VALUES (?, ?, ?, ?, ?)",
+                               (table_name, granularity, json.dumps(spec_columns, ensure_ascii=False),
+                                int(with_time_ms), int(with_row_counts)))
+                if cursor.rowcount == 0:
+                    logger.warning(f"分区表 {table_name} 已存在，沿用原有定义")
+                self._refresh_partition_view(cursor, table_name)
+                conn.commit()
+            finally:
+                cursor.close()
+        # 刷新表结构目录，写入路径上的 _partition_spec 直接识别新建的逻辑表
+        self.get_schema_catalog()
+
+    def _partition_spec(self, table_name: str) -> Optional[Dict[str, Any]]:
+        """
+        返回分区逻辑表的定义，普通表返回 None
+
+        写入路径上不为每次写入读取 schema_version：已缓存的目录中是普通表或分区表时直接使用；
+        目录中没有该表或它是普通视图（例如其他连接刚把它建成分区表）时，重新检查一次表结构目录
+        """
+        catalog = self._schema_catalog
+        info = catalog.get(table_name) if catalog is not None else None
+        if info is None or (info["type"] != 'table' and info["partitioned"] is None):
+            info = self.get_schema_catalog().get(table_name)
+        return info["partitioned"] if info else None
+
+    def _refresh_partition_view(self, cursor: sqlite3.Cursor, table_name: str):
+        """按登记表重建逻辑表视图；没有分区时为一个空视图，保证逻辑表的列始终可见"""
+        cursor.execute(f"SELECT columns FROM {self.quote_ident(self.PARTITIONED_TABLE_NAME)} WHERE logical_name = ?",
+                       (table_name,))
+        columns = list(json.loads(cursor.fetchone()[0]).keys())
+        cursor.execute(f"SELECT partition_name FROM {self.quote_ident(self.PARTITION_TABLE_NAME)} "
+                       f"WHERE logical_name = ? ORDER BY start_ms", (table_name,))
+        partitions = [row[0] for row in cursor.fetchall()]
+        columns_sql = ', '.join(self.quote_ident(column) for column in columns)
+        if partitions:
+            select_sql = self._union_all_sql([f"SELECT {columns_sql} FROM {self.quote_ident(p)}" for p in partitions])
+        else:
+            select_sql = "SELECT " + ', '.join(f"NULL AS {self.quote_ident(c)}" for c in columns) + " WHERE 0"
+        cursor.execute(f"DROP VIEW IF EXISTS {self.quote_ident(table_name)}")
+        cursor.execute(f"CREATE VIEW {self.quote_ident(table_name)} AS {select_sql}")
+
+    def _union_all_sql(self, selects: List[str]) -> str:
+        """UNION ALL 多个 SELECT，项数超过 MAX_COMPOUND_SELECT 时分组嵌套子查询"""
+        while len(selects) > self.MAX_COMPOUND_SELECT:
+            selects = [f"SELECT * FROM ({' UNION ALL '.join(selects[i:i + self.MAX_COMPOUND_SELECT])})"
+                       for i in range(0, len(selects), self.MAX_COMPOUND_SELECT)]
+        return " UNION ALL ".join(selects)
+
+    def _partition_bounds(self, time_value: Any, granularity: str):
+        """根据 time 值计算所在分区：返回 (分区后缀, start_ms, end_ms)，按本地时间划分"""
+        if time_value is None:
+            raise ValueError("分区表写入必须包含 time 值")
+        if isinstance(time_value, str):
+            day = datetime.date.fromisoformat(time_value[:10])
+        else:
+            day = datetime.datetime.fromtimestamp(float(time_value)).date()
+        if granularity == self.PARTITION_WEEK:
+            day -= datetime.timedelta(days=day.weekday())
+            next_day = day + datetime.timedelta(days=7)
+            suffix = f"w{day.strftime('%Y%m%d')}"
+        else:
+            next_day = day + datetime.timedelta(days=1)
+            suffix = day.strftime('%Y%m%d')
+        start_ms = int(datetime.datetime.combine(day, datetime.time()).timestamp() * 1000)
+        end_ms = int(datetime.datetime.combine(next_day, datetime.time()).timestamp() * 1000)
+        return suffix, start_ms, end_ms
+
+    def _ensure_partition(self, table_name: str, spec: Dict[str, Any], time_value: Any) -> str:
+        """返回 time_value 所在的物理分区表名，不存在时创建并登记"""
+        suffix, start_ms, end_ms = self._partition_bounds(time_value, spec["granularity"])
+        partition_name = f"{table_name}__p{suffix}"
+        if any(p[0] == partition_name for p in spec["partitions"]):
+            return partition_name
+
+        self.create_table(partition_name, spec["columns"], with_time_ms=spec["with_time_ms"],
+                          with_row_counts=spec["with_row_counts"])
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                self._begin_immediate(cursor)
+                cursor.execute(f"INSERT OR IGNORE INTO {self.quote_ident(self.PARTITION_TABLE_NAME)} "
+                               f"(partition_name, logical_name, start_ms, end_ms) VALUES (?, ?, ?, ?)",
+                               (partition_name, table_name, start_ms, end_ms))
+                if cursor.rowcount:
+                    self._refresh_partition_view(cursor, table_name)
+                conn.commit()
+            finally:
+                cursor.close()
+        logger.info(f"分区表 {table_name} 新建分区 {partition_name}")
+        # 视图重建改变了 schema_version，这里重新读取以拿到新的分区列表
+        spec.update(self.get_schema_catalog()[table_name]["partitioned"])
+        return partition_name
+
+    def _route_partition(self, table_name: str, time_value: Any) -> str:
+        """分区逻辑表返回写入的物理分区表名，普通表原样返回"""
+        spec = self._partition_spec(table_name)
+        if spec is None:
+            return table_name
+        return self._ensure_partition(table_name, spec, time_value)
+
+    def _insert_many_partitioned(self, verb: str, table_name: str, spec: Dict[str, Any], columns: Sequence[str],
+                                 rows, chunk_size: int) -> int:
+        """批量写入分区逻辑表：每块按所在分区分组后分别写入"""
+        if self.TIME_COLUMN_NAME not in columns:
+            raise ValueError("分区表写入必须包含 time 列")
+        time_index = list(columns).index(self.TIME_COLUMN_NAME)
+        columns_sql = ', '.join(self.quote_ident(c) for c in columns)
+        placeholders = ', '.join('?' * len(columns))
+        written = 0
+        # 同一天的 time 文本前 10 位相同，缓存避免逐行解析日期
+        resolved: Dict[Any, str] = {}
+        for chunk in self._iter_row_chunks(rows, chunk_size):
+            groups: Dict[str, list] = {}
+            for row in chunk:
+                time_value = row[time_index]
+                key = time_value[:10] if isinstance(time_value, str) else time_value
+                partition_name = resolved.get(key)
+                if partition_name is None:
+                    partition_name = resolved[key] = self._ensure_partition(table_name, spec, time_value)
+                groups.setdefault(partition_name, []).append(row)
+            for partition_name, group in groups.items():
+                sql = f"{verb} INTO {self.quote_ident(partition_name)} ({columns_sql}) VALUES ({placeholders});"
+                written += self._executemany_chunked(sql, partition_name, group, chunk_size)
+        return written
+
+    def get_partitions(self, table_name: str, start_time: Optional[float] = None,
+                       end_time: Optional[float] = None) -> List[str]:
+        """
+        返回与时间范围 [start_time, end_time]（秒级时间戳，None 表示不限）重叠的物理分区，按时间排序；
+        普通表返回 [table_name]
+        """
+        info = self.get_schema_catalog().get(table_name)
+        if info is None or info["partitioned"] is None:
+            return [table_name]
+        start_ms = None if start_time is None else math.floor(start_time * 1000)
+        end_ms = None if end_time is None else math.floor(end_time * 1000)
+        return [name for name, p_start, p_end in info["partitioned"]["partitions"]
+                if (start_ms is None or p_end > start_ms) and (end_ms is None or p_start <= end_ms)]
+
+    def _table_source(self, table_name: str, start_time: Optional[float] = None,
+                      end_time: Optional[float] = None) -> str:
+        """
+        范围查询的 FROM 子句：普通表为表名；分区逻辑表只 UNION ALL 与时间范围重叠的分区（分区裁剪）
+        """
+        info = self.get_schema_catalog().get(table_name)
+        if info is None or info["partitioned"] is None:
+            return self.quote_ident(table_name)
+        partitions = self.get_partitions(table_name, start_time, end_time)
+        if not partitions:
+            return f"(SELECT * FROM {self.quote_ident(table_name)} WHERE 0)"
+        if len(partitions) == 1:
+            return self.quote_ident(partitions[0])
+        return "(" + self._union_all_sql([f"SELECT * FROM {self.quote_ident(p)}" for p in partitions]) + ")"
+
+    def _time_text_to_seconds(self, value: Any) -> Optional[float]:
+        """把 time 文本或数值转换为秒级时间戳，无法识别时返回 None"""
+        if value is None or value == "":
+            return None
+        if isinstance(value, (int, float)):
+            return float(value)
+        try:
+            return datetime.datetime.fromisoformat(str(value).strip()).timestamp()
+        except ValueError:
+            return None
+
+    def _count_partitioned(self, table_name: str, start_time=None, end_time=None) -> int:
+        """分区逻辑表的行数：只统计重叠的分区，完全落在范围内的分区直接用其行数统计"""
+        start_s = self._time_text_to_seconds(start_time)
+        end_s = self._time_text_to_seconds(end_time)
+        info = self.get_schema_catalog()[table_name]
+        total = 0
+        for name, p_start, p_end in info["partitioned"]["partitions"]:
+            if (start_s is not None and p_end <= start_s * 1000) or (end_s is not None and p_start > end_s * 1000):
+                continue
+            covered = ((start_time is None or (start_s is not None and p_start >= start_s * 1000)) and
+                       (end_time is None or (end_s is not None and p_end - 1 <= end_s * 1000)))
+            if covered:
+                total += self._count_live(name)
+            else:
+                total += self._count_live(name, start_time, end_time)
+        return total
+
+    def _remove_partitions(self, table_name: str, partition_names: List[str], drop: bool) -> List[str]:
+        """从登记表移除分区并重建视图，drop=True 时同时删除分区表和其行数统计"""
+        if not partition_names:
+            return []
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                self._begin_immediate(cursor)
+                for partition_name in partition_names:
+                    cursor.execute(f"DELETE FROM {self.quote_ident(self.PARTITION_TABLE_NAME)} "
+                                   f"WHERE partition_name = ? AND logical_name = ?", (partition_name, table_name))
+                    if drop:
+                        cursor.execute(f"DROP TABLE IF EXISTS {self.quote_ident(partition_name)}")
+                        for count_table in (self.ROW_COUNT_TABLE_NAME, self.ROW_COUNT_BUCKET_TABLE_NAME):
+                            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                           (count_table,))
+                            if cursor.fetchone():
+                                cursor.execute(f"DELETE FROM {self.quote_ident(count_table)} WHERE table_name = ?",
+                                               (partition_name,))
+                self._refresh_partition_view(cursor, table_name)
+                conn.commit()
+            finally:
+                cursor.close()
+        logger.info(f"分区表 {table_name} {'删除' if drop else '分离'}分区: {partition_names}")
+        return list(partition_names)
+
+    def drop_partitions_before(self, table_name: str, before_time: float) -> List[str]:
+        """删除结束时间不晚于 before_time（秒级时间戳）的所有分区，按分区整表删除，不逐行 DELETE"""
+        info = self.get_schema_catalog().get(table_name)
+        if info is None or info["partitioned"] is None:
+            raise ValueError(f"{table_name} 不是分区表")
+        before_ms = math.floor(before_time * 1000)
+        expired = [name for name, _, p_end in info["partitioned"]["partitions"] if p_end <= before_ms]
+        return self._remove_partitions(table_name, expired, drop=True)
+
+    def drop_partition(self, table_name: str, partition_name: str) -> bool:
+        """删除一个分区"""
+        if self._partition_spec(table_name) is None:
+            raise ValueError(f"{table_name} 不是分区表")
+        if partition_name not in self.get_partitions(table_name):
+            return False
+        return bool(self._remove_partitions(table_name, [partition_name], drop=True))
+
+    def detach_partition(self, table_name: str, partition_name: str) -> bool:
+        """把分区从逻辑表中分离：数据保留为独立的普通表（可另行归档），逻辑表不再包含它"""
+        if self._partition_spec(table_name) is None:
+            raise ValueError(f"{table_name} 不是分区表")
+        if partition_name not in self.get_partitions(table_name):
+            return False
+        return bool(self._remove_partitions(table_name, [partition_name], drop=False))
+
+    # ==================== 冷数据归档 ====================
+    # 早于 N 天的数据按表、按天导出为 archive_dir/{表名}/{YYYYMMDD}_{版本}.npz（见 archive_store）后从数据库删除，
+    # 数据库文件、WAL 检查点和备份不再随时间无限增长。
+    # get_multi_table_data / query_joined_by_time / stream_multi_table_data / iter_table 的时间范围与归档重叠时，
+    # 把范围内的归档行载入本连接的临时表，与数据库中的数据 UNION ALL 后按原来的 SQL 查询，调用方无需区分；
+    # 游标分页只载入本页需要的归档行，get_table_data_count 加上归档的行数。
+    # 定时归档见 public/function/Monitor_data_storage/ArchiveJob.py（gui 配置的 [archive] 节）
+
+    def _ensure_archive_table(self, cursor: sqlite3.Cursor):
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.quote_ident(self.ARCHIVE_TABLE_NAME)} (
+                table_name TEXT NOT NULL,
+                day TEXT NOT NULL,
+                path TEXT NOT NULL,
+                row_count INTEGER NOT NULL,
+                start_ms INTEGER NOT NULL,
+                end_ms INTEGER NOT NULL,
+                archived_at REAL NOT NULL,
+                PRIMARY KEY (table_name, day)
+            ) WITHOUT ROWID
+        """)
+
+    def get_archived_days(self, table_name: str, start_time: Optional[float] = None,
+                          end_time: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        返回与时间范围 [start_time, end_time]（秒级时间戳，None 表示不限）重叠的归档文件，按日期排序
+
+        Returns:
+            [{"day": 'YYYY-MM-DD', "path": 绝对路径, "row_count": 行数, "start_ms": 当天零点, "end_ms": 次日零点}]
+        """
+        if self.ARCHIVE_TABLE_NAME not in self.get_schema_catalog():
+            return []
+        conditions = ["table_name = ?"]
+        params: list = [table_name]
+        if start_time is not None:
+            conditions.append("end_ms > ?")
+            params.append(math.floor(start_time * 1000))
+        if end_time is not None:
+            conditions.append("start_ms <= ?")
+            params.append(math.floor(end_time * 1000))
+        with self.execute_transaction(auto_commit=True) as cursor:
+            cursor.execute(f"SELECT day, path, row_count, start_ms, end_ms "
+                           f"FROM {self.quote_ident(self.ARCHIVE_TABLE_NAME)} "
+                           f"WHERE {' AND '.join(conditions)} ORDER BY day", params)
+            rows = cursor.fetchall()
+        return [{"day": day, "path": os.path.join(self.archive_dir, path), "row_count": row_count,
+                 "start_ms": start_ms, "end_ms": end_ms}
+                for day, path, row_count, start_ms, end_ms in rows]
+
+    def archive_older_than(self, days: int, tables: Optional[List[str]] = None,
+                           vacuum: bool = False) -> Dict[str, int]:
+        """
+        把早于 days 天（按本地日期对齐到零点）的数据归档到 archive_dir 并从数据库删除
+
+        同一天再次归档（例如补录的历史数据）时与已有的归档文件合并，写入新版本文件后再删除旧文件
+
+        Args:
+            days: 数据库中保留的天数，0 表示归档今天以前的所有数据
+            tables: 要归档的表，None 为所有带 time 列的数据表；分区表按逻辑表归档，已清空的分区随后删除
+            vacuum: 归档后是否执行检查点和 VACUUM，把释放的空间还给文件系统
+
+        Returns:
+            {表名: 本次归档的行数}
+        """
+        if days < 0:
+            raise ValueError("days must be >= 0")
+        cutoff_day = datetime.date.today() - datetime.timedelta(days=days)
+        cutoff = datetime.datetime.combine(cutoff_day, datetime.time()).timestamp()
+
+        catalog = self.get_schema_catalog()
+        if tables is None:
+            tables = [name for name in self.get_all_tables() if catalog[name]["has_time"]]
+        with self.execute_transaction() as cursor:
+            self._ensure_archive_table(cursor)
+
+        archived = {}
+        for table_name in tables:
+            info = self.get_schema_catalog().get(table_name)
+            if info is None or not info["has_time"]:
+                logger.warning(f"表 {table_name} 不存在或没有 time 列，跳过归档")
+                continue
+            archived[table_name] = self._archive_table_before(table_name, cutoff)
+            if info["partitioned"] is not None:
+                self.drop_partitions_before(table_name, cutoff)
+        logger.info(f"归档 {cutoff_day} 以前的数据: {archived}")
+
+        if vacuum:
+            with self.get_connection() as conn:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                conn.execute("VACUUM")
+        return archived
+
+    def _archive_table_before(self, table_name: str, cutoff: float) -> int:
+        """
+        按天归档一张表中 time 早于 cutoff（秒级时间戳）的行：先在读事务中取出并写好压缩文件，
+        再在一个短的写事务中核对数据未变后删除并登记，压缩期间不阻塞写入
+        """
+        from public.dao.SQLite import archive_store
+
+        key_expr = self.TIME_MS_COLUMN_NAME if self.has_time_ms(table_name) else self._time_ms_expr('time')
+        condition, params, _ = self._time_range_condition(table_name, 0, cutoff - 0.0005)
+        source = self._table_source(table_name, None, cutoff - 0.0005)
+        with self.execute_transaction(auto_commit=True) as cursor:
+            cursor.execute(f"SELECT DISTINCT date(({key_expr}) / 1000, 'unixepoch', 'localtime') AS day "
+                           f"FROM {source} WHERE {condition} ORDER BY day", params)
+            archive_days = [row[0] for row in cursor.fetchall() if row[0]]
+
+        total = 0
+        for day_text in archive_days:
+            day = datetime.date.fromisoformat(day_text)
+            day_start = datetime.datetime.combine(day, datetime.time()).timestamp()
+            day_end = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time()).timestamp()
+            range_end = min(day_end, cutoff) - 0.0005
+
+            # 持有写连接前准备好所有 SQL：读取逻辑表（或视图），按物理表（分区）删除
+            condition, params, order_column = self._time_range_condition(table_name, day_start, range_end)
+            select_sql = (f"SELECT {key_expr} AS _archive_key, * "
+                          f"FROM {self._table_source(table_name, day_start, range_end)} "
+                          f"WHERE {condition} ORDER BY {order_column}")
+            deletes = []
+            for target in self.get_partitions(table_name, day_start, range_end):
+                target_condition, target_params, _ = self._time_range_condition(target, day_start, range_end)
+                deletes.append((f"DELETE FROM {self.quote_ident(target)} WHERE {target_condition}", target_params))
+            previous = self.get_archived_days(table_name, day_start, day_start)
+            previous_path = previous[0]["path"] if previous else None
+            columns = self.get_table_columns(table_name)
+
+            day_start_ms = int(day_start * 1000)
+            # 写事务中只核对范围内的行数与时间戳之和（相对当天零点，整数运算不会溢出）
+            check_sql = (f"SELECT COUNT(*), SUM(({key_expr}) - {day_start_ms}) "
+                         f"FROM {self._table_source(table_name, day_start, range_end)} WHERE {condition}")
+
+            for attempt in range(1, self.ARCHIVE_RETRY_ATTEMPTS + 1):
+                # 读取与压缩写文件不持有写锁，写入方在此期间照常提交
+                with self.execute_transaction(auto_commit=True) as cursor:
+                    cursor.execute(select_sql, params)
+                    rows = cursor.fetchall()
+                if not rows:
+                    break
+                time_ms = [row[0] for row in rows]
+                rows = [row[1:] for row in rows]
+                fingerprint = (len(rows), sum(t - day_start_ms for t in time_ms))
+                if previous_path is not None:
+                    previous_rows, previous_ms = archive_store.read_archive(previous_path, columns)
+                    rows = previous_rows + rows
+                    time_ms = previous_ms + time_ms
+                path = os.path.join(self.archive_dir, table_name, f"{day.strftime('%Y%m%d')}_{time.time_ns()}.npz")
+                archive_store.write_archive(path, columns, rows, time_ms)
+
+                committed = False
+                with self.get_connection() as conn:
+                    cursor = conn.cursor()
+                    try:
+                        self._begin_immediate(cursor)
+                        cursor.execute(check_sql, params)
+                        if tuple(cursor.fetchone()) == fingerprint:
+                            for sql, delete_params in deletes:
+                                cursor.execute(sql, delete_params)
+                            cursor.execute(f"INSERT OR REPLACE INTO {self.quote_ident(self.ARCHIVE_TABLE_NAME)} "
+                                           f"(table_name, day, path, row_count, start_ms, end_ms, archived_at) "
+                                           f"VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                           (table_name, day_text, os.path.relpath(path, self.archive_dir), len(rows),
+                                            day_start_ms, int(day_end * 1000), time.time()))
+                            conn.commit()
+                            committed = True
+                        else:
+                            conn.rollback()
+                    except Exception:
+                        conn.rollback()
+                        os.remove(path)
+                        raise
+                    finally:
+                        cursor.close()
+                if committed:
+                    break
+                # 读取之后这一天又有数据写入（例如补录），丢弃文件重新读取
+                os.remove(path)
+                logger.warning(f"表 {table_name} {day_text} 的数据在归档期间发生变化，重新归档（第 {attempt} 次）")
+            else:
+                logger.warning(f"表 {table_name} {day_text} 的数据持续变化，本次跳过归档")
+                continue
+            if not rows:
+                continue
+
+            if previous_path is not None and os.path.exists(previous_path):
+                os.remove(previous_path)
+            archived_rows = len(rows) - (len(previous_rows) if previous_path is not None else 0)
+            total += archived_rows
+            logger.info(f"表 {table_name} 归档 {day_text} 的 {archived_rows} 行 -> {path}")
+        return total
+
+    def _prepare_archive_overlay(self, tables: List[str], start_time: Optional[float] = None,
+                                 end_time: Optional[float] = None) -> Dict[str, Any]:
+        """
+        找出时间范围（None 表示不限）内有归档行的文件，在取得查询连接之前调用
+        （文件在这里解压并缓存，行在写入临时表时才逐批解码）
+
+        Returns:
+            {表名: (列名列表, [(归档文件路径, start_ms, end_ms, rowid 基数)])}，只包含范围内有归档数据的表；
+            范围覆盖整个文件时 start_ms / end_ms 为 None，rowid 基数见 _prepare_keyset_archive_overlay
+        """
+        if self.ARCHIVE_TABLE_NAME not in self.get_schema_catalog():
+            return {}
+        from public.dao.SQLite import archive_store
+
+        start_ms = None if start_time is None else math.floor(start_time * 1000)
+        end_ms = None if end_time is None else math.floor(end_time * 1000)
+        overlay = {}
+        for table_name in tables:
+            files = []
+            for archive_file in self.get_archived_days(table_name, start_time, end_time):
+                lo = start_ms if start_ms is not None and start_ms > archive_file["start_ms"] else None
+                hi = end_ms if end_ms is not None and end_ms < archive_file["end_ms"] - 1 else None
+                try:
+                    if (lo is None and hi is None and archive_file["row_count"]) or \
+                            archive_store.count_rows(archive_file["path"], lo, hi):
+                        files.append((archive_file["path"], lo, hi, None))
+                except OSError as e:
+                    logger.warning(f"读取归档文件 {archive_file['path']} 失败，跳过: {e}")
+            if files:
+                overlay[table_name] = (self.get_table_columns(table_name), files)
+        return overlay
+
+    def _prepare_keyset_archive_overlay(self, tables: List[str], bound_key: Optional[list], scan_desc: bool,
+                                        limit: int, row_ids: bool = False) -> Dict[str, Any]:
+        """
+        游标分页用的归档数据：一页只需要边界之后（按扫描方向）的前 limit 个时间点，
+        每张表从边界所在的文件开始按扫描方向逐个文件取，取到 limit 个不同的时间戳为止，不载入整个归档
+
+        Args:
+            bound_key: 令牌中的排序键，None 表示从头（或从尾）开始
+            scan_desc: SQL 的扫描方向
+            limit: 需要的时间点个数（page_size + 1）
+            row_ids: 是否给归档行分配稳定的 rowid（单表分页按 (time, rowid) 定位）
+
+        Returns:
+            同 _prepare_archive_overlay
+        """
+        if self.ARCHIVE_TABLE_NAME not in self.get_schema_catalog():
+            return {}
+        from public.dao.SQLite import archive_store
+        import numpy as np
+
+        bound_ms = None
+        if bound_key is not None:
+            bound_s = self._time_text_to_seconds(bound_key[0])
+            if bound_s is None:
+                # 无法换算为时间戳的边界，载入所有归档
+                limit = math.inf
+            else:
+                bound_ms = math.floor(bound_s * 1000)
+
+        overlay = {}
+        for table_name in tables:
+            archived = self.get_archived_days(table_name)
+            if scan_desc:
+                archived.reverse()
+            files = []
+            remaining = limit
+            for archive_file in archived:
+                # 毫秒换算的舍入误差放宽 1ms，多出的行由 SQL 的边界条件过滤
+                lo = hi = None
+                if bound_ms is not None:
+                    if scan_desc:
+                        if archive_file["start_ms"] > bound_ms + 1:
+                            continue
+                        hi = bound_ms + 1
+                    else:
+                        if archive_file["end_ms"] <= bound_ms - 1:
+                            continue
+                        lo = bound_ms - 1
+                try:
+                    row_lo, row_hi = archive_store.row_range(archive_file["path"], lo, hi)
+                    times = np.unique(archive_store.time_index(archive_file["path"])[row_lo:row_hi])
+                except OSError as e:
+                    logger.warning(f"读取归档文件 {archive_file['path']} 失败，跳过: {e}")
+                    continue
+                if bound_ms is not None:
+                    times = times[(times < bound_ms - 1) | (times > bound_ms + 1)]
+                if scan_desc:
+                    times = times[::-1]
+                if not len(times) and row_lo == row_hi:
+                    continue
+                rowid_base = self._archive_rowid_base(archive_file["day"]) if row_ids else None
+                if len(times) >= remaining:
+                    cut = int(times[remaining - 1])
+                    lo, hi = (cut, hi) if scan_desc else (lo, cut)
+                    files.append((archive_file["path"], lo, hi, rowid_base))
+                    break
+                files.append((archive_file["path"], lo, hi, rowid_base))
+                remaining -= len(times)
+            if files:
+                # 临时表按文件的时间顺序写入
+                overlay[table_name] = (self.get_table_columns(table_name), files[::-1] if scan_desc else files)
+        return overlay
+
+    def _archive_rowid_base(self, day: str) -> int:
+        """某天归档文件中各行的 rowid 基数，加上文件内行号即为该行的 rowid（同一文件版本内稳定）"""
+        return self.ARCHIVE_ROWID_BASE + (datetime.date.fromisoformat(day).toordinal() << 32)
+
+    def _archive_temp_name(self, table_name: str) -> str:
+        return f"_archive__{table_name}"
+
+    def _with_archive_sources(self, sources: Dict[str, str], overlay: Dict[str, Any]) -> Dict[str, str]:
+        """把有归档数据的表的 FROM 子句替换为 归档临时表 UNION ALL 数据库数据（不排序时归档的旧数据在前）"""
+        return {table: (f"(SELECT * FROM temp.{self.quote_ident(self._archive_temp_name(table))} "
+                        f"UNION ALL SELECT * FROM {source})"
+                        if table in overlay else source)
+                for table, source in sources.items()}
+
+    @contextmanager
+    def _archive_overlay(self, cursor, overlay: Dict[str, Any]):
+        """在游标（或连接）所属的连接上创建归档临时表，退出时删除；overlay 为空时什么也不做"""
+        if not overlay:
+            yield
+            return
+        from public.dao.SQLite import archive_store
+
+        # 只读连接设置了 query_only，临时表的建删需要暂时关闭（mode=ro 仍保证主库不可写）
+        query_only = self.connection_profile == self.PROFILE_READER
+        created = []
+        try:
+            if query_only:
+                cursor.execute("PRAGMA query_only = OFF")
+            try:
+                # 在一个保存点内批量写入临时表，避免自动提交模式下逐行提交
+                cursor.execute("SAVEPOINT archive_overlay")
+                for table_name, (columns, files) in overlay.items():
+                    temp_name = self._archive_temp_name(table_name)
+                    q_temp = self.quote_ident(temp_name)
+                    cursor.execute(f"DROP TABLE IF EXISTS temp.{q_temp}")
+                    cursor.execute(f"CREATE TEMP TABLE {q_temp} "
+                                   f"({', '.join(self.quote_ident(c) for c in columns)})")
+                    created.append(q_temp)
+                    column_list = ', '.join(self.quote_ident(c) for c in columns)
+                    insert_sql = f"INSERT INTO temp.{q_temp} ({column_list}) VALUES ({', '.join('?' * len(columns))})"
+                    keyed_insert_sql = (f"INSERT INTO temp.{q_temp} (rowid, {column_list}) "
+                                        f"VALUES ({', '.join('?' * (len(columns) + 1))})")
+                    for path, start_ms, end_ms, rowid_base in files:
+                        rowid = None if rowid_base is None else \
+                            rowid_base + archive_store.row_range(path, start_ms, end_ms)[0]
+                        for rows in archive_store.iter_archive_cached(path, columns, start_ms, end_ms):
+                            if rowid is None:
+                                cursor.executemany(insert_sql, rows)
+                            else:
+                                cursor.executemany(keyed_insert_sql,
+                                                   [(rowid + i, *row) for i, row in enumerate(rows)])
+                                rowid += len(rows)
+                    for column in (self.TIME_COLUMN_NAME, self.TIME_MS_COLUMN_NAME):
+                        if column in columns:
+                            cursor.execute(f"CREATE INDEX temp.{self.quote_ident(f'{temp_name}_{column}')} "
+                                           f"ON {q_temp}({self.quote_ident(column)})")
+                cursor.execute("RELEASE archive_overlay")
+            finally:
+                if query_only:
+                    cursor.execute("PRAGMA query_only = ON")
+            yield
+        finally:
+            try:
+                if query_only:
+                    cursor.execute("PRAGMA query_only = OFF")
+                for q_temp in created:
+                    cursor.execute(f"DROP TABLE IF EXISTS temp.{q_temp}")
+            except sqlite3.Error as e:
+                logger.warning(f"删除归档临时表失败: {e}")
+            finally:
+                if query_only:
+                    cursor.execute("PRAGMA query_only = ON")
 
     def create_meta_table(self, table_name: str):
         """创建描述表"""
@@ -508,43 +2522,143 @@ class SQLiteManager:
 
     def insert(self, table_name: str, **kwargs) -> int:
         """插入数据，防止 SQL 注入"""
+        table_name = self._route_partition(table_name, kwargs.get(self.TIME_COLUMN_NAME))
         columns = ', '.join(kwargs.keys())
         placeholders = ', '.join('?' * len(kwargs))
         sql = f"""INSERT INTO "{table_name}" ({columns}) VALUES ({placeholders});"""
 
         with self.execute_transaction() as cursor:
             cursor.execute(sql, tuple(kwargs.values()))
+            self._invalidate_meta_cache(table_name)
             return cursor.rowcount
 
     def insert_or_ignore(self, table_name: str, **kwargs) -> int:
         """插入数据重复就忽略，防止 SQL 注入"""
+        table_name = self._route_partition(table_name, kwargs.get(self.TIME_COLUMN_NAME))
         columns = ', '.join(kwargs.keys())
         placeholders = ', '.join('?' * len(kwargs))
         sql = f"""INSERT OR IGNORE INTO "{table_name}" ({columns}) VALUES ({placeholders});"""
 
         with self.execute_transaction() as cursor:
             cursor.execute(sql, tuple(kwargs.values()))
+            self._invalidate_meta_cache(table_name)
             return cursor.rowcount
 
     def insert_2(self, table_name: str, columns_flag: List[str], datas: List[Any]) -> int:
         """插入数据，防止 SQL 注入"""
+        if self.TIME_COLUMN_NAME in columns_flag:
+            table_name = self._route_partition(table_name, datas[columns_flag.index(self.TIME_COLUMN_NAME)])
         columns = ', '.join(columns_flag)
         placeholders = ', '.join('?' * len(datas))
         sql = f"""INSERT INTO "{table_name}" ({columns}) VALUES ({placeholders});"""
 
         with self.execute_transaction() as cursor:
             cursor.execute(sql, tuple(datas))
+            self._invalidate_meta_cache(table_name)
             return cursor.rowcount
 
     def insert_not_columns(self, table_name: str, datas: List[Any]) -> int:
-        """插入数据不指定列名"""
+        """
+        插入数据不指定列名，datas 按表定义的列顺序排列；
+        表带 time_ms 列（见 migrate_time_ms）而 datas 不含它时，写入其余列，time_ms 由触发器填充
+        """
+        spec = self._partition_spec(table_name)
+        if spec is not None:
+            # 分区表的列顺序与定义一致
+            columns = list(spec["columns"])
+            time_index = columns.index(self.TIME_COLUMN_NAME)
+            table_name = self._ensure_partition(table_name, spec, datas[time_index])
+        else:
+            # 与 _partition_spec 相同，写入路径优先使用已缓存的目录，不为每次写入读取 schema_version；
+            # 目录中没有该表或列数对不上（其他连接修改了表结构）时重新检查一次
+            catalog = self._schema_catalog
+            info = catalog.get(table_name) if catalog is not None else None
+            if info is None or len(datas) not in (len(info["columns"]), len(info["columns"]) - 1):
+                info = self.get_schema_catalog().get(table_name)
+            columns = list(info["columns"]) if info else []
+        if self.TIME_MS_COLUMN_NAME in columns and len(datas) == len(columns) - 1:
+            columns.remove(self.TIME_MS_COLUMN_NAME)
         placeholders = ', '.join('?' * len(datas))
-        sql = f"""INSERT INTO "{table_name}" VALUES ({placeholders});"""
+        if len(columns) == len(datas):
+            columns_sql = ', '.join(self.quote_ident(c) for c in columns)
+            sql = f"""INSERT INTO "{table_name}" ({columns_sql}) VALUES ({placeholders});"""
+        else:
+            sql = f"""INSERT INTO "{table_name}" VALUES ({placeholders});"""
 
         with self.execute_transaction() as cursor:
             cursor.execute(sql, tuple(datas))
+            self._invalidate_meta_cache(table_name)
             return cursor.rowcount
 
+    def _iter_row_chunks(self, rows, chunk_size: int):
+        """把 rows 切成每块 chunk_size 行；NumPy 数组按切片 tolist()，转成 Python 原生类型"""
+        if hasattr(rows, "tolist") and hasattr(rows, "__getitem__") and hasattr(rows, "__len__"):
+            for start in range(0, len(rows), chunk_size):
+                yield rows[start:start + chunk_size].tolist()
+            return
+        iterator = iter(rows)
+        while True:
+            chunk = list(itertools.islice(iterator, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def _executemany_chunked(self, sql: str, table_name: str, rows, chunk_size: int) -> int:
+        """分块执行 executemany，每块一个事务，返回写入行数；出错时回滚当前块并返回已提交的行数"""
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be > 0")
+        written = 0
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                for chunk in self._iter_row_chunks(rows, chunk_size):
+                    try:
+                        self._begin_immediate(cursor)
+                        cursor.executemany(sql, chunk)
+                        conn.commit()
+                    except Exception as e:
+                        conn.rollback()
+                        logger.error(f"批量写入表 {table_name} 失败，已写入 {written} 行: {e}")
+                        return written
+                    written += max(cursor.rowcount, 0)
+            finally:
+                cursor.close()
+        self._invalidate_meta_cache(table_name)
+        return written
+
+    def insert_many(self, table_name: str, columns: Sequence[str], rows: Iterable[Sequence[Any]],
+                    chunk_size: int = 5000) -> int:
+        """
+        批量插入数据，每 chunk_size 行一个事务
+
+        Args:
+            table_name: 表名
+            columns: 列名列表
+            rows: 行数据的可迭代对象（可以是生成器），或二维 / 结构化 NumPy 数组
+            chunk_size: 每个事务写入的行数
+
+        Returns:
+            int: 写入的行数
+        """
+        spec = self._partition_spec(table_name)
+        if spec is not None:
+            return self._insert_many_partitioned("INSERT", table_name, spec, columns, rows, chunk_size)
+        columns_sql = ', '.join(self.quote_ident(c) for c in columns)
+        placeholders = ', '.join('?' * len(columns))
+        sql = f"""INSERT INTO {self.quote_ident(table_name)} ({columns_sql}) VALUES ({placeholders});"""
+        return self._executemany_chunked(sql, table_name, rows, chunk_size)
+
+    def insert_or_ignore_many(self, table_name: str, columns: Sequence[str], rows: Iterable[Sequence[Any]],
+                              chunk_size: int = 5000) -> int:
+        """批量插入数据重复就忽略，参数同 insert_many，返回实际写入（未被忽略）的行数"""
+        spec = self._partition_spec(table_name)
+        if spec is not None:
+            return self._insert_many_partitioned("INSERT OR IGNORE", table_name, spec, columns, rows, chunk_size)
+        columns_sql = ', '.join(self.quote_ident(c) for c in columns)
+        placeholders = ', '.join('?' * len(columns))
+        sql = f"""INSERT OR IGNORE INTO {self.quote_ident(table_name)} ({columns_sql}) VALUES ({placeholders});"""
+        return self._executemany_chunked(sql, table_name, rows, chunk_size)
+
     def query_conditions(self, table_name: str, conditions: str = "") -> List[tuple]:
         """查询数据"""
         sql = f"""SELECT * FROM "{table_name}" """
@@ -620,6 +2734,7 @@ class SQLiteManager:
 
         with self.execute_transaction() as cursor:
             cursor.execute(sql, tuple(kwargs.values()) + tuple(criteria.values()))
+            self._invalidate_meta_cache(table_name)
             return cursor.rowcount
 
     def delete(self, table_name: str, **kwargs) -> int:
@@ -631,17 +2746,34 @@ class SQLiteManager:
 
         with self.execute_transaction() as cursor:
             cursor.execute(sql, tuple(kwargs.values()))
+            self._invalidate_meta_cache(table_name)
             return cursor.rowcount
 
     def close(self):
-        """关闭数据库连接（在上下文管理模式下，这个方法主要用于兼容性）"""
-        logger.info("使用上下文管理器模式，连接会自动关闭")
+        """关闭数据库连接（非连接池模式下连接会自动关闭，这个方法主要用于兼容性）"""
+        if self.pool_mode is None:
+            logger.info("使用上下文管理器模式，连接会自动关闭")
+            return
+        self._pool_closed = True
+        with self._pool_lock:
+            connections = list(self._pool_connections.values())
+            self._pool_connections.clear()
+            self._pool_last_used.clear()
+            self._pool_owner.clear()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"关闭数据库连接失败: {e}")
+        logger.info(f"连接池已关闭，共关闭 {len(connections)} 个连接")
     """
     @author wangjie
     @create_time 2025-11-27
     @start
     """
-    def get_trajectory_xyz_data_by_table(self, table_name, start_time=None, end_time=None, limit=None):
+    @_catalog_scoped
+    def get_trajectory_xyz_data_by_table(self, table_name, start_time=None, end_time=None, limit=None,
+                                         columnar=False):
         """
         从指定表获取时间和XYZ坐标数据
 
@@ -650,9 +2782,10 @@ class SQLiteManager:
             start_time (str, optional): 开始时间
             end_time (str, optional): 结束时间
             limit (int, optional): 限制返回条数
+            columnar (bool): 是否返回 {'time','x','y','z': NumPy 数组}
 
         Returns:
-            list: 包含 [time, x, y, z] 的数据列表
+            list: 包含 [time, x, y, z] 的数据列表（columnar=True 时为列字典）
         """
         try:
             conditions = []
@@ -678,15 +2811,18 @@ class SQLiteManager:
 
             with self.execute_transaction() as cursor:
                 cursor.execute(sql, params)
+                if columnar:
+                    return self._columnar_from_cursor(cursor)
                 return cursor.fetchall()
 
         except Exception as e:
             logger.error(f"从表 {table_name} 获取XYZ轨迹数据失败: {e}")
-            return []
+            return {} if columnar else []
 
+    @_catalog_scoped
     def get_table_data_count(self, table_name, start_time=None, end_time=None):
         """
-        获取指定表的数据条数
+        获取指定表的数据条数（包括已归档的数据）
 
         Args:
             table_name (str): 表名
@@ -697,31 +2833,65 @@ class SQLiteManager:
             int: 数据条数
         """
         try:
-            conditions = []
-            params = []
+            return self._count_live(table_name, start_time, end_time) + \
+                self._count_archived(table_name, start_time, end_time)
+        except Exception as e:
+            logger.error(f"获取表 {table_name} 数据条数失败: {e}")
+            return 0
 
-            if start_time:
-                conditions.append("time >= ?")
-                params.append(start_time)
+    def _count_archived(self, table_name: str, start_time=None, end_time=None) -> int:
+        """已归档的行数：完全落在范围内的文件直接用登记的行数，其余文件按时间戳列计数"""
+        from public.dao.SQLite import archive_store
+
+        start_s = self._time_text_to_seconds(start_time)
+        end_s = self._time_text_to_seconds(end_time)
+        total = 0
+        for archive_file in self.get_archived_days(table_name, start_s, end_s):
+            lo = math.floor(start_s * 1000) if start_s is not None else None
+            hi = math.floor(end_s * 1000) if end_s is not None else None
+            if (lo is None or lo <= archive_file["start_ms"]) and (hi is None or hi >= archive_file["end_ms"] - 1):
+                total += archive_file["row_count"]
+            else:
+                total += archive_store.count_rows(archive_file["path"], lo, hi)
+        return total
+
+    def _count_live(self, table_name, start_time=None, end_time=None) -> int:
+        """数据库中（未归档）的数据条数"""
+        spec = self._partition_spec(table_name)
+        if spec is not None:
+            return self._count_partitioned(table_name, start_time, end_time)
+
+        # 优先使用触发器维护的行数统计
+        if not start_time and not end_time:
+            maintained = self.get_maintained_row_count(table_name)
+            if maintained is not None:
+                return maintained
+        else:
+            bucket_count = self._count_by_day_buckets(table_name, start_time, end_time)
+            if bucket_count is not None:
+                return bucket_count
 
-            if end_time:
-                conditions.append("time <= ?")
-                params.append(end_time)
+        conditions = []
+        params = []
 
-            where_clause = ""
-            if conditions:
-                where_clause = "WHERE " + " AND ".join(conditions)
+        if start_time:
+            conditions.append("time >= ?")
+            params.append(start_time)
 
-            sql = f'SELECT COUNT(*) FROM "{table_name}" {where_clause}'
+        if end_time:
+            conditions.append("time <= ?")
+            params.append(end_time)
 
-            with self.execute_transaction() as cursor:
-                cursor.execute(sql, params)
-                result = cursor.fetchone()
-                return result[0] if result else 0
+        where_clause = ""
+        if conditions:
+            where_clause = "WHERE " + " AND ".join(conditions)
 
-        except Exception as e:
-            logger.error(f"获取表 {table_name} 数据条数失败: {e}")
-            return 0
+        sql = f'SELECT COUNT(*) FROM "{table_name}" {where_clause}'
+
+        with self.execute_transaction() as cursor:
+            cursor.execute(sql, params)
+            result = cursor.fetchone()
+            return result[0] if result else 0
 
     def check_table_exists(self, table_name):
         """
@@ -734,9 +2904,7 @@ class SQLiteManager:
             bool: 表是否存在
         """
         try:
-            with self.execute_transaction() as cursor:
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-                return cursor.fetchone() is not None
+            return self.is_exist_table(table_name)
         except Exception as e:
             logger.error(f"检查表 {table_name} 是否存在失败: {e}")
             return False
@@ -750,10 +2918,13 @@ class SQLiteManager:
             list: 表名列表
         """
         try:
-            with self.execute_transaction() as cursor:
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-                tables = cursor.fetchall()
-                return [table[0] for table in tables]
+            catalog = self.get_schema_catalog()
+            internal = (self.ROW_COUNT_TABLE_NAME, self.ROW_COUNT_BUCKET_TABLE_NAME,
+                        self.PARTITIONED_TABLE_NAME, self.PARTITION_TABLE_NAME, self.ARCHIVE_TABLE_NAME)
+            # 分区表只返回逻辑表名
+            return [name for name, info in catalog.items()
+                    if (info["type"] == 'table' and name not in internal and info["partition_of"] is None)
+                    or info["partitioned"] is not None]
         except Exception as e:
             logger.error(f"获取所有表名失败: {e}")
             return []
@@ -770,7 +2941,7 @@ class SQLiteManager:
     @start
     """
 
-    def get_trajectory_xyz_data(self, table_name, limit=None, valid_only=True):
+    def get_trajectory_xyz_data(self, table_name, limit=None, valid_only=True, columnar=False):
         """
         获取指定表的XYZ轨迹数据
 
@@ -778,9 +2949,10 @@ class SQLiteManager:
             table_name (str): 表名
             limit (int, optional): 限制返回的数据条数
             valid_only (bool): 是否只返回有效数据（XYZ都不为null）
+            columnar (bool): 是否返回 {'image_name','X (m)','Y (m)','Z (m)': NumPy 数组}
 
         Returns:
-            list: XYZ轨迹数据列表
+            list: XYZ轨迹数据列表（columnar=True 时为列字典）
         """
         try:
             conditions = []
@@ -808,6 +2980,10 @@ class SQLiteManager:
 
             with self.execute_transaction() as cursor:
                 cursor.execute(sql)
+                if columnar:
+                    result = self._columnar_from_cursor(cursor)
+                    logger.info(f"📊 查询到 {len(result['image_name'])} 条数据")
+                    return result
                 result = cursor.fetchall()
                 logger.info(f"📊 查询到 {len(result)} 条数据")
 
@@ -819,16 +2995,91 @@ class SQLiteManager:
             import traceback
             traceback.print_exc()
             # 确保始终返回空列表而不是None
-            return []
+            return {} if columnar else []
     """
     @author wangjie
     @create_time 2025-12-02
     @end
     """
 
+class QueryStream:
+    """
+    流式查询结果：按批迭代元组列表，迭代期间独占一个连接
+
+    cancel() 可在其他线程调用，迭代会在当前批次结束后停止并释放连接
+    """
+
+    def __init__(self, manager: SQLiteManager, sql: str, params: Sequence[Any], arraysize: int,
+                 cancel_event: Optional[threading.Event] = None, overlay: Optional[Dict[str, Any]] = None):
+        """overlay: SQL 引用的归档临时表（见 SQLiteManager._prepare_archive_overlay），在流的连接上创建"""
+        if arraysize <= 0:
+            raise ValueError("arraysize must be > 0")
+        self.columns: List[str] = []
+        self.rows_fetched = 0
+        self._manager = manager
+        self._sql = sql
+        self._params = params
+        self._arraysize = arraysize
+        self._overlay = overlay
+        self._cancel_event = cancel_event or threading.Event()
+        self._batches = self._run()
+        # 先执行 SQL，拿到列名
+        next(self._batches)
+
+    def _run(self):
+        with self._manager.get_connection() as conn, self._manager._archive_overlay(conn, self._overlay):
+            cursor = conn.cursor()
+            cursor.arraysize = self._arraysize
+            try:
+                cursor.execute(self._sql, self._params)
+                self.columns = [desc[0] for desc in cursor.description] if cursor.description else []
+                yield None
+                while not self._cancel_event.is_set():
+                    rows = cursor.fetchmany()
+                    if not rows:
+                        break
+                    self.rows_fetched += len(rows)
+                    yield rows
+            finally:
+                cursor.close()
+
+    def __iter__(self):
+        return self._batches
+
+    def iter_rows(self):
+        """逐行迭代"""
+        for batch in self._batches:
+            yield from batch
+
+    def iter_dicts(self):
+        """逐行迭代为 {列名: 值}，只在当前批次内构造字典"""
+        columns = self.columns
+        for batch in self._batches:
+            for row in batch:
+                yield dict(zip(columns, row))
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def close(self):
+        self._batches.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
 # 权限控制类也需要相应修改
 class ReadOnlyUser(SQLiteManager):
-    """读取用户类"""
+    """读取用户类，使用只读连接配置"""
+
+    CONNECTION_PROFILE = SQLiteManager.PROFILE_READER
 
     def insert(self, *args, **kwargs):
         raise PermissionError("该用户没有写入权限。")
@@ -842,6 +3093,12 @@ class ReadOnlyUser(SQLiteManager):
     def insert_not_columns(self, *args, **kwargs):
         raise PermissionError("该用户没有写入权限。")
 
+    def insert_many(self, *args, **kwargs):
+        raise PermissionError("该用户没有写入权限。")
+
+    def insert_or_ignore_many(self, *args, **kwargs):
+        raise PermissionError("该用户没有写入权限。")
+
     def update(self, *args, **kwargs):
         raise PermissionError("该用户没有写入权限。")
 
@@ -854,9 +3111,32 @@ class ReadOnlyUser(SQLiteManager):
     def create_meta_table(self, *args, **kwargs):
         raise PermissionError("该用户没有写入权限。")
 
+    def enable_row_counts(self, *args, **kwargs):
+        raise PermissionError("该用户没有写入权限。")
+
+    def migrate_time_ms(self, *args, **kwargs):
+        raise PermissionError("该用户没有写入权限。")
+
+    def create_partitioned_table(self, *args, **kwargs):
+        raise PermissionError("该用户没有写入权限。")
+
+    def drop_partitions_before(self, *args, **kwargs):
+        raise PermissionError("该用户没有写入权限。")
+
+    def drop_partition(self, *args, **kwargs):
+        raise PermissionError("该用户没有写入权限。")
+
+    def detach_partition(self, *args, **kwargs):
+        raise PermissionError("该用户没有写入权限。")
+
+    def archive_older_than(self, *args, **kwargs):
+        raise PermissionError("该用户没有写入权限。")
+
 
 class WriteOnlyUser(SQLiteManager):
-    """写入用户类"""
+    """写入用户类，使用写入连接配置"""
+
+    CONNECTION_PROFILE = SQLiteManager.PROFILE_WRITER
 
     def query(self, *args, **kwargs):
         raise PermissionError("该用户没有读取权限。")
@@ -876,6 +3156,18 @@ class WriteOnlyUser(SQLiteManager):
     def get_multi_table_data(self, *args, **kwargs):
         raise PermissionError("该用户没有读取权限。")
 
+    def iter_query(self, *args, **kwargs):
+        raise PermissionError("该用户没有读取权限。")
+
+    def iter_table(self, *args, **kwargs):
+        raise PermissionError("该用户没有读取权限。")
+
+    def stream_multi_table_data(self, *args, **kwargs):
+        raise PermissionError("该用户没有读取权限。")
+
+    def query_downsampled(self, *args, **kwargs):
+        raise PermissionError("该用户没有读取权限。")
+
 
 def test():
     db = SQLiteManager('example.db')
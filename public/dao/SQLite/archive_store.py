@@ -0,0 +1,229 @@
+# 冷数据归档文件：每张表每天一个压缩的 NumPy .npz 列式文件
+# 文件内容：
+#   __columns__  列名（str 数组）
+#   __kinds__    每列的编码方式 int / float / text / blob / json / null
+#   __time_ms__  每行的毫秒时间戳（int64，已排序），用于范围过滤
+#   c{i}         第 i 列的值；text / json / blob 列为 c{i} (UTF-8 或原始字节 uint8 拼接) + c{i}_offsets，
+#                不按最长字符串补齐（旧版本文件中 text / json 为定长 str 数组，仍可读取）
+#   c{i}_null    第 i 列的 NULL 掩码
+# 不使用 pickle，np.load(allow_pickle=False) 即可读取
+import collections
+import functools
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+KIND_INT = 'int'
+KIND_FLOAT = 'float'
+KIND_TEXT = 'text'
+KIND_BLOB = 'blob'
+KIND_JSON = 'json'
+KIND_NULL = 'null'
+
+# 解码后的行缓存（见 iter_archive_cached）：按 (文件, 列, 行号范围) 缓存，总行数超过上限时淘汰最久未用的范围
+ROW_CACHE_MAX_ROWS = 500000
+_row_cache: "collections.OrderedDict[tuple, List[tuple]]" = collections.OrderedDict()
+_row_cache_rows = 0
+_row_cache_lock = threading.Lock()
+
+
+def _column_kind(values: Sequence[Any]) -> str:
+    types = {type(v) for v in values if v is not None}
+    if not types:
+        return KIND_NULL
+    if types == {int}:
+        return KIND_INT
+    if types <= {int, float}:
+        return KIND_FLOAT
+    if types == {str}:
+        return KIND_TEXT
+    if types == {bytes}:
+        return KIND_BLOB
+    if bytes in types:
+        raise ValueError(f"归档不支持混合二进制与其他类型的列: {types}")
+    return KIND_JSON
+
+
+def _encode_bytes(key: str, chunks: Sequence[bytes]) -> Dict[str, np.ndarray]:
+    """变长值按字节拼接，c{i}_offsets[k]:c{i}_offsets[k + 1] 为第 k 行"""
+    return {key: np.frombuffer(b''.join(chunks), dtype=np.uint8),
+            f"{key}_offsets": np.cumsum([0] + [len(c) for c in chunks], dtype=np.int64)}
+
+
+def _encode_column(index: int, values: Sequence[Any]) -> Dict[str, np.ndarray]:
+    kind = _column_kind(values)
+    key = f"c{index}"
+    null = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+    arrays = {f"{key}_null": null}
+    if kind == KIND_INT:
+        arrays[key] = np.array([0 if v is None else v for v in values], dtype=np.int64)
+    elif kind == KIND_FLOAT:
+        arrays[key] = np.array([0.0 if v is None else v for v in values], dtype=np.float64)
+    elif kind == KIND_TEXT:
+        arrays.update(_encode_bytes(key, [b'' if v is None else v.encode('utf-8') for v in values]))
+    elif kind == KIND_JSON:
+        arrays.update(_encode_bytes(key, [b'' if v is None else json.dumps(v, ensure_ascii=False).encode('utf-8')
+                                          for v in values]))
+    elif kind == KIND_BLOB:
+        arrays.update(_encode_bytes(key, [b'' if v is None else v for v in values]))
+    return {'kind': kind, **arrays}
+
+
+def _decode_column(data, index: int, kind: str, lo: int, hi: int) -> List[Any]:
+    """解码第 index 列的第 [lo, hi) 行"""
+    key = f"c{index}"
+    null = data[f"{key}_null"][lo:hi]
+    if kind == KIND_NULL:
+        return [None] * len(null)
+    if f"{key}_offsets" in data:
+        raw = data[key]
+        offsets = data[f"{key}_offsets"][lo:hi + 1].tolist()
+        values = [raw[start:end].tobytes() for start, end in zip(offsets, offsets[1:])]
+        if kind != KIND_BLOB:
+            values = [v.decode('utf-8') for v in values]
+    else:
+        values = data[key][lo:hi].tolist()
+    if kind == KIND_JSON:
+        values = [json.loads(v) if v else None for v in values]
+    return [None if is_null else value for value, is_null in zip(values, null.tolist())]
+
+
+def write_archive(path: str, columns: Sequence[str], rows: Sequence[Sequence[Any]], time_ms: Sequence[int]):
+    """
+    写入归档文件（先写临时文件再替换，中途失败不会留下不完整的文件）
+
+    Args:
+        path: 目标 .npz 路径
+        columns: 列名
+        rows: 行元组，与 time_ms 一一对应
+        time_ms: 每行的毫秒时间戳
+    """
+    order = np.argsort(np.asarray(time_ms, dtype=np.int64), kind='stable')
+    rows = [rows[i] for i in order]
+    arrays: Dict[str, np.ndarray] = {
+        "__columns__": np.array(list(columns), dtype=str),
+        "__time_ms__": np.asarray(time_ms, dtype=np.int64)[order],
+    }
+    kinds = []
+    for index, values in enumerate(zip(*rows) if rows else [[] for _ in columns]):
+        encoded = _encode_column(index, list(values))
+        kinds.append(encoded.pop('kind'))
+        arrays.update(encoded)
+    arrays["__kinds__"] = np.array(kinds, dtype=str)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+@functools.lru_cache(maxsize=32)
+def _load(path: str) -> Dict[str, np.ndarray]:
+    """读取整个归档文件；文件名带版本号，内容不会变化，可以安全缓存"""
+    with np.load(path, allow_pickle=False) as data:
+        return {key: data[key] for key in data.files}
+
+
+def _row_range(time_ms: np.ndarray, start_ms: Optional[int], end_ms: Optional[int]) -> Tuple[int, int]:
+    """time_ms 已排序，[start_ms, end_ms] 对应的行号范围 [lo, hi)"""
+    lo = 0 if start_ms is None else int(np.searchsorted(time_ms, start_ms, side='left'))
+    hi = len(time_ms) if end_ms is None else int(np.searchsorted(time_ms, end_ms, side='right'))
+    return lo, max(lo, hi)
+
+
+def time_index(path: str) -> np.ndarray:
+    """归档文件每行的毫秒时间戳（int64，已排序，与缓存共用，不要修改）"""
+    return _load(path)["__time_ms__"]
+
+
+def row_range(path: str, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> Tuple[int, int]:
+    """归档文件中 [start_ms, end_ms] 范围对应的行号范围 [lo, hi)"""
+    return _row_range(_load(path)["__time_ms__"], start_ms, end_ms)
+
+
+def column_kinds(path: str) -> Dict[str, str]:
+    """归档文件中每列的编码方式 {列名: int / float / text / blob / json / null}"""
+    data = _load(path)
+    return dict(zip(data["__columns__"].tolist(), data["__kinds__"].tolist()))
+
+
+def count_rows(path: str, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> int:
+    """归档文件中 [start_ms, end_ms] 范围内的行数（只读时间戳列，不解码其它列）"""
+    lo, hi = _row_range(_load(path)["__time_ms__"], start_ms, end_ms)
+    return hi - lo
+
+
+def iter_archive(path: str, columns: Sequence[str], start_ms: Optional[int] = None,
+                 end_ms: Optional[int] = None, batch_size: int = 10000) -> Iterator[List[tuple]]:
+    """
+    按批读取归档文件中 [start_ms, end_ms] 范围内的行，每批最多 batch_size 行，按时间排序；
+    每批按列解码后再组成行，不会一次把范围内所有行转换为 Python 对象
+
+    Args:
+        path: 归档文件路径
+        columns: 需要的列，文件中没有的列取 None
+        start_ms/end_ms: 毫秒时间戳范围（闭区间），None 表示不限
+    """
+    data = _load(path)
+    lo, hi = _row_range(data["__time_ms__"], start_ms, end_ms)
+    file_columns = data["__columns__"].tolist()
+    kinds = data["__kinds__"].tolist()
+    indexes = [file_columns.index(column) if column in file_columns else None for column in columns]
+    for batch_lo in range(lo, hi, batch_size):
+        batch_hi = min(batch_lo + batch_size, hi)
+        column_values = [_decode_column(data, index, kinds[index], batch_lo, batch_hi) if index is not None
+                         else [None] * (batch_hi - batch_lo)
+                         for index in indexes]
+        yield list(zip(*column_values)) if column_values else [()] * (batch_hi - batch_lo)
+
+
+def iter_archive_cached(path: str, columns: Sequence[str], start_ms: Optional[int] = None,
+                        end_ms: Optional[int] = None, batch_size: int = 10000) -> Iterator[List[tuple]]:
+    """
+    同 iter_archive，解码后的行按 (文件, 列, 行号范围) 缓存，同一范围再次读取（例如翻页、刷新图表）时不再解码；
+    文件名带版本号，内容不会变化，缓存无需失效。超过缓存上限四分之一的范围不缓存，直接按批解码
+    """
+    global _row_cache_rows
+    lo, hi = row_range(path, start_ms, end_ms)
+    if hi - lo > ROW_CACHE_MAX_ROWS // 4:
+        yield from iter_archive(path, columns, start_ms, end_ms, batch_size)
+        return
+    key = (path, tuple(columns), lo, hi)
+    with _row_cache_lock:
+        rows = _row_cache.get(key)
+        if rows is not None:
+            _row_cache.move_to_end(key)
+    if rows is None:
+        rows = [row for batch in iter_archive(path, columns, start_ms, end_ms, batch_size) for row in batch]
+        with _row_cache_lock:
+            if key not in _row_cache:
+                _row_cache[key] = rows
+                _row_cache_rows += len(rows)
+                while _row_cache_rows > ROW_CACHE_MAX_ROWS:
+                    _, evicted = _row_cache.popitem(last=False)
+                    _row_cache_rows -= len(evicted)
+    for i in range(0, len(rows), batch_size):
+        yield rows[i:i + batch_size]
+
+
+def read_archive(path: str, columns: Sequence[str], start_ms: Optional[int] = None,
+                 end_ms: Optional[int] = None):
+    """
+    读取归档文件中 [start_ms, end_ms] 范围内的行
+
+    Args:
+        path: 归档文件路径
+        columns: 需要的列，文件中没有的列取 None
+        start_ms/end_ms: 毫秒时间戳范围（闭区间），None 表示不限
+
+    Returns:
+        (行元组列表, 毫秒时间戳列表)，按时间排序
+    """
+    time_ms = _load(path)["__time_ms__"]
+    lo, hi = _row_range(time_ms, start_ms, end_ms)
+    rows = [row for batch in iter_archive(path, columns, start_ms, end_ms) for row in batch]
+    return rows, time_ms[lo:hi].tolist()
@@ -0,0 +1,143 @@
+# 连接配置压测：多个读线程 + 一个写线程并发访问同一数据库，对比默认连接与 reader/writer 连接配置
+# 用法: python -m public.dao.SQLite.benchmark_connection_profiles [--db bench.db] [--readers 8] [--seconds 10]
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from loguru import logger
+
+from public.dao.SQLite.SQliteManager import SQLiteManager, ReadOnlyUser, WriteOnlyUser
+
+TABLE_NAME = "bench_monitor_data"
+
+
+def _time_text(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+def prepare_database(db_name: str, rows: int):
+    """建表并预先写入 rows 行历史数据"""
+    manager = SQLiteManager(db_name)
+    manager.create_table(TABLE_NAME, {'id': 'INTEGER PRIMARY KEY AUTOINCREMENT', 'time': 'TEXT',
+                                      'temperature': 'REAL', 'humidity': 'REAL'}, with_time_ms=True)
+    start = time.time() - rows
+    manager.insert_many(TABLE_NAME, ['time', 'temperature', 'humidity'],
+                        ((_time_text(start + i), 20 + i % 10, 50 + i % 7) for i in range(rows)))
+    manager.close()
+
+
+def _reader_loop(manager: SQLiteManager, history: tuple, stop: threading.Event, stats: dict,
+                 lock: threading.Lock):
+    queries = errors = 0
+    latencies = []
+    history_start, history_end = history
+    while not stop.is_set():
+        # 只读压测开始前的历史数据，结果集大小不受写线程影响
+        start = random.randint(history_start, max(history_start, history_end - 3600 * 1000))
+        begin = time.perf_counter()
+        try:
+            with manager.get_connection() as conn:
+                conn.execute(f'SELECT time, temperature, humidity FROM "{TABLE_NAME}" '
+                             f'WHERE time_ms BETWEEN ? AND ? ORDER BY time_ms',
+                             (start, start + 3600 * 1000)).fetchall()
+            queries += 1
+            latencies.append(time.perf_counter() - begin)
+        except sqlite3.OperationalError:
+            errors += 1
+    with lock:
+        stats["reader_queries"] += queries
+        stats["reader_errors"] += errors
+        stats["reader_latencies"].extend(latencies)
+
+
+def _writer_loop(manager: SQLiteManager, stop: threading.Event, stats: dict, batch_size: int):
+    rows = errors = 0
+    while not stop.is_set():
+        now = time.time()
+        try:
+            with manager.get_connection() as conn:
+                cursor = conn.cursor()
+                manager._begin_immediate(cursor)
+                cursor.executemany(f'INSERT INTO "{TABLE_NAME}" (time, temperature, humidity) VALUES (?, ?, ?)',
+                                   [(_time_text(now + i / 1000), 25.0, 55.0) for i in range(batch_size)])
+                conn.commit()
+            rows += batch_size
+        except sqlite3.OperationalError:
+            errors += 1
+    stats["writer_rows"] = rows
+    stats["writer_errors"] = errors
+
+
+def run_case(name: str, reader_factory, writer_factory, history: tuple, readers: int, seconds: float,
+             batch_size: int) -> dict:
+    """运行一轮压测，返回吞吐量和错误数"""
+    stats = {"reader_queries": 0, "reader_errors": 0, "reader_latencies": [], "writer_rows": 0, "writer_errors": 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+    reader_manager = reader_factory()
+    writer_manager = writer_factory()
+    threads = [threading.Thread(target=_reader_loop, args=(reader_manager, history, stop, stats, lock))
+               for _ in range(readers)]
+    threads.append(threading.Thread(target=_writer_loop, args=(writer_manager, stop, stats, batch_size)))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    reader_manager.close()
+    writer_manager.close()
+
+    latencies = sorted(stats.pop("reader_latencies"))
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0
+    result = {
+        "case": name,
+        "reader_qps": round(stats["reader_queries"] / seconds, 1),
+        "reader_p95_ms": round(p95, 2),
+        "reader_errors": stats["reader_errors"],
+        "writer_rows_per_s": round(stats["writer_rows"] / seconds, 1),
+        "writer_errors": stats["writer_errors"],
+    }
+    logger.info(f"{name}: {result}")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="对比默认连接与 reader/writer 连接配置在并发读写下的表现")
+    parser.add_argument("--db", default=None, help="压测数据库路径，默认使用临时文件")
+    parser.add_argument("--rows", type=int, default=200000, help="预先写入的历史数据行数")
+    parser.add_argument("--readers", type=int, default=8, help="读线程数")
+    parser.add_argument("--seconds", type=float, default=10.0, help="每轮压测时长")
+    parser.add_argument("--batch-size", type=int, default=50, help="写线程每个事务写入的行数")
+    args = parser.parse_args(argv)
+
+    db_name = args.db or os.path.join(tempfile.mkdtemp(prefix="sqlite_bench_"), "bench.db")
+    if not os.path.exists(db_name):
+        prepare_database(db_name, args.rows)
+
+    with SQLiteManager(db_name).get_connection() as conn:
+        history = tuple(conn.execute(f'SELECT MIN(time_ms), MAX(time_ms) FROM "{TABLE_NAME}"').fetchone())
+
+    pool_mode = SQLiteManager.POOL_MODE_THREAD
+    results = [
+        run_case("default", lambda: SQLiteManager(db_name, pool_mode=pool_mode),
+                 lambda: SQLiteManager(db_name, pool_mode=pool_mode),
+                 history, args.readers, args.seconds, args.batch_size),
+        run_case("profiles", lambda: ReadOnlyUser(db_name, pool_mode=pool_mode),
+                 lambda: WriteOnlyUser(db_name, pool_mode=pool_mode),
+                 history, args.readers, args.seconds, args.batch_size),
+    ]
+    header = list(results[0].keys())
+    print("\t".join(header))
+    for result in results:
+        print("\t".join(str(result[key]) for key in header))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+# 为已有监控数据库补充 time_ms 毫秒时间戳列
+# 用法: python -m public.dao.SQLite.migrate_time_ms data.db [--tables a b] [--batch-size 50000]
+import argparse
+
+from loguru import logger
+
+from public.dao.SQLite.SQliteManager import SQLiteManager
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="为含 time 列的数据表添加并回填 time_ms 列、索引和触发器")
+    parser.add_argument("db_name", help="SQLite 数据库文件路径")
+    parser.add_argument("--tables", nargs="*", default=None, help="要迁移的表，默认所有含 time 列的数据表")
+    parser.add_argument("--batch-size", type=int, default=50000, help="每批回填的 rowid 跨度")
+    args = parser.parse_args(argv)
+
+    manager = SQLiteManager(args.db_name, pool_mode=SQLiteManager.POOL_MODE_THREAD)
+    try:
+        result = manager.migrate_time_ms(tables=args.tables, batch_size=args.batch_size)
+    finally:
+        manager.close()
+    logger.info(f"迁移完成: {sum(result.values())} 行，涉及 {len(result)} 张表")
+    return result
+
+
+if __name__ == "__main__":
+    main()
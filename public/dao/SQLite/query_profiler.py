@@ -0,0 +1,326 @@
+# SQLite 查询剖析：记录每条语句的耗时、行数、调用模块，慢查询输出 EXPLAIN QUERY PLAN
+import bisect
+import collections
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from loguru import logger
+
+# 直方图桶上界（毫秒），最后一个桶为 +inf
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?(?![\w\"])")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+# 这些模块内的栈帧不算作“调用方”
+_INTERNAL_MODULES = (__name__, "public.dao.SQLite.SQliteManager", "contextlib")
+# 这些第三方库内部执行 SQL 时，记到调用它们的业务模块上
+_LIBRARY_PREFIXES = ("pandas.",)
+
+
+def normalize_sql(sql: str) -> str:
+    """归一化 SQL：合并空白、字面量替换为 ?、IN (?, ?, ...) 合并为 (?...)，使同类语句聚合到一起"""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    return _PLACEHOLDER_LIST.sub("(?...)", sql)
+
+
+def _caller_module() -> str:
+    """返回第一个不属于数据库封装层的调用方模块名"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if (module not in _INTERNAL_MODULES and not module.endswith("SQliteManager")
+                and not module.startswith(_LIBRARY_PREFIXES)):
+            return module
+        frame = frame.f_back
+    return "<unknown>"
+
+
+class _StatementStats:
+    """单条归一化语句的聚合统计"""
+
+    __slots__ = ("count", "total_ms", "max_ms", "rows", "params", "histogram", "callers")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.params = 0
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.callers: Dict[str, int] = collections.Counter()
+
+    def add(self, elapsed_ms: float, rows: int, params: int, caller: str):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows += rows
+        self.params = params
+        self.histogram[bisect.bisect_left(HISTOGRAM_BOUNDS_MS, elapsed_ms)] += 1
+        self.callers[caller] += 1
+
+    def to_dict(self, sql: str) -> Dict[str, Any]:
+        labels = [f"<={b}ms" for b in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}ms"]
+        return {
+            "sql": sql,
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "rows": self.rows,
+            "params": self.params,
+            "histogram": dict(zip(labels, self.histogram)),
+            "callers": dict(self.callers),
+        }
+
+
+class QueryProfiler:
+    """
+    查询剖析器，挂到 SQLiteManager 上后由 get_connection 返回的连接自动记录每条语句
+
+    用法:
+        profiler = QueryProfiler(slow_threshold_ms=100)
+        SQLiteManager.set_default_profiler(profiler)   # 或 SQLiteManager(db, profiler=profiler)
+        ...
+        profiler.export_json("query_profile.json")
+    """
+
+    def __init__(self, slow_threshold_ms: float = 200.0, explain_slow: bool = True, max_slow_queries: int = 200):
+        """
+        Args:
+            slow_threshold_ms: 慢查询阈值（毫秒），耗时包含执行和取数
+            explain_slow: 慢查询是否附带 EXPLAIN QUERY PLAN
+            max_slow_queries: 保留的最近慢查询条数
+        """
+        self.slow_threshold_ms = slow_threshold_ms
+        self.explain_slow = explain_slow
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _StatementStats] = {}
+        self._slow_queries = collections.deque(maxlen=max_slow_queries)
+
+    def record(self, sql: str, params_count: int, rows: int, elapsed_ms: float, caller: str,
+               plan: Optional[List[str]] = None):
+        """记录一次语句执行"""
+        normalized = normalize_sql(sql)
+        with self._lock:
+            stats = self._stats.get(normalized)
+            if stats is None:
+                stats = self._stats[normalized] = _StatementStats()
+            stats.add(elapsed_ms, rows, params_count, caller)
+            if elapsed_ms >= self.slow_threshold_ms:
+                self._slow_queries.append({
+                    "sql": normalized,
+                    "elapsed_ms": round(elapsed_ms, 3),
+                    "rows": rows,
+                    "params": params_count,
+                    "caller": caller,
+                    "plan": plan,
+                    "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                })
+        if elapsed_ms >= self.slow_threshold_ms:
+            plan_text = ("\n    " + "\n    ".join(plan)) if plan else ""
+            logger.warning(f"慢查询 {elapsed_ms:.1f}ms rows={rows} params={params_count} caller={caller}: "
+                           f"{normalized}{plan_text}")
+
+    def is_slow(self, elapsed_ms: float) -> bool:
+        return elapsed_ms >= self.slow_threshold_ms
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """导出每条归一化语句的统计和耗时直方图，按总耗时降序"""
+        with self._lock:
+            items = [stats.to_dict(sql) for sql, stats in self._stats.items()]
+        return sorted(items, key=lambda item: item["total_ms"], reverse=True)
+
+    def slow_queries(self) -> List[Dict[str, Any]]:
+        """最近的慢查询记录"""
+        with self._lock:
+            return list(self._slow_queries)
+
+    def export_json(self, path: str):
+        """把统计和慢查询写入 JSON 文件"""
+        data = {"statements": self.snapshot(), "slow_queries": self.slow_queries()}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        logger.info(f"查询剖析结果已导出到 {path}")
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._slow_queries.clear()
+
+
+def explain_query_plan(conn: sqlite3.Connection, sql: str, params: Sequence[Any]) -> Optional[List[str]]:
+    """在原连接上执行 EXPLAIN QUERY PLAN，返回按层级缩进的计划文本行"""
+    try:
+        rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    except sqlite3.Error as e:
+        logger.debug(f"EXPLAIN QUERY PLAN 失败: {e}")
+        return None
+    depth = {0: -1}
+    lines = []
+    for node_id, parent_id, _, detail in rows:
+        depth[node_id] = depth.get(parent_id, -1) + 1
+        lines.append("  " * depth[node_id] + str(detail))
+    return lines
+
+
+class ProfiledCursor:
+    """包装 sqlite3.Cursor，记录 execute 到下一次 execute/close 之间的耗时与取到的行数"""
+
+    def __init__(self, cursor: sqlite3.Cursor, connection: "ProfiledConnection"):
+        self._cursor = cursor
+        self._connection = connection
+        self._pending: Optional[dict] = None
+
+    def _start(self, sql: str, params, params_count: int, many: bool):
+        self._finish()
+        self._pending = {"sql": sql, "params": params, "params_count": params_count, "many": many,
+                         "rows": 0, "elapsed": 0.0, "caller": _caller_module()}
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        profiler = self._connection._profiler
+        elapsed_ms = pending["elapsed"] * 1000
+        rows = pending["rows"]
+        if rows == 0 and self._cursor.rowcount > 0:
+            rows = self._cursor.rowcount
+        plan = None
+        if profiler.explain_slow and profiler.is_slow(elapsed_ms) and not pending["many"]:
+            plan = explain_query_plan(self._connection._conn, pending["sql"], pending["params"])
+        profiler.record(pending["sql"], pending["params_count"], rows, elapsed_ms, pending["caller"], plan)
+
+    def _timed(self, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            if self._pending is not None:
+                self._pending["elapsed"] += time.perf_counter() - start
+
+    def execute(self, sql: str, parameters: Sequence[Any] = ()):
+        self._start(sql, parameters, len(parameters), many=False)
+        self._timed(self._cursor.execute, sql, parameters)
+        return self
+
+    def executemany(self, sql: str, seq_of_parameters):
+        counter = {"params": 0}
+
+        def counted():
+            for params in seq_of_parameters:
+                counter["params"] += len(params)
+                yield params
+
+        self._start(sql, (), 0, many=True)
+        try:
+            self._timed(self._cursor.executemany, sql, counted())
+        finally:
+            self._pending["params_count"] = counter["params"]
+        return self
+
+    def executescript(self, sql_script: str):
+        self._start(sql_script, (), 0, many=True)
+        self._timed(self._cursor.executescript, sql_script)
+        return self
+
+    def _count(self, rows):
+        if self._pending is not None:
+            self._pending["rows"] += len(rows)
+        return rows
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        if row is not None and self._pending is not None:
+            self._pending["rows"] += 1
+        return row
+
+    def fetchmany(self, size: Optional[int] = None):
+        if size is None:
+            return self._count(self._timed(self._cursor.fetchmany))
+        return self._count(self._timed(self._cursor.fetchmany, size))
+
+    def fetchall(self):
+        return self._count(self._timed(self._cursor.fetchall))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._cursor, name, value)
+
+
+class ProfiledConnection:
+    """包装 sqlite3.Connection，cursor()/execute()/executemany() 返回 ProfiledCursor"""
+
+    def __init__(self, conn: sqlite3.Connection, profiler: QueryProfiler):
+        self._conn = conn
+        self._profiler = profiler
+        self._cursors: List[ProfiledCursor] = []
+
+    def _wrap(self, cursor: sqlite3.Cursor) -> ProfiledCursor:
+        wrapped = ProfiledCursor(cursor, self)
+        self._cursors.append(wrapped)
+        return wrapped
+
+    def cursor(self, *args, **kwargs) -> ProfiledCursor:
+        return self._wrap(self._conn.cursor(*args, **kwargs))
+
+    def execute(self, sql: str, parameters: Sequence[Any] = ()) -> ProfiledCursor:
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters) -> ProfiledCursor:
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script: str) -> ProfiledCursor:
+        return self.cursor().executescript(sql_script)
+
+    def finish(self):
+        """连接归还前调用：记录所有尚未结束的语句"""
+        cursors, self._cursors = self._cursors, []
+        for cursor in cursors:
+            try:
+                cursor._finish()
+            except Exception as e:
+                logger.debug(f"记录查询剖析数据失败: {e}")
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self._conn.__exit__(exc_type, exc_val, exc_tb)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
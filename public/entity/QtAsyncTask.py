@@ -0,0 +1,106 @@
+# 在 Qt 主线程上驱动协程：await 数据库查询时不阻塞界面，查询完成后回到主线程继续执行
+import functools
+import inspect
+from concurrent.futures import Future
+from typing import Any, Callable, Coroutine, Optional, Set
+
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+from loguru import logger
+
+#logger = logger.bind(category="gui_logger")
+
+
+class QtAsyncTask(QObject):
+    """
+    在 Qt 主线程中执行协程，协程内 await AsyncSQLiteManager 的查询（concurrent.futures.Future）时挂起，
+    查询线程完成后通过信号（跨线程自动排队）回到主线程继续执行，因此协程体内可以直接操作控件。
+
+    类似 qasync 的 asyncSlot，但不需要替换 Qt 事件循环。用法:
+        @qt_async_slot
+        async def refresh(self):
+            page = await self.async_db.query_Epoch_datas(self.table_name, page=self.current_page)
+            self.fill_table(page)
+    """
+
+    _resume = pyqtSignal(object)
+    finished = pyqtSignal(object)  # 协程返回值
+    failed = pyqtSignal(object)  # 协程抛出的异常
+
+    # 运行中的任务，防止被垃圾回收
+    _running: Set["QtAsyncTask"] = set()
+
+    def __init__(self, coro: Coroutine, name: str = "", parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self._coro = coro
+        self.name = name or getattr(coro, "__qualname__", "coroutine")
+        self._waiting: Optional[Future] = None
+        self._cancelled = False
+        self._resume.connect(self._step)
+
+    @classmethod
+    def start(cls, coro: Coroutine, on_result: Optional[Callable[[Any], Any]] = None,
+              on_error: Optional[Callable[[BaseException], Any]] = None, name: str = "") -> "QtAsyncTask":
+        """创建并立即开始执行协程（执行到第一个 await 为止）"""
+        task = cls(coro, name=name)
+        if on_result is not None:
+            task.finished.connect(on_result)
+        if on_error is not None:
+            task.failed.connect(on_error)
+        cls._running.add(task)
+        task._step(None)
+        return task
+
+    def cancel(self):
+        """取消任务：正在等待的查询若尚未开始会被取消，协程不再继续执行"""
+        self._cancelled = True
+        if self._waiting is not None:
+            self._waiting.cancel()
+        self._coro.close()
+        self._finish()
+
+    def is_running(self) -> bool:
+        return self in self._running
+
+    def _finish(self):
+        self._running.discard(self)
+        self._waiting = None
+
+    @pyqtSlot(object)
+    def _step(self, _):
+        if self._cancelled:
+            return
+        self._waiting = None
+        self._advance(lambda: self._coro.send(None))
+
+    def _advance(self, resume: Callable[[], Any]):
+        try:
+            awaited = resume()
+        except StopIteration as stop:
+            self._finish()
+            self.finished.emit(stop.value)
+            return
+        except Exception as e:
+            self._finish()
+            logger.error(f"协程任务 {self.name} 执行失败: {e}")
+            self.failed.emit(e)
+            return
+
+        if not isinstance(awaited, Future):
+            error = TypeError(f"QtAsyncTask 只能等待查询执行器返回的 Future，收到 {awaited!r}")
+            self._advance(lambda: self._coro.throw(error))
+            return
+        self._waiting = awaited
+        # 回调在查询线程中执行，emit 跨线程排队到本对象所在的主线程
+        awaited.add_done_callback(self._resume.emit)
+
+
+def qt_async_slot(func: Callable[..., Coroutine]) -> Callable[..., QtAsyncTask]:
+    """把 async def 方法包装为普通函数，可直接连接到 Qt 信号；调用时在主线程上启动 QtAsyncTask"""
+    if not inspect.iscoroutinefunction(func):
+        raise TypeError("qt_async_slot 只能装饰 async def 函数")
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return QtAsyncTask.start(func(*args, **kwargs), name=func.__qualname__)
+
+    return wrapper
@@ -2,108 +2,378 @@
 数据缓存管理器 - 使用SQLite存储历史记录
 支持电量数据和几何量数据的缓存
 """
+import atexit
+import copy
 import sqlite3
 import json
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Optional, Any
+from typing import Callable, List, Dict, Optional, Any, Sequence
 from loguru import logger
 
+from public.dao.SQLite.SQliteManager import SQLiteManager
+
+
+class _QueryCache:
+    """
+    查询结果的进程内缓存（LRU，条数有上限，条目带 TTL）
+
+    每个缓存库有一个版本号，条目记录写入时相关库的版本号，版本号不一致的条目视为失效。版本号在以下情况加一：
+        - 本进程写入缓存库后（写穿失效）
+        - 读取前检查 PRAGMA data_version，发现有其他连接（本进程的其他线程或其他进程）提交了修改
+    data_version 只在同一个连接上可比较，因此每个库使用一个专用连接读取（在缓存锁下），
+    整个进程共用一个基准值，新线程第一次读取不会使缓存失效。
+    返回值为深拷贝，调用方修改结果不会影响缓存。
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()  # key -> (过期时间, 各库版本号, 结果)
+        self._versions: Dict[int, int] = {}
+        # 每个库只用于读取 data_version 的专用连接，以及上次读到的值
+        self._poll_connections: Dict[int, sqlite3.Connection] = {}
+        self._data_versions: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, db: SQLiteManager):
+        with self._lock:
+            self._versions[id(db)] = self._versions.get(id(db), 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def close(self):
+        """清空缓存并关闭读取 data_version 的专用连接"""
+        with self._lock:
+            self._entries.clear()
+            for conn in self._poll_connections.values():
+                conn.close()
+            self._poll_connections.clear()
+            self._data_versions.clear()
+
+    def _poll(self, db: SQLiteManager):
+        """在该库的专用连接上检查 data_version，其他连接提交过修改时使该库的条目失效"""
+        key = id(db)
+        with self._lock:
+            conn = self._poll_connections.get(key)
+            if conn is None:
+                conn = self._poll_connections[key] = db._create_connection()
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            previous = self._data_versions.get(key)
+            self._data_versions[key] = data_version
+            # 第一次读取只记录基准值：此前该库还没有任何缓存条目
+            if previous is not None and previous != data_version:
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+    def get_or_load(self, key: tuple, dbs: Sequence[SQLiteManager], loader: Callable[[], Any]) -> Any:
+        """返回有效的缓存结果，否则调用 loader 查询并缓存（loader 抛出异常时不缓存）"""
+        for db in dbs:
+            self._poll(db)
+        now = time.monotonic()
+        with self._lock:
+            versions = tuple(self._versions.get(id(db), 0) for db in dbs)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now and entry[1] == versions:
+                self._entries.move_to_end(key)
+                return copy.deepcopy(entry[2])
+
+        # 查询期间发生的写入会使版本号变化，按查询前的版本号登记，下次读取时重新查询
+        value = loader()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, versions, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
 
 class DataCacheManager:
-    """数据缓存管理器"""
-    
+    """
+    数据缓存管理器
+
+    两个缓存库各由一个 thread 连接池模式的 SQLiteManager 管理：每个线程持有一个长连接（WAL 模式），
+    GUI 进程中的读线程与 connect_server 进程中的写入方可以并发访问。
+    固定的 SQL 语句定义为类常量，sqlite3 在同一连接上按语句文本缓存编译结果，长连接下可直接复用。
+    页面反复调用的最新记录、设备列表和统计查询经过 _QueryCache 缓存，写入后或其他进程修改后失效。
+    """
+
+    _SQL_INSERT_EXCEL = """
+        INSERT INTO excel_records
+        (device_id, file_path, file_name, timestamp, sheet_count,
+         rated_voltage, rated_voltage_unit, rated_frequency, rated_frequency_unit, extra_data, content_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    _SQL_LATEST_EXCEL_BY_DEVICE = """
+        SELECT * FROM excel_records
+        WHERE device_id = ?
+        ORDER BY timestamp DESC, id DESC
+        LIMIT 1
+    """
+    _SQL_LATEST_EXCEL = """
+        SELECT * FROM excel_records
+        ORDER BY timestamp DESC, id DESC
+        LIMIT 1
+    """
+    _SQL_EXCEL_DEVICES = "SELECT DISTINCT device_id FROM excel_records ORDER BY device_id"
+    _SQL_INSERT_MEASUREMENT = """
+        INSERT INTO excel_measurements
+        (record_id, sheet_index, sheet_name, type_index, data_type, phase_index, phase,
+         device_index, device_name, mean, min, max, std, count)
+        VALUES (:record_id, :sheet_index, :sheet_name, :type_index, :data_type, :phase_index, :phase,
+                :device_index, :device_name, :mean, :min, :max, :std, :count)
+    """
+    _SQL_DELETE_MEASUREMENTS = "DELETE FROM excel_measurements WHERE record_id = ?"
+    # 每条记录取第一个包含 phase 文本的相位（与逐个解析 Excel 时的匹配规则一致）
+    _SQL_MEASUREMENT_TREND = """
+        SELECT timestamp, mean FROM (
+            SELECT r.id AS id, r.timestamp AS timestamp, m.mean AS mean, MIN(m.phase_index)
+            FROM excel_records r
+            JOIN excel_measurements m ON m.record_id = r.id
+            WHERE r.device_id = ? AND m.sheet_index = ? AND m.data_type = ?
+              AND instr(m.phase, ?) > 0 AND m.device_index = ?
+            GROUP BY r.id
+            ORDER BY r.timestamp DESC, r.id DESC
+            LIMIT ?
+        )
+        ORDER BY timestamp, id
+    """
+    _SQL_RECORDS_WITHOUT_MEASUREMENTS = """
+        SELECT * FROM (
+            SELECT * FROM excel_records
+            WHERE device_id = ?
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        ) r
+        WHERE NOT r.measurements_checked
+          AND NOT EXISTS (SELECT 1 FROM excel_measurements m WHERE m.record_id = r.id)
+    """
+    # 已计算过测量值统计（可能没有任何测量值）的记录不再补算
+    _SQL_MARK_MEASUREMENTS_CHECKED = "UPDATE excel_records SET measurements_checked = 1 WHERE id = ?"
+
+    _SQL_INSERT_IMAGE = """
+        INSERT INTO image_records
+        (device_id, file_path, file_name, original_path, recognized_path,
+         timestamp, file_size, extra_data, content_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    _SQL_LATEST_IMAGES_BY_DEVICE = """
+        SELECT * FROM image_records
+        WHERE device_id = ?
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    """
+    _SQL_LATEST_IMAGES = """
+        SELECT * FROM image_records
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    """
+    _SQL_IMAGE_DEVICES = "SELECT DISTINCT device_id FROM image_records ORDER BY device_id"
+    _SQL_IMAGE_EXTRA_DATA = "SELECT id, extra_data FROM image_records WHERE file_path = ?"
+    _SQL_UPDATE_IMAGE_EXTRA_DATA = "UPDATE image_records SET extra_data = ? WHERE id = ?"
+
+    # 磁盘配额相关：按数据类型选择缓存库和表
+    _SQL_UNHASHED_FILES = """
+        SELECT id, file_path FROM {table}
+        WHERE content_hash IS NULL AND NOT evicted AND id > ?
+        ORDER BY id
+        LIMIT ?
+    """
+    _SQL_SET_CONTENT_HASH = "UPDATE {table} SET content_hash = ? WHERE id = ?"
+    # 已淘汰的记录也计入：上次删除失败（例如文件正被打开）留下的硬链接下次一并删除
+    _SQL_REFERENCED_HASHES = "SELECT DISTINCT content_hash FROM {table} WHERE content_hash IS NOT NULL"
+    _SQL_PATHS_BY_HASH = "SELECT DISTINCT file_path FROM {table} WHERE content_hash = ?"
+    _SQL_MARK_EVICTED = "UPDATE {table} SET evicted = 1 WHERE content_hash = ? AND NOT evicted"
+
     def __init__(self, cache_dir: str = "cache"):
         """
         初始化缓存管理器
-        
+
         Args:
             cache_dir: 缓存目录路径
         """
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(parents=True, exist_ok=True)
-        
+
         # 电量数据数据库
         self.excel_db_path = self.cache_dir / "excel_data_cache.db"
         # 几何量数据数据库
         self.image_db_path = self.cache_dir / "image_data_cache.db"
-        
+
+        # 每个线程一个长连接，连接在线程结束或 close() 时关闭
+        self.excel_db = SQLiteManager(str(self.excel_db_path), pool_mode=SQLiteManager.POOL_MODE_THREAD,
+                                      connection_profile=SQLiteManager.PROFILE_WRITER)
+        self.image_db = SQLiteManager(str(self.image_db_path), pool_mode=SQLiteManager.POOL_MODE_THREAD,
+                                      connection_profile=SQLiteManager.PROFILE_WRITER)
+
+        # 最新记录、设备列表、统计信息的查询缓存
+        self._query_cache = _QueryCache()
+
         # 初始化数据库
         self._init_excel_database()
         self._init_image_database()
-        
+
         logger.info(f"缓存管理器初始化完成，目录: {self.cache_dir}")
-    
+
+    def close(self):
+        """关闭两个缓存库的所有连接（最后一个连接关闭时 SQLite 会做 WAL 检查点）"""
+        self._query_cache.close()
+        self.excel_db.close()
+        self.image_db.close()
+
+    # ==================== 连接辅助 ====================
+
+    @staticmethod
+    def _row_to_record(row: sqlite3.Row) -> Dict[str, Any]:
+        record = dict(row)
+        if record.get('extra_data'):
+            try:
+                record['extra_data'] = json.loads(record['extra_data'])
+            except:
+                pass
+        return record
+
+    def _fetch_records(self, db: SQLiteManager, sql: str, params: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+        with db.get_connection(row_factory=sqlite3.Row) as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [self._row_to_record(row) for row in rows]
+
+    def _fetch_column(self, db: SQLiteManager, sql: str, params: Sequence[Any] = ()) -> List[Any]:
+        with db.get_connection() as conn:
+            return [row[0] for row in conn.execute(sql, params).fetchall()]
+
+    def _execute_write(self, db: SQLiteManager, sql: str, params: Sequence[Any] = ()) -> int:
+        """执行一条写语句并提交，返回受影响的行数"""
+        try:
+            with db.get_connection() as conn:
+                cursor = conn.execute(sql, params)
+                conn.commit()
+                return cursor.rowcount
+        finally:
+            self._query_cache.invalidate(db)
+
+    @staticmethod
+    def _ensure_column(cursor: sqlite3.Cursor, table_name: str, column: str, declaration: str):
+        """旧版本创建的表缺少列时补上（新增列均可为空）"""
+        columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table_name})")}
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column} {declaration}")
+
     def _init_excel_database(self):
         """初始化电量数据数据库"""
-        conn = sqlite3.connect(str(self.excel_db_path))
-        cursor = conn.cursor()
-        
-        # 创建电量数据表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS excel_records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                device_id TEXT NOT NULL,
-                file_path TEXT NOT NULL,
-                file_name TEXT NOT NULL,
-                timestamp TEXT NOT NULL,
-                sheet_count INTEGER DEFAULT 0,
-                rated_voltage REAL DEFAULT 0,
-                rated_voltage_unit TEXT DEFAULT '',
-                rated_frequency REAL DEFAULT 0,
-                rated_frequency_unit TEXT DEFAULT '',
-                extra_data TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # 创建索引
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_device_timestamp 
-            ON excel_records(device_id, timestamp DESC)
-        """)
-        
-        conn.commit()
-        conn.close()
+        with self.excel_db.get_connection() as conn:
+            cursor = conn.cursor()
+
+            # 创建电量数据表
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS excel_records (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    device_id TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    sheet_count INTEGER DEFAULT 0,
+                    rated_voltage REAL DEFAULT 0,
+                    rated_voltage_unit TEXT DEFAULT '',
+                    rated_frequency REAL DEFAULT 0,
+                    rated_frequency_unit TEXT DEFAULT '',
+                    extra_data TEXT,
+                    content_hash TEXT,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            self._ensure_column(cursor, 'excel_records', 'content_hash', 'TEXT')
+            # 文件被磁盘配额清理删除后记录保留（元信息、测量值统计仍可用于列表和趋势图），只标记为已淘汰
+            self._ensure_column(cursor, 'excel_records', 'evicted', 'INTEGER NOT NULL DEFAULT 0')
+            self._ensure_column(cursor, 'excel_records', 'measurements_checked', 'INTEGER NOT NULL DEFAULT 0')
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_excel_content_hash ON excel_records(content_hash)")
+
+            # 创建索引
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_device_timestamp
+                ON excel_records(device_id, timestamp DESC)
+            """)
+
+            # 每个文件每个 (Sheet, 数据类型, 相位, 设备) 组合的测量值统计，入库时计算一次
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS excel_measurements (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    record_id INTEGER NOT NULL REFERENCES excel_records(id) ON DELETE CASCADE,
+                    sheet_index INTEGER NOT NULL,
+                    sheet_name TEXT NOT NULL,
+                    type_index INTEGER NOT NULL,
+                    data_type TEXT NOT NULL,
+                    phase_index INTEGER NOT NULL,
+                    phase TEXT NOT NULL,
+                    device_index INTEGER NOT NULL,
+                    device_name TEXT NOT NULL,
+                    mean REAL,
+                    min REAL,
+                    max REAL,
+                    std REAL,
+                    count INTEGER DEFAULT 0
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_measurement_record_type
+                ON excel_measurements(record_id, data_type, sheet_index, device_index)
+            """)
+
+            conn.commit()
         logger.info("电量数据数据库初始化完成")
-    
+
     def _init_image_database(self):
         """初始化几何量数据数据库"""
-        conn = sqlite3.connect(str(self.image_db_path))
-        cursor = conn.cursor()
-        
-        # 创建几何量数据表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS image_records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                device_id TEXT NOT NULL,
-                file_path TEXT NOT NULL,
-                file_name TEXT NOT NULL,
-                original_path TEXT NOT NULL,
-                recognized_path TEXT,
-                timestamp TEXT NOT NULL,
-                file_size INTEGER DEFAULT 0,
-                extra_data TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # 创建索引
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_image_device_timestamp 
-            ON image_records(device_id, timestamp DESC)
-        """)
-        
-        conn.commit()
-        conn.close()
+        with self.image_db.get_connection() as conn:
+            cursor = conn.cursor()
+
+            # 创建几何量数据表
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS image_records (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    device_id TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    original_path TEXT NOT NULL,
+                    recognized_path TEXT,
+                    timestamp TEXT NOT NULL,
+                    file_size INTEGER DEFAULT 0,
+                    extra_data TEXT,
+                    content_hash TEXT,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            self._ensure_column(cursor, 'image_records', 'content_hash', 'TEXT')
+            # 文件被磁盘配额清理删除后记录保留（元信息、测量值统计仍可用于列表和趋势图），只标记为已淘汰
+            self._ensure_column(cursor, 'image_records', 'evicted', 'INTEGER NOT NULL DEFAULT 0')
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_image_content_hash ON image_records(content_hash)")
+
+            # 创建索引
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_image_device_timestamp
+                ON image_records(device_id, timestamp DESC)
+            """)
+            # 识别结果按文件路径回写
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_image_file_path
+                ON image_records(file_path)
+            """)
+
+            conn.commit()
         logger.info("几何量数据数据库初始化完成")
-    
+
     # ==================== 电量数据相关操作 ====================
-    
+
     def save_excel_record(self, record: Dict[str, Any]) -> bool:
         """
         保存电量数据记录
-        
+
         Args:
             record: 记录字典，包含以下字段：
                 - device_id: 设备ID
@@ -116,24 +386,19 @@ class DataCacheManager:
                 - rated_frequency: 额定频率（可选）
                 - rated_frequency_unit: 额定频率单位（可选）
                 - extra_data: 额外数据（dict，可选）
-        
+                - content_hash: 文件内容的 SHA-256（内容存储中的键，可选）
+                - measurements: 测量值统计列表（excel_parser.summarize_measurements 的结果，可选），
+                  与记录在同一个事务中写入；给出时（即使为空）记录标记为已统计，不再补算
+
         Returns:
             bool: 是否保存成功
         """
         try:
-            conn = sqlite3.connect(str(self.excel_db_path))
-            cursor = conn.cursor()
-            
             extra_data = record.get('extra_data')
             if extra_data and isinstance(extra_data, dict):
                 extra_data = json.dumps(extra_data, ensure_ascii=False)
-            
-            cursor.execute("""
-                INSERT INTO excel_records 
-                (device_id, file_path, file_name, timestamp, sheet_count, 
-                 rated_voltage, rated_voltage_unit, rated_frequency, rated_frequency_unit, extra_data)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+
+            self._insert_with_measurements(self._SQL_INSERT_EXCEL, (
                 record.get('device_id', 'unknown'),
                 record.get('file_path', ''),
                 record.get('file_name', ''),
@@ -143,151 +408,183 @@ class DataCacheManager:
                 record.get('rated_voltage_unit', ''),
                 record.get('rated_frequency', 0),
                 record.get('rated_frequency_unit', ''),
-                extra_data
-            ))
-            
-            conn.commit()
-            conn.close()
-            
+                extra_data,
+                record.get('content_hash')
+            ), record.get('measurements'))
+
             logger.info(f"保存电量数据记录成功: {record.get('file_name')}")
             return True
-            
+
         except Exception as e:
             logger.error(f"保存电量数据记录失败: {e}")
             return False
-    
+
+    def _insert_with_measurements(self, sql: str, params: Sequence[Any],
+                                  measurements: Optional[List[Dict[str, Any]]]) -> int:
+        """插入电量数据记录及其测量值统计（同一个写事务），返回记录ID；measurements 为 None 表示尚未统计"""
+        with self.excel_db.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                self.excel_db._begin_immediate(cursor)
+                cursor.execute(sql, params)
+                record_id = cursor.lastrowid
+                if measurements is not None:
+                    cursor.executemany(self._SQL_INSERT_MEASUREMENT,
+                                       [{**m, 'record_id': record_id} for m in measurements])
+                    cursor.execute(self._SQL_MARK_MEASUREMENTS_CHECKED, (record_id,))
+                conn.commit()
+            finally:
+                cursor.close()
+                self._query_cache.invalidate(self.excel_db)
+        return record_id
+
+    def save_excel_measurements(self, record_id: int, measurements: List[Dict[str, Any]]) -> bool:
+        """
+        替换一条电量数据记录的测量值统计（用于补算入库前已有的记录），并标记为已统计
+
+        Args:
+            record_id: excel_records.id
+            measurements: excel_parser.summarize_measurements 的结果，为空时只做标记（文件中没有测量值）
+        """
+        try:
+            with self.excel_db.get_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    self.excel_db._begin_immediate(cursor)
+                    cursor.execute(self._SQL_DELETE_MEASUREMENTS, (record_id,))
+                    cursor.executemany(self._SQL_INSERT_MEASUREMENT,
+                                       [{**m, 'record_id': record_id} for m in measurements])
+                    cursor.execute(self._SQL_MARK_MEASUREMENTS_CHECKED, (record_id,))
+                    conn.commit()
+                finally:
+                    cursor.close()
+                    self._query_cache.invalidate(self.excel_db)
+            return True
+
+        except Exception as e:
+            logger.error(f"保存测量值统计失败: {e}")
+            return False
+
+    def get_excel_records_without_measurements(self, device_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """设备最新 limit 条记录中尚未统计测量值的记录"""
+        try:
+            return self._fetch_records(self.excel_db, self._SQL_RECORDS_WITHOUT_MEASUREMENTS, (device_id, limit))
+
+        except Exception as e:
+            logger.error(f"获取待补算测量值统计的记录失败: {e}")
+            return []
+
+    def get_measurement_trend(self, device_id: str, data_type: str, phase: str, sheet_index: int = 0,
+                              device_index: int = 0, limit: int = 50) -> List[tuple]:
+        """
+        获取设备最新 limit 个文件中某个 (Sheet, 数据类型, 相位, 设备) 组合的平均值
+
+        Args:
+            device_id: 上传文件的设备ID
+            data_type: 数据类型名称，如 "功率W"
+            phase: 相位名称中包含的文本，如 "A相"
+            sheet_index: 第几个Sheet（从0开始）
+            device_index: 相位下的第几个设备（从0开始）
+            limit: 最多取多少个文件
+
+        Returns:
+            List[(timestamp, mean)]: 按时间从旧到新排列
+        """
+        try:
+            with self.excel_db.get_connection() as conn:
+                return conn.execute(self._SQL_MEASUREMENT_TREND,
+                                    (device_id, sheet_index, data_type, phase, device_index, limit)).fetchall()
+
+        except Exception as e:
+            logger.error(f"获取测量值趋势失败: {e}")
+            return []
+
     def get_latest_excel_record(self, device_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         获取最新的电量数据记录
-        
+
         Args:
             device_id: 设备ID，如果为None则获取所有设备的最新记录
-        
+
         Returns:
             Dict: 记录字典，如果没有记录则返回None
         """
         try:
-            conn = sqlite3.connect(str(self.excel_db_path))
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
             if device_id:
-                cursor.execute("""
-                    SELECT * FROM excel_records 
-                    WHERE device_id = ?
-                    ORDER BY timestamp DESC, id DESC
-                    LIMIT 1
-                """, (device_id,))
+                load = lambda: self._fetch_records(self.excel_db, self._SQL_LATEST_EXCEL_BY_DEVICE, (device_id,))
             else:
-                cursor.execute("""
-                    SELECT * FROM excel_records 
-                    ORDER BY timestamp DESC, id DESC
-                    LIMIT 1
-                """)
-            
-            row = cursor.fetchone()
-            conn.close()
-            
-            if row:
-                record = dict(row)
-                if record.get('extra_data'):
-                    try:
-                        record['extra_data'] = json.loads(record['extra_data'])
-                    except:
-                        pass
-                return record
-            
-            return None
-            
+                load = lambda: self._fetch_records(self.excel_db, self._SQL_LATEST_EXCEL)
+            records = self._query_cache.get_or_load(('latest_excel', device_id), (self.excel_db,), load)
+
+            return records[0] if records else None
+
         except Exception as e:
             logger.error(f"获取最新电量数据记录失败: {e}")
             return None
-    
-    def get_excel_records(self, device_id: Optional[str] = None, 
+
+    def get_excel_records(self, device_id: Optional[str] = None,
                          start_date: Optional[str] = None,
                          end_date: Optional[str] = None,
                          limit: int = 100) -> List[Dict[str, Any]]:
         """
         获取电量数据记录列表
-        
+
         Args:
             device_id: 设备ID筛选
             start_date: 开始日期 (YYYY-MM-DD)
             end_date: 结束日期 (YYYY-MM-DD)
             limit: 返回记录数量限制
-        
+
         Returns:
             List[Dict]: 记录列表
         """
         try:
-            conn = sqlite3.connect(str(self.excel_db_path))
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            query = "SELECT * FROM excel_records WHERE 1=1"
-            params = []
-            
-            if device_id:
-                query += " AND device_id = ?"
-                params.append(device_id)
-            
-            if start_date:
-                query += " AND timestamp >= ?"
-                params.append(start_date)
-            
-            if end_date:
-                query += " AND timestamp <= ?"
-                params.append(end_date + " 23:59:59")
-            
-            query += " ORDER BY timestamp DESC, id DESC LIMIT ?"
-            params.append(limit)
-            
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
-            conn.close()
-            
-            records = []
-            for row in rows:
-                record = dict(row)
-                if record.get('extra_data'):
-                    try:
-                        record['extra_data'] = json.loads(record['extra_data'])
-                    except:
-                        pass
-                records.append(record)
-            
-            return records
-            
+            query, params = self._build_records_query("excel_records", device_id, start_date, end_date, limit)
+            return self._fetch_records(self.excel_db, query, params)
+
         except Exception as e:
             logger.error(f"获取电量数据记录列表失败: {e}")
             return []
-    
+
+    @staticmethod
+    def _build_records_query(table_name: str, device_id: Optional[str], start_date: Optional[str],
+                             end_date: Optional[str], limit: int):
+        """记录列表查询：筛选条件的组合有限，生成的语句文本固定，同样可以复用编译结果"""
+        query = f"SELECT * FROM {table_name} WHERE 1=1"
+        params = []
+
+        if device_id:
+            query += " AND device_id = ?"
+            params.append(device_id)
+
+        if start_date:
+            query += " AND timestamp >= ?"
+            params.append(start_date)
+
+        if end_date:
+            query += " AND timestamp <= ?"
+            params.append(end_date + " 23:59:59")
+
+        query += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        params.append(limit)
+        return query, params
+
     def get_excel_devices(self) -> List[str]:
         """获取所有电量数据设备ID列表"""
         try:
-            conn = sqlite3.connect(str(self.excel_db_path))
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT DISTINCT device_id FROM excel_records 
-                ORDER BY device_id
-            """)
-            
-            rows = cursor.fetchall()
-            conn.close()
-            
-            return [row[0] for row in rows]
-            
+            return self._query_cache.get_or_load(('excel_devices',), (self.excel_db,),
+                                                 lambda: self._fetch_column(self.excel_db, self._SQL_EXCEL_DEVICES))
+
         except Exception as e:
             logger.error(f"获取设备列表失败: {e}")
             return []
-    
+
     # ==================== 几何量数据相关操作 ====================
-    
+
     def save_image_record(self, record: Dict[str, Any]) -> bool:
         """
         保存几何量数据记录
-        
+
         Args:
             record: 记录字典，包含以下字段：
                 - device_id: 设备ID
@@ -298,24 +595,17 @@ class DataCacheManager:
                 - timestamp: 时间戳
                 - file_size: 文件大小（可选）
                 - extra_data: 额外数据（dict，可选）
-        
+                - content_hash: 文件内容的 SHA-256（内容存储中的键，可选）
+
         Returns:
             bool: 是否保存成功
         """
         try:
-            conn = sqlite3.connect(str(self.image_db_path))
-            cursor = conn.cursor()
-            
             extra_data = record.get('extra_data')
             if extra_data and isinstance(extra_data, dict):
                 extra_data = json.dumps(extra_data, ensure_ascii=False)
-            
-            cursor.execute("""
-                INSERT INTO image_records 
-                (device_id, file_path, file_name, original_path, recognized_path, 
-                 timestamp, file_size, extra_data)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+
+            self._execute_write(self.image_db, self._SQL_INSERT_IMAGE, (
                 record.get('device_id', 'unknown'),
                 record.get('file_path', ''),
                 record.get('file_name', ''),
@@ -323,207 +613,217 @@ class DataCacheManager:
                 record.get('recognized_path', ''),
                 record.get('timestamp', datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
                 record.get('file_size', 0),
-                extra_data
+                extra_data,
+                record.get('content_hash')
             ))
-            
-            conn.commit()
-            conn.close()
-            
+
             logger.info(f"保存几何量数据记录成功: {record.get('file_name')}")
             return True
-            
+
         except Exception as e:
             logger.error(f"保存几何量数据记录失败: {e}")
             return False
-    
-    def get_latest_image_records(self, device_id: Optional[str] = None, 
+
+    def update_image_extra_data(self, file_path: str, updates: Dict[str, Any]) -> bool:
+        """
+        合并更新几何量数据记录的 extra_data（读取、合并、写回在同一个写事务内完成）
+
+        Args:
+            file_path: 记录的文件路径
+            updates: 要合并进 extra_data 的键值
+
+        Returns:
+            bool: 是否找到并更新了记录
+        """
+        try:
+            with self.image_db.get_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    self.image_db._begin_immediate(cursor)
+                    rows = cursor.execute(self._SQL_IMAGE_EXTRA_DATA, (file_path,)).fetchall()
+                    for record_id, extra_data in rows:
+                        extra_data = json.loads(extra_data) if extra_data else {}
+                        extra_data.update(updates)
+                        cursor.execute(self._SQL_UPDATE_IMAGE_EXTRA_DATA,
+                                       (json.dumps(extra_data, ensure_ascii=False), record_id))
+                    conn.commit()
+                finally:
+                    cursor.close()
+                    self._query_cache.invalidate(self.image_db)
+            return bool(rows)
+
+        except Exception as e:
+            logger.error(f"更新几何量数据记录失败: {e}")
+            return False
+
+    def get_latest_image_records(self, device_id: Optional[str] = None,
                                 limit: int = 20) -> List[Dict[str, Any]]:
         """
         获取最新的几何量数据记录列表
-        
+
         Args:
             device_id: 设备ID，如果为None则获取所有设备
             limit: 返回记录数量限制
-        
+
         Returns:
             List[Dict]: 记录列表
         """
         try:
-            conn = sqlite3.connect(str(self.image_db_path))
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
             if device_id:
-                cursor.execute("""
-                    SELECT * FROM image_records 
-                    WHERE device_id = ?
-                    ORDER BY timestamp DESC, id DESC
-                    LIMIT ?
-                """, (device_id, limit))
+                load = lambda: self._fetch_records(self.image_db, self._SQL_LATEST_IMAGES_BY_DEVICE, (device_id, limit))
             else:
-                cursor.execute("""
-                    SELECT * FROM image_records 
-                    ORDER BY timestamp DESC, id DESC
-                    LIMIT ?
-                """, (limit,))
-            
-            rows = cursor.fetchall()
-            conn.close()
-            
-            records = []
-            for row in rows:
-                record = dict(row)
-                if record.get('extra_data'):
-                    try:
-                        record['extra_data'] = json.loads(record['extra_data'])
-                    except:
-                        pass
-                records.append(record)
-            
-            return records
-            
+                load = lambda: self._fetch_records(self.image_db, self._SQL_LATEST_IMAGES, (limit,))
+            return self._query_cache.get_or_load(('latest_images', device_id, limit), (self.image_db,), load)
+
         except Exception as e:
             logger.error(f"获取最新几何量数据记录失败: {e}")
             return []
-    
+
     def get_image_records(self, device_id: Optional[str] = None,
                          start_date: Optional[str] = None,
                          end_date: Optional[str] = None,
                          limit: int = 100) -> List[Dict[str, Any]]:
         """
         获取几何量数据记录列表
-        
+
         Args:
             device_id: 设备ID筛选
             start_date: 开始日期 (YYYY-MM-DD)
             end_date: 结束日期 (YYYY-MM-DD)
             limit: 返回记录数量限制
-        
+
         Returns:
             List[Dict]: 记录列表
         """
         try:
-            conn = sqlite3.connect(str(self.image_db_path))
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            query = "SELECT * FROM image_records WHERE 1=1"
-            params = []
-            
-            if device_id:
-                query += " AND device_id = ?"
-                params.append(device_id)
-            
-            if start_date:
-                query += " AND timestamp >= ?"
-                params.append(start_date)
-            
-            if end_date:
-                query += " AND timestamp <= ?"
-                params.append(end_date + " 23:59:59")
-            
-            query += " ORDER BY timestamp DESC, id DESC LIMIT ?"
-            params.append(limit)
-            
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
-            conn.close()
-            
-            records = []
-            for row in rows:
-                record = dict(row)
-                if record.get('extra_data'):
-                    try:
-                        record['extra_data'] = json.loads(record['extra_data'])
-                    except:
-                        pass
-                records.append(record)
-            
-            return records
-            
+            query, params = self._build_records_query("image_records", device_id, start_date, end_date, limit)
+            return self._fetch_records(self.image_db, query, params)
+
         except Exception as e:
             logger.error(f"获取几何量数据记录列表失败: {e}")
             return []
-    
+
     def get_image_devices(self) -> List[str]:
         """获取所有几何量数据设备ID列表"""
         try:
-            conn = sqlite3.connect(str(self.image_db_path))
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT DISTINCT device_id FROM image_records 
-                ORDER BY device_id
-            """)
-            
-            rows = cursor.fetchall()
-            conn.close()
-            
-            return [row[0] for row in rows]
-            
+            return self._query_cache.get_or_load(('image_devices',), (self.image_db,),
+                                                 lambda: self._fetch_column(self.image_db, self._SQL_IMAGE_DEVICES))
+
         except Exception as e:
             logger.error(f"获取设备列表失败: {e}")
             return []
-    
+
+    # ==================== 磁盘配额相关操作 ====================
+
+    def _db_and_table(self, data_type: str):
+        if data_type == 'excel':
+            return self.excel_db, 'excel_records'
+        if data_type == 'image':
+            return self.image_db, 'image_records'
+        raise ValueError(f"未知的数据类型: {data_type}")
+
+    def get_unhashed_files(self, data_type: str, after_id: int = 0, limit: int = 500) -> List[tuple]:
+        """ID 大于 after_id 且尚未关联内容哈希的记录 [(记录ID, 文件路径)]（内容存储启用前下载的文件）"""
+        db, table = self._db_and_table(data_type)
+        with db.get_connection() as conn:
+            return conn.execute(self._SQL_UNHASHED_FILES.format(table=table), (after_id, limit)).fetchall()
+
+    def set_content_hashes(self, data_type: str, hashes: Sequence[tuple]) -> int:
+        """在一个事务中批量设置记录的内容哈希，hashes 为 [(content_hash, 记录ID)]"""
+        if not hashes:
+            return 0
+        db, table = self._db_and_table(data_type)
+        with db.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                db._begin_immediate(cursor)
+                cursor.executemany(self._SQL_SET_CONTENT_HASH.format(table=table), hashes)
+                conn.commit()
+            finally:
+                cursor.close()
+                self._query_cache.invalidate(db)
+        return len(hashes)
+
+    def get_referenced_hashes(self, data_type: str) -> set:
+        """被记录引用的所有内容哈希"""
+        db, table = self._db_and_table(data_type)
+        return set(self._fetch_column(db, self._SQL_REFERENCED_HASHES.format(table=table)))
+
+    def get_paths_by_content_hash(self, data_type: str, content_hash: str) -> List[str]:
+        """引用某个内容哈希的所有记录的文件路径（即指向该内容的硬链接）"""
+        db, table = self._db_and_table(data_type)
+        return self._fetch_column(db, self._SQL_PATHS_BY_HASH.format(table=table), (content_hash,))
+
+    def mark_records_evicted(self, data_type: str, hashes: Sequence[str]) -> int:
+        """
+        在一个事务中把引用这些内容哈希的记录标记为已淘汰（文件已删除，记录及测量值统计保留）
+
+        Returns:
+            新标记的记录数
+        """
+        if not hashes:
+            return 0
+        db, table = self._db_and_table(data_type)
+        with db.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                db._begin_immediate(cursor)
+                marked = 0
+                for content_hash in hashes:
+                    marked += cursor.execute(self._SQL_MARK_EVICTED.format(table=table), (content_hash,)).rowcount
+                conn.commit()
+            finally:
+                cursor.close()
+                self._query_cache.invalidate(db)
+        return marked
+
     # ==================== 通用操作 ====================
-    
+
     def clear_old_records(self, days: int = 30):
         """
-        清理旧记录
-        
+        清理旧记录（只删除数据库记录；不再被引用的文件由磁盘配额清理按最近访问时间回收）
+
         Args:
             days: 保留最近多少天的记录
         """
         try:
             from datetime import timedelta
             cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
-            
+
             # 清理电量数据
-            conn = sqlite3.connect(str(self.excel_db_path))
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM excel_records WHERE timestamp < ?", (cutoff_date,))
-            excel_deleted = cursor.rowcount
-            conn.commit()
-            conn.close()
-            
+            excel_deleted = self._execute_write(self.excel_db, "DELETE FROM excel_records WHERE timestamp < ?",
+                                                (cutoff_date,))
+
             # 清理几何量数据
-            conn = sqlite3.connect(str(self.image_db_path))
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM image_records WHERE timestamp < ?", (cutoff_date,))
-            image_deleted = cursor.rowcount
-            conn.commit()
-            conn.close()
-            
+            image_deleted = self._execute_write(self.image_db, "DELETE FROM image_records WHERE timestamp < ?",
+                                                (cutoff_date,))
+
             logger.info(f"清理旧记录完成: 电量数据{excel_deleted}条, 几何量数据{image_deleted}条")
-            
+
         except Exception as e:
             logger.error(f"清理旧记录失败: {e}")
-    
+
+    def _load_statistics(self) -> Dict[str, Any]:
+        stats = {}
+
+        # 电量数据统计
+        with self.excel_db.get_connection() as conn:
+            stats['excel_count'], stats['excel_devices'] = conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT device_id) FROM excel_records").fetchone()
+
+        # 几何量数据统计
+        with self.image_db.get_connection() as conn:
+            stats['image_count'], stats['image_devices'] = conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT device_id) FROM image_records").fetchone()
+
+        return stats
+
     def get_statistics(self) -> Dict[str, Any]:
         """获取缓存统计信息"""
         try:
-            stats = {}
-            
-            # 电量数据统计
-            conn = sqlite3.connect(str(self.excel_db_path))
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM excel_records")
-            stats['excel_count'] = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(DISTINCT device_id) FROM excel_records")
-            stats['excel_devices'] = cursor.fetchone()[0]
-            conn.close()
-            
-            # 几何量数据统计
-            conn = sqlite3.connect(str(self.image_db_path))
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM image_records")
-            stats['image_count'] = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(DISTINCT device_id) FROM image_records")
-            stats['image_devices'] = cursor.fetchone()[0]
-            conn.close()
-            
-            return stats
-            
+            return self._query_cache.get_or_load(('statistics',), (self.excel_db, self.image_db),
+                                                 self._load_statistics)
+
         except Exception as e:
             logger.error(f"获取统计信息失败: {e}")
             return {}
@@ -531,4 +831,4 @@ class DataCacheManager:
 
 # 全局缓存管理器实例
 cache_manager = DataCacheManager()
-
+atexit.register(cache_manager.close)
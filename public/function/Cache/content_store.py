@@ -0,0 +1,253 @@
+"""
+内容寻址下载存储 - 下载的文件按内容 SHA-256 只保存一份
+各设备目录下的文件是指向同一份内容的硬链接，file_id → 哈希 的映射用于跳过已下载过的文件
+"""
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from public.dao.SQLite.SQliteManager import SQLiteManager
+from public.function.Cache.parsed_data_cache import file_sha256
+
+
+class ContentStore:
+    """
+    内容寻址存储
+
+    目录结构:
+        {root}/objects/{sha256[:2]}/{sha256}{扩展名}  文件内容（只保存一份）
+        {root}/tmp/                                  下载中的临时文件（与 objects 在同一文件系统，可直接改名）
+        {root}/content_store.db                      content_blobs(哈希 → 大小、扩展名、最近访问时间)、
+                                                     content_file_ids((数据类型, file_id) → 哈希)
+
+    最近访问时间（秒级时间戳）在写入、重复下载和页面打开文件时更新，磁盘配额清理按它淘汰最久未查看的内容
+
+    lock: 下载线程 查找/写入内容 → 在设备目录创建链接 与磁盘配额清理删除内容互斥，
+          避免刚查到的内容文件在创建链接前被删除
+    """
+
+    _SQL_FIND_FILE_ID = "SELECT sha256 FROM content_file_ids WHERE data_type = ? AND file_id = ?"
+    _SQL_FIND_BLOB = "SELECT ext FROM content_blobs WHERE sha256 = ?"
+    _SQL_INSERT_BLOB = "INSERT OR IGNORE INTO content_blobs (sha256, size, ext, last_accessed) VALUES (?, ?, ?, ?)"
+    _SQL_MAP_FILE_ID = "INSERT OR REPLACE INTO content_file_ids (data_type, file_id, sha256) VALUES (?, ?, ?)"
+    _SQL_DELETE_BLOB = "DELETE FROM content_blobs WHERE sha256 = ?"
+    _SQL_DELETE_BLOB_FILE_IDS = "DELETE FROM content_file_ids WHERE sha256 = ?"
+    _SQL_TOUCH = "UPDATE content_blobs SET last_accessed = ? WHERE sha256 = ?"
+    _SQL_TOTAL_SIZE = "SELECT COALESCE(SUM(size), 0) FROM content_blobs"
+    _SQL_BLOBS_BY_ACCESS = """
+        SELECT sha256, size, ext FROM content_blobs
+        ORDER BY COALESCE(last_accessed, CAST(strftime('%s', created_at) AS REAL)), sha256
+    """
+
+    def __init__(self, root: str = "data/store"):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.tmp_dir = self.root / "tmp"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.RLock()
+
+        self.db = SQLiteManager(str(self.root / "content_store.db"), pool_mode=SQLiteManager.POOL_MODE_THREAD,
+                                connection_profile=SQLiteManager.PROFILE_WRITER)
+        with self.db.get_connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS content_blobs (
+                    sha256 TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    ext TEXT NOT NULL DEFAULT '',
+                    last_accessed REAL,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS content_file_ids (
+                    data_type TEXT NOT NULL,
+                    file_id TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    PRIMARY KEY (data_type, file_id)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_content_file_ids_sha256 ON content_file_ids(sha256)")
+            if 'last_accessed' not in {row[1] for row in conn.execute("PRAGMA table_info(content_blobs)")}:
+                conn.execute("ALTER TABLE content_blobs ADD COLUMN last_accessed REAL")
+            conn.commit()
+
+    def close(self):
+        self.db.close()
+
+    def blob_path(self, sha256: str, ext: str = "") -> Path:
+        return self.objects_dir / sha256[:2] / f"{sha256}{ext}"
+
+    def temp_path(self, file_name: str) -> Path:
+        """下载用的临时文件路径（保留原扩展名）"""
+        return self.tmp_dir / f"{uuid.uuid4().hex}{Path(file_name).suffix.lower()}"
+
+    # ==================== 查找 ====================
+
+    def find_blob(self, sha256: str) -> Optional[Path]:
+        """按内容哈希查找已保存的文件，不存在时返回 None"""
+        with self.db.get_connection() as conn:
+            row = conn.execute(self._SQL_FIND_BLOB, (sha256,)).fetchone()
+        if row is None:
+            return None
+        path = self.blob_path(sha256, row[0])
+        if not path.exists():
+            # 内容文件已被删除（例如磁盘配额清理），登记一并失效
+            self.forget_blob(sha256)
+            return None
+        return path
+
+    def find(self, data_type: str, file_id, sha256: Optional[str] = None) -> Optional[Tuple[str, Path]]:
+        """
+        下载前的重复检测：通知中带有内容哈希时按哈希查找，否则按 file_id 映射查找
+
+        Returns:
+            (sha256, 内容文件路径)，没有下载过时返回 None
+        """
+        if not sha256:
+            with self.db.get_connection() as conn:
+                row = conn.execute(self._SQL_FIND_FILE_ID, (data_type, str(file_id))).fetchone()
+            if row is None:
+                return None
+            sha256 = row[0]
+        path = self.find_blob(sha256)
+        return (sha256, path) if path is not None else None
+
+    # ==================== 写入 ====================
+
+    def ingest(self, tmp_path: Path, data_type: str, file_id,
+               accessed_at: Optional[float] = None) -> Tuple[str, Path, bool]:
+        """
+        下载后的重复检测：计算临时文件的哈希，内容已存在时删除临时文件，否则移入 objects，
+        并记录 file_id → 哈希（file_id 为 None 时不记录）
+
+        Args:
+            accessed_at: 记为最近访问时间的秒级时间戳，默认为当前时间
+
+        Returns:
+            (sha256, 内容文件路径, 是否为重复内容)
+        """
+        digest = hashlib.sha256()
+        size = 0
+        with open(tmp_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+                size += len(chunk)
+        sha256 = digest.hexdigest()
+
+        accessed_at = time.time() if accessed_at is None else accessed_at
+        existing = self.find_blob(sha256)
+        if existing is not None:
+            os.remove(tmp_path)
+            path, duplicate = existing, True
+            self._touch_hash(sha256, accessed_at)
+        else:
+            ext = Path(tmp_path).suffix.lower()
+            path = self.blob_path(sha256, ext)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, path)
+            with self.db.get_connection() as conn:
+                conn.execute(self._SQL_INSERT_BLOB, (sha256, size, ext, accessed_at))
+                conn.commit()
+            duplicate = False
+
+        if file_id is not None:
+            with self.db.get_connection() as conn:
+                conn.execute(self._SQL_MAP_FILE_ID, (data_type, str(file_id), sha256))
+                conn.commit()
+        return sha256, path, duplicate
+
+    def adopt(self, file_path: Path, data_type: str) -> str:
+        """
+        把内容存储之前下载的文件纳入存储：内容已存在时原文件替换为硬链接（释放重复占用的空间），
+        否则原文件本身成为内容文件，原路径保留为指向它的硬链接
+
+        Returns:
+            文件内容的 SHA-256
+        """
+        file_path = Path(file_path)
+        tmp_path = self.temp_path(file_path.name)
+        try:
+            os.link(file_path, tmp_path)
+        except OSError:
+            shutil.copy2(file_path, tmp_path)
+        sha256, blob, _ = self.ingest(tmp_path, data_type, None, accessed_at=file_path.stat().st_mtime)
+        self.link(blob, file_path)
+        return sha256
+
+    def link(self, blob: Path, target: Path):
+        """
+        在 target 处创建指向内容文件的硬链接（已是同一文件时不做任何事）；
+        文件系统不支持硬链接时退回复制
+        """
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if target.exists() and os.path.samefile(blob, target):
+            return
+        tmp_target = target.with_name(f".{target.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            os.link(blob, tmp_target)
+        except OSError as e:
+            logger.warning(f"[内容存储] 无法创建硬链接，改为复制 {target}: {e}")
+            shutil.copy2(blob, tmp_target)
+        os.replace(tmp_target, target)
+
+    # ==================== 访问记录与配额 ====================
+
+    def _touch_hash(self, sha256: str, accessed_at: Optional[float] = None):
+        with self.db.get_connection() as conn:
+            conn.execute(self._SQL_TOUCH, (time.time() if accessed_at is None else accessed_at, sha256))
+            conn.commit()
+
+    def touch(self, file_path, sha256: Optional[str] = None) -> bool:
+        """
+        记录文件被查看（页面打开文件时调用），文件不在内容存储中时不做任何事
+
+        Args:
+            sha256: 文件内容的哈希（记录中已有时传入，省去计算）
+
+        Returns:
+            是否更新了访问时间
+        """
+        try:
+            sha256 = sha256 or file_sha256(str(file_path))
+            with self.db.get_connection() as conn:
+                updated = conn.execute(self._SQL_TOUCH, (time.time(), sha256)).rowcount
+                conn.commit()
+            return updated > 0
+        except Exception as e:
+            logger.warning(f"[内容存储] 记录访问时间失败 {file_path}: {e}")
+            return False
+
+    def total_size(self) -> int:
+        """内容存储中所有文件的总字节数（每份内容只计一次）"""
+        with self.db.get_connection() as conn:
+            return conn.execute(self._SQL_TOTAL_SIZE).fetchone()[0]
+
+    def blobs_by_access(self) -> List[Tuple[str, int, Path]]:
+        """所有内容文件 [(sha256, 大小, 路径)]，按最近访问时间从旧到新排列"""
+        with self.db.get_connection() as conn:
+            rows = conn.execute(self._SQL_BLOBS_BY_ACCESS).fetchall()
+        return [(sha256, size, self.blob_path(sha256, ext)) for sha256, size, ext in rows]
+
+    def forget_blobs(self, hashes: Iterable[str]):
+        """在一个事务中删除多个内容哈希的登记"""
+        params = [(sha256,) for sha256 in hashes]
+        with self.db.get_connection() as conn:
+            conn.executemany(self._SQL_DELETE_BLOB, params)
+            conn.executemany(self._SQL_DELETE_BLOB_FILE_IDS, params)
+            conn.commit()
+
+    def forget_blob(self, sha256: str):
+        """删除内容哈希的登记（内容文件由调用方处理）"""
+        self.forget_blobs([sha256])
+
+
+# 全局内容存储实例
+content_store = ContentStore()
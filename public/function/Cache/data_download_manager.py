@@ -11,13 +11,18 @@ from queue import Queue
 from PyQt6.QtCore import QObject, pyqtSignal, QThread, Qt
 from loguru import logger
 
+from public.config_class.global_setting import global_setting
+from public.function.Cache import excel_parser
 from public.function.Cache.cache_manager import cache_manager
+from public.function.Cache.content_store import content_store
+from public.function.Cache.disk_quota import DiskQuotaManager
+from public.function.Cache.thumbnail_cache import thumbnail_cache
 
 
 class DownloadTask:
     """下载任务"""
     def __init__(self, data_type: str, device_id: str, file_id: Any, 
-                 file_name: str, file_size: int = 0, timestamp: str = None):
+                 file_name: str, file_size: int = 0, timestamp: str = None, sha256: str = None):
         """
         Args:
             data_type: 数据类型 ('excel' or 'image')
@@ -26,6 +31,7 @@ class DownloadTask:
             file_name: 文件名
             file_size: 文件大小
             timestamp: 时间戳
+            sha256: 文件内容的 SHA-256（通知中带有时用于下载前判重，可选）
         """
         self.data_type = data_type
         self.device_id = device_id
@@ -33,11 +39,18 @@ class DownloadTask:
         self.file_name = file_name
         self.file_size = file_size
         self.timestamp = timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.sha256 = sha256
 
 
 class DownloadWorkerThread(QThread):
-    """下载工作线程"""
-    download_finished = pyqtSignal(str, str, str)  # data_type, file_path, device_id
+    """
+    下载工作线程
+
+    文件内容保存在内容存储中（按 SHA-256 只保存一份），设备目录下的文件是指向它的硬链接：
+    下载前按 file_id（或通知中的哈希）判重，已有内容时不再下载；下载后按内容哈希判重，重复内容只保留一份
+    """
+    # data_type, file_path, device_id, content_hash, 电量数据的汇总（excel_parser.summarize_excel_file，几何量为 None）
+    download_finished = pyqtSignal(str, str, str, str, object)
     download_failed = pyqtSignal(str, str, str)    # data_type, error, device_id
     
     def __init__(self, client, task: DownloadTask):
@@ -65,22 +78,53 @@ class DownloadWorkerThread(QThread):
             save_dir.mkdir(parents=True, exist_ok=True)
             save_path = save_dir / task.file_name
             
-            logger.info(f"[下载管理器] 开始下载 {task.data_type}: {task.file_name}")
-            
-            # 执行下载
             if task.file_id is None:
                 raise Exception("file_id 为 None")
             
-            download_method(task.file_id, save_path)
+            # 下载前判重：同一文件（或相同内容）已经下载过时直接使用已有内容
+            # （查找到创建链接之间持有 content_store.lock，磁盘配额清理不会删除这份内容）
+            with content_store.lock:
+                found = content_store.find(task.data_type, task.file_id, task.sha256)
+                if found is not None:
+                    sha256, blob_path = found
+                    content_store.link(blob_path, save_path)
+                    content_store.touch(save_path, sha256)
+            if found is not None:
+                logger.info(f"[下载管理器] 内容已存在，跳过下载 {task.data_type}: {task.file_name} ({sha256[:12]})")
+            else:
+                logger.info(f"[下载管理器] 开始下载 {task.data_type}: {task.file_name}")
+                tmp_path = content_store.temp_path(task.file_name)
+                try:
+                    download_method(task.file_id, tmp_path)
+                    # 下载后判重：内容相同的文件只保留一份
+                    with content_store.lock:
+                        sha256, blob_path, duplicate = content_store.ingest(tmp_path, task.data_type, task.file_id)
+                        content_store.link(blob_path, save_path)
+                finally:
+                    if tmp_path.exists():
+                        tmp_path.unlink()
+                if duplicate:
+                    logger.info(f"[下载管理器] 下载的内容与已有文件相同，不再重复保存: {task.file_name} ({sha256[:12]})")
             
             logger.info(f"[下载管理器] ✅ 下载完成: {save_path}")
-            self.download_finished.emit(task.data_type, str(save_path), task.device_id)
+            # 解析与测量值统计在下载线程中完成，主线程的回调只写入缓存库
+            summary = self._summarize_excel(save_path) if task.data_type == 'excel' else None
+            self.download_finished.emit(task.data_type, str(save_path), task.device_id, sha256, summary)
             
         except Exception as e:
             import traceback
             logger.error(f"[下载管理器] ❌ 下载失败: {e}\n{traceback.format_exc()}")
             self.download_failed.emit(task.data_type, str(e), task.device_id)
 
+    @staticmethod
+    def _summarize_excel(file_path: Path) -> Dict[str, Any]:
+        """电量数据文件的汇总，解析失败时只记录文件（测量值统计留空）"""
+        try:
+            return excel_parser.summarize_excel_file(str(file_path))
+        except Exception as e:
+            logger.error(f"[下载管理器] 解析电量数据失败 {file_path}: {e}")
+            return {}
+
 
 class DataDownloadManager(QObject):
     """统一数据下载管理器"""
@@ -96,6 +140,7 @@ class DataDownloadManager(QObject):
         self.download_queue = Queue()  # 下载队列（备用）
         self.lock = threading.Lock()  # 线程锁
         self.message_queue = None  # 跨进程消息队列
+        self.disk_quota = None  # 磁盘配额管理（配置了占用上限时创建）
         
         logger.info("[下载管理器] 初始化完成")
     
@@ -121,6 +166,7 @@ class DataDownloadManager(QObject):
                 - file_name: 文件名
                 - file_size: 文件大小（可选）
                 - timestamp: 时间戳（可选）
+                - sha256: 文件内容的 SHA-256（可选）
         """
         try:
             data_type_raw = data.get('type', '')
@@ -129,6 +175,7 @@ class DataDownloadManager(QObject):
             file_name = data.get('file_name', 'unknown')
             file_size = data.get('file_size', 0)
             timestamp = data.get('timestamp', datetime.now().isoformat())
+            sha256 = data.get('sha256')
             
             # 确定数据类型
             if 'excel' in data_type_raw.lower():
@@ -157,7 +204,8 @@ class DataDownloadManager(QObject):
                 file_id=file_id,
                 file_name=file_name,
                 file_size=file_size,
-                timestamp=timestamp if isinstance(timestamp, str) else datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                timestamp=timestamp if isinstance(timestamp, str) else datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                sha256=sha256
             )
             
             # 启动下载线程
@@ -199,14 +247,15 @@ class DataDownloadManager(QObject):
         except Exception as e:
             logger.error(f"[下载管理器] 启动下载失败: {e}")
     
-    def _on_download_finished(self, data_type: str, file_path: str, device_id: str):
+    def _on_download_finished(self, data_type: str, file_path: str, device_id: str, content_hash: str,
+                              summary: Dict[str, Any] = None):
         """下载完成回调"""
         try:
             logger.info(f"[下载管理器] 下载完成: {Path(file_path).name}, 类型: {data_type}, 设备: {device_id}")
             
             # 保存到缓存
             if data_type == 'excel':
-                self._save_excel_to_cache(file_path, device_id)
+                self._save_excel_to_cache(file_path, device_id, content_hash, summary)
                 # 通过队列通知电量数据页面（跨进程）
                 self._send_queue_message('excel_data_viewer', 'cache_data_ready', {
                     'file_path': file_path,
@@ -215,7 +264,7 @@ class DataDownloadManager(QObject):
                 logger.info(f"[下载管理器] 已通过队列通知电量数据页面更新")
                 
             elif data_type == 'image':
-                self._save_image_to_cache(file_path, device_id)
+                self._save_image_to_cache(file_path, device_id, content_hash)
                 # 通过队列通知几何量数据页面（跨进程）
                 self._send_queue_message('image_data_viewer', 'cache_data_ready', {
                     'file_path': file_path,
@@ -223,10 +272,23 @@ class DataDownloadManager(QObject):
                 })
                 logger.info(f"[下载管理器] 已通过队列通知几何量数据页面更新")
             
+            self._enforce_disk_quota()
+            
         except Exception as e:
             import traceback
             logger.error(f"[下载管理器] 处理下载完成失败: {e}\n{traceback.format_exc()}")
     
+    def _enforce_disk_quota(self):
+        """下载文件总占用超过配置的上限（[download] max_cache_size_mb）时，在后台删除最久未查看的文件"""
+        if self.disk_quota is None:
+            download_config = global_setting.get_setting("connect_server", {}).get("download", {})
+            max_mb = float(download_config.get("max_cache_size_mb", 0) or 0)
+            if max_mb <= 0:
+                return
+            self.disk_quota = DiskQuotaManager(int(max_mb * 1024 * 1024))
+            logger.info(f"[下载管理器] 下载文件占用上限: {max_mb:.0f}MB")
+        self.disk_quota.enforce_async()
+    
     def _send_queue_message(self, target: str, title: str, data: dict):
         """通过队列发送消息（跨进程通信）"""
         try:
@@ -265,46 +327,30 @@ class DataDownloadManager(QObject):
         except Exception as e:
             logger.error(f"[下载管理器] 清理线程失败: {e}")
     
-    def _save_excel_to_cache(self, file_path: str, device_id: str):
-        """保存电量数据到缓存"""
+    def _save_excel_to_cache(self, file_path: str, device_id: str, content_hash: str = None,
+                             summary: Dict[str, Any] = None):
+        """
+        保存电量数据到缓存
+
+        Args:
+            summary: 下载线程中计算的汇总（excel_parser.summarize_excel_file），其中每个
+                (Sheet, 数据类型, 相位, 设备) 组合的测量值统计与记录一并写入，趋势图直接查询统计表
+        """
         try:
-            # 解析Excel获取元信息
-            import pandas as pd
-            excel_file = pd.ExcelFile(file_path)
-            sheet_count = len(excel_file.sheet_names)
-            
-            # 尝试读取第一个sheet获取额定参数
-            rated_voltage = 0
-            rated_voltage_unit = ''
-            rated_frequency = 0
-            rated_frequency_unit = ''
-            
-            try:
-                df = excel_file.parse(excel_file.sheet_names[0], header=None)
-                data_clean = df.dropna()
-                if not data_clean.empty:
-                    import re
-                    df_colum_0_unique = data_clean.drop_duplicates(subset=[data_clean.columns[0]])
-                    df_colum_1_unique = data_clean.drop_duplicates(subset=[data_clean.columns[1]])
-                    
-                    rated_frequency = float("".join(re.findall(r'[0-9]', str(df_colum_1_unique.iloc[0, 1]))))
-                    rated_frequency_unit = "".join(re.findall(r'[A-Za-z]', str(df_colum_1_unique.iloc[0, 1])))
-                    rated_voltage = float("".join(re.findall(r'[0-9]', str(df_colum_0_unique.iloc[0, 0]).split(",")[0])))
-                    rated_voltage_unit = "".join(re.findall(r'[A-Za-z]', str(df_colum_0_unique.iloc[0, 0]).split(",")[0]))
-            except:
-                pass
-            
-            # 保存到缓存
+            summary = summary or {}
             cache_record = {
                 'device_id': device_id,
                 'file_path': file_path,
                 'file_name': Path(file_path).name,
                 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'sheet_count': sheet_count,
-                'rated_voltage': rated_voltage,
-                'rated_voltage_unit': rated_voltage_unit,
-                'rated_frequency': rated_frequency,
-                'rated_frequency_unit': rated_frequency_unit
+                'sheet_count': summary.get('sheet_count', 0),
+                'rated_voltage': summary.get('rated_voltage', 0),
+                'rated_voltage_unit': summary.get('rated_voltage_unit', ''),
+                'rated_frequency': summary.get('rated_frequency', 0),
+                'rated_frequency_unit': summary.get('rated_frequency_unit', ''),
+                'content_hash': content_hash,
+                # 解析失败时不写统计，趋势图首次查看时补算
+                'measurements': summary.get('measurements')
             }
             
             cache_manager.save_excel_record(cache_record)
@@ -313,7 +359,7 @@ class DataDownloadManager(QObject):
         except Exception as e:
             logger.error(f"[下载管理器] 保存电量数据到缓存失败: {e}")
     
-    def _save_image_to_cache(self, file_path: str, device_id: str):
+    def _save_image_to_cache(self, file_path: str, device_id: str, content_hash: str = None):
         """保存几何量数据到缓存"""
         try:
             cache_record = {
@@ -323,12 +369,16 @@ class DataDownloadManager(QObject):
                 'original_path': file_path,
                 'recognized_path': file_path,  # 识别后会更新
                 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'file_size': Path(file_path).stat().st_size if Path(file_path).exists() else 0
+                'file_size': Path(file_path).stat().st_size if Path(file_path).exists() else 0,
+                'content_hash': content_hash
             }
             
             cache_manager.save_image_record(cache_record)
             logger.info(f"[下载管理器] 几何量数据已保存到缓存: {Path(file_path).name}")
             
+            # 后台生成各页面使用的缩略图
+            thumbnail_cache.submit(file_path, content_hash)
+            
         except Exception as e:
             logger.error(f"[下载管理器] 保存几何量数据到缓存失败: {e}")
     
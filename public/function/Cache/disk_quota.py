@@ -0,0 +1,165 @@
+"""
+磁盘配额管理 - 下载的电量/几何量文件总占用超过上限时，按最近查看时间淘汰最久未查看的文件
+"""
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List
+
+from loguru import logger
+
+from public.function.Cache.cache_manager import cache_manager
+from public.function.Cache.content_store import content_store
+from public.function.Cache.parsed_data_cache import file_sha256, parsed_data_cache
+from public.function.Cache.thumbnail_cache import thumbnail_cache
+
+
+class DiskQuotaManager:
+    """
+    磁盘配额管理
+
+    下载的文件都保存在内容存储中（每份内容只占一份空间），占用量即内容存储的总字节数。
+    超出上限时从最久未查看的内容开始淘汰，直到低于上限：
+        1. 每个缓存库在一个事务中把引用这些内容的记录标记为已淘汰（记录与电量数据的测量值统计保留）
+        2. 删除各设备目录下指向该内容的硬链接、内容文件本身以及它的解析缓存和缩略图
+        3. 在一个事务中删除内容存储中的登记（文件删除失败的内容保留登记，下次再试）
+    选择与删除期间持有 content_store.lock，下载线程不会链接到正在删除的内容。
+    内容存储启用前下载的文件（记录没有内容哈希）在第一次检查时纳入内容存储。
+    上限由 [download] max_cache_size_mb 配置，默认 0（不启用）。
+    """
+
+    DATA_TYPES = ('excel', 'image')
+
+    def __init__(self, max_bytes: int, store=content_store, cache=cache_manager, parsed_cache=parsed_data_cache,
+                 thumbnails=thumbnail_cache):
+        """
+        Args:
+            max_bytes: 占用上限（字节）
+        """
+        self.max_bytes = max_bytes
+        self.store = store
+        self.cache = cache
+        self.parsed_cache = parsed_cache
+        self.thumbnails = thumbnails
+        self._lock = threading.Lock()
+        self._adopted = False
+
+    def usage(self) -> int:
+        """当前占用的字节数"""
+        return self.store.total_size()
+
+    # ==================== 旧文件纳入存储 ====================
+
+    def adopt_legacy_files(self, batch_size: int = 500) -> int:
+        """把没有内容哈希的记录对应的文件纳入内容存储，每批记录的哈希在一个事务中写回；返回纳入的文件数"""
+        adopted = 0
+        for data_type in self.DATA_TYPES:
+            # 文件已不存在的记录保持没有哈希，按 ID 往后翻页，避免反复读到它们
+            last_id = 0
+            while True:
+                rows = self.cache.get_unhashed_files(data_type, after_id=last_id, limit=batch_size)
+                if not rows:
+                    break
+                hashes = []
+                for record_id, file_path in rows:
+                    try:
+                        if file_path and Path(file_path).is_file():
+                            hashes.append((self.store.adopt(Path(file_path), data_type), record_id))
+                    except OSError as e:
+                        logger.warning(f"[磁盘配额] 纳入内容存储失败 {file_path}: {e}")
+                self.cache.set_content_hashes(data_type, hashes)
+                adopted += len(hashes)
+                last_id = rows[-1][0]
+        if adopted:
+            logger.info(f"[磁盘配额] {adopted} 个已有文件纳入内容存储")
+        return adopted
+
+    # ==================== 淘汰 ====================
+
+    @staticmethod
+    def _is_same_content(path: Path, blob: Path, sha256: str) -> bool:
+        """path 是否仍是这份内容（硬链接，或不支持硬链接时的副本）；同名文件可能已被新内容覆盖"""
+        try:
+            if blob.exists() and os.path.samefile(path, blob):
+                return True
+            return file_sha256(str(path)) == sha256
+        except OSError:
+            return False
+
+    def _remove_content(self, sha256: str, blob: Path, links: List[str]) -> bool:
+        """删除内容的所有硬链接与内容文件，全部删除（或本已不存在）时返回 True"""
+        removed = True
+        for path in [Path(p) for p in links] + [blob]:
+            try:
+                if path.exists() and (path == blob or self._is_same_content(path, blob, sha256)):
+                    path.unlink()
+            except OSError as e:
+                # 例如 Windows 上文件正被页面打开
+                logger.warning(f"[磁盘配额] 删除文件失败 {path}: {e}")
+                removed = False
+        self.parsed_cache.remove(sha256)
+        self.thumbnails.remove(sha256)
+        return removed
+
+    def enforce(self) -> Dict[str, int]:
+        """
+        检查占用量，超出上限时淘汰最久未查看的文件
+
+        Returns:
+            {'usage': 清理后的占用字节数, 'freed_bytes': 释放的字节数, 'evicted': 删除的内容数,
+             'records': 标记为已淘汰的记录数}
+        """
+        with self._lock:
+            if not self._adopted:
+                self.adopt_legacy_files()
+                self._adopted = True
+
+            with self.store.lock:
+                usage = self.usage()
+                result = {'usage': usage, 'freed_bytes': 0, 'evicted': 0, 'records': 0}
+                if usage <= self.max_bytes:
+                    return result
+
+                victims = []
+                for sha256, size, blob in self.store.blobs_by_access():
+                    if usage <= self.max_bytes:
+                        break
+                    victims.append((sha256, size, blob))
+                    usage -= size
+                hashes = [sha256 for sha256, _, _ in victims]
+
+                links = {sha256: [] for sha256 in hashes}
+                for data_type in self.DATA_TYPES:
+                    referenced = self.cache.get_referenced_hashes(data_type)
+                    evicted = [sha256 for sha256 in hashes if sha256 in referenced]
+                    for sha256 in evicted:
+                        links[sha256].extend(self.cache.get_paths_by_content_hash(data_type, sha256))
+                    result['records'] += self.cache.mark_records_evicted(data_type, evicted)
+
+                removed = []
+                for sha256, size, blob in victims:
+                    if self._remove_content(sha256, blob, links[sha256]):
+                        removed.append(sha256)
+                        result['freed_bytes'] += size
+                self.store.forget_blobs(removed)
+
+            result['evicted'] = len(removed)
+            result['usage'] = self.usage()
+            logger.info(f"[磁盘配额] 占用超出上限 {self.max_bytes / 1024 ** 2:.0f}MB，删除 {len(removed)} 个最久未查看的文件"
+                        f"（{result['records']} 条记录标记为已淘汰），释放 {result['freed_bytes'] / 1024 ** 2:.1f}MB，"
+                        f"当前占用 {result['usage'] / 1024 ** 2:.1f}MB")
+            return result
+
+    def enforce_async(self) -> bool:
+        """在后台线程中执行 enforce；已有检查在进行时直接返回 False"""
+        if self._lock.locked():
+            return False
+
+        def run():
+            try:
+                self.enforce()
+            except Exception as e:
+                logger.error(f"[磁盘配额] 清理失败: {e}")
+
+        threading.Thread(target=run, name="DiskQuotaThread", daemon=True).start()
+        return True
@@ -0,0 +1,288 @@
+"""
+电量数据Excel解析
+ExcelDataViewerWindow 显示、DataDownloadManager 入库时生成测量值汇总共用同一套解析逻辑
+"""
+import re
+import math
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from public.function.Cache.parsed_data_cache import parsed_data_cache
+
+# 解析结果缓存的版本号，parse_single_sheet 的逻辑或 xlsx_data 结构变化时需要加 1
+PARSER_VERSION = 1
+
+
+# ==================== 数据结构 ====================
+@dataclass
+class xlsx_datas_device_item:
+    name: str = ""
+    data: list = field(default_factory=list)
+
+
+@dataclass
+class xlsx_datas_phase_item:
+    name: str = ""
+    data: list = field(default_factory=list)
+
+
+@dataclass
+class xlsx_datas_item_x:
+    name: list = field(default_factory=list)
+    data: list = field(default_factory=list)
+
+
+@dataclass
+class xlsx_datas_item:
+    x: xlsx_datas_item_x = field(default_factory=xlsx_datas_item_x)
+    y: list = field(default_factory=list)
+
+
+@dataclass
+class xlsx_datas_type_item:
+    name: str = ""
+    data: xlsx_datas_item = field(default_factory=xlsx_datas_item)
+
+
+@dataclass
+class xlsx_data:
+    rated_voltage: float = 0
+    rated_voltage_unit: str = ''
+    rated_frequency: float = 0
+    rated_frequency_unit: str = ''
+    name: str = ""
+    data: list = field(default_factory=list)
+
+
+def xlsx_data_from_dict(d: dict) -> xlsx_data:
+    """由 asdict(xlsx_data) 的结果重建 xlsx_data（用于解析缓存）"""
+    return xlsx_data(
+        rated_voltage=d["rated_voltage"],
+        rated_voltage_unit=d["rated_voltage_unit"],
+        rated_frequency=d["rated_frequency"],
+        rated_frequency_unit=d["rated_frequency_unit"],
+        name=d["name"],
+        data=[xlsx_datas_type_item(
+            name=type_item["name"],
+            data=xlsx_datas_item(
+                x=xlsx_datas_item_x(name=type_item["data"]["x"]["name"], data=type_item["data"]["x"]["data"]),
+                y=[xlsx_datas_phase_item(
+                    name=phase_item["name"],
+                    data=[xlsx_datas_device_item(name=device_item["name"], data=device_item["data"])
+                          for device_item in phase_item["data"]])
+                    for phase_item in type_item["data"]["y"]]))
+            for type_item in d["data"]])
+
+
+# ==================== 解析 ====================
+def parse_excel_all_sheets(file_path: str) -> dict:
+    """
+    解析Excel所有Sheet（优先读取按文件内容缓存的解析结果）
+    返回: {sheet_name: xlsx_data}
+    """
+    cached = parsed_data_cache.load(file_path, PARSER_VERSION)
+    if cached is not None:
+        return {sheet_name: xlsx_data_from_dict(sheet) for sheet_name, sheet in cached.items()}
+
+    result = _parse_excel_all_sheets(file_path)
+    if result is None:
+        return {}
+    # 没有可解析 Sheet 的文件也缓存空结果，之后不再重复解析
+    parsed_data_cache.save(file_path, PARSER_VERSION,
+                           {sheet_name: asdict(sheet) for sheet_name, sheet in result.items()})
+    return result
+
+
+def _parse_excel_all_sheets(file_path: str) -> Optional[dict]:
+    """解析Excel所有Sheet（不使用缓存），文件无法读取时返回 None"""
+    logger.info(f"解析Excel: {file_path}")
+
+    try:
+        excel_file = pd.ExcelFile(file_path)
+        result = {}
+
+        for sheet_name in excel_file.sheet_names:
+            logger.info(f"解析Sheet: {sheet_name}")
+            df = excel_file.parse(sheet_name, header=None)
+            sheet_data = parse_single_sheet(df, sheet_name)
+
+            if sheet_data:
+                result[sheet_name] = sheet_data
+                logger.info(f"✅ {sheet_name} 解析成功")
+
+        logger.info(f"✅ 共解析{len(result)}个Sheet")
+        return result
+
+    except Exception as e:
+        import traceback
+        logger.error(f"解析失败: {e}\n{traceback.format_exc()}")
+        return None
+
+
+def parse_single_sheet(data, sheet_name: str) -> xlsx_data:
+    """解析单个Sheet（使用test/get_test.py的逻辑）"""
+    try:
+        data_each_counts = 36
+        return_data = xlsx_data()
+        return_data.name = sheet_name
+
+        data_clean = data.dropna()
+        if data_clean.empty:
+            return None
+
+        df_colum_0_unique = data_clean.drop_duplicates(subset=[data_clean.columns[0]])
+        df_colum_1_unique = data_clean.drop_duplicates(subset=[data_clean.columns[1]])
+
+        # 额定频率和电压
+        return_data.rated_frequency = float("".join(re.findall(r'[0-9]', str(df_colum_1_unique.iloc[0, 1]))))
+        return_data.rated_frequency_unit = "".join(re.findall(r'[A-Za-z]', str(df_colum_1_unique.iloc[0, 1])))
+        return_data.rated_voltage = float("".join(re.findall(r'[0-9]', str(df_colum_0_unique.iloc[0, 0]).split(",")[0])))
+        return_data.rated_voltage_unit = "".join(re.findall(r'[A-Za-z]', str(df_colum_0_unique.iloc[0, 0]).split(",")[0]))
+
+        # X轴数据
+        xlsx_datas_type_item_obj_x_data = []
+        for row in range(data_clean.shape[0]):
+            temp = row / data_each_counts
+            index = math.floor(temp)
+
+            if temp == 0:
+                xlsx_datas_type_item_obj = xlsx_datas_type_item()
+                xlsx_datas_type_item_obj.name = "功率W"
+                xlsx_datas_type_item_obj.data.x.name.append(str(data.iloc[3, 2]))
+                xlsx_datas_type_item_obj.data.x.name.append("电流/A")
+                return_data.data.append(xlsx_datas_type_item_obj)
+            elif temp == 1:
+                xlsx_datas_type_item_obj = xlsx_datas_type_item()
+                xlsx_datas_type_item_obj.name = "电压"
+                xlsx_datas_type_item_obj.data.x.name.append(str(data.iloc[3, 2]))
+                xlsx_datas_type_item_obj.data.x.name.append("电流/A")
+                return_data.data.append(xlsx_datas_type_item_obj)
+                return_data.data[index - 1].data.x.data = xlsx_datas_type_item_obj_x_data
+                xlsx_datas_type_item_obj_x_data = []
+            elif temp == 2:
+                xlsx_datas_type_item_obj = xlsx_datas_type_item()
+                xlsx_datas_type_item_obj.name = "电流"
+                xlsx_datas_type_item_obj.data.x.name.append(str(data.iloc[3, 2]))
+                xlsx_datas_type_item_obj.data.x.name.append("电流/A")
+                return_data.data.append(xlsx_datas_type_item_obj)
+                return_data.data[index - 1].data.x.data = xlsx_datas_type_item_obj_x_data
+                xlsx_datas_type_item_obj_x_data = []
+            elif temp == 3:
+                xlsx_datas_type_item_obj = xlsx_datas_type_item()
+                xlsx_datas_type_item_obj.name = "相角"
+                xlsx_datas_type_item_obj.data.x.name.append(str(data.iloc[3, 2]))
+                xlsx_datas_type_item_obj.data.x.name.append("电流/A")
+                return_data.data.append(xlsx_datas_type_item_obj)
+                return_data.data[index - 1].data.x.data = xlsx_datas_type_item_obj_x_data
+                xlsx_datas_type_item_obj_x_data = []
+
+            # 额定电流
+            rated_current_unit = "".join(re.findall(r'[A-Za-z]', str(data_clean.iloc[row, 0]).strip().split(",")[1]))
+            if rated_current_unit == "mA":
+                rated_current = float("".join(re.findall(r'[0-9]', str(data_clean.iloc[row, 0]).strip().split(",")[1]))) / 1000
+            else:
+                rated_current = float("".join(re.findall(r'[0-9]', str(data_clean.iloc[row, 0]).strip().split(",")[1])))
+
+            xlsx_datas_type_item_obj_x_data.append([data_clean.iloc[row, 2], rated_current])
+
+        return_data.data[-1].data.x.data = xlsx_datas_type_item_obj_x_data
+
+        # Y轴数据
+        df_rows_2_4_unique = data.iloc[3, 4:].dropna()
+        df_rows_3_4 = data.iloc[4, 4:]
+
+        for row in range(data_clean.shape[0]):
+            temp = row / data_each_counts
+            index = math.floor(temp)
+            if temp == 0 or temp == 1 or temp == 2 or temp == 3:
+                for j in range(df_rows_2_4_unique.shape[0]):
+                    xlsx_datas_phase_item_obj = xlsx_datas_phase_item()
+                    xlsx_datas_phase_item_obj.name = df_rows_2_4_unique.iloc[j]
+
+                    device_series = df_rows_3_4.drop_duplicates()[:-2]
+                    for device_row in range(device_series.shape[0]):
+                        xlsx_datas_device_item_obj = xlsx_datas_device_item()
+                        xlsx_datas_device_item_obj.name = device_series.iloc[device_row]
+                        xlsx_datas_phase_item_obj.data.append(xlsx_datas_device_item_obj)
+
+                    return_data.data[index].data.y.append(xlsx_datas_phase_item_obj)
+
+        # 具体值
+        for row in range(data_clean.shape[0]):
+            temp = row / data_each_counts
+            index = math.floor(temp)
+
+            for j in range(df_rows_2_4_unique.shape[0]):
+                device_series = df_rows_3_4.drop_duplicates()[:-2]
+                for device_row in range(device_series.shape[0]):
+                    return_data.data[index].data.y[j].data[device_row].data.append(
+                        data_clean.iloc[row, int(df_rows_2_4_unique.index[j]) + device_row])
+
+        return return_data
+
+    except Exception as e:
+        logger.error(f"解析Sheet失败: {e}")
+        return None
+
+
+# ==================== 测量值汇总 ====================
+def summarize_measurements(sheet_data_dict: Dict[str, xlsx_data]) -> List[Dict[str, Any]]:
+    """
+    计算每个 (Sheet, 数据类型, 相位, 设备) 组合的测量值统计，非数值的单元格不参与统计
+
+    Returns:
+        [{"sheet_index", "sheet_name", "type_index", "data_type", "phase_index", "phase",
+          "device_index", "device_name", "mean", "min", "max", "std", "count"}]，
+        没有有效数值时 mean/min/max/std 为 None、count 为 0；std 为总体标准差
+    """
+    summaries = []
+    for sheet_index, (sheet_name, sheet) in enumerate(sheet_data_dict.items()):
+        for type_index, type_item in enumerate(sheet.data):
+            for phase_index, phase_item in enumerate(type_item.data.y):
+                for device_index, device_item in enumerate(phase_item.data):
+                    values = pd.to_numeric(pd.Series(device_item.data, dtype=object), errors='coerce').to_numpy(
+                        dtype=np.float64)
+                    values = values[np.isfinite(values)]
+                    count = int(values.size)
+                    summaries.append({
+                        "sheet_index": sheet_index,
+                        "sheet_name": str(sheet_name),
+                        "type_index": type_index,
+                        "data_type": str(type_item.name),
+                        "phase_index": phase_index,
+                        "phase": str(phase_item.name),
+                        "device_index": device_index,
+                        "device_name": str(device_item.name),
+                        "mean": float(values.mean()) if count else None,
+                        "min": float(values.min()) if count else None,
+                        "max": float(values.max()) if count else None,
+                        "std": float(values.std()) if count else None,
+                        "count": count,
+                    })
+    return summaries
+
+
+def summarize_excel_file(file_path: str) -> Dict[str, Any]:
+    """
+    入库用的电量数据文件汇总（在下载线程中调用）：Sheet 数、第一个 Sheet 的额定参数和测量值统计
+
+    Returns:
+        {"sheet_count", "rated_voltage", "rated_voltage_unit", "rated_frequency", "rated_frequency_unit",
+         "measurements"}，第一个 Sheet 无法解析时额定参数为 0 / ''
+    """
+    with pd.ExcelFile(file_path) as excel_file:
+        sheet_names = excel_file.sheet_names
+    sheets = parse_excel_all_sheets(file_path)
+    first = sheets.get(sheet_names[0]) if sheet_names else None
+    return {
+        "sheet_count": len(sheet_names),
+        "rated_voltage": first.rated_voltage if first else 0,
+        "rated_voltage_unit": first.rated_voltage_unit if first else '',
+        "rated_frequency": first.rated_frequency if first else 0,
+        "rated_frequency_unit": first.rated_frequency_unit if first else '',
+        "measurements": summarize_measurements(sheets),
+    }
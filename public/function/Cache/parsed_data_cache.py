@@ -0,0 +1,141 @@
+"""
+解析结果缓存 - 按文件内容的 SHA-256 与解析器版本缓存解析后的数据
+同一文件再次加载时直接读取缓存，不再重新解析
+"""
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+# 文件内容 SHA-256 的计算缓存 {路径: (大小, 修改时间, 哈希)}，文件未变化时不重复读取
+_hash_memo: Dict[str, Tuple[int, int, str]] = {}
+_hash_memo_lock = threading.Lock()
+
+
+def file_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """计算文件内容的 SHA-256（大小和修改时间未变化时返回上次的结果）"""
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+    with _hash_memo_lock:
+        memo = _hash_memo.get(path)
+    if memo is not None and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+        return memo[2]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    sha256 = digest.hexdigest()
+    with _hash_memo_lock:
+        _hash_memo[path] = (stat.st_size, stat.st_mtime_ns, sha256)
+    return sha256
+
+
+def _is_number_list(value: Any) -> bool:
+    return (isinstance(value, list) and len(value) > 0
+            and all(isinstance(v, (int, float, np.integer, np.floating)) and not isinstance(v, (bool, np.bool_))
+                    for v in value))
+
+
+def _pack(value: Any, chunks: Dict[str, list]) -> Any:
+    """
+    把嵌套的 dict/list 中的数值列表替换为 {"__array__": 数组名, "slice": [起, 止]}，
+    数值按整型/浮点型分别追加到 chunks 中，最终各拼成一个数组（读取时只需解压两个数组）
+    """
+    if _is_number_list(value):
+        array = np.asarray(value)
+        kind = "i8" if array.dtype.kind in "iu" else "f8"
+        values = chunks[kind]
+        start = len(values)
+        values.extend(array.astype(kind).tolist())
+        return {"__array__": kind, "slice": [start, len(values)]}
+    if isinstance(value, dict):
+        return {k: _pack(v, chunks) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_pack(v, chunks) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _unpack(value: Any, lists: Dict[str, list]) -> Any:
+    if isinstance(value, dict):
+        if len(value) == 2 and "__array__" in value and "slice" in value:
+            start, end = value["slice"]
+            return lists[value["__array__"]][start:end]
+        return {k: _unpack(v, lists) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_unpack(v, lists) for v in value]
+    return value
+
+
+class ParsedDataCache:
+    """
+    解析结果缓存
+
+    数据为由 dict/list/str/数值组成的嵌套结构：数值列表拼接为整型、浮点型两个 NumPy 数组，其余结构存为一段 JSON 头，
+    一起写入 {sha256}_v{版本}.npz（不使用 pickle）。解析器逻辑变化时提高版本号，旧缓存自然失效。
+    """
+
+    def __init__(self, cache_dir: str = "cache/parsed"):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _cache_path(self, sha256: str, version: int) -> Path:
+        return self.cache_dir / f"{sha256}_v{version}.npz"
+
+    def load(self, file_path: str, version: int) -> Optional[Any]:
+        """读取文件对应的缓存，没有缓存或缓存损坏时返回 None"""
+        try:
+            cache_path = self._cache_path(file_sha256(file_path), version)
+            if not cache_path.exists():
+                return None
+            with np.load(cache_path, allow_pickle=False) as data:
+                header = json.loads(data["__header__"].tobytes().decode('utf-8'))
+                lists = {"i8": data["i8"].tolist(), "f8": data["f8"].tolist()}
+            return _unpack(header, lists)
+        except Exception as e:
+            logger.warning(f"读取解析缓存失败，将重新解析 {file_path}: {e}")
+            return None
+
+    def save(self, file_path: str, version: int, value: Any) -> bool:
+        """写入缓存（先写临时文件再替换）；数据中含有无法序列化的对象时不缓存"""
+        tmp_path = None
+        try:
+            chunks: Dict[str, list] = {"i8": [], "f8": []}
+            header = json.dumps(_pack(value, chunks), ensure_ascii=False)
+            arrays = {
+                "__header__": np.frombuffer(header.encode('utf-8'), dtype=np.uint8),
+                "i8": np.asarray(chunks["i8"], dtype=np.int64),
+                "f8": np.asarray(chunks["f8"], dtype=np.float64),
+            }
+            cache_path = self._cache_path(file_sha256(file_path), version)
+            tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp_path, cache_path)
+            return True
+        except Exception as e:
+            logger.warning(f"写入解析缓存失败 {file_path}: {e}")
+            if tmp_path is not None and tmp_path.exists():
+                tmp_path.unlink()
+            return False
+
+    def remove(self, sha256: str) -> int:
+        """删除某个文件内容所有解析器版本的缓存（内容文件被清理时调用），返回删除的文件数"""
+        removed = 0
+        for cache_path in self.cache_dir.glob(f"{sha256}_v*.npz"):
+            try:
+                cache_path.unlink()
+                removed += 1
+            except OSError as e:
+                logger.warning(f"删除解析缓存失败 {cache_path}: {e}")
+        return removed
+
+
+# 全局解析结果缓存实例
+parsed_data_cache = ParsedDataCache()
@@ -0,0 +1,155 @@
+"""
+缩略图缓存 - 按 (文件内容 SHA-256, 目标尺寸) 缓存缩放好的缩略图
+图片入库时在后台线程池中生成，页面显示时直接读取缩略图，不再解码原图后在 GUI 线程中缩放
+"""
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QImage, QImageReader
+from loguru import logger
+
+from public.function.Cache.parsed_data_cache import file_sha256
+
+
+class ThumbnailCache:
+    """
+    缩略图缓存
+
+    缩略图保存为 {cache_dir}/{sha256[:2]}/{sha256}_{尺寸}.jpg（带透明通道的图片为 .png），
+    尺寸为缩略图长边的像素上限。原图内容变化后哈希随之变化，旧缩略图不会再被使用，
+    在内容文件被磁盘配额清理时一并删除。
+
+    只使用 QImage / QImageReader（可在非 GUI 线程中使用），不使用 QPixmap。
+    """
+
+    SIZE_TABLE = 60     # 缓存表格中的缩略图
+    SIZE_GRID = 150     # 实时识别网格
+    SIZE_DETAIL = 300   # 历史记录详情
+    SIZES = (SIZE_TABLE, SIZE_GRID, SIZE_DETAIL)
+
+    _EXTS = {'.jpg': 'JPG', '.png': 'PNG'}
+    _JPEG_QUALITY = 85
+
+    def __init__(self, cache_dir: str = "cache/thumbnails", max_workers: int = 2):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ThumbnailWorker")
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _thumbnail_path(self, sha256: str, size: int, ext: str) -> Path:
+        return self.cache_dir / sha256[:2] / f"{sha256}_{size}{ext}"
+
+    def find(self, sha256: str, size: int) -> Optional[Path]:
+        """已生成的缩略图路径，没有时返回 None"""
+        for ext in self._EXTS:
+            path = self._thumbnail_path(sha256, size, ext)
+            if path.exists():
+                return path
+        return None
+
+    # ==================== 生成 ====================
+
+    @staticmethod
+    def _read_scaled(source_path: Path, size: int) -> QImage:
+        """解码时直接缩放到长边不超过 size（JPEG 在解码阶段缩小，不生成全分辨率图像）"""
+        reader = QImageReader(str(source_path))
+        reader.setAutoTransform(True)
+        source_size = reader.size()
+        if source_size.isValid() and (source_size.width() > size or source_size.height() > size):
+            reader.setScaledSize(source_size.scaled(size, size, Qt.AspectRatioMode.KeepAspectRatio))
+        image = reader.read()
+        if image.isNull():
+            raise ValueError(f"无法读取图片 {source_path}: {reader.errorString()}")
+        return image
+
+    def _save(self, image: QImage, sha256: str, size: int) -> Path:
+        ext = '.png' if image.hasAlphaChannel() else '.jpg'
+        path = self._thumbnail_path(sha256, size, ext)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        if not image.save(str(tmp_path), self._EXTS[ext], self._JPEG_QUALITY if ext == '.jpg' else -1):
+            raise OSError(f"写入缩略图失败 {path}")
+        os.replace(tmp_path, path)
+        return path
+
+    def generate(self, source_path, sha256: Optional[str] = None,
+                 sizes: Sequence[int] = SIZES) -> Dict[int, Path]:
+        """
+        生成各尺寸的缩略图（已存在的尺寸跳过）：原图只按最大尺寸解码一次，较小的尺寸由它缩放
+
+        Returns:
+            {尺寸: 缩略图路径}
+        """
+        source_path = Path(source_path)
+        sha256 = sha256 or file_sha256(str(source_path))
+        result = {size: self.find(sha256, size) for size in sizes}
+        missing = sorted((size for size, path in result.items() if path is None), reverse=True)
+        if not missing:
+            return result
+        image = self._read_scaled(source_path, missing[0])
+        for size in missing:
+            if image.width() > size or image.height() > size:
+                image = image.scaled(size, size, Qt.AspectRatioMode.KeepAspectRatio,
+                                     Qt.TransformationMode.SmoothTransformation)
+            result[size] = self._save(image, sha256, size)
+        return result
+
+    def submit(self, source_path, sha256: Optional[str] = None) -> Future:
+        """在后台线程池中生成缩略图（图片入库时调用）"""
+        def run():
+            try:
+                return self.generate(source_path, sha256)
+            except Exception as e:
+                logger.warning(f"[缩略图] 生成失败 {source_path}: {e}")
+                return {}
+
+        return self._executor.submit(run)
+
+    def submit_load(self, source_path, size: int, sha256: Optional[str] = None) -> Future:
+        """在后台线程池中执行 load_image，Future 的结果为 QImage（读取失败时为空 QImage）"""
+        return self._executor.submit(self.load_image, source_path, size, sha256)
+
+    # ==================== 读取 ====================
+
+    def load_image(self, source_path, size: int, sha256: Optional[str] = None) -> QImage:
+        """
+        读取长边不超过 size 的缩略图：已缓存时直接读取缩略图文件，
+        否则从原图按目标尺寸解码并写入缓存；读取失败时返回空 QImage
+        """
+        try:
+            sha256 = sha256 or file_sha256(str(source_path))
+            cached = self.find(sha256, size)
+            if cached is not None:
+                image = QImage(str(cached))
+                if not image.isNull():
+                    return image
+            image = self._read_scaled(Path(source_path), size)
+            try:
+                self._save(image, sha256, size)
+            except OSError as e:
+                logger.warning(f"[缩略图] {e}")
+            return image
+        except Exception as e:
+            logger.error(f"[缩略图] 读取失败 {source_path}: {e}")
+            return QImage()
+
+    def remove(self, sha256: str) -> int:
+        """删除某个文件内容的所有缩略图（内容文件被清理时调用），返回删除的文件数"""
+        removed = 0
+        for path in self.cache_dir.glob(f"{sha256[:2]}/{sha256}_*"):
+            try:
+                path.unlink()
+                removed += 1
+            except OSError as e:
+                logger.warning(f"[缩略图] 删除失败 {path}: {e}")
+        return removed
+
+
+# 全局缩略图缓存实例
+thumbnail_cache = ThumbnailCache()
@@ -32,3 +32,36 @@ class DataCaculation:
         if len(datas) == 0 or len(columns) == 0:
             return retur_datas
 
+
+    def caculate_data_stream(self, columns: list, stream, on_batch=None) -> dict:
+        """
+        对流式查询结果逐批累计统计，内存占用与数据量无关
+        :param columns: 为用户选择的列
+        :param stream: SQLiteManager.iter_query / stream_multi_table_data 返回的 QueryStream
+        :param on_batch: 每批统计前调用 on_batch(batch)（例如同时写入 CSV），流只需遍历一次
+        :return: {列名: {'count','min','max','mean'}}，非数值忽略
+        """
+        stats = {}
+        if stream is None:
+            return stats
+        indexes = {column: stream.columns.index(column) for column in columns if column in stream.columns}
+        sums = {column: 0.0 for column in indexes}
+        for column in indexes:
+            stats[column] = {'count': 0, 'min': None, 'max': None, 'mean': None}
+        for batch in stream:
+            if on_batch is not None:
+                on_batch(batch)
+            for column, index in indexes.items():
+                item = stats[column]
+                for row in batch:
+                    value = row[index]
+                    if not isinstance(value, (int, float)):
+                        continue
+                    item['count'] += 1
+                    sums[column] += value
+                    item['min'] = value if item['min'] is None else min(item['min'], value)
+                    item['max'] = value if item['max'] is None else max(item['max'], value)
+        for column, item in stats.items():
+            if item['count'] > 0:
+                item['mean'] = sums[column] / item['count']
+        return stats
@@ -0,0 +1,106 @@
+# 冷数据归档任务：后台线程按固定间隔调用 SQLiteManager.archive_older_than，把早于 N 天的数据移出数据库
+import os
+import threading
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from public.config_class.global_setting import global_setting
+from public.dao.SQLite.SQliteManager import SQLiteManager
+
+
+class ArchiveJob:
+    """
+    定时归档任务：启动后先归档一次，之后每隔 interval 秒归档一次，
+    每次把早于 keep_days 天的数据写入归档文件并从数据库删除（见 SQLiteManager.archive_older_than）
+    """
+
+    def __init__(self, manager: SQLiteManager, keep_days: int, interval: float = 24 * 3600,
+                 tables: Optional[List[str]] = None, vacuum: bool = False):
+        """
+        Args:
+            manager: 要归档的数据库
+            keep_days: 数据库中保留的天数
+            interval: 两次归档之间的秒数
+            tables: 要归档的表，None 为所有带 time 列的数据表
+            vacuum: 归档后是否执行检查点和 VACUUM
+        """
+        if keep_days < 0:
+            raise ValueError("keep_days must be >= 0")
+        if interval <= 0:
+            raise ValueError("interval must be > 0")
+        self.manager = manager
+        self.keep_days = keep_days
+        self.interval = interval
+        self.tables = tables
+        self.vacuum = vacuum
+        self.last_result: Dict[str, int] = {}
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="archive_job", daemon=True)
+        self._thread.start()
+        logger.info(f"归档任务已启动: 保留 {self.keep_days} 天，每 {self.interval} 秒执行一次")
+
+    def stop(self, timeout: Optional[float] = 10.0):
+        """停止任务；正在进行的归档在当前这一天写完后才会结束，最多等待 timeout 秒"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        logger.info("归档任务已停止")
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def run_once(self) -> Dict[str, int]:
+        """立即归档一次，返回 {表名: 本次归档的行数}"""
+        self.last_result = self.manager.archive_older_than(self.keep_days, tables=self.tables, vacuum=self.vacuum)
+        return self.last_result
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"归档任务执行失败: {e}")
+            self._stop_event.wait(self.interval)
+
+
+def start_archive_job_from_config() -> Optional[ArchiveJob]:
+    """
+    按 gui 配置的 [archive] 节启动归档任务（程序启动时与存储写入服务在同一处调用）；
+    已在运行时直接返回现有任务，未配置 db_path 或数据库文件不存在时不启动并返回 None
+    """
+    job: Optional[ArchiveJob] = global_setting.get_setting("archive_job")
+    if job is not None and job.is_running():
+        return job
+    archive_config = global_setting.get_setting("configer", {}).get("archive", {})
+    db_path = archive_config.get("db_path")
+    if not db_path:
+        logger.info("未配置 [archive] db_path，归档任务未启动")
+        return None
+    if not os.path.exists(db_path):
+        logger.warning(f"归档的数据库 {db_path} 不存在，归档任务未启动")
+        return None
+    manager = SQLiteManager(db_path, pool_mode=SQLiteManager.POOL_MODE_THREAD)
+    job = ArchiveJob(manager,
+                     keep_days=int(archive_config.get("keep_days", 30)),
+                     interval=float(archive_config.get("interval_hours", 24)) * 3600,
+                     vacuum=str(archive_config.get("vacuum", "false")).lower() in ("1", "true", "yes"))
+    job.start()
+    global_setting.set_setting("archive_job", job)
+    return job
+
+
+def stop_archive_job():
+    """停止 global_setting 中的归档任务（程序退出时调用）"""
+    job: Optional[ArchiveJob] = global_setting.get_setting("archive_job")
+    if job is not None:
+        job.stop()
+        job.manager.close()
+        global_setting.set_setting("archive_job", None)
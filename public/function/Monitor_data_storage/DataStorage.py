@@ -2,6 +2,7 @@ import queue
 import threading
 import time
 import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from dataclasses import dataclass
 from typing import Any, Optional
 
@@ -13,8 +14,9 @@ class DataItem:
     """存储数据项"""
     id: str
     data: Any
-    result_queue: Optional[queue.Queue] = None
+    result_queue: Optional[queue.Queue] = None  # 兼容旧的结果队列，新代码使用 future
     timestamp: float = None
+    future: Optional[Future] = None  # 写入服务提交后以 StorageResult 完成
 
 @dataclass
 class StorageResult:
@@ -23,6 +25,48 @@ class StorageResult:
     success: bool
     error: Optional[str] = None
     timestamp: float = None
+
+
+def _get_store_queue():
+    """取 global_setting 中的存储队列及其锁，未初始化时创建并保存"""
+    storeQ_g = global_setting.get_setting("store_Q")
+    if storeQ_g is None:
+        storeQ_g = queue.Queue()
+        global_setting.set_setting("store_Q", storeQ_g)
+    lock_g = global_setting.get_setting("store_Q_lock")
+    if lock_g is None:
+        lock_g = threading.Lock()
+        global_setting.set_setting("store_Q_lock", lock_g)
+    return storeQ_g, lock_g
+
+
+def _enqueue(data, with_future: bool) -> DataItem:
+    data_item = DataItem(
+        id=str(uuid.uuid4()),
+        data=data,
+        timestamp=time.time(),
+        future=Future() if with_future else None
+    )
+
+    storeQ_g, lock_g = _get_store_queue()
+    with lock_g:
+        storeQ_g.put(data_item)
+    return data_item
+
+
+def store_data_async(data) -> Future:
+    """
+    存储数据，不等待写入
+
+    Args:
+        data: 要存储的数据（格式见 StorageWriterService.default_item_converter）
+
+    Returns:
+        Future，写入服务提交该数据所在的批次后以 StorageResult 完成
+    """
+    return _enqueue(data, with_future=True).future
+
+
 def store_data_with_result(data, need_result=False, timeout=5):
     """
     存储数据并可选择性获取结果
@@ -35,45 +79,18 @@ def store_data_with_result(data, need_result=False, timeout=5):
     Returns:
         StorageResult对象（如果need_result=True）或None
     """
-    # 生成唯一ID
-    item_id = str(uuid.uuid4())
-
-    # 创建结果队列（如果需要的话）
-    result_queue = None
-    if need_result:
-        result_queue = queue.Queue()
-
-        # 注册结果队列
-        result_queues_lock_q = global_setting.get_setting("result_queues_lock")
-        result_queues_q = global_setting.get_setting("result_queues")
-        with result_queues_lock_q:
-            result_queues_q[item_id] = result_queue
+    if not need_result:
+        _enqueue(data, with_future=False)
+        return None
 
-    # 创建数据项
-    data_item = DataItem(
-        id=item_id,
-        data=data,
-        result_queue=result_queue,
-        timestamp=time.time()
-    )
-
-    # 放入存储队列
-    lock_g = global_setting.get_setting("store_Q_lock", threading.Lock())
-    storeQ_g = global_setting.get_setting("store_Q", queue.Queue())
-
-    with lock_g:
-        storeQ_g.put(data_item)
+    service = global_setting.get_setting("storage_writer_service")
+    if service is None or not service.is_running():
+        # 没有写入服务在取队列，等待只会超时；不放入队列，避免服务之后启动时写入调用方已视为失败的数据
+        return StorageResult(str(uuid.uuid4()), False, "存储写入服务未启动", time.time())
 
-    # 如果需要结果，等待并返回
-    if need_result and result_queue:
-        try:
-            result = result_queue.get(timeout=timeout)
-            return result
-        except queue.Empty:
-            # 超时清理
-            with result_queues_lock_q:
-                if item_id in result_queues_q:
-                    del result_queues_q[item_id]
-            return StorageResult(item_id, False, f"等待存储结果超时({timeout}秒)")
-
-    return None
+    data_item = _enqueue(data, with_future=True)
+    try:
+        return data_item.future.result(timeout=timeout)
+    except FutureTimeoutError:
+        # 数据仍在队列中，之后会被写入，这里只是不再等待结果
+        return StorageResult(data_item.id, False, f"等待存储结果超时({timeout}秒)")
@@ -0,0 +1,274 @@
+# 存储队列的组提交写入服务：按数量或时间窗口批量取出 store_Q 中的 DataItem，每批一个事务写入 SQLite
+import collections
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from public.config_class.global_setting import global_setting
+from public.dao.SQLite.SQliteManager import SQLiteManager, WriteOnlyUser
+from public.function.Monitor_data_storage.DataStorage import DataItem, StorageResult, _get_store_queue
+
+
+def default_item_converter(data: Any) -> Iterable[Tuple[str, Dict[str, Any]]]:
+    """
+    把 DataItem.data 转换为 [(表名, {列名: 值})]
+
+    支持:
+        {"table_name": "xxx", "values": {"time": ..., "temperature": ...}}
+        或由上述字典组成的列表（同一数据项的多行在同一个保存点内写入，要么全部成功要么全部失败）
+    """
+    records = data if isinstance(data, (list, tuple)) else [data]
+    for record in records:
+        if not isinstance(record, dict) or "table_name" not in record or "values" not in record:
+            raise ValueError(f"无法识别的存储数据格式: {record!r}")
+        yield record["table_name"], record["values"]
+
+
+class StorageWriterService:
+    """
+    组提交写入服务：后台线程从 store_Q 取数据，凑满 max_batch_size 条或等待 max_batch_delay 秒后，
+    在一个 BEGIN IMMEDIATE 事务中写入整批，每个数据项一个 SAVEPOINT，单项失败不影响同批其它数据项。
+    写入结果通过 DataItem.future（concurrent.futures.Future）返回 StorageResult。
+    """
+
+    # 保留最近多少次提交耗时用于计算分位数
+    LATENCY_WINDOW = 1000
+
+    def __init__(self, manager: SQLiteManager, store_queue: Optional[queue.Queue] = None,
+                 max_batch_size: int = 500, max_batch_delay: float = 0.05,
+                 converter: Callable[[Any], Iterable[Tuple[str, Dict[str, Any]]]] = default_item_converter):
+        """
+        Args:
+            manager: 写入使用的数据库管理器（建议 WriteOnlyUser + thread 连接池）
+            store_queue: 待写入队列，默认为 global_setting 中的 store_Q
+            max_batch_size: 每批最多的数据项数
+            max_batch_delay: 取到第一项后最多再等待的秒数
+            converter: DataItem.data -> [(表名, {列名: 值})]
+        """
+        if max_batch_size <= 0:
+            raise ValueError("max_batch_size must be > 0")
+        self.manager = manager
+        self.store_queue = store_queue if store_queue is not None else global_setting.get_setting("store_Q")
+        if self.store_queue is None:
+            raise ValueError("store_Q 尚未初始化")
+        self.max_batch_size = max_batch_size
+        self.max_batch_delay = max_batch_delay
+        self.converter = converter
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._sql_cache: Dict[Tuple[str, Tuple[str, ...]], str] = {}
+
+        self._metrics_lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=self.LATENCY_WINDOW)
+        self._batches = 0
+        self._items_written = 0
+        self._items_failed = 0
+        self._max_batch_seen = 0
+
+    # ==================== 生命周期 ====================
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="storage_writer_service", daemon=True)
+        self._thread.start()
+        logger.info("存储写入服务已启动")
+
+    def stop(self, drain: bool = True, timeout: Optional[float] = 10.0):
+        """停止服务，drain=True 时先写完队列中剩余的数据"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if drain:
+            while True:
+                batch = self._collect_batch(block=False)
+                if not batch:
+                    break
+                self._write_batch(batch)
+        logger.info(f"存储写入服务已停止: {self.metrics()}")
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._collect_batch(block=True)
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    logger.error(f"存储写入服务写入批次失败: {e}")
+                    for item in batch:
+                        self._resolve(item, e)
+
+    def _collect_batch(self, block: bool) -> List[DataItem]:
+        """阻塞等待第一项，之后在 max_batch_delay 内尽量凑满 max_batch_size 项"""
+        batch: List[DataItem] = []
+        try:
+            first = self.store_queue.get(timeout=0.5) if block else self.store_queue.get_nowait()
+        except queue.Empty:
+            return batch
+        batch.append(first)
+        deadline = time.monotonic() + self.max_batch_delay
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.store_queue.get(timeout=remaining) if remaining > 0 and block
+                             else self.store_queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    # ==================== 写入 ====================
+
+    def _insert_sql(self, table_name: str, columns: Tuple[str, ...]) -> str:
+        key = (table_name, columns)
+        sql = self._sql_cache.get(key)
+        if sql is None:
+            columns_sql = ', '.join(self.manager.quote_ident(c) for c in columns)
+            placeholders = ', '.join('?' * len(columns))
+            sql = f"INSERT INTO {self.manager.quote_ident(table_name)} ({columns_sql}) VALUES ({placeholders})"
+            self._sql_cache[key] = sql
+        return sql
+
+    def _prepare(self, item: DataItem) -> List[Tuple[str, tuple]]:
+        statements = []
+        for table_name, values in self.converter(item.data):
+            # 分区表路由到物理分区（必要时建分区），需在持有写连接之前完成
+            table_name = self.manager._route_partition(table_name, values.get(SQLiteManager.TIME_COLUMN_NAME))
+            columns = tuple(values.keys())
+            statements.append((self._insert_sql(table_name, columns), tuple(values.values())))
+        return statements
+
+    def _write_batch(self, batch: List[DataItem]):
+        prepared: List[Tuple[DataItem, List[Tuple[str, tuple]]]] = []
+        for item in batch:
+            try:
+                prepared.append((item, self._prepare(item)))
+            except Exception as e:
+                self._resolve(item, e)
+        if not prepared:
+            return
+
+        start = time.perf_counter()
+        results: List[Tuple[DataItem, Optional[BaseException]]] = []
+        with self.manager.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                self.manager._begin_immediate(cursor)
+                for item, statements in prepared:
+                    cursor.execute("SAVEPOINT storage_item")
+                    try:
+                        for sql, params in statements:
+                            cursor.execute(sql, params)
+                        cursor.execute("RELEASE storage_item")
+                        results.append((item, None))
+                    except sqlite3.Error as e:
+                        cursor.execute("ROLLBACK TO storage_item")
+                        cursor.execute("RELEASE storage_item")
+                        results.append((item, e))
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"批量写入 {len(prepared)} 项失败，整批回滚: {e}")
+                results = [(item, e) for item, _ in prepared]
+            finally:
+                cursor.close()
+        latency = time.perf_counter() - start
+
+        failed = sum(1 for _, error in results if error is not None)
+        with self._metrics_lock:
+            self._latencies.append(latency)
+            self._batches += 1
+            self._items_written += len(results) - failed
+            self._items_failed += failed
+            self._max_batch_seen = max(self._max_batch_seen, len(batch))
+        for item, error in results:
+            self._resolve(item, error)
+
+    def _resolve(self, item: DataItem, error: Optional[BaseException]):
+        """把写入结果交给等待方：future 优先，兼容旧的 result_queue"""
+        if error is not None:
+            logger.error(f"数据项 {item.id} 写入失败: {error}")
+        result = StorageResult(item.id, error is None, None if error is None else str(error), time.time())
+        if item.future is not None and not item.future.done():
+            item.future.set_result(result)
+        if item.result_queue is not None:
+            item.result_queue.put(result)
+
+    # ==================== 指标 ====================
+
+    def metrics(self) -> Dict[str, Any]:
+        """队列深度、批次数、写入/失败项数、平均批大小以及提交耗时（毫秒）的均值/p50/p95/最大值"""
+        with self._metrics_lock:
+            latencies = sorted(self._latencies)
+            batches = self._batches
+            written = self._items_written
+            failed = self._items_failed
+            max_batch = self._max_batch_seen
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 3)
+
+        return {
+            "queue_depth": self.store_queue.qsize(),
+            "batches": batches,
+            "items_written": written,
+            "items_failed": failed,
+            "avg_batch_size": round((written + failed) / batches, 2) if batches else 0.0,
+            "max_batch_size": max_batch,
+            "commit_latency_ms": {
+                "avg": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+            },
+        }
+
+
+def start_storage_writer(manager: SQLiteManager, **kwargs) -> StorageWriterService:
+    """初始化 global_setting 中的 store_Q，并启动写入服务（保存为 storage_writer_service）"""
+    store_queue, _ = _get_store_queue()
+    service = StorageWriterService(manager, store_queue=store_queue, **kwargs)
+    service.start()
+    global_setting.set_setting("storage_writer_service", service)
+    return service
+
+
+def start_storage_writer_from_config() -> Optional[StorageWriterService]:
+    """
+    按 gui 配置的 [storage] 节启动写入服务（程序启动时在设置好 store_Q 的同一处调用）；
+    已在运行时直接返回现有服务，未配置 db_path 时不启动并返回 None
+    """
+    service: Optional[StorageWriterService] = global_setting.get_setting("storage_writer_service")
+    if service is not None and service.is_running():
+        return service
+    storage_config = global_setting.get_setting("configer", {}).get("storage", {})
+    db_path = storage_config.get("db_path")
+    if not db_path:
+        logger.info("未配置 [storage] db_path，存储写入服务未启动")
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    manager = WriteOnlyUser(db_path, pool_mode=SQLiteManager.POOL_MODE_THREAD)
+    service = start_storage_writer(manager,
+                                   max_batch_size=int(storage_config.get("max_batch_size", 500)),
+                                   max_batch_delay=float(storage_config.get("max_batch_delay", 0.05)))
+    return service
+
+
+def stop_storage_writer(drain: bool = True):
+    """停止 global_setting 中的写入服务（程序退出时调用），drain=True 时先写完队列中剩余的数据"""
+    service: Optional[StorageWriterService] = global_setting.get_setting("storage_writer_service")
+    if service is not None:
+        service.stop(drain=drain)
+        service.manager.close()
+        global_setting.set_setting("storage_writer_service", None)
@@ -0,0 +1,279 @@
+#sqlite db文件转成列式文件（Parquet / Feather / gzip CSV），供数据分析使用
+# 与 DbTransferExcel 不同，这里没有行数上限，也不构造完整的 DataFrame：
+# 每张表按块从 SQLite（含已归档的数据）流式读取，逐块写入目标文件，内存占用与表的行数无关
+import csv
+import gzip
+import json
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from public.dao.SQLite.SQliteManager import ReadOnlyUser
+
+
+class DbTransferColumnar():
+    FORMAT_PARQUET = 'parquet'
+    FORMAT_FEATHER = 'feather'
+    FORMAT_CSV_GZ = 'csv.gz'
+    FORMATS = (FORMAT_PARQUET, FORMAT_FEATHER, FORMAT_CSV_GZ)
+    # 只给了开始时间时的结束时间上限（3000-01-01）
+    MAX_TIME = 32503680000.0
+
+    def __init__(self, db_name: str):
+        self.sqlite_manager = ReadOnlyUser(db_name)
+
+    def stop(self):
+        self.sqlite_manager.close()
+
+    def get_export_tables(self) -> List[str]:
+        """可导出的监控数据表（带 time 列；分区表只返回逻辑表名）"""
+        catalog = self.sqlite_manager.get_schema_catalog()
+        return [name for name in self.sqlite_manager.get_all_tables()
+                if name in catalog and catalog[name]["has_time"]]
+
+    # ==================== 读取 ====================
+
+    def _range_sql(self, table_name: str, start_time: Optional[float],
+                   end_time: Optional[float], select: str = "*") -> Tuple[str, list]:
+        """时间范围查询（秒级时间戳，None 表示不限），条件与其它查询一样由 _time_range_condition 生成"""
+        manager = self.sqlite_manager
+        source = manager._table_source(table_name, start_time, end_time)
+        if start_time is None and end_time is None:
+            return f"SELECT {select} FROM {source}", []
+        condition, params, _ = manager._time_range_condition(
+            table_name, 0 if start_time is None else start_time,
+            self.MAX_TIME if end_time is None else end_time)
+        return f"SELECT {select} FROM {source} WHERE {condition}", params
+
+    def iter_table_batches(self, table_name: str, start_time: Optional[float] = None,
+                           end_time: Optional[float] = None, chunksize: int = 50000,
+                           cancel_event: Optional[threading.Event] = None):
+        """
+        按块读取一张表在时间范围内的数据：先读归档文件，再读数据库中的数据
+
+        Yields:
+            行元组列表（列顺序与 get_table_columns 一致）
+        """
+        from public.dao.SQLite import archive_store
+
+        manager = self.sqlite_manager
+        columns = manager.get_table_columns(table_name) or []
+        start_ms = None if start_time is None else math.floor(start_time * 1000)
+        end_ms = None if end_time is None else math.floor(end_time * 1000)
+        for archive_file in manager.get_archived_days(table_name, start_time, end_time):
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            rows, _ = archive_store.read_archive(archive_file["path"], columns, start_ms, end_ms)
+            for i in range(0, len(rows), chunksize):
+                yield rows[i:i + chunksize]
+
+        sql, params = self._range_sql(table_name, start_time, end_time)
+        with manager.iter_query(sql, params, arraysize=chunksize, cancel_event=cancel_event) as stream:
+            for batch in stream:
+                yield batch
+
+    # ==================== 写入 ====================
+
+    @staticmethod
+    def _arrow_type(pa, declared_type: str):
+        """按 SQLite 的类型亲和性规则把声明类型映射为 Arrow 类型"""
+        declared = (declared_type or "").upper()
+        if "INT" in declared:
+            return pa.int64()
+        if any(s in declared for s in ("CHAR", "CLOB", "TEXT")):
+            return pa.string()
+        if "BLOB" in declared:
+            return pa.binary()
+        if not declared:
+            # 没有声明类型的列可以存任意值，按文本导出
+            return pa.string()
+        # REAL / NUMERIC 亲和性（含 TIMESTAMP、DATETIME、DECIMAL 等），存了文本值时由 _text_valued_columns 改为文本
+        return pa.float64()
+
+    def _declared_types(self, table_name: str) -> Dict[str, str]:
+        with self.sqlite_manager.execute_transaction(auto_commit=True) as cursor:
+            cursor.execute(f"PRAGMA table_info({self.sqlite_manager.quote_ident(table_name)})")
+            return {row[1]: row[2] for row in cursor.fetchall()}
+
+    def _text_valued_columns(self, table_name: str, columns: List[str], start_time: Optional[float] = None,
+                             end_time: Optional[float] = None) -> Set[str]:
+        """
+        columns 中在导出范围内存有非数值（文本、二进制）的列：数据库中按与 iter_table_batches 相同的
+        时间条件一次扫描检查所有列，范围内的归档文件按文件中记录的列编码判断
+        """
+        from public.dao.SQLite import archive_store
+
+        if not columns:
+            return set()
+        manager = self.sqlite_manager
+        checks = ", ".join(f"MAX(typeof({manager.quote_ident(c)}) NOT IN ('integer', 'real', 'null'))"
+                           for c in columns)
+        sql, params = self._range_sql(table_name, start_time, end_time, select=checks)
+        with manager.execute_transaction(auto_commit=True) as cursor:
+            cursor.execute(sql, params)
+            flags = cursor.fetchone()
+        text_valued = {column for column, flag in zip(columns, flags) if flag}
+        numeric_kinds = (archive_store.KIND_INT, archive_store.KIND_FLOAT, archive_store.KIND_NULL)
+        for archive_file in manager.get_archived_days(table_name, start_time, end_time):
+            kinds = archive_store.column_kinds(archive_file["path"])
+            text_valued.update(c for c in columns if kinds.get(c, archive_store.KIND_NULL) not in numeric_kinds)
+        return text_valued
+
+    def build_arrow_schema(self, table_name: str, start_time: Optional[float] = None,
+                           end_time: Optional[float] = None):
+        """
+        构造表的 Arrow schema：列的 metadata 中 description 为 _meta 表中的描述，
+        schema 的 metadata 中 table 为表名、descriptions 为所有列描述的 JSON；
+        start_time/end_time 为导出范围，只按范围内的值判断声明为数值的列是否需要按文本导出
+        """
+        import pyarrow as pa
+
+        manager = self.sqlite_manager
+        columns = manager.get_table_columns(table_name) or []
+        descriptions = manager.get_table_meta(table_name) or {}
+        declared = self._declared_types(table_name)
+        if not declared and columns:
+            # 分区逻辑表是视图，取第一个分区的声明类型
+            partitions = manager.get_schema_catalog()[table_name]["partitioned"]["partitions"]
+            declared = self._declared_types(partitions[0][0]) if partitions else {}
+        types = {column: self._arrow_type(pa, declared.get(column, "")) for column in columns}
+        text_valued = self._text_valued_columns(
+            table_name, [column for column, arrow_type in types.items() if pa.types.is_floating(arrow_type)],
+            start_time, end_time)
+        fields = []
+        for column in columns:
+            metadata = {"description": descriptions[column]} if descriptions.get(column) else None
+            if column in text_valued:
+                logger.info(f"表 {table_name} 的列 {column} 声明为 {declared.get(column)}，但存有文本值，按文本导出")
+                types[column] = pa.string()
+            fields.append(pa.field(column, types[column], metadata=metadata))
+        return pa.schema(fields, metadata={
+            "table": table_name,
+            "descriptions": json.dumps(descriptions, ensure_ascii=False),
+        })
+
+    @staticmethod
+    def _to_record_batch(pa, schema, batch: List[tuple]):
+        arrays = []
+        for field, values in zip(schema, zip(*batch)):
+            if pa.types.is_string(field.type):
+                values = [v if v is None or isinstance(v, str) else
+                          (v.hex() if isinstance(v, (bytes, bytearray, memoryview)) else str(v)) for v in values]
+            try:
+                arrays.append(pa.array(values, type=field.type))
+            except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError) as e:
+                raise ValueError(f"列 {field.name} 的值无法转换为 {field.type}: {e}") from e
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def _write_arrow(self, table_name: str, output_path: str, file_format: str, batches,
+                     start_time: Optional[float] = None, end_time: Optional[float] = None) -> int:
+        import pyarrow as pa
+
+        schema = self.build_arrow_schema(table_name, start_time, end_time)
+        if file_format == self.FORMAT_PARQUET:
+            import pyarrow.parquet as pq
+            writer = pq.ParquetWriter(output_path, schema, compression='zstd')
+            write = writer.write_batch
+        else:
+            writer = pa.ipc.new_file(output_path, schema,
+                                     options=pa.ipc.IpcWriteOptions(compression='lz4'))
+            write = writer.write_batch
+        rows = 0
+        try:
+            for batch in batches:
+                if batch:
+                    write(self._to_record_batch(pa, schema, batch))
+                    rows += len(batch)
+        finally:
+            writer.close()
+        return rows
+
+    def _write_csv_gz(self, table_name: str, output_path: str, batches) -> int:
+        """gzip CSV 没有 schema，列描述写入同名的 .meta.json 文件"""
+        manager = self.sqlite_manager
+        columns = manager.get_table_columns(table_name) or []
+        with open(f"{output_path}.meta.json", 'w', encoding='utf-8') as f:
+            json.dump({"table": table_name, "descriptions": manager.get_table_meta(table_name) or {}},
+                      f, ensure_ascii=False, indent=2)
+        rows = 0
+        with gzip.open(output_path, 'wt', encoding='utf-8', newline='', compresslevel=6) as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for batch in batches:
+                writer.writerows(tuple(v.hex() if isinstance(v, (bytes, bytearray, memoryview)) else v
+                                       for v in row) for row in batch)
+                rows += len(batch)
+        return rows
+
+    def export_table(self, table_name: str, output_path: str, file_format: str = FORMAT_PARQUET,
+                     start_time: Optional[float] = None, end_time: Optional[float] = None,
+                     chunksize: int = 50000, cancel_event: Optional[threading.Event] = None) -> int:
+        """
+        导出一张表（含已归档的数据）到列式文件
+
+        Args:
+            table_name: 表名（分区表为逻辑表名）
+            output_path: 输出文件路径
+            file_format: 'parquet' / 'feather' / 'csv.gz'
+            start_time/end_time: 秒级时间戳范围（闭区间），None 表示不限
+            chunksize: 每块的行数
+            cancel_event: 置位后停止导出并删除未完成的文件
+
+        Returns:
+            导出的行数
+        """
+        if file_format not in self.FORMATS:
+            raise ValueError(f"不支持的导出格式: {file_format}，可选 {self.FORMATS}")
+        batches = self.iter_table_batches(table_name, start_time, end_time, chunksize, cancel_event)
+        try:
+            if file_format == self.FORMAT_CSV_GZ:
+                rows = self._write_csv_gz(table_name, output_path, batches)
+            else:
+                rows = self._write_arrow(table_name, output_path, file_format, batches, start_time, end_time)
+        except BaseException:
+            self._remove_output(output_path)
+            raise
+        if cancel_event is not None and cancel_event.is_set():
+            self._remove_output(output_path)
+            logger.info(f"导出表 {table_name} 已取消")
+            return 0
+        return rows
+
+    @staticmethod
+    def _remove_output(output_path: str):
+        for path in (output_path, f"{output_path}.meta.json"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def export_db(self, output_dir: str, file_format: str = FORMAT_PARQUET, tables: Optional[List[str]] = None,
+                  start_time: Optional[float] = None, end_time: Optional[float] = None,
+                  chunksize: int = 50000, cancel_event: Optional[threading.Event] = None) -> Dict[str, str]:
+        """
+        把每张监控数据表导出为 output_dir 下的 "{表名}.{格式}" 文件
+
+        Returns:
+            {表名: 文件路径}，只包含成功导出的表
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        exported = {}
+        for table_name in tables or self.get_export_tables():
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            output_path = os.path.join(output_dir, f"{table_name}.{file_format}")
+            try:
+                start = time.perf_counter()
+                rows = self.export_table(table_name, output_path, file_format, start_time, end_time,
+                                         chunksize, cancel_event)
+            except Exception as e:
+                logger.error(f"导出表 {table_name} 到 {output_path} 失败: {e}")
+                continue
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            logger.info(f"[INFO] 表 {table_name} 导出 {rows} 行到 {output_path}，"
+                        f"耗时 {time.perf_counter() - start:.2f}s")
+            exported[table_name] = output_path
+        return exported
@@ -1,28 +1,121 @@
 #sqlite db文件转成excel文件
+import itertools
+import multiprocessing
+import os
+import queue
 import re
+import shutil
+import tempfile
 import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 
-from typing import List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import pandas as pd
 from loguru import logger
 
 from public.config_class.global_setting import global_setting
+from public.dao.SQLite.Monitor_Datas_Handle import Monitor_Datas_Handle
+from public.dao.SQLite.SQliteManager import ReadOnlyUser
 
 from public.entity.queue.ObjectQueueItem import ObjectQueueItem
+from public.function.Modbus.Modbus_Type import Modbus_Slave_Type
 
 from public.util.time_util import time_util
 
+# 快速导出时工作进程与主进程之间的消息队列、取消事件（通过进程池 initializer 继承）
+_worker_queue = None
+_worker_cancel = None
+
+
+def _init_export_worker(out_queue, cancel_event):
+    global _worker_queue, _worker_cancel
+    _worker_queue = out_queue
+    _worker_cancel = cancel_event
+
+
+def _hex_bytes(row: tuple) -> tuple:
+    # 将 bytes/bytearray/memoryview 转为 hex 字符串（可读）
+    if any(isinstance(v, (bytes, bytearray, memoryview)) for v in row):
+        return tuple(v.hex() if isinstance(v, (bytes, bytearray, memoryview)) else v for v in row)
+    return row
+
+
+def _export_table_worker(db_name: str, table_name: str, col_mapping: Dict[str, str], work_dir: str,
+                         chunksize: int, max_sheet_rows: int) -> List[Tuple[str, int]]:
+    """
+    工作进程：读取一张表（先读归档数据，再读数据库中的数据），逐块写入 sheet XML 临时文件，
+    超过 max_sheet_rows 行时续写到下一个文件
+
+    发送给主进程的消息: ("start", 表名, 总行数) / ("rows", 表名, 已写行数)
+
+    Returns:
+        [(sheet XML 文件路径, 数据行数)]，取消时返回 []
+    """
+    from public.dao.SQLite import archive_store
+    from public.function.Tansfer.xlsx_stream_writer import SheetXmlWriter
+
+    manager = ReadOnlyUser(db_name)
+    columns = manager.get_table_columns(table_name) or []
+    header = [col_mapping.get(c, c) for c in columns]
+    archived = manager.get_archived_days(table_name)
+    # get_table_data_count 已包含归档的行数
+    total = manager.get_table_data_count(table_name)
+    _worker_queue.put(("start", table_name, total))
+
+    def archived_batches():
+        for day in archived:
+            rows, _ = archive_store.read_archive(day["path"], columns)
+            for i in range(0, len(rows), chunksize):
+                yield rows[i:i + chunksize]
+
+    parts: List[Tuple[str, int]] = []
+    writer = None
+    written = 0
+    try:
+        with manager.iter_query(f"SELECT * FROM {manager.quote_ident(table_name)}", arraysize=chunksize,
+                                cancel_event=_worker_cancel) as stream:
+            for batch in itertools.chain(archived_batches(), stream):
+                if _worker_cancel.is_set():
+                    break
+                for row in batch:
+                    if writer is None or writer.rows >= max_sheet_rows:
+                        if writer is not None:
+                            writer.close()
+                            parts.append((writer.path, writer.rows - 1))
+                        writer = SheetXmlWriter(os.path.join(work_dir, f"{uuid.uuid4().hex}.xml"))
+                        writer.append(header)
+                    writer.append(_hex_bytes(row))
+                written += len(batch)
+                _worker_queue.put(("rows", table_name, written))
+        if writer is None:
+            writer = SheetXmlWriter(os.path.join(work_dir, f"{uuid.uuid4().hex}.xml"))
+            writer.append(header)
+    finally:
+        if writer is not None:
+            writer.close()
+            parts.append((writer.path, writer.rows - 1))
+    return [] if _worker_cancel.is_set() else parts
+
 
 class DbTransferExcel():
     INVALID_SHEET_CHARS = r'[:\\/*?\[\]]'
     MAX_SHEET_LEN = 31
+    # Excel 单个 sheet 的最大行数（含表头），超出时续写到 "{sheet}_2" 等后续 sheet
+    MAX_SHEET_ROWS = 1048576
     def __init__(self,db_name=None):
         self.handler = Monitor_Datas_Handle(db_name)
+        self.cancel_event = None
         pass
     def stop(self):
         self.handler.stop()
 
+    def cancel(self):
+        """取消正在进行的快速导出（export_db_to_excel_fast）"""
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+
 
     def sanitize_sheet_name(self,name: str, used: set) -> str:
         # 删除非法字符，替换为空格，截断到 31 字符，确保唯一（添加数字后缀）
@@ -42,6 +135,30 @@ class DbTransferExcel():
         used.add(s)
         return s
 
+    def build_sheet_names(self, name: str, sheet_used: set) -> Tuple[str, str]:
+        """由表名构造 (sheet 名, 中文 sheet 名)"""
+        raw_sheet = name
+        sheet_name = self.sanitize_sheet_name(raw_sheet, sheet_used)
+        sheet_name_split = sheet_name.split("_")
+        # 将数据库表英文名字转成中文名字
+        module_name_str = sheet_name_split[0]
+        cage_number_str = sheet_name_split[len(sheet_name_split) - 1]
+        if cage_number_str.isdigit():
+            cage_number = int(cage_number_str)
+        else:
+            cage_number=None
+        sheet_name_CN= ""
+        for modbus_type in Modbus_Slave_Type.Not_Each_Mouse_Cage.value+Modbus_Slave_Type.Each_Mouse_Cage.value+Modbus_Slave_Type.Calibrations.value+Modbus_Slave_Type.Epochs.value+Modbus_Slave_Type.Cameras.value:
+            if module_name_str == modbus_type.value['name']:
+                sheet_name_CN+=modbus_type.value['description']
+                break
+
+        sheet_name_CN+="监控数据"
+        if cage_number is not None:
+            sheet_name_CN+=f"_通道{cage_number} {'参考气路' if  cage_number==int(global_setting.get_setting('configer')['mouse_cage']['reference']) else ''}"
+            pass
+        return sheet_name, sheet_name_CN
+
     def get_table_list(self) -> List[Tuple[str, str]]:
         # 返回 (name, type) 列表，排除 sqlite_ 开头的内部表
         return self.handler.sqlite_manager.get_tables_with_time_sql_results(select_column_name=["name","type"],exclude_substr=["sqlite_","meta"])
@@ -61,6 +178,15 @@ class DbTransferExcel():
                 df[col] = df[col].apply(lambda x: x.hex() if isinstance(x, (bytes, bytearray, memoryview)) else x)
         return df
 
+    def read_sql_frame(self, sql: str) -> pd.DataFrame:
+        """
+        通过 SQLiteManager 执行查询并构造 DataFrame
+        （开启查询剖析时连接是包装对象，不能直接交给 pd.read_sql_query，否则 pandas 会告警）
+        """
+        with self.handler.sqlite_manager.iter_query(sql, arraysize=5000) as stream:
+            rows = [row for batch in stream for row in batch]
+            return pd.DataFrame.from_records(rows, columns=stream.columns)
+
     def export_db_to_excel(self,writer: pd.ExcelWriter, combine_mode: bool, sheet_used: set,
                            chunksize: int = None):
 
@@ -73,33 +199,12 @@ class DbTransferExcel():
 
             for name, typ in tables:
                 # 构造 sheet 名
-
-                raw_sheet = name
-                sheet_name = self.sanitize_sheet_name(raw_sheet, sheet_used)
-                sheet_name_split = sheet_name.split("_")
-                # 将数据库表英文名字转成中文名字
-                module_name_str = sheet_name_split[0]
-                cage_number_str = sheet_name_split[len(sheet_name_split) - 1]
-                if cage_number_str.isdigit():
-                    cage_number = int(cage_number_str)
-                else:
-                    cage_number=None
-                sheet_name_CN= ""
-                for modbus_type in Modbus_Slave_Type.Not_Each_Mouse_Cage.value+Modbus_Slave_Type.Each_Mouse_Cage.value+Modbus_Slave_Type.Calibrations.value+Modbus_Slave_Type.Epochs.value+Modbus_Slave_Type.Cameras.value:
-                    if module_name_str == modbus_type.value['name']:
-                        sheet_name_CN+=modbus_type.value['description']
-                        break
-
-                sheet_name_CN+="监控数据"
-                if cage_number is not None:
-                    sheet_name_CN+=f"_通道{cage_number} {'参考气路' if  cage_number==int(global_setting.get_setting('configer')['mouse_cage']['reference']) else ''}"
-                    pass
+                sheet_name, sheet_name_CN = self.build_sheet_names(name, sheet_used)
 
                 # 读取 'xxx_meta' 表，它包含字段名称和中文描述
                 meta_query = f"SELECT item_name, description FROM {name}_meta"
                 # 正确的调用方式
-                with self.handler.sqlite_manager.get_connection() as conn:
-                    meta_df = pd.read_sql_query(meta_query, conn)
+                meta_df = self.read_sql_frame(meta_query)
                 # logger.critical(f"meta_df: {meta_df}")
                 # 创建列名到中文描述的映射字典
                 col_mapping = dict(zip(meta_df['item_name'], meta_df['description']))
@@ -109,9 +214,10 @@ class DbTransferExcel():
 
                 if chunksize and chunksize > 0:
                     startrow = 0
-                    # 使用 pandas.read_sql_query 的 chunksize 返回迭代器
-                    with self.handler.sqlite_manager.get_connection() as conn:
-                        for i, chunk in enumerate(pd.read_sql_query(sql, conn, chunksize=chunksize)):
+                    # 流式按 fetchmany(chunksize) 分批读取，每批直接构造 DataFrame
+                    with self.handler.sqlite_manager.iter_query(sql, arraysize=chunksize) as stream:
+                        for i, batch in enumerate(stream):
+                            chunk = pd.DataFrame.from_records(batch, columns=stream.columns)
                             # logger.critical(f"chunk: {chunk}")
                             df = self.convert_bytes_columns(chunk)
                             # 替换列名
@@ -121,12 +227,11 @@ class DbTransferExcel():
                             df.to_excel(writer, sheet_name=sheet_name_CN, index=False, startrow=startrow, header=header)
                             startrow += len(df)
                 else:
-                    with self.handler.sqlite_manager.get_connection() as conn:
-                        df = pd.read_sql_query(sql, conn,)
-                        df = self.convert_bytes_columns(df)
-                        # 替换列名
-                        df.rename(columns=col_mapping, inplace=True)
-                        df.to_excel(writer, sheet_name=sheet_name_CN, index=False)
+                    df = self.read_sql_frame(sql)
+                    df = self.convert_bytes_columns(df)
+                    # 替换列名
+                    df.rename(columns=col_mapping, inplace=True)
+                    df.to_excel(writer, sheet_name=sheet_name_CN, index=False)
         finally:
             # # 返回响应
             # queue = global_setting.get_setting("queue", None)
@@ -137,4 +242,118 @@ class DbTransferExcel():
             #                         data=f"成功导出数据",
             #                         time=time_util.get_format_from_time(time.time())))
             self.handler.stop()
-    pass
\ No newline at end of file
+    def _report(self, to: str, title: str, data: Any):
+        # 通过全局消息队列发送导出进度/结果
+        message_queue = global_setting.get_setting("queue", None)
+        if message_queue:
+            message_queue.put(
+                ObjectQueueItem(origin="DbTransferExcel", to=to, title=title, data=data,
+                                time=time_util.get_format_from_time(time.time())))
+
+    def export_db_to_excel_fast(self, output_path: str, workers: Optional[int] = None, chunksize: int = 5000,
+                                to: str = "MainWindow_index") -> bool:
+        """
+        快速导出：各表在工作进程中并行读取（含已归档的数据），逐块写成 sheet XML 临时文件，
+        全部完成后由主进程流式打包为 xlsx（见 xlsx_stream_writer），各进程内存占用与数据量无关
+
+        进度与结果通过全局 queue 发送 ObjectQueueItem(origin="DbTransferExcel")：
+            export_progress: {"table", "sheet", "rows", "total_rows", "tables_done", "tables_total"}
+            export_finished: 导出文件路径
+            export_cancelled / export_failed: 原因
+        导出过程中可在其他线程调用 cancel()，取消或失败时不生成文件
+
+        Args:
+            output_path: 导出的 xlsx 路径
+            workers: 工作进程数，默认为 CPU 数 - 1（最多 4 个）
+            chunksize: 每块的行数
+            to: 消息的目的窗口
+
+        Returns:
+            是否完整导出
+        """
+        from public.function.Tansfer.xlsx_stream_writer import write_workbook
+
+        context = multiprocessing.get_context("spawn")
+        self.cancel_event = context.Event()
+        workers = workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        out_queue = context.Queue()
+
+        manager = self.handler.sqlite_manager
+        catalog = manager.get_schema_catalog()
+        raw_used, sheet_used = set(), set()
+        states: Dict[str, Dict[str, Any]] = {}
+        # get_table_list 也会返回索引、触发器等对象，这里只保留带 time 列的表
+        for name, _ in self.get_table_list():
+            if name not in catalog or not catalog[name]["has_time"]:
+                continue
+            _, sheet_name_CN = self.build_sheet_names(name, raw_used)
+            states[name] = {"sheet_name": self.sanitize_sheet_name(sheet_name_CN, sheet_used),
+                            "meta": manager.get_table_meta(name) or {}, "rows": 0, "total": 0}
+        work_dir = tempfile.mkdtemp(prefix="db_export_")
+        tables_done = 0
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_export_worker,
+                                     initargs=(out_queue, self.cancel_event)) as pool:
+                futures = {pool.submit(_export_table_worker, manager.db_name, name, state["meta"], work_dir,
+                                       chunksize, self.MAX_SHEET_ROWS): name
+                           for name, state in states.items()}
+                try:
+                    pending = set(futures)
+                    while pending and not self.cancel_event.is_set():
+                        try:
+                            kind, table_name, value = out_queue.get(timeout=0.2)
+                            state = states[table_name]
+                            if kind == "start":
+                                state["total"] = value
+                                logger.info(f"[INFO] 从 db 的表 {table_name} 导出到 sheet '{state['sheet_name']}' ...")
+                            else:
+                                state["rows"] = value
+                        except queue.Empty:
+                            table_name = None
+                        for future in [f for f in pending if f.done()]:
+                            pending.discard(future)
+                            state = states[futures[future]]
+                            state["parts"] = future.result()
+                            tables_done += 1
+                            self._report(to, "export_progress", {
+                                "table": futures[future], "sheet": state["sheet_name"], "rows": state["rows"],
+                                "total_rows": state["total"], "tables_done": tables_done,
+                                "tables_total": len(states)})
+                        if table_name is not None:
+                            state = states[table_name]
+                            self._report(to, "export_progress", {
+                                "table": table_name, "sheet": state["sheet_name"], "rows": state["rows"],
+                                "total_rows": state["total"], "tables_done": tables_done,
+                                "tables_total": len(states)})
+                finally:
+                    # 提前结束（取消或出错）时通知其余工作进程停止
+                    if tables_done < len(states):
+                        self.cancel_event.set()
+
+            if tables_done < len(states):
+                logger.info(f"导出已取消: {output_path}")
+                self._report(to, "export_cancelled", "导出已取消")
+                return False
+
+            # 超过 Excel 行数上限的表续写到 "{sheet}_2" 等后续 sheet
+            sheets = []
+            for state in states.values():
+                for part, (xml_path, _) in enumerate(state["parts"], start=1):
+                    title = state["sheet_name"] if part == 1 else \
+                        self.sanitize_sheet_name(f"{state['sheet_name']}_{part}", sheet_used)
+                    sheets.append((title, xml_path))
+            write_workbook(output_path, sheets)
+            logger.info(f"成功导出 {len(states)} 张表到 {output_path}")
+            self._report(to, "export_finished", output_path)
+            return True
+        except Exception as e:
+            logger.error(f"导出到 {output_path} 失败: {e}")
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            self._report(to, "export_failed", str(e))
+            return False
+        finally:
+            self.cancel_event = None
+            shutil.rmtree(work_dir, ignore_errors=True)
+            self.handler.stop()
+    pass
@@ -0,0 +1,107 @@
+# 流式 xlsx 写入：每个 sheet 的 XML 先逐行写入临时文件（可在不同进程中并行生成），最后打包为 xlsx
+# 字符串以内联字符串（inlineStr）写入，不需要在内存中维护共享字符串表，内存占用与行数无关
+import math
+import re
+import shutil
+import zipfile
+from typing import Any, List, Sequence, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+# XML 1.0 不允许的控制字符
+_ILLEGAL_XML_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_WORKSHEET_HEAD = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                   '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+_WORKSHEET_TAIL = '</sheetData></worksheet>'
+
+
+def column_letter(index: int) -> str:
+    """0 -> A, 25 -> Z, 26 -> AA"""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+class SheetXmlWriter:
+    """把一个 sheet 的行逐行写入 worksheet XML 文件"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0
+        self._letters: List[str] = []
+        self._file = open(path, 'w', encoding='utf-8')
+        self._file.write(_WORKSHEET_HEAD)
+
+    def _cell(self, ref: str, value: Any) -> str:
+        if value is None:
+            return ''
+        if isinstance(value, bool):
+            return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+        if isinstance(value, (int, float)):
+            if isinstance(value, float) and not math.isfinite(value):
+                value = str(value)
+            else:
+                return f'<c r="{ref}"><v>{value!r}</v></c>'
+        text = escape(_ILLEGAL_XML_CHARS.sub('', str(value)))
+        return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+    def append(self, row: Sequence[Any]):
+        self.rows += 1
+        while len(self._letters) < len(row):
+            self._letters.append(column_letter(len(self._letters)))
+        number = self.rows
+        cells = ''.join(self._cell(f'{letter}{number}', value) for letter, value in zip(self._letters, row))
+        self._file.write(f'<row r="{number}">{cells}</row>')
+
+    def close(self):
+        if not self._file.closed:
+            self._file.write(_WORKSHEET_TAIL)
+            self._file.close()
+
+
+def write_workbook(output_path: str, sheets: Sequence[Tuple[str, str]]):
+    """
+    把已生成的 sheet XML 文件打包为 xlsx，逐个流式拷贝进压缩包
+
+    Args:
+        output_path: xlsx 路径
+        sheets: [(sheet 名, sheet XML 文件路径)]，sheet 名需已合法且唯一
+    """
+    overrides = ''.join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="application/'
+                        f'vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                        for i in range(1, len(sheets) + 1))
+    content_types = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                     '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                     '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                     '<Default Extension="xml" ContentType="application/xml"/>'
+                     '<Override PartName="/xl/workbook.xml" ContentType="application/'
+                     'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                     f'{overrides}</Types>')
+    root_rels = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                 '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                 '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+                 'relationships/officeDocument" Target="xl/workbook.xml"/></Relationships>')
+    sheet_entries = ''.join(f'<sheet name={quoteattr(title)} sheetId="{i}" r:id="rId{i}"/>'
+                            for i, (title, _) in enumerate(sheets, start=1))
+    workbook = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                f'<sheets>{sheet_entries}</sheets></workbook>')
+    workbook_rels = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                     + ''.join(f'<Relationship Id="rId{i}" Type="http://schemas.openxmlformats.org/officeDocument/'
+                               f'2006/relationships/worksheet" Target="worksheets/sheet{i}.xml"/>'
+                               for i in range(1, len(sheets) + 1))
+                     + '</Relationships>')
+
+    with zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        zf.writestr('[Content_Types].xml', content_types)
+        zf.writestr('_rels/.rels', root_rels)
+        zf.writestr('xl/workbook.xml', workbook)
+        zf.writestr('xl/_rels/workbook.xml.rels', workbook_rels)
+        for i, (_, xml_path) in enumerate(sheets, start=1):
+            with open(xml_path, 'rb') as src, zf.open(f'xl/worksheets/sheet{i}.xml', 'w', force_zip64=True) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
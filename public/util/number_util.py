@@ -77,4 +77,55 @@ class number_util():
         counter = Counter(all_numbers)
         most_common = counter.most_common(1)[0]
 
-        return most_common[0], most_common[1], all_numbers
\ No newline at end of file
+        return most_common[0], most_common[1], all_numbers
+    @classmethod
+    def lttb_indexes(cls, xs, ys, threshold: int) -> list:
+        """
+        Largest-Triangle-Three-Buckets 降采样，返回保留点的下标
+
+        Args:
+            xs: x 值序列（单调递增）
+            ys: y 值序列，None 视为缺失点（不会被选为中间点）
+            threshold: 最多保留的点数
+
+        Returns:
+            list: 保留点的下标（升序，包含首尾点）
+        """
+        n = len(xs)
+        if threshold >= n:
+            return list(range(n))
+        if threshold < 3:
+            # 点数太少时只保留首尾点
+            return [0, n - 1][:max(threshold, 0)]
+
+        indexes = [0]
+        bucket_size = (n - 2) / (threshold - 2)
+        a = 0
+        for i in range(threshold - 2):
+            # 下一个桶的平均点
+            next_start = int((i + 1) * bucket_size) + 1
+            next_end = min(int((i + 2) * bucket_size) + 1, n)
+            next_points = [(xs[j], ys[j]) for j in range(next_start, next_end) if ys[j] is not None]
+            if next_points:
+                avg_x = sum(p[0] for p in next_points) / len(next_points)
+                avg_y = sum(p[1] for p in next_points) / len(next_points)
+            else:
+                avg_x, avg_y = xs[n - 1], ys[n - 1] if ys[n - 1] is not None else 0
+
+            # 当前桶中与上一个选中点、下一个桶平均点构成最大三角形的点
+            start = int(i * bucket_size) + 1
+            end = int((i + 1) * bucket_size) + 1
+            ax, ay = xs[a], ys[a] if ys[a] is not None else avg_y
+            max_area = -1.0
+            selected = start
+            for j in range(start, end):
+                if ys[j] is None:
+                    continue
+                area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+                if area > max_area:
+                    max_area = area
+                    selected = j
+            indexes.append(selected)
+            a = selected
+        indexes.append(n - 1)
+        return indexes
@@ -0,0 +1,146 @@
+"""
+冷数据归档回归测试：npz 文件读写往返、archive_older_than 前后各读取路径（范围查询、联立分页、游标分页、
+流式读取、行数统计）的结果一致，按配置启动的定时归档任务
+"""
+import datetime
+import time
+
+import numpy as np
+
+from public.dao.SQLite import archive_store
+from public.dao.SQLite.SQliteManager import SQLiteManager
+
+
+def _time_text(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+def test_write_read_round_trip(tmp_path):
+    path = str(tmp_path / "day.npz")
+    columns = ['id', 'time', 'v', 's', 'b']
+    rows = [
+        (1, '2024-01-01 00:00:00.000', 1.5, '中文' * 200, b'\x00\x01'),
+        (2, '2024-01-01 00:00:01.000', None, None, None),
+        (3, '2024-01-01 00:00:02.000', -2.0, '', b''),
+        (4, '2024-01-01 00:00:03.000', 3.25, 'x', b'\xff'),
+    ]
+    archive_store.write_archive(path, columns, rows, [0, 1000, 2000, 3000])
+
+    with np.load(path) as data:
+        # 文本按 UTF-8 字节加偏移量保存，而不是定长的 str 数组
+        assert data['c3'].dtype == np.uint8 and 'c3_offsets' in data.files
+
+    read, time_ms = archive_store.read_archive(path, columns)
+    assert [tuple(r) for r in read] == rows
+    assert list(time_ms) == [0, 1000, 2000, 3000]
+
+    # 时间范围为闭区间，未知列读出为 None
+    read, _ = archive_store.read_archive(path, ['s', 'missing'], 1000, 2000)
+    assert [tuple(r) for r in read] == [(None, None), ('', None)]
+    assert archive_store.count_rows(path, 1000, 2000) == 2
+    batches = list(archive_store.iter_archive(path, ['id'], batch_size=3))
+    assert [[r[0] for r in batch] for batch in batches] == [[1, 2, 3], [4]]
+
+    # 同一范围再次读取时复用缓存中解码好的行
+    cached = list(archive_store.iter_archive_cached(path, ['id', 's'], 1000, 3000))
+    assert list(archive_store.iter_archive_cached(path, ['id', 's'], 1000, 3000)) == cached
+    assert (path, ('id', 's'), 1, 4) in archive_store._row_cache
+    assert [r[0] for batch in cached for r in batch] == [2, 3, 4]
+
+
+def test_read_legacy_fixed_width_text(tmp_path):
+    path = str(tmp_path / "legacy.npz")
+    np.savez_compressed(path, __columns__=np.array(['s']), __kinds__=np.array(['text']),
+                        __time_ms__=np.array([1, 2, 3]), c0=np.array(['x', '', 'yy']),
+                        c0_null=np.array([False, True, False]))
+    read, _ = archive_store.read_archive(path, ['s'], 2, 4)
+    assert [tuple(r) for r in read] == [(None,), ('yy',)]
+
+
+def test_archive_older_than_keeps_query_results(tmp_path):
+    m = SQLiteManager(str(tmp_path / "test.db"), pool_mode=SQLiteManager.POOL_MODE_THREAD)
+    try:
+        m.create_table('a', {'id': 'INTEGER PRIMARY KEY AUTOINCREMENT', 'time': 'TEXT', 'v': 'REAL', 's': 'TEXT'})
+        m.create_partitioned_table('p', {'id': 'INTEGER', 'time': 'TEXT', 'x': 'REAL'})
+        end = time.time()
+        start = end - 5 * 86400
+        n = 5 * 24
+        m.insert_many('a', ['time', 'v', 's'],
+                      [(_time_text(start + i * 3600), i * 0.5, None if i % 7 == 0 else f"s{i}") for i in range(n)])
+        m.insert_many('p', ['id', 'time', 'x'], [(i, _time_text(start + i * 3600), float(i)) for i in range(n)])
+
+        def walk(query, **kwargs):
+            rows, token = [], None
+            while True:
+                page = query(page_size=7, token=token, **kwargs)
+                rows.extend(page['rows'])
+                if not page['has_next']:
+                    return rows, page['total_items']
+                token = page['next_token']
+
+        def stream_rows(table):
+            with m.stream_multi_table_data([table], start, end, arraysize=50) as stream:
+                return [row for batch in stream for row in batch]
+
+        def snapshot():
+            with m.iter_table('a') as stream:
+                table_rows = sorted(row for batch in stream for row in batch)
+            return (m.get_multi_table_data(['a', 'p'], start, end, join_type='join'),
+                    m.get_multi_table_data(['a'], start + 1800, end - 1800, join_type='union'),
+                    m.query_joined_by_time(['a', 'p'], page=2, page_size=20, start_time=start, end_time=end),
+                    m.query_joined_by_time(['a', 'p'], page=3, page_size=20),
+                    [walk(m.query_Epoch_datas_keyset, table=t, descending=d, total_mode='exact')
+                     for t in ('a', 'p') for d in (True, False)],
+                    [walk(m.query_joined_by_time_keyset, tables=['a', 'p'], descending=d, total_mode='exact')
+                     for d in (True, False)],
+                    stream_rows('a'), stream_rows('p'), table_rows,
+                    m.get_table_data_count('a'), m.get_table_data_count('p'),
+                    m.get_table_data_count('a', _time_text(start + 1800), _time_text(end - 86400)))
+
+        before = snapshot()
+        archived = m.archive_older_than(2)
+        assert archived['a'] > 0 and archived['p'] > 0
+        assert m.get_table_data_count('a') == n
+        assert sum(day['row_count'] for day in m.get_archived_days('a')) == archived['a']
+        assert snapshot() == before
+        assert len(before[4][0][0]) == n and before[4][0][1] == n
+
+        # 补录已归档日期的数据后再次归档，与已有文件合并
+        m.insert('a', time=_time_text(start + 60), v=-1.0, s='late')
+        assert m.archive_older_than(2)['a'] == 1
+        assert sum(day['row_count'] for day in m.get_archived_days('a')) == archived['a'] + 1
+        rows = m.get_multi_table_data(['a'], start, start + 120, join_type='union')
+        assert [row[-1] for row in rows[0]] == [None, 'late']
+    finally:
+        m.close()
+
+
+def test_archive_job_from_config(tmp_path):
+    from public.config_class.global_setting import global_setting
+    from public.function.Monitor_data_storage.ArchiveJob import start_archive_job_from_config, stop_archive_job
+
+    path = str(tmp_path / "test.db")
+    m = SQLiteManager(path, pool_mode=SQLiteManager.POOL_MODE_THREAD)
+    previous_config = global_setting.get_setting("configer")
+    try:
+        m.create_table('a', {'time': 'TEXT', 'v': 'REAL'})
+        m.insert_many('a', ['time', 'v'], [(_time_text(time.time() - 40 * 86400), 1.0), (_time_text(time.time()), 2.0)])
+
+        # 未配置 db_path 时不启动
+        global_setting.set_setting("configer", {"archive": {"db_path": ""}})
+        assert start_archive_job_from_config() is None
+
+        global_setting.set_setting("configer", {"archive": {"db_path": path, "keep_days": "30",
+                                                            "interval_hours": "24"}})
+        job = start_archive_job_from_config()
+        # 启动后立即归档一次
+        deadline = time.time() + 5
+        while not job.last_result and time.time() < deadline:
+            time.sleep(0.02)
+        assert job.last_result == {'a': 1}
+        assert start_archive_job_from_config() is job
+        assert m.get_table_data_count('a') == 2 and len(m.get_archived_days('a')) == 1
+    finally:
+        stop_archive_job()
+        global_setting.set_setting("configer", previous_config)
+        m.close()
@@ -0,0 +1,48 @@
+"""
+AsyncSQLiteManager 回归测试：排队的查询超过上限时立即报错、完成后释放名额、在 asyncio 中 await 查询结果
+"""
+import asyncio
+import threading
+
+import pytest
+
+from public.dao.SQLite.AsyncSQLiteManager import AsyncSQLiteManager, QueryExecutor, QueryQueueFullError
+from public.dao.SQLite.SQliteManager import SQLiteManager
+
+
+def test_submit_raises_when_queue_is_full():
+    executor = QueryExecutor(max_workers=1, max_pending=1, name="test_query")
+    release = threading.Event()
+    try:
+        running = executor.submit(release.wait)
+        pending = executor.submit(lambda: 'pending')
+        with pytest.raises(QueryQueueFullError):
+            executor.submit(lambda: 'rejected')
+
+        # 执行完成后名额释放，可以继续提交
+        release.set()
+        assert running.result(timeout=5) is True
+        assert pending.result(timeout=5) == 'pending'
+        assert executor.submit(lambda: 'accepted').result(timeout=5) == 'accepted'
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def test_await_query_in_asyncio(tmp_path):
+    manager = SQLiteManager(str(tmp_path / "test.db"), pool_mode=SQLiteManager.POOL_MODE_BOUNDED, pool_size=2)
+    executor = QueryExecutor(max_workers=2, max_pending=4, name="test_query")
+    async_db = AsyncSQLiteManager(manager, executor=executor)
+    try:
+        manager.create_table('t', {'time': 'TEXT', 'v': 'REAL'})
+        manager.insert_many('t', ['time', 'v'], [('2024-01-01 00:00:00.000', 1.0), ('2024-01-01 00:00:01.000', 2.0)])
+
+        async def query():
+            return await asyncio.gather(async_db.get_table_data_count('t'),
+                                        async_db.query_conditions('t', "WHERE v > 1"))
+
+        count, rows = asyncio.run(query())
+        assert count == 2 and rows == [('2024-01-01 00:00:01.000', 2.0)]
+    finally:
+        # 非默认执行器随外观一起关闭
+        async_db.close(close_manager=True)
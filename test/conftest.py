@@ -0,0 +1,23 @@
+"""
+pytest 公共设置
+
+缓存、内容存储等模块在导入时按相对路径创建全局实例（cache/、data/store/），
+整个测试会话在临时目录中运行，避免在仓库目录中生成文件；这些模块需在测试函数或夹具中导入
+"""
+import sys
+
+import pytest
+from loguru import logger
+
+# 默认输出绑定在收集阶段被 pytest 替换的 stderr 上，全局实例在退出时关闭连接写日志会报错
+logger.remove()
+logger.add(sys.__stderr__, level="WARNING")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def isolated_working_directory(tmp_path_factory):
+    """会话级：切换到临时工作目录，Qt 使用 offscreen 平台，结束后恢复"""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(tmp_path_factory.mktemp("cwd"))
+        mp.setenv("QT_QPA_PLATFORM", "offscreen")
+        yield
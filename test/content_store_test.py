@@ -0,0 +1,72 @@
+"""
+内容寻址存储回归测试：相同内容只保存一份、按 file_id 或内容哈希查找、已下载的文件纳入存储后去重
+"""
+import hashlib
+import os
+
+import pytest
+
+
+@pytest.fixture
+def store(tmp_path):
+    # 缓存模块导入时按相对路径创建全局实例，在测试中导入，见 conftest
+    from public.function.Cache.content_store import ContentStore
+
+    store = ContentStore(str(tmp_path / "store"))
+    yield store
+    store.close()
+
+
+def _download(store, content: bytes, name: str = "a.PNG"):
+    tmp = store.temp_path(name)
+    tmp.write_bytes(content)
+    return tmp
+
+
+def test_ingest_deduplicates_content(store, tmp_path):
+    first_tmp = _download(store, b"image bytes")
+    sha256, blob, duplicate = store.ingest(first_tmp, 'image', 1, accessed_at=100.0)
+    assert sha256 == hashlib.sha256(b"image bytes").hexdigest() and not duplicate
+    assert blob == store.blob_path(sha256, '.png') and blob.read_bytes() == b"image bytes"
+    assert not first_tmp.exists()
+
+    # 同样的内容以另一个 file_id 再次下载：删除临时文件，复用已有内容并刷新访问时间
+    second_tmp = _download(store, b"image bytes")
+    assert store.ingest(second_tmp, 'image', 2, accessed_at=200.0) == (sha256, blob, True)
+    assert not second_tmp.exists()
+    assert store.total_size() == len(b"image bytes")
+    assert [(h, size) for h, size, _ in store.blobs_by_access()] == [(sha256, len(b"image bytes"))]
+    with store.db.get_connection() as conn:
+        assert conn.execute("SELECT last_accessed FROM content_blobs").fetchone()[0] == 200.0
+
+    # 两个 file_id 都指向同一份内容
+    assert store.find('image', 1) == (sha256, blob)
+    assert store.find('image', 2) == (sha256, blob)
+    assert store.find('image', 3) is None
+    assert store.find('image', 3, sha256) == (sha256, blob)
+
+    # 链接到设备目录的文件与内容文件是同一个文件
+    targets = [tmp_path / "dev" / "a.png", tmp_path / "dev" / "b.png"]
+    for target in targets:
+        store.link(blob, target)
+    assert all(os.path.samefile(blob, target) for target in targets)
+
+
+def test_missing_blob_is_forgotten(store):
+    sha256, blob, _ = store.ingest(_download(store, b"data"), 'excel', 'f1')
+    blob.unlink()
+    assert store.find('excel', 'f1') is None
+    assert store.total_size() == 0
+    # 内容文件丢失后再次下载视为新内容
+    assert store.ingest(_download(store, b"data"), 'excel', 'f1')[2] is False
+
+
+def test_adopt_replaces_duplicate_with_link(store, tmp_path):
+    sha256, blob, _ = store.ingest(_download(store, b"same"), 'image', 1)
+    legacy = tmp_path / "legacy" / "old.png"
+    legacy.parent.mkdir()
+    legacy.write_bytes(b"same")
+
+    assert store.adopt(legacy, 'image') == sha256
+    assert os.path.samefile(legacy, blob)
+    assert store.total_size() == len(b"same")
@@ -0,0 +1,73 @@
+"""
+磁盘配额回归测试：超出上限时淘汰最久未查看的内容，记录保留并标记为已淘汰
+"""
+import time
+from pathlib import Path
+
+import pytest
+
+
+@pytest.fixture
+def quota_env(tmp_path):
+    # 缓存模块导入时按相对路径创建全局实例，在测试中（切换到临时工作目录之后）再导入，见 conftest
+    from public.function.Cache.cache_manager import DataCacheManager
+    from public.function.Cache.content_store import ContentStore
+
+    store = ContentStore(str(tmp_path / "store"))
+    cache = DataCacheManager(str(tmp_path / "cache"))
+    yield tmp_path, store, cache
+    store.close()
+    cache.close()
+
+
+def _download(tmp_path: Path, store, cache, index: int, accessed_at: float) -> str:
+    tmp = store.temp_path(f"f{index}.png")
+    tmp.write_bytes(bytes([index]) * 1000)
+    sha256, blob, _ = store.ingest(tmp, 'image', index, accessed_at=accessed_at)
+    target = tmp_path / "data" / "image" / "dev" / f"f{index}.png"
+    store.link(blob, target)
+    cache.save_image_record({'device_id': 'dev', 'file_path': str(target), 'file_name': target.name,
+                             'original_path': str(target), 'content_hash': sha256})
+    return sha256
+
+
+def _quota_manager(tmp_path: Path, store, cache, max_bytes: int):
+    from public.function.Cache.disk_quota import DiskQuotaManager
+    from public.function.Cache.parsed_data_cache import ParsedDataCache
+    from public.function.Cache.thumbnail_cache import ThumbnailCache
+
+    return DiskQuotaManager(max_bytes, store=store, cache=cache, parsed_cache=ParsedDataCache(str(tmp_path / "parsed")),
+                            thumbnails=ThumbnailCache(str(tmp_path / "thumbs")))
+
+
+def test_eviction_keeps_records(quota_env):
+    tmp_path, store, cache = quota_env
+    now = time.time()
+    hashes = [_download(tmp_path, store, cache, i, accessed_at=now - 100 + i) for i in range(3)]
+    quota = _quota_manager(tmp_path, store, cache, 2000)
+
+    result = quota.enforce()
+
+    assert result['evicted'] == 1 and result['records'] == 1
+    assert result['usage'] == store.total_size() == 2000
+    # 最久未查看的文件被删除，记录保留并标记为已淘汰
+    with cache.image_db.get_connection() as conn:
+        rows = conn.execute("SELECT file_name, evicted FROM image_records ORDER BY file_name").fetchall()
+    assert rows == [('f0.png', 1), ('f1.png', 0), ('f2.png', 0)]
+    assert sorted(p.name for p in (tmp_path / "data" / "image" / "dev").iterdir()) == ['f1.png', 'f2.png']
+    assert store.find('image', 0) is None
+    assert store.find('image', 1, hashes[1]) is not None
+    assert len(cache.get_image_records('dev')) == 3
+
+    # 未超出上限时不再淘汰
+    assert quota.enforce()['evicted'] == 0
+
+
+def test_cached_latest_records_see_eviction(quota_env):
+    tmp_path, store, cache = quota_env
+    _download(tmp_path, store, cache, 0, accessed_at=time.time() - 100)
+    _download(tmp_path, store, cache, 1, accessed_at=time.time())
+    assert [r['evicted'] for r in cache.get_latest_image_records('dev')] == [0, 0]
+    _quota_manager(tmp_path, store, cache, 1000).enforce()
+    # 最新记录经过查询缓存，淘汰后不能返回旧结果
+    assert sorted(r['evicted'] for r in cache.get_latest_image_records('dev')) == [0, 1]
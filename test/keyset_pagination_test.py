@@ -0,0 +1,63 @@
+"""
+游标（keyset）分页回归测试：相同时间戳的行不重复、不遗漏，前后翻页与 OFFSET 分页结果一致
+"""
+import datetime
+
+import pytest
+
+from public.dao.SQLite.SQliteManager import SQLiteManager
+
+
+def _time_text(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+@pytest.fixture
+def manager(tmp_path):
+    m = SQLiteManager(str(tmp_path / "test.db"), pool_mode=SQLiteManager.POOL_MODE_THREAD)
+    yield m
+    m.close()
+
+
+def _walk_keyset(query, page_size: int, descending: bool, **kwargs):
+    pages, token = [], None
+    while True:
+        page = query(page_size=page_size, token=token, descending=descending, **kwargs)
+        pages.append(page)
+        if not page["has_next"]:
+            return pages
+        token = page["next_token"]
+
+
+def test_keyset_plain_table_duplicate_timestamps(manager):
+    manager.create_table('t', {'id': 'INTEGER PRIMARY KEY AUTOINCREMENT', 'time': 'TEXT'})
+    manager.insert_many('t', ['time'], [(_time_text(1700000000.0),)] * 5)
+    pages = _walk_keyset(manager.query_Epoch_datas_keyset, 2, True, table='t')
+    assert [row['id'] for page in pages for row in page['rows']] == [5, 4, 3, 2, 1]
+
+
+def test_keyset_prev_token_returns_previous_page(manager):
+    manager.create_table('t', {'id': 'INTEGER PRIMARY KEY AUTOINCREMENT', 'time': 'TEXT'})
+    manager.insert_many('t', ['time'], [(_time_text(1700000000.0 + i),) for i in range(7)])
+    pages = _walk_keyset(manager.query_Epoch_datas_keyset, 3, False, table='t')
+    assert [[row['id'] for row in page['rows']] for page in pages] == [[1, 2, 3], [4, 5, 6], [7]]
+
+    previous = manager.query_Epoch_datas_keyset('t', page_size=3, token=pages[2]['prev_token'], descending=False)
+    assert [row['id'] for row in previous['rows']] == [4, 5, 6]
+    assert previous['has_prev'] and previous['has_next']
+    last = manager.query_Epoch_datas_keyset('t', page_size=3, last=True, descending=False, total_mode='exact')
+    assert [row['id'] for row in last['rows']] == [5, 6, 7] and last['total_items'] == 7
+
+
+@pytest.mark.parametrize("descending", [True, False])
+def test_joined_keyset_matches_offset_paging(manager, descending):
+    manager.create_table('a', {'time': 'TEXT', 'x': 'REAL'})
+    manager.create_table('b', {'time': 'TEXT', 'y': 'REAL'})
+    manager.insert_many('a', ['time', 'x'], [(_time_text(1700000000.0 + i), float(i)) for i in range(0, 20, 2)])
+    manager.insert_many('b', ['time', 'y'], [(_time_text(1700000000.0 + i), float(i)) for i in range(0, 20, 3)])
+
+    pages = _walk_keyset(manager.query_joined_by_time_keyset, 4, descending, tables=['a', 'b'])
+    keyset_rows = [row for page in pages for row in page['rows']]
+    offset = manager.query_joined_by_time(['a', 'b'], page=1, page_size=100, order_asc=descending)
+    assert keyset_rows == offset['rows']
+    assert len(keyset_rows) == offset['total_items'] == 13
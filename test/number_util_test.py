@@ -0,0 +1,34 @@
+"""
+number_util.lttb_indexes 回归测试：保留首尾点与峰值、跳过缺失点、点数不超过阈值
+"""
+import math
+
+from public.util.number_util import number_util
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    xs = list(range(1000))
+    ys = [math.sin(x / 50) for x in xs]
+    ys[500] = 10.0
+    ys[700] = -10.0
+
+    indexes = number_util.lttb_indexes(xs, ys, 50)
+
+    assert len(indexes) == 50
+    assert indexes[0] == 0 and indexes[-1] == 999
+    assert indexes == sorted(set(indexes))
+    assert 500 in indexes and 700 in indexes
+
+
+def test_lttb_skips_missing_points():
+    xs = list(range(100))
+    ys = [None if x % 2 else float(x % 7) for x in xs]
+    ys[-1] = 1.0
+    indexes = number_util.lttb_indexes(xs, ys, 20)
+    assert all(ys[i] is not None for i in indexes)
+
+
+def test_lttb_small_inputs():
+    assert number_util.lttb_indexes([0, 1, 2], [0, 1, 2], 10) == [0, 1, 2]
+    assert number_util.lttb_indexes(list(range(10)), list(range(10)), 2) == [0, 9]
+    assert number_util.lttb_indexes(list(range(10)), list(range(10)), 0) == []
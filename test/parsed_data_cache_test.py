@@ -0,0 +1,59 @@
+"""
+解析结果缓存回归测试：保存后读取得到相同的数据、按文件内容与解析器版本区分缓存、损坏的缓存视为未命中
+"""
+import pytest
+
+
+@pytest.fixture
+def cache(tmp_path):
+    # 缓存模块导入时按相对路径创建全局实例，在测试中导入，见 conftest
+    from public.function.Cache.parsed_data_cache import ParsedDataCache
+    return ParsedDataCache(str(tmp_path / "parsed"))
+
+
+def test_save_load_round_trip(cache, tmp_path):
+    source = tmp_path / "data.xlsx"
+    source.write_bytes(b"excel content")
+    value = {
+        "device": "设备1",
+        "phases": [{"name": "A相", "data": [1, 2, 3], "values": [0.5, -1.25, 1e300]},
+                   {"name": "B相", "data": [], "flags": [True, False], "note": None}],
+        "mixed": [1, 2.5, 3],
+        "nested": [[1, 2], [3.0, 4.0]],
+    }
+
+    assert cache.load(str(source), 1) is None
+    assert cache.save(str(source), 1, value)
+    loaded = cache.load(str(source), 1)
+
+    assert loaded == value
+    assert type(loaded["phases"][0]["data"][0]) is int and type(loaded["mixed"][0]) is float
+    # 解析器版本变化后旧缓存不再命中
+    assert cache.load(str(source), 2) is None
+
+
+def test_cache_follows_file_content(cache, tmp_path):
+    from public.function.Cache.parsed_data_cache import file_sha256
+
+    source = tmp_path / "data.xlsx"
+    source.write_bytes(b"first")
+    cache.save(str(source), 1, {"v": [1.0]})
+    copy = tmp_path / "copy.xlsx"
+    copy.write_bytes(b"first")
+    # 内容相同的另一个文件命中同一份缓存
+    assert cache.load(str(copy), 1) == {"v": [1.0]}
+
+    source.write_bytes(b"second, longer")
+    assert cache.load(str(source), 1) is None
+    assert cache.remove(file_sha256(str(copy))) == 1
+    assert cache.load(str(copy), 1) is None
+
+
+def test_corrupt_cache_is_a_miss(cache, tmp_path):
+    from public.function.Cache.parsed_data_cache import file_sha256
+
+    source = tmp_path / "data.xlsx"
+    source.write_bytes(b"content")
+    cache.save(str(source), 1, {"v": [1]})
+    (tmp_path / "parsed" / f"{file_sha256(str(source))}_v1.npz").write_bytes(b"not a zip")
+    assert cache.load(str(source), 1) is None
@@ -0,0 +1,74 @@
+"""
+按时间分区表回归测试：跨分区的游标分页、其他实例新建的分区表的写入路由、范围查询只扫描重叠分区
+"""
+import datetime
+
+import pytest
+
+from public.dao.SQLite.SQliteManager import SQLiteManager
+
+
+def _time_text(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+@pytest.fixture
+def manager(tmp_path):
+    m = SQLiteManager(str(tmp_path / "test.db"), pool_mode=SQLiteManager.POOL_MODE_THREAD)
+    yield m
+    m.close()
+
+
+def _walk_keyset(m: SQLiteManager, table: str, page_size: int, descending: bool):
+    pages, token = [], None
+    while True:
+        page = m.query_Epoch_datas_keyset(table, page_size=page_size, token=token, descending=descending)
+        pages.append(page["rows"])
+        if not page["has_next"]:
+            return pages
+        token = page["next_token"]
+
+
+@pytest.mark.parametrize("descending", [True, False])
+def test_keyset_partitioned_duplicate_timestamps(manager, descending):
+    manager.create_partitioned_table('p', {'id': 'INTEGER', 'time': 'TEXT', 'v': 'REAL'})
+    day = datetime.datetime(2024, 1, 1, 23, 59, 59).timestamp()
+    # 4 行时间相同，跨越分区边界的第二天再有 3 行时间相同
+    rows = [(i, _time_text(day), float(i)) for i in range(4)]
+    rows += [(4 + i, _time_text(day + 2), float(4 + i)) for i in range(3)]
+    manager.insert_many('p', ['id', 'time', 'v'], rows)
+    assert len(manager.get_partitions('p')) == 2
+
+    pages = _walk_keyset(manager, 'p', page_size=2, descending=descending)
+    ids = [row['id'] for page in pages for row in page]
+    assert sorted(ids) == list(range(7))
+    assert all(len(page) == 2 for page in pages[:-1])
+    assert manager.approximate_table_count('p') >= 7
+
+
+def test_insert_routes_to_partition_created_by_another_instance(tmp_path):
+    path = str(tmp_path / "test.db")
+    writer = SQLiteManager(path, pool_mode=SQLiteManager.POOL_MODE_THREAD)
+    creator = SQLiteManager(path, pool_mode=SQLiteManager.POOL_MODE_THREAD)
+    try:
+        writer.create_table('other', {'time': 'TEXT'})
+        writer.insert('other', time=_time_text(1700000000.0))
+        creator.create_partitioned_table('p', {'time': 'TEXT', 'v': 'REAL'})
+        writer.insert('p', time=_time_text(1700000000.0), v=1.0)
+        assert writer.get_table_data_count('p') == 1
+    finally:
+        writer.close()
+        creator.close()
+
+
+def test_range_query_prunes_partitions(manager):
+    manager.create_partitioned_table('p', {'time': 'TEXT', 'v': 'REAL'})
+    start = datetime.datetime(2024, 1, 1).timestamp()
+    manager.insert_many('p', ['time', 'v'], [(_time_text(start + i * 3600), float(i)) for i in range(72)])
+    assert len(manager.get_partitions('p')) == 3
+
+    day2_start, day2_end = start + 86400, start + 2 * 86400 - 1
+    assert manager.get_partitions('p', day2_start, day2_end) == manager.get_partitions('p')[1:2]
+    rows, _ = manager.get_multi_table_data(['p'], day2_start, day2_end, join_type='union')
+    assert [row[2] for row in rows] == [float(i) for i in range(24, 48)]
+    assert manager.get_table_data_count('p', _time_text(day2_start), _time_text(day2_end)) == 24
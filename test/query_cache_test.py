@@ -0,0 +1,83 @@
+"""
+缓存库查询缓存回归测试：新线程第一次读取不使缓存失效、其他连接提交的修改使缓存失效、返回值互不影响
+"""
+import sqlite3
+import threading
+
+import pytest
+
+from public.dao.SQLite.SQliteManager import SQLiteManager
+
+
+@pytest.fixture
+def query_cache():
+    # 缓存模块导入时按相对路径创建全局实例，在测试中导入，见 conftest
+    from public.function.Cache.cache_manager import _QueryCache
+
+    cache = _QueryCache()
+    yield cache
+    cache.close()
+
+
+def test_query_cache_survives_new_thread_and_sees_external_commit(tmp_path, query_cache):
+    m = SQLiteManager(str(tmp_path / "test.db"), pool_mode=SQLiteManager.POOL_MODE_THREAD)
+    loads = []
+
+    def load():
+        with m.get_connection() as conn:
+            loads.append(conn.execute("SELECT COUNT(*) FROM t").fetchone()[0])
+        return loads[-1]
+
+    try:
+        with m.get_connection() as conn:
+            conn.execute("CREATE TABLE t (v INTEGER)")
+            conn.execute("INSERT INTO t VALUES (1)")
+            conn.commit()
+        assert query_cache.get_or_load(('count',), (m,), load) == 1
+
+        # 新线程第一次读取不会使缓存失效
+        results = []
+        worker = threading.Thread(target=lambda: results.append(query_cache.get_or_load(('count',), (m,), load)))
+        worker.start()
+        worker.join()
+        assert results == [1] and len(loads) == 1
+
+        # 其他连接提交的修改使缓存失效
+        external = sqlite3.connect(m.db_name)
+        external.execute("INSERT INTO t VALUES (2)")
+        external.commit()
+        external.close()
+        assert query_cache.get_or_load(('count',), (m,), load) == 2
+        assert len(loads) == 2
+    finally:
+        m.close()
+
+
+def test_commit_from_second_manager_invalidates_cached_records(tmp_path):
+    from public.function.Cache.cache_manager import DataCacheManager
+
+    # 两个实例各自持有连接，相当于 GUI 进程中的读取方与 connect_server 进程中的写入方
+    reader = DataCacheManager(str(tmp_path / "cache"))
+    writer = DataCacheManager(str(tmp_path / "cache"))
+
+    def record(index: int) -> dict:
+        path = str(tmp_path / f"f{index}.png")
+        return {'device_id': 'dev', 'file_path': path, 'file_name': f"f{index}.png", 'original_path': path}
+
+    try:
+        assert writer.save_image_record(record(0))
+        first = reader.get_latest_image_records('dev')
+        assert [r['file_name'] for r in first] == ['f0.png']
+
+        # 修改返回值不影响缓存
+        first[0]['file_name'] = 'changed'
+        assert [r['file_name'] for r in reader.get_latest_image_records('dev')] == ['f0.png']
+
+        assert reader.get_image_devices() == ['dev']
+        writer.save_image_record({**record(1), 'device_id': 'dev2'})
+        writer.save_image_record(record(2))
+        assert sorted(r['file_name'] for r in reader.get_latest_image_records('dev')) == ['f0.png', 'f2.png']
+        assert reader.get_image_devices() == ['dev', 'dev2']
+    finally:
+        reader.close()
+        writer.close()
@@ -0,0 +1,66 @@
+"""
+SQLiteManager 回归测试：连接池嵌套借用
+"""
+import sqlite3
+
+import pytest
+
+from public.dao.SQLite.SQliteManager import SQLiteManager
+
+
+@pytest.fixture(params=[SQLiteManager.POOL_MODE_THREAD, SQLiteManager.POOL_MODE_BOUNDED])
+def manager(request, tmp_path):
+    m = SQLiteManager(str(tmp_path / "test.db"), timeout=2.0, pool_mode=request.param, pool_size=1)
+    yield m
+    m.close()
+
+
+# ==================== 连接池 ====================
+
+def test_nested_connection_keeps_outer_transaction(manager):
+    with manager.get_connection() as conn:
+        conn.execute("CREATE TABLE t (v INTEGER)")
+        conn.commit()
+
+    with manager.get_connection() as outer:
+        outer.execute("BEGIN")
+        outer.execute("INSERT INTO t VALUES (1)")
+        # 嵌套借用（例如在事务中查询表结构）不能回滚外层事务
+        with manager.get_connection() as inner:
+            assert inner is outer
+            inner.execute("SELECT COUNT(*) FROM t").fetchone()
+        assert outer.in_transaction
+        outer.commit()
+
+    with manager.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 1
+
+
+def test_nested_connection_restores_settings_at_its_own_exit(manager):
+    with manager.get_connection() as outer:
+        with manager.get_connection(row_factory=sqlite3.Row) as inner:
+            assert isinstance(inner.execute("SELECT 1 AS x").fetchone(), sqlite3.Row)
+        assert outer.row_factory is None
+        assert outer.execute("SELECT 1").fetchone() == (1,)
+
+
+def test_outermost_exit_rolls_back_uncommitted(manager):
+    with manager.get_connection() as conn:
+        conn.execute("CREATE TABLE t (v INTEGER)")
+        conn.commit()
+    with manager.get_connection() as conn:
+        conn.execute("BEGIN")
+        conn.execute("INSERT INTO t VALUES (1)")
+    with manager.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+
+def test_bounded_pool_nested_borrow_does_not_wait(tmp_path):
+    m = SQLiteManager(str(tmp_path / "test.db"), timeout=0.5, pool_mode=SQLiteManager.POOL_MODE_BOUNDED,
+                      pool_size=1)
+    try:
+        with m.get_connection() as outer:
+            with m.get_connection() as inner:
+                assert inner is outer
+    finally:
+        m.close()
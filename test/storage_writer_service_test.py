@@ -0,0 +1,71 @@
+"""
+存储写入服务回归测试：同一批次中单个数据项失败只回滚该项、每个数据项的 future 都以结果完成、
+写入服务未启动时 store_data_with_result 直接返回失败且不放入队列
+"""
+import queue
+import uuid
+from concurrent.futures import Future
+
+import pytest
+
+from public.config_class.global_setting import global_setting
+from public.dao.SQLite.SQliteManager import SQLiteManager
+from public.function.Monitor_data_storage.DataStorage import DataItem, store_data_with_result
+from public.function.Monitor_data_storage.StorageWriterService import StorageWriterService
+
+
+@pytest.fixture
+def service(tmp_path):
+    manager = SQLiteManager(str(tmp_path / "test.db"), pool_mode=SQLiteManager.POOL_MODE_THREAD)
+    manager.create_table('t', {'time': 'TEXT NOT NULL', 'v': 'REAL'})
+    yield StorageWriterService(manager, store_queue=queue.Queue())
+    manager.close()
+
+
+def _item(data) -> DataItem:
+    return DataItem(id=str(uuid.uuid4()), data=data, future=Future())
+
+
+def _row(time_text, v):
+    return {"table_name": "t", "values": {"time": time_text, "v": v}}
+
+
+def test_failing_item_rolls_back_only_its_savepoint(service):
+    ok = _item(_row('2024-01-01 00:00:00.000', 1.0))
+    # 第二行违反 NOT NULL：整个数据项（包括已写入的第一行）回滚
+    failing = _item([_row('2024-01-01 00:00:01.000', 2.0), _row(None, 3.0)])
+    unknown_format = _item({"values": {}})
+    ok_after = _item([_row('2024-01-01 00:00:02.000', 4.0), _row('2024-01-01 00:00:03.000', 5.0)])
+
+    service._write_batch([ok, failing, unknown_format, ok_after])
+
+    results = {name: item.future.result(timeout=0) for name, item in
+               [('ok', ok), ('failing', failing), ('unknown_format', unknown_format), ('ok_after', ok_after)]}
+    assert all(item.done() for item in (ok.future, failing.future, unknown_format.future, ok_after.future))
+    assert results['ok'].success and results['ok_after'].success
+    assert not results['failing'].success and 'NOT NULL' in results['failing'].error
+    assert not results['unknown_format'].success
+    assert results['ok'].item_id == ok.id
+
+    with service.manager.get_connection() as conn:
+        assert [r[0] for r in conn.execute("SELECT v FROM t ORDER BY v")] == [1.0, 4.0, 5.0]
+    metrics = service.metrics()
+    # 格式无法识别的数据项在进入事务前就已失败，不计入批次的失败数
+    assert metrics['items_written'] == 2 and metrics['items_failed'] == 1 and metrics['batches'] == 1
+
+
+def test_store_with_result_fails_fast_without_service():
+    store_queue = queue.Queue()
+    previous_queue = global_setting.get_setting("store_Q")
+    previous_service = global_setting.get_setting("storage_writer_service")
+    global_setting.set_setting("store_Q", store_queue)
+    global_setting.set_setting("storage_writer_service", None)
+    try:
+        result = store_data_with_result(_row('2024-01-01 00:00:00.000', 1.0), need_result=True, timeout=0.1)
+        assert not result.success and store_queue.empty()
+        # 不需要结果时照常放入队列，由之后启动的写入服务写入
+        assert store_data_with_result(_row('2024-01-01 00:00:00.000', 1.0)) is None
+        assert store_queue.qsize() == 1
+    finally:
+        global_setting.set_setting("store_Q", previous_queue)
+        global_setting.set_setting("storage_writer_service", previous_service)
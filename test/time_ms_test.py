@@ -0,0 +1,44 @@
+"""
+整数毫秒时间列 time_ms 回归测试：迁移后插入自动补全 time_ms、数值范围查询与文本范围查询结果一致
+"""
+import datetime
+
+from public.dao.SQLite.SQliteManager import SQLiteManager
+
+
+def _time_text(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+def test_insert_not_columns_after_migrate_time_ms(tmp_path):
+    m = SQLiteManager(str(tmp_path / "test.db"), pool_mode=SQLiteManager.POOL_MODE_THREAD)
+    try:
+        m.create_table('t', {'time': 'TEXT', 'v': 'REAL'}, with_time_ms=False)
+        m.insert_not_columns('t', [_time_text(1700000000.0), 1.0])
+        m.migrate_time_ms(['t'])
+        assert m.has_time_ms('t')
+        m.insert_not_columns('t', [_time_text(1700000001.0), 2.0])
+        with m.get_connection() as conn:
+            rows = conn.execute("SELECT v, time_ms FROM t ORDER BY v").fetchall()
+        assert rows == [(1.0, 1700000000000), (2.0, 1700000001000)]
+    finally:
+        m.close()
+
+
+def test_range_query_same_with_and_without_time_ms(tmp_path):
+    m = SQLiteManager(str(tmp_path / "test.db"), pool_mode=SQLiteManager.POOL_MODE_THREAD)
+    try:
+        m.create_table('with_ms', {'time': 'TEXT', 'v': 'REAL'}, with_time_ms=True)
+        m.create_table('text_only', {'time': 'TEXT', 'v': 'REAL'})
+        rows = [(_time_text(1700000000.0 + i * 0.5), float(i)) for i in range(20)]
+        m.insert_many('with_ms', ['time', 'v'], rows)
+        m.insert_many('text_only', ['time', 'v'], rows)
+        assert m.has_time_ms('with_ms') and not m.has_time_ms('text_only')
+
+        start, end = 1700000002.0, 1700000006.5
+        with_ms, _ = m.get_multi_table_data(['with_ms'], start, end, join_type='union')
+        text_only, _ = m.get_multi_table_data(['text_only'], start, end, join_type='union')
+        assert [row[1:] for row in with_ms] == [row[1:] for row in text_only]
+        assert [row[2] for row in with_ms] == [float(i) for i in range(4, 14)]
+    finally:
+        m.close()
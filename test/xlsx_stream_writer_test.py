@@ -0,0 +1,40 @@
+"""
+流式 xlsx 写入回归测试：打包后的文件可以由 openpyxl 打开，数值、文本、布尔、空值与非法字符按预期写入
+"""
+import openpyxl
+
+from public.function.Tansfer.xlsx_stream_writer import SheetXmlWriter, column_letter, write_workbook
+
+
+def test_column_letter():
+    assert [column_letter(i) for i in (0, 25, 26, 701, 702)] == ['A', 'Z', 'AA', 'ZZ', 'AAA']
+
+
+def test_workbook_opens_in_openpyxl(tmp_path):
+    sheets = []
+    for name, rows in (('数据', [['time', 'v', 's', 'b'],
+                                 ['2024-01-01 00:00:00.000', 1.5, '<a & "b">', True],
+                                 ['2024-01-01 00:00:01.000', None, 'x\x01y', False],
+                                 ['2024-01-01 00:00:02.000', 3, float('nan'), None]]),
+                       ('empty', [['only header']])):
+        writer = SheetXmlWriter(str(tmp_path / f"{len(sheets)}.xml"))
+        for row in rows:
+            writer.append(row)
+        writer.close()
+        sheets.append((name, writer.path))
+    output = str(tmp_path / "out.xlsx")
+
+    write_workbook(output, sheets)
+
+    workbook = openpyxl.load_workbook(output)
+    try:
+        assert workbook.sheetnames == ['数据', 'empty']
+        assert list(workbook['数据'].iter_rows(values_only=True)) == [
+            ('time', 'v', 's', 'b'),
+            ('2024-01-01 00:00:00.000', 1.5, '<a & "b">', True),
+            ('2024-01-01 00:00:01.000', None, 'xy', False),
+            ('2024-01-01 00:00:02.000', 3, 'nan', None),
+        ]
+        assert list(workbook['empty'].iter_rows(values_only=True)) == [('only header',)]
+    finally:
+        workbook.close()